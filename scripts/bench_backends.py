@@ -0,0 +1,93 @@
+"""
+Benchmark of the PostgreSQL and DuckDB storage backends.
+
+Copies an existing PostgreSQL database (for example the one seeded by
+scripts/bench_queries.py) into a DuckDB file, then times the wide reads the
+analysis runs on both repos: fetch_adjclose_long over every ticker, the full
+coverage query, and fetch_ohlcv_since. Reports the median wall time per call
+and the speedup of DuckDB over PostgreSQL.
+
+Usage:
+    python scripts/bench_queries.py --dbname trilobite_bench --tickers 500 --years 5
+    python scripts/bench_backends.py --dbname trilobite_bench --duckdb /tmp/trilobite_bench.duckdb
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import timedelta
+from typing import Any, Callable
+
+from trilobite.db.connect import DbSettings, connect
+from trilobite.db.duck.connect import connect as connect_duckdb
+from trilobite.db.duck.repo import DuckMarketRepo
+from trilobite.db.duck.schema import create_schema as create_duckdb_schema
+from trilobite.db.duck.sync import sync_from_postgres
+from trilobite.db.repo import MarketRepo
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> tuple[float, Any]:
+    """
+    Returns the median wall time in ms over `repeat` calls, and the last result
+    """
+    out: Any = None
+    ms: list[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        ms.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(ms), out
+
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(prog="bench_backends")
+    p.add_argument("--dbname", default="trilobite_bench", help="PostgreSQL database to read from")
+    p.add_argument("--host", default="/run/postgresql")
+    p.add_argument("--user", default=None)
+    p.add_argument("--port", type=int, default=5432)
+    p.add_argument("--duckdb", default=None, help="DuckDB file, default data/trilobite.duckdb")
+    p.add_argument("--period", default="1y", help="Period used by the coverage query")
+    p.add_argument("--range-days", type=int, default=365 * 3, help="Date range of the adjclose fetch")
+    p.add_argument("--repeat", type=int, default=5, help="Calls per measurement")
+    ns = p.parse_args(argv)
+
+    pg = connect(DbSettings(dbname=ns.dbname, host=ns.host, user=ns.user, port=ns.port))
+    duck = connect_duckdb(ns.duckdb)
+    create_duckdb_schema(duck)
+
+    t0 = time.perf_counter()
+    res = sync_from_postgres(pg, duck)
+    print(f"sync: {res.rows} rows for {res.refreshed}/{res.instruments} instruments in {time.perf_counter() - t0:.2f}s")
+
+    repos = {"postgres": MarketRepo(pg), "duckdb": DuckMarketRepo(duck)}
+    last_dates = [d for d in repos["postgres"].last_ohlcv_date_for_all_tickers().values() if d is not None]
+    if not last_dates:
+        print("Database has no OHLCV rows, seed it with scripts/bench_queries.py", file=sys.stderr)
+        return 2
+    end_date = max(last_dates)
+    start_date = end_date - timedelta(days=ns.range_days)
+    tickers = repos["postgres"].list_active_tickers()
+    since = {t: start_date for t in tickers}
+
+    cases: dict[str, Callable[[MarketRepo | DuckMarketRepo], Callable[[], Any]]] = {
+        "fetch_adjclose_long": lambda r: lambda: r.fetch_adjclose_long(tickers, start_date=start_date, end_date=end_date),
+        "full_coverage": lambda r: lambda: r.list_tickers_with_full_ohlcv_coverage(ns.period, end_date=end_date),
+        "fetch_ohlcv_since": lambda r: lambda: r.fetch_ohlcv_since(since),
+    }
+    print(f"{'case':<22} {'postgres':>12} {'duckdb':>12} {'speedup':>9} rows")
+    for name, make in cases.items():
+        pg_ms, pg_out = _time(make(repos["postgres"]), ns.repeat)
+        duck_ms, duck_out = _time(make(repos["duckdb"]), ns.repeat)
+        if len(pg_out) != len(duck_out):
+            print(f"{name}: row count differs, postgres={len(pg_out)} duckdb={len(duck_out)}", file=sys.stderr)
+        print(f"{name:<22} {pg_ms:>10.1f}ms {duck_ms:>10.1f}ms {pg_ms / max(duck_ms, 1e-9):>8.1f}x {len(pg_out)}")
+
+    pg.close()
+    duck.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
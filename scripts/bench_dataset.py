@@ -0,0 +1,73 @@
+"""
+Benchmark of the training data paths of FactorWindowDirectionDataset.
+
+Builds the dataset from synthetic factors and returns, then iterates full
+shuffled epochs the way NNDirectionsTrainer.fit does:
+- per-sample: DataLoader(ds, batch_size=B, shuffle=True), one __getitem__
+  per sample and a torch.stack per batch (the old default)
+- batched: DataLoader(BatchedWindows(ds), sampler=WindowBatchSampler(..),
+  batch_size=None), one gather per batch from a strided view
+
+and reports samples per second of each, median over the epochs.
+
+Usage:
+    python scripts/bench_dataset.py --days 756 --tickers 2000 --factors 64 --lookback 60
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from torch.utils.data import DataLoader
+
+from trilobite.analysis.dataset import BatchedWindows, FactorDatasetSpec, FactorWindowDirectionDataset, WindowBatchSampler
+
+
+def _epoch(loader: Iterable, n_samples: int) -> float:
+    """
+    Returns samples per second of one pass over the loader
+    """
+    t0 = time.perf_counter()
+    for x, y in loader:
+        #Touch the batch like the training step would
+        x.sum()
+        y.sum()
+    return n_samples / (time.perf_counter() - t0)
+
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(prog="bench_dataset")
+    p.add_argument("--days", type=int, default=756, help="Rows of the returns matrix, about 3 years")
+    p.add_argument("--tickers", type=int, default=2000)
+    p.add_argument("--factors", type=int, default=64)
+    p.add_argument("--lookback", type=int, default=60)
+    p.add_argument("--batch-sizes", default="32,128,512", help="Comma separated batch sizes")
+    p.add_argument("--epochs", type=int, default=5, help="Epochs per measurement")
+    p.add_argument("--seed", type=int, default=7)
+    ns = p.parse_args(argv)
+
+    rng = np.random.default_rng(ns.seed)
+    index = pd.bdate_range("2020-01-01", periods=ns.days)
+    factors = pd.DataFrame(rng.standard_normal((ns.days, ns.factors), dtype=np.float32), index=index)
+    returns = pd.DataFrame(rng.standard_normal((ns.days, ns.tickers)) * 0.01, index=index)
+    ds = FactorWindowDirectionDataset(factors, returns, FactorDatasetSpec(lookback=ns.lookback))
+    n = len(ds)
+    print(f"{n} samples, windows ({ns.lookback}, {ns.factors}), labels ({ns.tickers},)")
+
+    print(f"{'batch':>6} {'per-sample':>14} {'batched':>14} {'speedup':>8}")
+    for bs in (int(b) for b in ns.batch_sizes.split(",")):
+        per_sample = DataLoader(ds, batch_size=bs, shuffle=True, drop_last=False)
+        batched = DataLoader(BatchedWindows(ds), sampler=WindowBatchSampler(n, bs, shuffle=True), batch_size=None)
+        old = statistics.median(_epoch(per_sample, n) for _ in range(ns.epochs))
+        new = statistics.median(_epoch(batched, n) for _ in range(ns.epochs))
+        print(f"{bs:>6} {old:>12.0f}/s {new:>12.0f}/s {new / old:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+"""
+Benchmark of the float dtype policies of the analysis pipeline, see
+CFGAnalysis.dtype.
+
+Runs `trilobite --train-nn` once per policy and repeat, each in its own
+process, and reports the median wall time and the peak resident set size of
+the process (from wait4, so nothing is added to the measured process). The
+PCA is refitted in every run (--refit-factors) so the runs do the same work.
+The app is run headless like `python -m trilobite`, with the database of
+--dbname/--host/--user instead of the one in CFGDataBase.
+
+Usage:
+    python scripts/bench_queries.py --dbname trilobite_bench --tickers 500 --years 5
+    python scripts/bench_dtype.py --dbname trilobite_bench --period 3y --epochs 1
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import replace
+
+
+def _child(argv: list[str]) -> int:
+    """
+    One measured run: `bench_dtype.py --child DBNAME HOST USER -- trilobite args`
+    """
+    from trilobite.app import App
+    from trilobite.cli.cli import parse_args
+
+    dbname, host, user = argv[:3]
+    cfg, flags = parse_args(argv[4:])
+    cfg = replace(cfg, db=replace(cfg.db, dbname=dbname, host=host, user=user or None))
+    App(cfg).run_headless(flags)
+    return 0
+
+
+def _run(cmd: list[str]) -> tuple[float, float]:
+    """
+    Returns the wall time in s and the peak RSS in MB of one run
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    assert proc.stderr is not None
+    err = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} exited with {proc.returncode}:\n{err.decode(errors='replace')}")
+    #ru_maxrss is in kB on Linux
+    return seconds, usage.ru_maxrss / 1024
+
+
+def main(argv: list[str]) -> int:
+    if argv[:1] == ["--child"]:
+        return _child(argv[1:])
+    p = argparse.ArgumentParser(prog="bench_dtype")
+    p.add_argument("--dbname", default="trilobite_bench", help="PostgreSQL database to read from")
+    p.add_argument("--host", default="/run/postgresql")
+    p.add_argument("--user", default=None)
+    p.add_argument("--dtypes", default="float64,float32", help="Comma separated policies, the first is the baseline")
+    p.add_argument("--period", default="3y")
+    p.add_argument("--n-factors", type=int, default=20)
+    p.add_argument("--epochs", type=int, default=1)
+    p.add_argument("--repeat", type=int, default=3, help="Runs per policy")
+    p.add_argument("--use-mirror", action="store_true", help="Read the matrices from the columnar mirror")
+    ns = p.parse_args(argv)
+
+    base = [
+        sys.executable, os.path.abspath(__file__), "--child", ns.dbname, ns.host, ns.user or "", "--",
+        "--train-nn", "--refit-factors",
+        "--period", ns.period, "--n-factors", str(ns.n_factors), "--epochs", str(ns.epochs),
+    ]
+    if ns.use_mirror:
+        base.append("--use-mirror")
+
+    print(f"{'dtype':<8} {'time':>9} {'peak RSS':>11} {'vs first':>9}")
+    first: float | None = None
+    for dtype in ns.dtypes.split(","):
+        runs = [_run(base + ["--dtype", dtype]) for _ in range(ns.repeat)]
+        seconds = statistics.median(s for s, _ in runs)
+        peak = statistics.median(mb for _, mb in runs)
+        first = first or peak
+        print(f"{dtype:<8} {seconds:>8.1f}s {peak:>9.0f}MB {peak / first:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
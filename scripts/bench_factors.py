@@ -0,0 +1,100 @@
+"""
+Benchmark of the PCA solvers of PCAReturnFactors, see FactorSpec.solver.
+
+Fits every solver on synthetic daily returns (a few market factors plus
+idiosyncratic noise) for a range of universe sizes, and reports the median
+fit time, the peak memory allocated during the fit (tracemalloc, which sees
+numpy's buffers), and how well the fitted subspace agrees with the exact
+"full" solver: the smallest cosine of the principal angles between the two
+sets of components, 1.0 meaning the same subspace.
+
+Usage:
+    python scripts/bench_factors.py --days 756 --tickers 500,2000,5000 --factors 64
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from trilobite.analysis.factors import SOLVERS, FactorSpec, PCAReturnFactors
+
+
+def _returns(days: int, tickers: int, *, n_market: int, seed: int) -> pd.DataFrame:
+    """
+    Synthetic log returns with n_market common factors of decaying strength
+    """
+    rng = np.random.default_rng(seed)
+    F = rng.standard_normal((days, n_market)) * 0.01 / np.sqrt(np.arange(1, n_market + 1))
+    B = rng.standard_normal((n_market, tickers))
+    X = F @ B + rng.standard_normal((days, tickers)) * 0.015
+    index = pd.bdate_range("2020-01-01", periods=days)
+    return pd.DataFrame(X, index=index, columns=[f"T{i:05d}" for i in range(tickers)])
+
+
+def _subspace_agreement(a: np.ndarray, b: np.ndarray) -> tuple[float, float]:
+    """
+    Smallest cosine and mean squared cosine of the principal angles between
+    the row spaces of a and b
+    """
+    s = np.linalg.svd(a @ b.T, compute_uv=False)
+    return float(s.min()), float(np.mean(s**2))
+
+
+def _fit(spec: FactorSpec, returns: pd.DataFrame, repeat: int) -> tuple[float, float, PCAReturnFactors]:
+    """
+    Returns the median fit time in ms, the peak traced memory in MB of one fit,
+    and the last fitted model
+    """
+    ms: list[float] = []
+    fm = PCAReturnFactors(spec)
+    for _ in range(repeat):
+        fm = PCAReturnFactors(spec)
+        t0 = time.perf_counter()
+        fm.fit(returns)
+        ms.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    PCAReturnFactors(spec).fit(returns)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(ms), peak / 1e6, fm
+
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(prog="bench_factors")
+    p.add_argument("--days", type=int, default=756, help="Rows of the returns matrix, about 3 years")
+    p.add_argument("--tickers", default="500,2000,5000", help="Comma separated universe sizes")
+    p.add_argument("--factors", type=int, default=64, help="n_factors of the spec")
+    p.add_argument("--market-factors", type=int, default=20, help="Common factors in the synthetic returns")
+    p.add_argument("--standardize", action="store_true")
+    p.add_argument("--repeat", type=int, default=3, help="Fits per measurement")
+    p.add_argument("--seed", type=int, default=7)
+    ns = p.parse_args(argv)
+
+    print(f"{'tickers':>7} {'solver':<10} {'picked':<10} {'fit':>11} {'peak':>10} {'top':>9} {'all':>9} {'expl.var':>9}")
+    for n in (int(t) for t in ns.tickers.split(",")):
+        returns = _returns(ns.days, n, n_market=ns.market_factors, seed=ns.seed)
+        exact: np.ndarray | None = None
+        for solver in ("full",) + tuple(s for s in SOLVERS if s != "full"):
+            spec = FactorSpec(n_factors=ns.factors, standardize=ns.standardize, solver=solver)
+            ms, mb, fm = _fit(spec, returns, ns.repeat)
+            comps = fm.components
+            if exact is None:
+                exact = comps
+            m = min(ns.market_factors, ns.factors)
+            top, _ = _subspace_agreement(comps[:m], exact[:m])
+            _, overall = _subspace_agreement(comps, exact)
+            print(
+                f"{n:>7} {solver:<10} {fm.solver or '':<10} {ms:>9.1f}ms {mb:>8.1f}MB "
+                f"{top:>9.6f} {overall:>9.6f} {fm.explained_variance_ratio.sum():>8.1%}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,92 @@
+"""
+Benchmark of the parallel fan-out reads, see db/fanout.py.
+
+Times fetch_adjclose_long and fetch_logret_long over every active ticker
+with fan-out widths 1 (a single connection), 2, 4, .. and both shard
+layouts, checks every sharded result is equal to the single connection one,
+and reports the median wall time per call and the speedup. The speedup is
+bounded by the cores the PostgreSQL server and this process can use.
+
+Usage:
+    python scripts/bench_queries.py --dbname trilobite_bench --tickers 500 --years 5
+    python scripts/bench_fanout.py --dbname trilobite_bench --widths 1,2,4,8
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import timedelta
+from typing import Any, Callable
+
+from trilobite.db.connect import DbSettings, connect, open_pool
+from trilobite.db.fanout import ParallelReader
+from trilobite.db.repo import MarketRepo
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> tuple[float, Any]:
+    """
+    Returns the median wall time in ms over `repeat` calls, and the last result
+    """
+    out: Any = None
+    ms: list[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        ms.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(ms), out
+
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(prog="bench_fanout")
+    p.add_argument("--dbname", default="trilobite_bench", help="PostgreSQL database to read from")
+    p.add_argument("--host", default="/run/postgresql")
+    p.add_argument("--user", default=None)
+    p.add_argument("--port", type=int, default=5432)
+    p.add_argument("--widths", default="1,2,4,8", help="Comma separated fan-out widths, 1 is the single connection baseline")
+    p.add_argument("--shard-by", default="ticker,date", help="Comma separated shard layouts to time")
+    p.add_argument("--range-days", type=int, default=365 * 3, help="Date range of the fetches")
+    p.add_argument("--repeat", type=int, default=5, help="Calls per measurement")
+    ns = p.parse_args(argv)
+
+    settings = DbSettings(dbname=ns.dbname, host=ns.host, user=ns.user, port=ns.port)
+    widths = sorted({int(w) for w in ns.widths.split(",")})
+    pg = connect(settings)
+    pool = open_pool(settings, min_size=1, max_size=max(widths) + 1)
+
+    base = MarketRepo(pg)
+    last_dates = [d for d in base.last_ohlcv_date_for_all_tickers().values() if d is not None]
+    if not last_dates:
+        print("Database has no OHLCV rows, seed it with scripts/bench_queries.py", file=sys.stderr)
+        return 2
+    end_date = max(last_dates)
+    start_date = end_date - timedelta(days=ns.range_days)
+    tickers = base.list_active_tickers()
+    print(f"{len(tickers)} tickers, {start_date} .. {end_date}")
+
+    cases: dict[str, Callable[[MarketRepo], Callable[[], Any]]] = {
+        "fetch_adjclose_long": lambda r: lambda: r.fetch_adjclose_long(tickers, start_date=start_date, end_date=end_date),
+        "fetch_logret_long": lambda r: lambda: r.fetch_logret_long(tickers, start_date=start_date, end_date=end_date),
+    }
+    status = 0
+    print(f"{'case':<22} {'shard_by':<8} {'width':>5} {'time':>12} {'speedup':>9} rows")
+    for name, make in cases.items():
+        base_ms, base_out = _time(make(base), ns.repeat)
+        print(f"{name:<22} {'-':<8} {1:>5} {base_ms:>10.1f}ms {1.0:>8.1f}x {len(base_out)}")
+        for shard_by in ns.shard_by.split(","):
+            for width in (w for w in widths if w > 1):
+                reader = ParallelReader(pool, width=width, min_tickers=1, shard_by=shard_by)
+                ms, out = _time(make(MarketRepo(pg, fanout=reader)), ns.repeat)
+                if not out.equals(base_out):
+                    print(f"{name} {shard_by} x{width}: result differs from the single connection read", file=sys.stderr)
+                    status = 1
+                print(f"{name:<22} {shard_by:<8} {width:>5} {ms:>10.1f}ms {base_ms / max(ms, 1e-9):>8.1f}x {len(out)}")
+
+    pool.close()
+    pg.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,284 @@
+"""
+Query-plan benchmark harness for the statements in trilobite.db.queries.
+
+Seeds a scratch database with synthetic price history, then runs
+EXPLAIN (ANALYZE, BUFFERS) for every statement in the queries module and
+appends execution time and buffer counts to logs/query_bench.jsonl. Each run
+is compared with the previous run on the same dataset size, and statements
+that got slower or touch more buffers than the tolerance allows are reported
+as regressions.
+
+Write statements are explained inside a transaction that is rolled back, so
+the seeded data is the same for every statement.
+
+Usage:
+    createdb trilobite_bench
+    python scripts/bench_queries.py --dbname trilobite_bench --tickers 500 --years 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable
+
+import psycopg
+
+from trilobite.db import queries as q
+from trilobite.db.connect import DbSettings, connect
+from trilobite.db.schema import create_schema
+from trilobite.utils.paths import logs_dir
+
+SEED_INSTRUMENTS = """
+INSERT INTO instrument (ticker, is_active, last_seen)
+SELECT 'T' || lpad(g::text, 5, '0'), TRUE, CURRENT_DATE
+FROM generate_series(1, %s) AS g;
+"""
+
+# Random walk per instrument over business days, one row per instrument and day
+SEED_OHLCV = """
+INSERT INTO ohlcv_daily (
+    instrument_id, date, open, high, low, close, adjclose, volume, dividends, stocksplits
+)
+SELECT
+    i.id,
+    d.date,
+    p.px, p.px * 1.01, p.px * 0.99, p.px, p.px,
+    (random() * 1000000)::bigint,
+    0, 0
+FROM instrument AS i
+CROSS JOIN LATERAL (
+    SELECT day::date AS date
+    FROM generate_series(%s::date, %s::date, interval '1 day') AS day
+    WHERE extract(isodow FROM day) < 6
+) AS d
+CROSS JOIN LATERAL (
+    SELECT round((50 + 10 * sin(i.id + (d.date - DATE '2000-01-01') / 60.0) + random())::numeric, 4) AS px
+) AS p;
+"""
+
+
+@dataclass(frozen=True)
+class BenchContext:
+    """
+    Values used to fill in the statement parameters.
+    """
+    tickers: list[str]
+    instrument_id: int
+    start_date: date
+    end_date: date
+
+
+def _utc(d: date) -> datetime:
+    """
+    Midnight UTC of a date, for the intraday statements
+    """
+    return datetime.combine(d, time(), tzinfo=timezone.utc)
+
+
+# Parameters for each statement with placeholders. A statement that is added to
+# queries.py without an entry here is reported as missing and skipped.
+PARAMS: dict[str, Callable[[BenchContext], tuple]] = {
+    "ENSURE_INSTRUMENT": lambda c: (c.tickers[0],),
+    "DEACTIVATE_TICKERS": lambda c: (c.tickers[:10],),
+    "TICKER_FOR_INSTRUMENT": lambda c: (c.instrument_id,),
+    "LAST_OHLCV_DATE_FOR_TICKER": lambda c: (c.tickers[0],),
+    "UPSERT_OHLCV_DAILY": lambda c: (c.instrument_id, c.end_date, 1, 1, 1, 1, 1, 100, 0, 0),
+    "FETCH_ADJCLOSE_LONG": lambda c: (c.tickers, c.start_date, c.end_date),
+    "LIST_TICKERS_WITH_MIN_OHLCV_DAYS": lambda c: (c.start_date, c.end_date, 200),
+    "FETCH_ADJCLOSE_SERIES_BETWEEN": lambda c: (c.tickers[0], c.start_date, c.end_date),
+    "FETCH_ADJCLOSE_SERIES_LEQ": lambda c: (c.tickers[0], c.end_date),
+    "LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE": lambda c: (c.start_date, c.end_date, c.end_date),
+    "REFRESH_INSTRUMENT_STATS": lambda c: (c.instrument_id,) * 4,
+    "FETCH_OHLCV_SINCE": lambda c: (c.tickers, [c.start_date] * len(c.tickers)),
+    "LIST_TRADING_DATES_SINCE": lambda c: (c.start_date,),
+    "FETCH_OHLCV_ROWS_SINCE_BY_ID": lambda c: ([c.instrument_id], [c.start_date]),
+    "REFRESH_RETURNS_DAILY": lambda c: (c.instrument_id, c.instrument_id, c.start_date, c.start_date, c.start_date),
+    "FETCH_LOGRET_LONG": lambda c: (c.tickers, c.start_date, c.end_date),
+    "COMPACT_OHLCV_RANGE": lambda c: (c.start_date, c.start_date + timedelta(days=30)),
+    "UNPACK_COLD_SEGMENTS": lambda c: (c.instrument_id, c.start_date.year, c.start_date.year),
+    "FETCH_ADJCLOSE_LONG_TIERED": lambda c: (c.tickers, c.start_date, c.end_date) * 2 + (c.start_date, c.end_date),
+    "FETCH_ADJCLOSE_SERIES_BETWEEN_TIERED": lambda c: (c.tickers[0], c.start_date, c.end_date),
+    "FETCH_ADJCLOSE_SERIES_LEQ_TIERED": lambda c: (c.tickers[0], c.end_date),
+    "FETCH_OHLCV_SINCE_TIERED": lambda c: (c.tickers, [c.start_date] * len(c.tickers)),
+    "FETCH_OHLCV_ROWS_SINCE_BY_ID_TIERED": lambda c: ([c.instrument_id], [c.start_date]),
+    "LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE_TIERED": lambda c: (c.start_date, c.end_date),
+    "LIST_TRADING_DATES_SINCE_TIERED": lambda c: (c.start_date,),
+    "LAST_INTRADAY_TS_FOR_ALL_TICKERS": lambda c: (5,),
+    "FETCH_INTRADAY_BARS": lambda c: (c.tickers[0], 5, _utc(c.end_date - timedelta(days=30)), _utc(c.end_date)),
+    "ROLLUP_INTRADAY_DAILY": lambda c: ("America/New_York", 5, _utc(c.end_date - timedelta(days=7))),
+    "DELETE_EXPIRED_INTRADAY": lambda c: (5, _utc(c.start_date)),
+    "LIST_INTRADAY_PARTITIONS": lambda c: ("ohlcv_intraday_5m",),
+    "EXPORT_OHLCV_BY_TICKER": lambda c: (c.start_date,),
+    "EXPORT_OHLCV_BY_DATE": lambda c: (c.start_date,),
+    "EXPORT_OHLCV_BY_TICKER_TIERED": lambda c: (c.start_date,),
+    "EXPORT_OHLCV_BY_DATE_TIERED": lambda c: (c.start_date,),
+    "EXPORT_LOGRET_BY_TICKER": lambda c: (c.start_date,),
+    "EXPORT_LOGRET_BY_DATE": lambda c: (c.start_date,),
+    "LIST_TICKERS_WITH_ROWS_AFTER": lambda c: (c.start_date,),
+    "RECORD_FETCH_FAILURE": lambda c: ("no data", 2, _utc(c.end_date), _utc(c.end_date), _utc(c.end_date + timedelta(days=1)), c.tickers[0]),
+    "CLEAR_FETCH_FAILURES": lambda c: (c.tickers[:10],),
+}
+
+
+def _statements() -> dict[str, str]:
+    """
+    Returns every SQL statement defined in the queries module, by name
+    """
+    return {
+        name: sql
+        for name, sql in vars(q).items()
+        if name.isupper() and isinstance(sql, str)
+    }
+
+
+def seed(conn: psycopg.Connection, *, n_tickers: int, years: int, end_date: date) -> None:
+    """
+    Replaces the contents of the scratch database with synthetic data
+    """
+    start_date = end_date - timedelta(days=365 * years)
+    create_schema(conn)
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE instrument RESTART IDENTITY CASCADE;")
+        cur.execute(SEED_INSTRUMENTS, (n_tickers,))
+        cur.execute(SEED_OHLCV, (start_date, end_date))
+        cur.execute(q.REBUILD_INSTRUMENT_STATS)
+        cur.execute("TRUNCATE returns_daily;")
+        cur.execute(q.REBUILD_RETURNS_DAILY)
+    conn.commit()
+    conn.autocommit = True
+    try:
+        conn.execute("VACUUM ANALYZE;")
+    finally:
+        conn.autocommit = False
+
+
+def explain(conn: psycopg.Connection, sql: str, params: tuple, repeat: int) -> dict[str, Any]:
+    """
+    Runs EXPLAIN (ANALYZE, BUFFERS) `repeat` times, rolling back after each
+    run. Reports the median planning and execution time and the buffer counts
+    of the last (warm) run.
+    """
+    exec_ms: list[float] = []
+    plan_ms: list[float] = []
+    plan: dict[str, Any] = {}
+    for _ in range(repeat):
+        with psycopg.ClientCursor(conn) as cur:
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+            row = cur.fetchone()
+        conn.rollback()
+        if row is None:
+            raise RuntimeError("EXPLAIN returned no rows")
+        doc = row[0][0]
+        exec_ms.append(float(doc["Execution Time"]))
+        plan_ms.append(float(doc["Planning Time"]))
+        plan = doc["Plan"]
+    return {
+        "execution_ms": statistics.median(exec_ms),
+        "planning_ms": statistics.median(plan_ms),
+        "shared_hit": int(plan.get("Shared Hit Blocks", 0)),
+        "shared_read": int(plan.get("Shared Read Blocks", 0)),
+        "rows": int(plan.get("Actual Rows", 0)),
+        "node": plan.get("Node Type", ""),
+    }
+
+
+def _previous_run(path, dataset: dict[str, Any]) -> dict[str, Any] | None:
+    """
+    Returns the last recorded run on the same dataset, if any
+    """
+    if not path.exists():
+        return None
+    last = None
+    with path.open(encoding="utf-8") as fh:
+        for line in fh:
+            rec = json.loads(line)
+            if rec.get("dataset") == dataset:
+                last = rec
+    return last
+
+
+def _regressions(current: dict[str, Any], previous: dict[str, Any] | None, tolerance: float) -> list[str]:
+    if previous is None:
+        return []
+    out = []
+    for name, cur in current.items():
+        prev = previous["results"].get(name)
+        if prev is None:
+            continue
+        if cur["execution_ms"] > max(prev["execution_ms"] * tolerance, prev["execution_ms"] + 1.0):
+            out.append(f"{name}: execution {prev['execution_ms']:.2f}ms -> {cur['execution_ms']:.2f}ms")
+        prev_buf = prev["shared_hit"] + prev["shared_read"]
+        cur_buf = cur["shared_hit"] + cur["shared_read"]
+        if cur_buf > max(prev_buf * tolerance, prev_buf + 8):
+            out.append(f"{name}: buffers {prev_buf} -> {cur_buf}")
+    return out
+
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(prog="bench_queries")
+    p.add_argument("--dbname", default="trilobite_bench", help="Scratch database, its contents are replaced")
+    p.add_argument("--host", default="/run/postgresql")
+    p.add_argument("--user", default=None)
+    p.add_argument("--port", type=int, default=5432)
+    p.add_argument("--tickers", type=int, default=500, help="Synthetic instruments to seed")
+    p.add_argument("--years", type=int, default=5, help="Years of daily history to seed")
+    p.add_argument("--range-days", type=int, default=365, help="Date range used by the range queries")
+    p.add_argument("--repeat", type=int, default=3, help="EXPLAIN runs per statement")
+    p.add_argument("--tolerance", type=float, default=1.5, help="Ratio over the previous run counted as a regression")
+    p.add_argument("--no-seed", action="store_true", help="Reuse the data already in the scratch database")
+    ns = p.parse_args(argv)
+
+    if ns.dbname == DbSettings.dbname and not ns.no_seed:
+        print(f"Refusing to seed the default database '{ns.dbname}', use a scratch database", file=sys.stderr)
+        return 2
+
+    conn = connect(DbSettings(dbname=ns.dbname, host=ns.host, user=ns.user, port=ns.port))
+    end_date = date(2024, 12, 31)
+    if not ns.no_seed:
+        seed(conn, n_tickers=ns.tickers, years=ns.years, end_date=end_date)
+
+    tickers = [t for (t,) in conn.execute("SELECT ticker FROM instrument ORDER BY ticker;").fetchall()]
+    instrument_id = conn.execute("SELECT MIN(id) FROM instrument;").fetchone()[0]  # type: ignore[index]
+    conn.rollback()
+    if not tickers:
+        print("Scratch database has no instruments, run without --no-seed", file=sys.stderr)
+        return 2
+    ctx = BenchContext(
+        tickers=tickers,
+        instrument_id=int(instrument_id),
+        start_date=end_date - timedelta(days=ns.range_days),
+        end_date=end_date,
+    )
+
+    results: dict[str, Any] = {}
+    for name, sql in _statements().items():
+        if "%s" in sql and name not in PARAMS:
+            print(f"{name:<45} SKIPPED (no parameters registered)")
+            continue
+        params = PARAMS[name](ctx) if name in PARAMS else ()
+        res = explain(conn, sql, params, ns.repeat)
+        results[name] = res
+        print(
+            f"{name:<45} {res['execution_ms']:>10.2f}ms "
+            f"hit={res['shared_hit']:<8} read={res['shared_read']:<8} "
+            f"rows={res['rows']:<8} {res['node']}"
+        )
+    conn.close()
+
+    dataset = {"tickers": len(tickers), "years": ns.years, "range_days": ns.range_days}
+    out_path = logs_dir() / "query_bench.jsonl"
+    regressions = _regressions(results, _previous_run(out_path, dataset), ns.tolerance)
+    with out_path.open("a", encoding="utf-8") as fh:
+        fh.write(json.dumps({"ts": datetime.now().isoformat(timespec="seconds"), "dataset": dataset, "results": results}) + "\n")
+
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
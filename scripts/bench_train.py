@@ -0,0 +1,110 @@
+"""
+Benchmark of the runtime options of NNDirectionsTrainer, see the runtime
+section of NNDirectionsConfig.
+
+Trains on the same synthetic returns (a few market factors plus noise,
+seeded, so every run sees the same data and batches) once per configuration
+and thread count, and reports from NNDirectionsTrainer.history the time of
+the first epoch (which pays for torch.compile) and the median time and
+samples per second of the others. Each run is a fresh process, so the
+inter-op thread count can be set and one compile does not warm up the next.
+
+Configurations:
+- log1: eager, loss read every step (the old loop)
+- eager: eager, loss read every 50 steps
+- bf16: eager with bf16 autocast
+- compile: torch.compile'd model
+- compile-bf16: both
+
+Usage:
+    python scripts/bench_train.py --days 1260 --tickers 2000 --factors 20 --threads 1,4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CONFIGS: dict[str, dict] = {
+    "log1": {"log_every": 1},
+    "eager": {},
+    "bf16": {"bf16_autocast": True},
+    "compile": {"compile": True},
+    "compile-bf16": {"compile": True, "bf16_autocast": True},
+}
+
+
+def _child(args: dict) -> int:
+    """
+    One measured run, prints the epoch statistics as JSON
+    """
+    import numpy as np
+    import pandas as pd
+    import torch
+
+    from trilobite.analysis.trainers.nn_direction import NNDirectionsConfig, NNDirectionsTrainer
+
+    rng = np.random.default_rng(args["seed"])
+    F = rng.standard_normal((args["days"], 10)) * 0.01
+    X = F @ rng.standard_normal((10, args["tickers"])) + rng.standard_normal((args["days"], args["tickers"])) * 0.015
+    index = pd.bdate_range("2020-01-01", periods=args["days"])
+    returns = pd.DataFrame(X, index=index, columns=[f"T{i:05d}" for i in range(args["tickers"])])
+
+    torch.manual_seed(args["seed"])
+    cfg = NNDirectionsConfig(
+        n_factors=args["factors"],
+        lookback=args["lookback"],
+        epochs=args["epochs"],
+        batch_size=args["batch_size"],
+        num_threads=args["threads"],
+        num_interop_threads=args["threads"],
+        **CONFIGS[args["config"]],
+    )
+    trainer = NNDirectionsTrainer(cfg)
+    trainer.fit(returns)
+    print(json.dumps([(s.seconds, s.samples, s.loss) for s in trainer.history]))
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    if argv[:1] == ["--child"]:
+        return _child(json.loads(argv[1]))
+    p = argparse.ArgumentParser(prog="bench_train")
+    p.add_argument("--days", type=int, default=1260, help="Rows of the returns matrix, about 5 years")
+    p.add_argument("--tickers", type=int, default=2000)
+    p.add_argument("--factors", type=int, default=20)
+    p.add_argument("--lookback", type=int, default=60)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--epochs", type=int, default=4, help="Epochs per run, the first is reported apart")
+    p.add_argument("--threads", default=f"1,{os.cpu_count() or 1}", help="Comma separated thread counts")
+    p.add_argument("--configs", default=",".join(CONFIGS), help=f"Comma separated, of {', '.join(CONFIGS)}")
+    p.add_argument("--seed", type=int, default=7)
+    ns = p.parse_args(argv)
+
+    print(f"{'config':<13} {'threads':>7} {'1st epoch':>10} {'epoch':>9} {'samples/s':>10} {'loss':>8}")
+    for name in ns.configs.split(","):
+        for threads in sorted({int(t) for t in ns.threads.split(",")}):
+            args = {
+                "config": name, "threads": threads, "days": ns.days, "tickers": ns.tickers, "factors": ns.factors,
+                "lookback": ns.lookback, "batch_size": ns.batch_size, "epochs": ns.epochs, "seed": ns.seed,
+            }
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", json.dumps(args)],
+                capture_output=True, text=True,
+            )
+            if out.returncode != 0:
+                print(f"{name:<13} {threads:>7} failed: {out.stderr.strip().splitlines()[-1]}")
+                continue
+            history = json.loads(out.stdout.strip().splitlines()[-1])
+            first, rest = history[0], history[1:] or history
+            seconds = statistics.median(s for s, _, _ in rest)
+            rate = statistics.median(n / s for s, n, _ in rest)
+            print(f"{name:<13} {threads:>7} {first[0]:>9.2f}s {seconds:>8.2f}s {rate:>10.0f} {history[-1][2]:>8.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+import torch
+from pandas import DataFrame
+
+from trilobite.analysis.sharedmatrix import SharedMatrix, SharedMatrixRef, attach
+from trilobite.analysis.trainers.base import Prediction
+from trilobite.analysis.trainers.nn_direction import NNDirectionsConfig, NNDirectionsTrainer
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ("expanding", "rolling")
+
+#Trading days per year, for the annualized long/short Sharpe ratio
+YEAR_DAYS = 252
+
+
+@dataclass(frozen=True)
+class BacktestSpec:
+    """
+    Walk-forward backtest settings.
+
+    Attributes
+    ----------
+    window:
+        "expanding" trains every fold on all the rows before its test dates,
+        "rolling" on the last train_days of them.
+    train_days:
+        Rows of the first fold's training set, and of every training set
+        when rolling.
+    refit_every:
+        Test dates of a fold, the model is refitted after as many days.
+    top_n:
+        Tickers in each leg of the top-N long/short returns.
+    workers:
+        Folds trained at the same time, each in its own process. 1 runs the
+        folds in this process, None uses one process per CPU.
+    batch_size:
+        Windows per forward pass when scoring, see
+        NNDirectionsTrainer.score_dates.
+    seed:
+        Plus the fold number, of each fold's torch initialization, so a
+        fold trains the same whichever worker runs it.
+    """
+    window: str = "expanding"
+    train_days: int = 504
+    refit_every: int = 63
+    top_n: int = 20
+    workers: int | None = 1
+    batch_size: int = 512
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.window not in WINDOWS:
+            raise ValueError(f"window must be one of {WINDOWS}, got {self.window!r}")
+        if self.refit_every <= 0:
+            raise ValueError("refit_every must be > 0")
+        if self.top_n <= 0:
+            raise ValueError("top_n must be > 0")
+
+
+@dataclass(frozen=True)
+class Fold:
+    """
+    One refit of the walk-forward backtest, as row positions of the returns
+    matrix (half-open ranges).
+
+    Attributes
+    ----------
+    number:
+        Position of the fold, from 0.
+    train_lo, train_hi:
+        Rows the model is fitted on.
+    test_lo, test_hi:
+        Rows scored with that model, each predicting the return horizon
+        rows later. test_lo == train_hi, so no fold trains on a day after
+        the ones it scores.
+    """
+    number: int
+    train_lo: int
+    train_hi: int
+    test_lo: int
+    test_hi: int
+
+
+@dataclass(frozen=True)
+class FoldStats:
+    """
+    Training statistics of a finished fold.
+
+    Attributes
+    ----------
+    fold:
+        The fold.
+    seconds:
+        Wall time of the fit and the scoring, in the worker.
+    loss:
+        Training loss of the last epoch.
+    """
+    fold: Fold
+    seconds: float
+    loss: float
+
+
+def plan_folds(n_rows: int, spec: BacktestSpec, *, lookback: int, horizon: int) -> list[Fold]:
+    """
+    Splits the rows of a returns matrix into walk-forward folds. The test
+    dates run from row train_days to the last row with a realized return
+    horizon rows later.
+
+    Params:
+    - n_rows: rows of the returns matrix
+    - spec: window and refit settings
+    - lookback, horizon: of the trainer, a training set needs more than
+    lookback + horizon rows
+
+    Returns:
+    - the folds, in date order
+    """
+    if spec.train_days <= lookback + horizon:
+        raise ValueError(f"train_days ({spec.train_days}) must be > lookback + horizon ({lookback + horizon})")
+    end = n_rows - horizon
+    if end <= spec.train_days:
+        raise ValueError(f"Need more than {spec.train_days + horizon} rows of returns to backtest, got {n_rows}")
+    folds = []
+    for number, test_lo in enumerate(range(spec.train_days, end, spec.refit_every)):
+        train_lo = 0 if spec.window == "expanding" else test_lo - spec.train_days
+        folds.append(Fold(number, train_lo, test_lo, test_lo, min(test_lo + spec.refit_every, end)))
+    return folds
+
+
+def direction_metrics(probs: np.ndarray, realized: np.ndarray, *, top_n: int) -> DataFrame:
+    """
+    Scores the predictions of every date at once.
+
+    - hit_rate: share of tickers where p_up > 0.5 matches the direction of
+    the realized return
+    - auc: probability that a ticker that went up is ranked above one that
+    did not (Mann-Whitney, ties counted half), NaN on a date where every
+    ticker moved the same way
+    - long, short: equal weight simple return of the top_n tickers of
+    Prediction.ranked, and of the top_n at the bottom of it
+    - long_short: long - short
+
+    Params:
+    - probs: (dates, tickers) up probabilities
+    - realized: (dates, tickers) log returns the probabilities predict
+
+    Returns:
+    - the metrics, one row per date
+    """
+    if probs.shape != realized.shape:
+        raise ValueError(f"probs {probs.shape} and realized {realized.shape} differ in shape")
+    D, N = probs.shape
+    top_n = min(top_n, N // 2)
+    up = realized > 0.0
+    hit = ((probs > 0.5) == up).mean(axis=1)
+
+    #Average ranks of the ties, as pandas.Series.rank would give them
+    ranks = DataFrame(probs).rank(axis=1).to_numpy()
+    n_up = up.sum(axis=1)
+    n_down = N - n_up
+    with np.errstate(divide="ignore", invalid="ignore"):
+        auc = (np.where(up, ranks, 0.0).sum(axis=1) - n_up * (n_up + 1) / 2.0) / (n_up * n_down)
+    auc[(n_up == 0) | (n_down == 0)] = np.nan
+
+    #Same order as Prediction.ranked, highest p_up first
+    order = np.argsort(-probs, axis=1, kind="stable")
+    simple = np.expm1(realized)
+    long = np.take_along_axis(simple, order[:, :top_n], axis=1).mean(axis=1)
+    short = np.take_along_axis(simple, order[:, N - top_n :], axis=1).mean(axis=1)
+    return DataFrame({"hit_rate": hit, "auc": auc, "long": long, "short": short, "long_short": long - short})
+
+
+@dataclass(frozen=True)
+class BacktestResult:
+    """
+    Out-of-sample predictions and scores of a walk-forward backtest.
+
+    Attributes
+    ----------
+    probs:
+        (dates, tickers) up probabilities, each from the fold that scored
+        the date.
+    daily:
+        direction_metrics of every date.
+    folds:
+        Statistics of every fold, in date order.
+    """
+    probs: DataFrame
+    daily: DataFrame
+    folds: list[FoldStats]
+
+    def prediction(self, date: pd.Timestamp) -> Prediction:
+        return Prediction(date=pd.Timestamp(date), probs_up=self.probs.loc[date].rename("p_up"))
+
+    def summary(self) -> pd.Series:
+        """
+        Means of the daily metrics, and the annualized Sharpe ratio of the
+        long/short returns
+        """
+        d = self.daily
+        ls = d["long_short"]
+        std = ls.std()
+        return pd.Series({
+            "days": len(d),
+            "folds": len(self.folds),
+            "hit_rate": d["hit_rate"].mean(),
+            "auc": d["auc"].mean(),
+            "long": d["long"].mean(),
+            "short": d["short"].mean(),
+            "long_short": ls.mean(),
+            "long_short_sharpe": ls.mean() / std * np.sqrt(YEAR_DAYS) if std > 0 else np.nan,
+        })
+
+
+def worker_config(cfg: NNDirectionsConfig, workers: int) -> NNDirectionsConfig:
+    """
+    cfg for one of workers processes training at the same time: an equal
+    share of the CPUs as torch threads, unless cfg sets num_threads, and
+    one inter-op thread
+    """
+    threads = cfg.num_threads or max(1, (os.cpu_count() or 1) // workers)
+    return replace(cfg, num_threads=threads, num_interop_threads=1)
+
+
+def process_pool(workers: int, initializer: Callable[..., None], initargs: tuple) -> ProcessPoolExecutor:
+    """
+    Pool of spawned worker processes, forking a process that has started
+    torch's thread pools can hang
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+
+class WalkForwardBacktest:
+    """
+    Walk-forward backtest of NNDirectionsTrainer: every fold fits a new
+    trainer (PCA and GRU) on its training rows and scores its test dates
+    in batches with score_dates, then the predictions of all folds are
+    scored against the realized returns.
+
+    With more than one worker the folds run in a spawned process pool. The
+    returns matrix is copied once into shared memory, which every worker
+    maps instead of receiving a pickled copy, and the workers write their
+    predictions into a second shared array, so only the fold positions and
+    statistics are sent between the processes. The workers' torch threads
+    are limited by worker_config.
+
+    Params:
+    - returns_wide: (dates, tickers) log returns without NaNs
+    - trainer_cfg: settings of every fold's trainer
+    - spec: backtest settings
+    """
+    def __init__(self, returns_wide: DataFrame, trainer_cfg: NNDirectionsConfig, spec: BacktestSpec) -> None:
+        if returns_wide.isna().any().any():
+            raise ValueError("returns_wide contains NaNs (v1 requires no NaNs)")
+        self._returns = returns_wide
+        self._cfg = trainer_cfg
+        self._spec = spec
+        self._folds = plan_folds(len(returns_wide), spec, lookback=trainer_cfg.lookback, horizon=trainer_cfg.horizon)
+        self._probs: np.ndarray | None = None
+        self._stats: list[FoldStats] = []
+
+    @property
+    def folds(self) -> list[Fold]:
+        return list(self._folds)
+
+    def workers(self) -> int:
+        """
+        Processes the folds run in, at most one per fold
+        """
+        w = self._spec.workers or os.cpu_count() or 1
+        return max(1, min(w, len(self._folds)))
+
+    def run(self) -> Iterator[FoldStats]:
+        """
+        Runs the folds, yielding the statistics of each as it finishes (not
+        in fold order when parallel). Call result() afterwards.
+        """
+        R = self._returns.to_numpy()
+        T, N = R.shape
+        workers = self.workers()
+        self._stats = []
+        if workers == 1:
+            probs = np.full((T, N), np.nan, dtype=np.float32)
+            _attach(R, probs, self._returns.index, self._returns.columns, self._cfg, self._spec)
+            try:
+                for fold in self._folds:
+                    st = _run_fold(fold)
+                    self._stats.append(st)
+                    yield st
+            finally:
+                _detach()
+            self._probs = probs
+            return
+
+        cfg = worker_config(self._cfg, workers)
+        with SharedMatrix.from_array(R) as shared_r, SharedMatrix((T, N), np.float32, fill=np.nan) as shared_p:
+            initargs = (shared_r.ref, shared_p.ref, self._returns.index.to_numpy(), list(self._returns.columns), cfg, self._spec)
+            with process_pool(workers, _init_worker, initargs) as ex:
+                futures = [ex.submit(_run_fold, fold) for fold in self._folds]
+                for f in as_completed(futures):
+                    st = f.result()
+                    self._stats.append(st)
+                    yield st
+            self._probs = shared_p.array.copy()
+
+    def result(self) -> BacktestResult:
+        """
+        Returns the predictions and their scores, after run()
+        """
+        if self._probs is None:
+            raise RuntimeError("Backtest not run. Call run() first.")
+        lo, hi = self._folds[0].test_lo, self._folds[-1].test_hi
+        h = self._cfg.horizon
+        probs = self._probs[lo:hi]
+        R = self._returns.to_numpy()
+        daily = direction_metrics(probs, R[lo + h : hi + h], top_n=self._spec.top_n)
+        index = self._returns.index[lo:hi]
+        daily.index = index
+        return BacktestResult(
+            probs=DataFrame(probs, index=index, columns=self._returns.columns, copy=False),
+            daily=daily,
+            folds=sorted(self._stats, key=lambda s: s.fold.number),
+        )
+
+
+#State of the process running folds, set by _attach
+_worker: dict = {}
+
+
+def _attach(R: np.ndarray,
+            probs: np.ndarray,
+            index: pd.Index,
+            columns: list[str],
+            cfg: NNDirectionsConfig,
+            spec: BacktestSpec,
+            shms: tuple[SharedMemory, ...] = (),
+            ) -> None:
+    _worker.update(
+        returns=DataFrame(R, index=index, columns=columns, copy=False),
+        probs=probs, cfg=cfg, spec=spec, shms=shms,
+    )
+
+
+def _detach() -> None:
+    for shm in _worker.get("shms", ()):
+        shm.close()
+    _worker.clear()
+
+
+def _init_worker(r_ref: SharedMatrixRef,
+                 p_ref: SharedMatrixRef,
+                 index: np.ndarray,
+                 columns: list[str],
+                 cfg: NNDirectionsConfig,
+                 spec: BacktestSpec,
+                 ) -> None:
+    shm_r, R = attach(r_ref, readonly=True)
+    shm_p, probs = attach(p_ref)
+    _attach(R, probs, pd.DatetimeIndex(index), columns, cfg, spec, (shm_r, shm_p))
+
+
+def _run_fold(fold: Fold) -> FoldStats:
+    """
+    Fits a trainer on the fold's training rows and writes the predictions
+    of its test rows into the shared predictions
+    """
+    t0 = time.perf_counter()
+    rets: DataFrame = _worker["returns"]
+    cfg: NNDirectionsConfig = _worker["cfg"]
+    spec: BacktestSpec = _worker["spec"]
+    torch.manual_seed(spec.seed + fold.number)
+    trainer = NNDirectionsTrainer(cfg)
+    trainer.fit(rets.iloc[fold.train_lo : fold.train_hi])
+    #The windows of the test dates start lookback - 1 rows before them
+    scored = trainer.score_dates(rets.iloc[fold.test_lo - cfg.lookback + 1 : fold.test_hi], batch_size=spec.batch_size)
+    _worker["probs"][fold.test_lo : fold.test_hi] = scored.to_numpy()
+    seconds = time.perf_counter() - t0
+    loss = trainer.history[-1].loss if trainer.history else float("nan")
+    logger.debug(f"Fold {fold.number} rows {fold.train_lo}:{fold.train_hi} -> {fold.test_lo}:{fold.test_hi} in {seconds:.1f}s")
+    return FoldStats(fold=fold, seconds=seconds, loss=loss)
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Tuple
+from typing import TYPE_CHECKING, Iterator, Tuple
 
 import numpy as np
 import pandas as pd
 import torch
 from pandas import DataFrame
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Sampler
+
+if TYPE_CHECKING:
+    from trilobite.analysis.memmapdataset import MemmapFactorDataset
 
 
 @dataclass(frozen=True)
@@ -32,14 +35,18 @@ def make_direction_labels(returns_wide: DataFrame, *, horizon: int = 1) -> DataF
 
     Output DataFrame has same columns as returns_wide (tickers).
     Last `horizon` rows are dropped.
+
+    The comparison is written straight into the float32 output, which is
+    the only copy made.
     """
     _assert_matrix(returns_wide, name="returns_wide")
     if horizon <= 0:
         raise ValueError("horizon must be > 0")
 
-    future = returns_wide.shift(-horizon)
-    y = (future > 0.0).astype(np.float32)
-    return y.iloc[:-horizon]
+    R = returns_wide.to_numpy()
+    y = np.empty((max(len(R) - horizon, 0), R.shape[1]), dtype=np.float32)
+    np.greater(R[horizon:], 0.0, out=y)
+    return DataFrame(y, index=returns_wide.index[: len(y)], columns=returns_wide.columns, copy=False)
 
 
 def _assert_matrix(df: DataFrame, *, name: str) -> None:
@@ -87,7 +94,7 @@ class FactorWindowDirectionDataset(Dataset[Tuple[torch.Tensor, torch.Tensor]]):
         if not factors.index.equals(returns_wide.index):
             raise ValueError("factors and returns_wide must have identical date index in v1")
 
-        f_df = factors.loc[y_df.index]
+        f_df = factors.iloc[: len(y_df)]
 
         self._tickers = list(returns_wide.columns)
         self._factor_names = list(f_df.columns)
@@ -95,9 +102,10 @@ class FactorWindowDirectionDataset(Dataset[Tuple[torch.Tensor, torch.Tensor]]):
 
         self._lookback = spec.lookback
 
-        # Convert to tensors
-        self._X = torch.from_numpy(f_df.to_numpy(dtype=np.float32))     # (T', K)
-        self._y = torch.from_numpy(y_df.to_numpy(dtype=np.float32))     # (T', N)
+        # Convert to tensors. The labels are float32 already, but pandas hands
+        # out read-only views, which torch can not share, so those are copied
+        self._X = torch.from_numpy(np.require(f_df.to_numpy(dtype=np.float32), requirements=["C", "W"]))  # (T', K)
+        self._y = torch.from_numpy(np.require(y_df.to_numpy(dtype=np.float32), requirements=["C", "W"]))  # (T', N)
 
         # Need enough rows for at least 1 sample
         self._n_samples = len(self._dates) - (self._lookback - 1)
@@ -107,6 +115,13 @@ class FactorWindowDirectionDataset(Dataset[Tuple[torch.Tensor, torch.Tensor]]):
                 f"Need at least {spec.lookback + spec.horizon} rows total."
             )
 
+        # Every sample as a view, no copies: windows[idx] == self[idx][0].
+        # Consecutive windows overlap, one row (K values) apart, and a gather
+        # from this layout comes out contiguous as (B, lookback, K)
+        K = self._X.shape[1]
+        self._windows = self._X.contiguous().as_strided((self._n_samples, self._lookback, K), (K, K, 1))
+        self._y_samples = self._y[self._lookback - 1 :]                   # (n_samples, N)
+
     @property
     def tickers(self) -> list[str]:
         return self._tickers
@@ -131,3 +146,75 @@ class FactorWindowDirectionDataset(Dataset[Tuple[torch.Tensor, torch.Tensor]]):
         y = self._y[i, :]                                  # (N,)
         return x, y
 
+    def batch(self, idx: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Gathers a whole batch of samples at once.
+
+        All windows are a strided view over the factor rows (as_strided, no
+        copy), so a batch is one fancy-index gather per tensor instead of a
+        slice per sample and a torch.stack.
+
+        Returns:
+        - X: (B, lookback, K), y: (B, N)
+        """
+        x = self._windows[idx]  # (B, lookback, K)
+        y = self._y_samples[idx]  # (B, N)
+        return x, y
+
+
+class WindowBatchSampler(Sampler[torch.Tensor]):
+    """
+    Yields the sample indices of whole batches, for DataLoader(sampler=...,
+    batch_size=None) over a dataset whose __getitem__ takes index tensors,
+    see BatchedWindows.
+    """
+
+    def __init__(
+        self,
+        n_samples: int,
+        batch_size: int,
+        *,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        generator: torch.Generator | None = None,
+    ) -> None:
+        if batch_size <= 0:
+            raise ValueError("batch_size must be > 0")
+        self._n = n_samples
+        self._batch_size = batch_size
+        self._shuffle = shuffle
+        self._drop_last = drop_last
+        self._generator = generator
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        if self._shuffle:
+            order = torch.randperm(self._n, generator=self._generator)
+        else:
+            order = torch.arange(self._n)
+        for batch in order.split(self._batch_size):
+            if self._drop_last and len(batch) < self._batch_size:
+                return
+            yield batch
+
+    def __len__(self) -> int:
+        if self._drop_last:
+            return self._n // self._batch_size
+        return -(-self._n // self._batch_size)
+
+
+class BatchedWindows(Dataset[Tuple[torch.Tensor, torch.Tensor]]):
+    """
+    Batched view of a FactorWindowDirectionDataset or MemmapFactorDataset:
+    indexed with a tensor of sample indices (from WindowBatchSampler) it 
+    returns the whole batch.
+    """
+
+    def __init__(self, ds: FactorWindowDirectionDataset | MemmapFactorDataset) -> None:
+        self._ds = ds
+
+    def __len__(self) -> int:
+        return len(self._ds)
+
+    def __getitem__(self, idx: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self._ds.batch(idx)
+
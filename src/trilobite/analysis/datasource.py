@@ -2,31 +2,61 @@ from __future__ import annotations
 
 from datetime import date, timedelta
 import logging
+from typing import Iterator, Sequence
+import numpy as np
+import pandas as pd
 from pandas import DataFrame
+from trilobite.db.duck.repo import DuckMarketRepo
+from trilobite.analysis.features import check_dtype, compact_rows
 from trilobite.db.repo import MarketRepo
+from trilobite.db.screen import FULL_COVERAGE, Screen
+from trilobite.mirror.mirror import ColumnarMirror
 from trilobite.utils.utils import period_to_date
 
 logger = logging.getLogger(__name__)
 
 class MarketDataSource:
-    def __init__(self, repo: MarketRepo) -> None:
+    """
+    Loads analysis matrices from the DB, or from the local columnar mirror 
+    when one is given and has been synced.
+
+    The matrices are of dtype, "float64" or "float32", and every load 
+    builds its matrix once, in that dtype, straight from the long rows or
+    the mapped mirror file.
+    """
+    def __init__(self,
+                 repo: MarketRepo | DuckMarketRepo,
+                 mirror: ColumnarMirror | None = None,
+                 *,
+                 dtype: str = "float64",
+                 ) -> None:
         self._repo = repo
+        self._mirror = mirror
+        self._dtype = check_dtype(dtype)
+
+    @property
+    def dtype(self) -> str:
+        return self._dtype.name
 
 
     def load_adjclose_matrix(self,
                              *,
                              period: str,
                              end_date: date | None = None,
+                             screen: Screen | None = None,
                              ) -> DataFrame:
         """
-        Loads the matrix for all adjclose values
+        Loads the matrix for all adjclose values of the tickers that pass the
+        screen, evaluated in the DB so only those tickers are fetched. 
+        Defaults to full coverage over the period, where any ticker with a
+        missing price is dropped. Only with a screen that allows gaps (see 
+        Screen.allows_gaps) are missing days forward filled, and tickers 
+        without a price on the first day of the period dropped.
         """
         #tickers = self._repo.list_tickers_with_min_ohlcv_days(period, end_date=end_date)
 
         if end_date is None:
-            end_date = self._repo._scalar("SELECT CURRENT_DATE;")
-            if end_date is None:
-                raise RuntimeError("DB returned NULL for CURRENT_DATE")
+            end_date = self._repo.current_date()
             # with self._repo.conn.cursor() as cur:
             #     cur.execute("SELECT CURRENT_DATE;")
             #     (end_date_db,) = cur.fetchone()
@@ -37,16 +67,241 @@ class MarketDataSource:
         if start_date is None:
             raise ValueError("No start date")
 
-        tickers = self._repo.list_tickers_with_full_ohlcv_coverage(period, end_date=end_date)
+        if self._mirror is not None and self._mirror.exists:
+            return self._load_adjclose_matrix_from_mirror(start_date, end_date, screen=screen)
+
+        tickers = self._repo.screen_tickers(screen or FULL_COVERAGE, start_date=start_date, end_date=end_date)
         if not tickers:
             return DataFrame()
 
         long_df = self._repo.fetch_adjclose_long(tickers, start_date=start_date, end_date=end_date)
         logger.debug(f"Long df rows: {len(long_df)}")
+        if long_df.empty:
+            return DataFrame()
 
-        wide = long_df.pivot(index="date", columns="ticker", values="adjclose").sort_index()
-        logger.debug(f"Wide before dropna: {wide.shape}")
-        wide = wide.dropna(axis=1)
-        logger.debug(f"Wide after dropna(axis=1): {wide.shape}")
+        if not (screen or FULL_COVERAGE).allows_gaps:
+            wide = _long_to_wide(long_df, "adjclose", columns=tickers, dtype=self._dtype, fill=np.nan)
+            logger.debug(f"Wide before dropna: {wide.shape}")
+            wide = wide.dropna(axis=1)
+            logger.debug(f"Wide after dropna(axis=1): {wide.shape}")
+            return wide
+
+        #Forward filling leaves NaN only before a ticker's first price, so the
+        #tickers kept are those with a price on the first day
+        first = long_df["date"].min()
+        first_day = long_df.loc[(long_df["date"] == first) & long_df["adjclose"].notna(), "ticker"]
+        wide = _long_to_wide(long_df, "adjclose", columns=sorted(first_day), dtype=self._dtype, fill=np.nan)
+        wide.ffill(inplace=True)
+        logger.debug(f"Wide after coverage filter: {wide.shape}")
         return wide
 
+    def load_returns_matrix(self,
+                            *,
+                            period: str,
+                            end_date: date | None = None,
+                            screen: Screen | None = None,
+                            ) -> DataFrame:
+        """
+        Loads the matrix of daily log returns for the tickers that pass the
+        screen (full coverage over the period by default), read from 
+        returns_daily. Unlike 
+        prices_to_log_returns on the adjclose matrix, the first day of the 
+        period keeps its return, since the stored returns are taken against 
+        the day before the period. Dates where any ticker has no valid return
+        are dropped, like prices_to_log_returns does. Days a ticker has no row
+        are 0, the return over the gap is stored on its next row, and tickers 
+        without a return on the first day are dropped.
+
+        With a synced mirror the same matrix is computed from the mirrored
+        adjclose instead, see _mirror_returns.
+        """
+        if end_date is None:
+            end_date = self._repo.current_date()
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        if start_date is None:
+            raise ValueError("No start date")
+
+        if self._mirror is not None and self._mirror.exists:
+            return self._mirror_returns(start_date, end_date, screen=screen)
+
+        tickers = self._repo.screen_tickers(screen or FULL_COVERAGE, start_date=start_date, end_date=end_date)
+        if not tickers:
+            return DataFrame()
+
+        long_df = self._repo.fetch_logret_long(tickers, start_date=start_date, end_date=end_date)
+        logger.debug(f"Long df rows: {len(long_df)}")
+        long_df = _drop_invalid_dates(long_df)
+        if long_df.empty:
+            return DataFrame()
+        #Tickers starting after the first day are dropped, like the adjclose matrix
+        first = long_df["date"].min()
+        columns = sorted(long_df.loc[long_df["date"] == first, "ticker"])
+        wide = _long_to_wide(long_df, "logret", columns=columns, dtype=self._dtype, fill=0.0)
+        logger.debug(f"Wide after dropna(axis=0): {wide.shape}")
+        return wide
+
+    def iter_returns_chunks(self,
+                            *,
+                            period: str,
+                            end_date: date | None = None,
+                            screen: Screen | None = None,
+                            chunk_days: int = 365,
+                            ) -> Iterator[DataFrame]:
+        """
+        The returns matrix of load_returns_matrix in consecutive date chunks
+        of chunk_days calendar days, for building datasets that do not fit
+        in memory. Every chunk has the same columns: the screened tickers 
+        with a return on the first valid day of the period, decided by the 
+        first chunk.
+
+        With a synced mirror the whole matrix is loaded from it (the mirror
+        is mapped from disk) and yielded in chunks.
+        """
+        if end_date is None:
+            end_date = self._repo.current_date()
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        if start_date is None:
+            raise ValueError("No start date")
+
+        if self._mirror is not None and self._mirror.exists:
+            wide = self._mirror_returns(start_date, end_date, screen=screen)
+            #About chunk_days calendar days of trading days
+            rows = max(chunk_days * 5 // 7, 1)
+            for lo in range(0, len(wide), rows):
+                yield wide.iloc[lo : lo + rows]
+            return
+
+        tickers = self._repo.screen_tickers(screen or FULL_COVERAGE, start_date=start_date, end_date=end_date)
+        if not tickers:
+            return
+        columns = None
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+            long_df = self._repo.fetch_logret_long(tickers, start_date=chunk_start, end_date=chunk_end)
+            chunk_start = chunk_end + timedelta(days=1)
+            long_df = _drop_invalid_dates(long_df)
+            if long_df.empty:
+                continue
+            if columns is None:
+                #Tickers starting after the first day are dropped, like load_returns_matrix
+                first = long_df["date"].min()
+                columns = sorted(long_df.loc[long_df["date"] == first, "ticker"])
+            yield _long_to_wide(long_df, "logret", columns=columns, dtype=self._dtype, fill=0.0)
+
+    def _mirror_returns(self, start_date: date, end_date: date, *, screen: Screen | None = None) -> DataFrame:
+        """
+        Mirror path of load_returns_matrix, the matrix the DB path reads from
+        returns_daily computed from the mapped adjclose file. Each return is
+        taken against the ticker's previous row, for the first day of the 
+        period a row before it, and the dates, tickers and zero filled days
+        then follow the DB path. A row is a day with an adjclose or a close,
+        so a row without an adjclose drops its date like a NULL logret.
+        """
+        assert self._mirror is not None
+        adj = self._mirror.frame("adjclose", end_date=end_date)
+        if adj.empty:
+            return DataFrame()
+        a = int(adj.index.searchsorted(pd.Timestamp(start_date)))
+        px = adj.to_numpy()
+        if screen is not None and not screen.is_full_coverage_only:
+            tickers = self._repo.screen_tickers(screen, start_date=start_date, end_date=end_date)
+            cols = np.flatnonzero(adj.columns.isin(tickers))
+        else:
+            cols = np.flatnonzero(~np.isnan(px[a:]).any(axis=0)) if a < len(px) else np.empty(0, dtype=np.intp)
+        cols = cols[np.argsort(adj.columns[cols])]
+        if a == len(px) or len(cols) == 0:
+            return DataFrame()
+
+        px = np.take(px, cols, axis=1)
+        close = np.take(self._mirror.frame("close", end_date=end_date).to_numpy(), cols, axis=1)
+        row = ~(np.isnan(px) & np.isnan(close))
+        #Position of each ticker's previous row on every day, -1 before its first
+        last = np.where(row, np.arange(len(px))[:, None], -1)
+        np.maximum.accumulate(last, axis=0, out=last)
+        prev = np.vstack([np.full((1, len(cols)), -1), last[:-1]])[a:]
+        prev_px = px[np.maximum(prev, 0), np.arange(len(cols))]
+        cur = px[a:]
+        has = row[a:] & (prev >= 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rets = np.log(cur / prev_px)
+        #NaN prices compare False, like a NULL logret
+        valid = (cur > 0.0) & (prev_px > 0.0)
+
+        #Dates without a row are not in returns_daily, dates with an invalid return are dropped
+        keep = has.any(axis=1) & ~(has & ~valid).any(axis=1)
+        if not keep.any():
+            return DataFrame()
+        rets, has = rets[keep], has[keep]
+        #Tickers starting after the first day are dropped
+        first = has[0]
+        out = np.where(has[:, first], rets[:, first], 0.0).astype(self._dtype, copy=False)
+        wide = DataFrame(out, index=adj.index[a:][keep], columns=adj.columns[cols][first], copy=False)
+        logger.debug(f"Mirror returns: {wide.shape}")
+        return wide
+
+    def _load_adjclose_matrix_from_mirror(self,
+                                          start_date: date,
+                                          end_date: date,
+                                          *,
+                                          screen: Screen | None = None,
+                                          ) -> DataFrame:
+        """
+        Mirror path of load_adjclose_matrix. The window is a view on the mapped
+        adjclose file, and a ticker with full coverage is a column without NaN
+        in it, so the only copy made is the selection of those columns (in 
+        ticker order, like the DB path), gathered straight into the dtype of
+        the source. Any other screen is still evaluated in the DB, and the 
+        window is forward filled like the DB path when the screen allows gaps.
+        """
+        assert self._mirror is not None
+        window = self._mirror.frame("adjclose", start_date=start_date, end_date=end_date)
+        logger.debug(f"Mirror window: {window.shape}")
+        if window.empty:
+            return DataFrame()
+        if screen is not None and not screen.is_full_coverage_only:
+            tickers = self._repo.screen_tickers(screen, start_date=start_date, end_date=end_date)
+            window = window.loc[:, window.columns.isin(tickers)]
+            if screen.allows_gaps:
+                window = window.ffill()
+        values = window.to_numpy()
+        full = np.flatnonzero(~np.isnan(values).any(axis=0))
+        full = full[np.argsort(window.columns[full])]
+        out = np.empty((values.shape[0], len(full)), dtype=self._dtype)
+        #mode="clip" writes into out directly, "raise" buffers a copy first
+        np.take(values, full, axis=1, out=out, mode="clip")
+        wide = DataFrame(out, index=window.index, columns=window.columns[full], copy=False)
+        logger.debug(f"Wide after coverage filter: {wide.shape}")
+        return wide
+
+
+def _drop_invalid_dates(long_df: DataFrame) -> DataFrame:
+    """
+    Drops the rows of the dates where any ticker has no valid logret
+    """
+    invalid = long_df["logret"].isna()
+    if not invalid.any():
+        return long_df
+    return long_df.loc[~long_df["date"].isin(long_df.loc[invalid, "date"].unique())]
+
+
+def _long_to_wide(long_df: DataFrame,
+                  values: str,
+                  *,
+                  columns: Sequence[str],
+                  dtype: np.dtype,
+                  fill: float,
+                  ) -> DataFrame:
+    """
+    Pivots (ticker, date, values) rows to a (dates x columns) matrix of dtype,
+    with fill where a ticker has no row, like pivot + reindex + fillna but 
+    written into one preallocated array. The dates are all dates of the 
+    rows, sorted, and rows of tickers not in columns are ignored.
+    """
+    date_codes, dates = pd.factorize(long_df["date"], sort=True)
+    columns = pd.Index(columns, name="ticker")
+    col_codes = columns.get_indexer(long_df["ticker"])
+    known = col_codes >= 0
+    out = np.full((len(dates), len(columns)), fill, dtype=dtype)
+    out[date_codes[known], col_codes[known]] = long_df[values].to_numpy()[known]
+    return DataFrame(out, index=pd.DatetimeIndex(dates, name="date"), columns=columns, copy=False)
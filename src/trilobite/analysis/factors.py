@@ -1,12 +1,22 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
 from typing import Optional
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
 
+from trilobite.analysis.features import check_dtype
+
+
+SOLVERS = ("auto", "full", "randomized", "gram")
+#Version of the files written by PCAReturnFactors.save
+STATE_VERSION = 1
+
 
 @dataclass(frozen=True)
 class FactorSpec:
@@ -21,9 +31,73 @@ class FactorSpec:
         If True, standardize each ticker return series by its training-period
         std dev (and mean-center always). This can help when tickers have
         different volatilities. For v1, we keep it simple but include it.
+    solver:
+        How the top components are computed:
+        - "full": thin SVD of the whole (T, N) matrix, exact but computes
+          min(T, N) components to keep n_factors of them
+        - "randomized": randomized SVD (Halko et al.) of a sketch with
+          n_factors + oversamples columns, refined by n_iter power iterations
+        - "gram": eigendecomposition of the smaller of the T x T and N x N
+          Gram matrices. Exact for the leading components, squaring the
+          matrix only costs precision in the small ones that are dropped.
+        - "auto": "full" when n_factors is close to min(T, N), "gram" when
+          the smaller side is at most gram_max_dim, else "randomized"
+    oversamples, n_iter, random_state:
+        Randomized solver settings, the sketch is seeded so fits repeat.
+    gram_max_dim:
+        Largest Gram matrix side "auto" picks the gram solver for.
+    forgetting:
+        Per row decay of the earlier data in partial_fit, 1.0 weighs all
+        rows equally, 0.99 halves the weight of a row in about 69 days.
+    refit_min_overlap:
+        partial_fit recommends a full refit when the subspace overlap with
+        the last full fit (mean squared cosine of the principal angles) falls
+        below this.
+    refit_max_updates:
+        ..or after this many partial_fit calls, the truncation to n_factors
+        components in every update adds up. None never.
+    dtype:
+        Float dtype the returns are centered, scaled, decomposed and
+        projected in, "float64" or "float32". The fitted mean, scale and
+        components are kept as float64 either way.
     """
     n_factors: int = 64
     standardize: bool = False
+    solver: str = "auto"
+    oversamples: int = 10
+    n_iter: int = 4
+    random_state: int | None = 0
+    gram_max_dim: int = 4000
+    forgetting: float = 1.0
+    refit_min_overlap: float = 0.9
+    refit_max_updates: int | None = 250
+    dtype: str = "float64"
+
+
+@dataclass(frozen=True)
+class FactorDrift:
+    """
+    How far partial_fit has moved the factor model since its last full fit.
+
+    Attributes
+    ----------
+    overlap:
+        Mean squared cosine of the principal angles between the current
+        components and those of the last full fit, 1.0 is the same subspace.
+    max_angle_deg:
+        Largest principal angle between the two subspaces.
+    explained_change:
+        Change in the total explained variance ratio since the full fit.
+    updates:
+        partial_fit calls since the full fit.
+    refit:
+        True when a full refit is recommended, see FactorSpec.
+    """
+    overlap: float
+    max_angle_deg: float
+    explained_change: float
+    updates: int
+    refit: bool
 
 
 class PCAReturnFactors:
@@ -41,17 +115,37 @@ class PCAReturnFactors:
     -----
     - Uses SVD on mean-centered (and optionally standardized) returns.
     - Stores parameters needed to transform new data consistently.
+    - fit, partial_fit and transform make one copy of the returns, in
+      spec.dtype, and center and scale it in place.
     """
 
     def __init__(self, spec: Optional[FactorSpec] = None) -> None:
         self.spec = spec or FactorSpec()
         if self.spec.n_factors <= 0:
             raise ValueError("n_factors must be > 0")
+        if self.spec.solver not in SOLVERS:
+            raise ValueError(f"solver must be one of {SOLVERS}, got {self.spec.solver!r}")
+        if not 0.0 < self.spec.forgetting <= 1.0:
+            raise ValueError(f"forgetting must be in (0, 1], got {self.spec.forgetting}")
+        self._dtype = check_dtype(self.spec.dtype)
 
         self._tickers: list[str] = []
         self._mean: np.ndarray | None = None           # (N,)
         self._scale: np.ndarray | None = None          # (N,)
         self._components: np.ndarray | None = None     # (K, N)
+        self._singular_values: np.ndarray | None = None  # (K,)
+        self._solver: str | None = None
+
+        # Running statistics for partial_fit: effective (decayed) row count
+        # and sum of squared deviations from the mean, per ticker
+        self._n_samples: float = 0.0
+        self._m2: np.ndarray | None = None             # (N,)
+        self._last_date: pd.Timestamp | None = None
+
+        # Components and explained variance ratio of the last full fit
+        self._fit_components: np.ndarray | None = None  # (K, N)
+        self._fit_explained: float = 0.0
+        self._updates: int = 0
 
         self._fitted: bool = False
 
@@ -65,36 +159,232 @@ class PCAReturnFactors:
             return self.spec.n_factors
         return int(self._components.shape[0])
 
+    @property
+    def components(self) -> np.ndarray:
+        """
+        Principal directions in ticker space, (K, N)
+        """
+        return _require(self._components)
+
+    @property
+    def solver(self) -> str | None:
+        """
+        Solver used by the last fit, "auto" resolved
+        """
+        return self._solver
+
+    @property
+    def last_date(self) -> pd.Timestamp | None:
+        """
+        Last date of the returns the model was fitted or updated on
+        """
+        return self._last_date
+
+    @property
+    def explained_variance(self) -> np.ndarray:
+        """
+        Variance of the (scaled) returns along each component, (K,)
+        """
+        S = _require(self._singular_values)
+        return S**2 / max(self._n_samples - 1.0, 1.0)
+
+    @property
+    def explained_variance_ratio(self) -> np.ndarray:
+        """
+        Share of the total (scaled) return variance each component explains,
+        (K,)
+        """
+        ev = self.explained_variance
+        m2 = _require(self._m2)
+        scale = _require(self._scale)
+        total = float(np.sum(m2 / scale**2)) / max(self._n_samples - 1.0, 1.0)
+        if total <= 0.0:
+            return np.zeros_like(ev)
+        return ev / total
+
     def fit(self, returns_wide: DataFrame) -> "PCAReturnFactors":
         _assert_returns_matrix(returns_wide)
 
         self._tickers = list(returns_wide.columns)
-        X = returns_wide.to_numpy(dtype=np.float64, copy=True)  # (T, N)
+        Xc = returns_wide.to_numpy(dtype=self._dtype, copy=True)  # (T, N)
 
-        mean = X.mean(axis=0)  # (N,)
-        Xc = X - mean
+        # Statistics are accumulated in float64 whatever the dtype
+        mean = Xc.mean(axis=0, dtype=np.float64)  # (N,)
+        Xc -= mean.astype(self._dtype)
 
+        m2 = np.einsum("ij,ij->j", Xc, Xc, dtype=np.float64)  # (N,)
         if self.spec.standardize:
-            scale = Xc.std(axis=0, ddof=1)
-            # Avoid division by zero for ultra-flat series
-            scale[scale == 0.0] = 1.0
-            Xc = Xc / scale
+            scale = _scale_from(m2, Xc.shape[0])
+            Xc /= scale.astype(self._dtype)
             self._scale = scale
         else:
             self._scale = np.ones(Xc.shape[1], dtype=np.float64)
 
-        # SVD: Xc = U S Vt, where Vt rows are principal directions
-        # We want top K rows of Vt -> (K, N)
-        U, S, Vt = np.linalg.svd(Xc, full_matrices=False)
-
-        K = min(self.spec.n_factors, Vt.shape[0])
-        comps = Vt[:K, :]  # (K, N)
+        K = min(self.spec.n_factors, *Xc.shape)
+        solver = _pick_solver(self.spec, Xc.shape, K)
+        S, comps = _SOLVE[solver](Xc, K, self.spec)  # (K,), (K, N)
 
         self._mean = mean
-        self._components = comps
+        self._components = _flip_signs(comps.astype(np.float64))
+        self._singular_values = S.astype(np.float64)
+        self._solver = solver
+        self._n_samples = float(Xc.shape[0])
+        self._m2 = m2
+        self._last_date = pd.Timestamp(returns_wide.index[-1])
         self._fitted = True
+
+        self._fit_components = self._components
+        self._fit_explained = float(self.explained_variance_ratio.sum())
+        self._updates = 0
+        return self
+
+    def partial_fit(self, returns_wide: DataFrame) -> "PCAReturnFactors":
+        """
+        Updates a fitted model with new rows of returns instead of refitting
+        on the whole history. Falls back to fit() when not fitted yet.
+
+        The mean, the scale and the squared deviations are merged exactly
+        (Chan et al.), and the components come from the SVD of a small
+        matrix: the current components weighted by their singular values,
+        the centered new rows and a mean shift row (incremental PCA, Ross et
+        al.). Variance outside the n_factors kept components is not carried
+        from one update to the next, see drift() for when to refit.
+
+        Rows dated at or before last_date are skipped, so the same returns
+        matrix can be passed again after new days were added to it.
+        """
+        if not self._fitted:
+            return self.fit(returns_wide)
+        _assert_returns_matrix(returns_wide)
+        if list(returns_wide.columns) != self._tickers:
+            raise ValueError(
+                "Ticker columns do not match fitted factor model. "
+                "Ensure consistent ticker set and ordering."
+            )
+        if self._last_date is not None:
+            returns_wide = returns_wide.loc[returns_wide.index > self._last_date]
+        if returns_wide.empty:
+            return self
+
+        Xb = returns_wide.to_numpy(dtype=self._dtype, copy=True)  # (b, N)
+        b = Xb.shape[0]
+        mean_old = _require(self._mean)
+        scale_old = _require(self._scale)
+        comps_old = _require(self._components)
+        S_old = _require(self._singular_values)
+
+        # Decay the earlier rows, then merge the running statistics
+        decay = self.spec.forgetting**b
+        n_old = self._n_samples * decay
+        n = n_old + b
+        mean_b = Xb.mean(axis=0, dtype=np.float64)
+        Xb -= mean_b.astype(self._dtype)
+        delta = mean_b - mean_old
+        mean = mean_old + delta * (b / n)
+        m2 = _require(self._m2) * decay + np.einsum("ij,ij->j", Xb, Xb, dtype=np.float64) + delta**2 * (n_old * b / n)
+
+        if self.spec.standardize:
+            scale = _scale_from(m2, n)
+        else:
+            scale = scale_old
+
+        # Earlier rows as their rank K summary, rescaled to the new scale
+        Xb /= scale.astype(self._dtype)
+        stacked = np.vstack([
+            (S_old * np.sqrt(decay))[:, None] * comps_old * (scale_old / scale)[None, :],
+            Xb,
+            np.sqrt(n_old * b / n) * (delta / scale)[None, :],
+        ], dtype=self._dtype)
+        _U, S, Vt = np.linalg.svd(stacked, full_matrices=False)
+        K = comps_old.shape[0]
+
+        self._mean = mean
+        self._scale = scale
+        self._m2 = m2
+        self._n_samples = n
+        self._singular_values = S[:K].astype(np.float64)
+        self._components = _align_signs(Vt[:K, :].astype(np.float64), comps_old)
+        self._last_date = pd.Timestamp(returns_wide.index[-1])
+        self._updates += 1
         return self
 
+    def drift(self) -> FactorDrift:
+        """
+        Compares the components with those of the last full fit, and
+        recommends a refit when they moved too far or after too many updates
+        """
+        comps = _require(self._components)
+        ref = _require(self._fit_components)
+        cos = np.clip(np.linalg.svd(comps @ ref.T, compute_uv=False), 0.0, 1.0)
+        overlap = float(np.mean(cos**2))
+        max_updates = self.spec.refit_max_updates
+        refit = overlap < self.spec.refit_min_overlap or (max_updates is not None and self._updates >= max_updates)
+        return FactorDrift(
+            overlap=overlap,
+            max_angle_deg=float(np.degrees(np.arccos(cos.min()))),
+            explained_change=float(self.explained_variance_ratio.sum()) - self._fit_explained,
+            updates=self._updates,
+            refit=refit,
+        )
+
+    def save(self, path: Path) -> None:
+        """
+        Writes the fitted state to an .npz file (no pickles), replacing it
+        atomically, so partial_fit can continue in a later process
+        """
+        if not self._fitted:
+            raise RuntimeError("PCAReturnFactors is not fitted. Call fit() first.")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "version": STATE_VERSION,
+            "spec": asdict(self.spec),
+            "solver": self._solver,
+            "n_samples": self._n_samples,
+            "last_date": None if self._last_date is None else self._last_date.isoformat(),
+            "fit_explained": self._fit_explained,
+            "updates": self._updates,
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta)),
+                tickers=np.array(self._tickers, dtype=str),
+                mean=_require(self._mean),
+                scale=_require(self._scale),
+                m2=_require(self._m2),
+                singular_values=_require(self._singular_values),
+                components=_require(self._components),
+                fit_components=_require(self._fit_components),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "PCAReturnFactors":
+        """
+        Reads a state written by save()
+        """
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            #States written before the version was stored are version 1
+            if meta.get("version", 1) != STATE_VERSION:
+                raise ValueError(f"Unsupported factor state version {meta['version']} in {path}")
+            fm = cls(FactorSpec(**meta["spec"]))
+            fm._tickers = [str(t) for t in z["tickers"]]
+            fm._mean = z["mean"]
+            fm._scale = z["scale"]
+            fm._m2 = z["m2"]
+            fm._singular_values = z["singular_values"]
+            fm._components = z["components"]
+            fm._fit_components = z["fit_components"]
+        fm._solver = meta["solver"]
+        fm._n_samples = float(meta["n_samples"])
+        fm._last_date = None if meta["last_date"] is None else pd.Timestamp(meta["last_date"])
+        fm._fit_explained = float(meta["fit_explained"])
+        fm._updates = int(meta["updates"])
+        fm._fitted = True
+        return fm
+
     def transform(self, returns_wide: DataFrame) -> DataFrame:
         if not self._fitted:
             raise RuntimeError("PCAReturnFactors is not fitted. Call fit() first.")
@@ -106,23 +396,105 @@ class PCAReturnFactors:
                 "Ensure consistent ticker set and ordering."
             )
 
-        X = returns_wide.to_numpy(dtype=np.float64, copy=True)
+        Xc = returns_wide.to_numpy(dtype=self._dtype, copy=True)
         mean = _require(self._mean)
         scale = _require(self._scale)
         comps = _require(self._components)  # (K, N)
 
-        Xc = (X - mean) / scale  # (T, N)
+        Xc -= mean.astype(self._dtype)
+        Xc /= scale.astype(self._dtype)  # (T, N)
 
         # Project into factor space: Z = Xc @ comps.T -> (T, K)
-        Z = Xc @ comps.T
+        Z = Xc @ comps.T.astype(self._dtype)
 
         cols = [f"F{i+1:02d}" for i in range(Z.shape[1])]
-        return pd.DataFrame(Z.astype(np.float32), index=returns_wide.index, columns=cols)
+        return pd.DataFrame(Z.astype(np.float32, copy=False), index=returns_wide.index, columns=cols)
 
     def fit_transform(self, returns_wide: DataFrame) -> DataFrame:
         return self.fit(returns_wide).transform(returns_wide)
 
 
+def _pick_solver(spec: FactorSpec, shape: tuple[int, int], K: int) -> str:
+    if spec.solver != "auto":
+        return spec.solver
+    small = min(shape)
+    if K >= 0.8 * small:
+        return "full"
+    if small <= spec.gram_max_dim:
+        return "gram"
+    return "randomized"
+
+
+def _solve_full(Xc: np.ndarray, K: int, spec: FactorSpec) -> tuple[np.ndarray, np.ndarray]:
+    # SVD: Xc = U S Vt, where Vt rows are principal directions
+    # We want top K rows of Vt -> (K, N)
+    _U, S, Vt = np.linalg.svd(Xc, full_matrices=False)
+    return S[:K], Vt[:K, :]
+
+
+def _solve_randomized(Xc: np.ndarray, K: int, spec: FactorSpec) -> tuple[np.ndarray, np.ndarray]:
+    # Range finder: Q spans (approximately) the top K left singular vectors.
+    # Each power iteration multiplies by Xc Xc^T, which sharpens the decay of
+    # the spectrum; the QR in between keeps Q from collapsing numerically.
+    T, N = Xc.shape
+    L = min(K + spec.oversamples, T, N)
+    rng = np.random.default_rng(spec.random_state)
+    Q, _ = np.linalg.qr(Xc @ rng.standard_normal((N, L)).astype(Xc.dtype, copy=False))  # (T, L)
+    for _ in range(spec.n_iter):
+        Q, _ = np.linalg.qr(Xc.T @ Q)  # (N, L)
+        Q, _ = np.linalg.qr(Xc @ Q)    # (T, L)
+    B = Q.T @ Xc  # (L, N)
+    _U, S, Vt = np.linalg.svd(B, full_matrices=False)
+    return S[:K], Vt[:K, :]
+
+
+def _solve_gram(Xc: np.ndarray, K: int, spec: FactorSpec) -> tuple[np.ndarray, np.ndarray]:
+    T, N = Xc.shape
+    if N <= T:
+        # Xc^T Xc = V S^2 V^T, (N, N)
+        w, V = np.linalg.eigh(Xc.T @ Xc)
+        w, V = w[::-1][:K], V[:, ::-1][:, :K]
+        return np.sqrt(np.clip(w, 0.0, None)), V.T
+    # Xc Xc^T = U S^2 U^T, (T, T), then V^T = S^-1 U^T Xc
+    w, U = np.linalg.eigh(Xc @ Xc.T)
+    w, U = w[::-1][:K], U[:, ::-1][:, :K]
+    S = np.sqrt(np.clip(w, 0.0, None))
+    Vt = U.T @ Xc
+    Vt /= np.where(S > 0.0, S, 1.0)[:, None]
+    return S, Vt
+
+
+_SOLVE = {
+    "full": _solve_full,
+    "randomized": _solve_randomized,
+    "gram": _solve_gram,
+}
+
+
+def _flip_signs(comps: np.ndarray) -> np.ndarray:
+    # Singular vectors are only defined up to sign, make the largest loading
+    # of each component positive so every solver returns the same factors
+    idx = np.abs(comps).argmax(axis=1)
+    signs = np.sign(comps[np.arange(comps.shape[0]), idx])
+    signs[signs == 0.0] = 1.0
+    return comps * signs[:, None]
+
+
+def _align_signs(comps: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    # Keep each updated component pointing the same way as before, so the
+    # factor series stay continuous across updates
+    signs = np.sign(np.einsum("ij,ij->i", comps, prev))
+    signs[signs == 0.0] = 1.0
+    return comps * signs[:, None]
+
+
+def _scale_from(m2: np.ndarray, n: float) -> np.ndarray:
+    scale = np.sqrt(m2 / max(n - 1.0, 1.0))
+    # Avoid division by zero for ultra-flat series
+    scale[scale == 0.0] = 1.0
+    return scale
+
+
 def _require(x):
     if x is None:
         raise RuntimeError("Internal state missing; factor model not fitted correctly.")
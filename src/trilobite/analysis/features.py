@@ -1,15 +1,65 @@
 import numpy as np
 from pandas import DataFrame
 
-def prices_to_log_returns(adjclose_wide: DataFrame) -> DataFrame:
+#Float dtypes of the analysis matrices, see MarketDataSource
+DTYPES = ("float64", "float32")
+
+
+def check_dtype(dtype: str) -> np.dtype:
+    """
+    Returns the numpy dtype of a dtype policy name, see DTYPES
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+    return np.dtype(dtype)
+
+
+def prices_to_log_returns(adjclose_wide: DataFrame, *, dtype: str = "float64") -> DataFrame:
     """
     Returns logs
+
+    Computed into a single new (T - 1, N) array of dtype: the price ratios
+    are divided into it straight from adjclose_wide's values (which may be a
+    read-only view, as from the mirror) and the log is taken in place. Dates
+    where any ticker has no valid return (a price <= 0 or NaN on either day)
+    are dropped by moving the rows after them up, also in place.
     """
-    px = adjclose_wide.where(adjclose_wide > 0.0)
+    out_dtype = check_dtype(dtype)
+    px = adjclose_wide.to_numpy()
+    if px.dtype.kind != "f":
+        px = px.astype(out_dtype)
+    if len(px) < 2:
+        return DataFrame(np.empty((0, px.shape[1]), dtype=out_dtype), index=adjclose_wide.index[:0], columns=adjclose_wide.columns)
+
+    rets = np.empty((px.shape[0] - 1, px.shape[1]), dtype=out_dtype)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(px[1:], px[:-1], out=rets, casting="same_kind")
+        np.log(rets, out=rets)
 
-    rets = np.log(px / px.shift(1))
-    
-    rets = rets.replace([np.inf, -np.inf], np.nan).dropna(axis=0, how="any")
+    #A day is valid when both prices are > 0, a ratio of two negative prices is not
+    positive = (px > 0.0).all(axis=1)
+    keep = positive[1:] & positive[:-1] & np.isfinite(rets).all(axis=1)
+    index = adjclose_wide.index[1:][keep]
+    rets = compact_rows(rets, keep)
     #return np.log(adjclose_wide / adjclose_wide.shift(1)).dropna()
-    return rets
+    return DataFrame(rets, index=index, columns=adjclose_wide.columns, copy=False)
+
 
+def compact_rows(a: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """
+    Drops the rows of a where keep is False by moving the kept rows up in
+    place, instead of the copy a[keep] makes. Returns a view on a's first
+    rows. Cheap when few rows are dropped, which is the usual case.
+    """
+    drop = np.flatnonzero(~keep)
+    if len(drop) == 0:
+        return a
+    #Move each run of kept rows between two dropped ones up to the write position
+    dst = int(drop[0])
+    bounds = np.append(drop, len(a))
+    for lo, hi in zip(bounds[:-1] + 1, bounds[1:]):
+        n = int(hi - lo)
+        if n > 0:
+            a[dst : dst + n] = a[lo:hi]
+            dst += n
+    return a[:dst]
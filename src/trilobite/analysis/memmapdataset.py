@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from pandas import DataFrame
+from torch.utils.data import Dataset
+
+from trilobite.analysis.dataset import FactorDatasetSpec
+
+logger = logging.getLogger(__name__)
+
+LABEL_FORMATS = ("packbits", "uint8")
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class DatasetManifest:
+    """
+    Describes the on-disk layout of a MemmapFactorDataset.
+
+    Attributes
+    ----------
+    n_rows:
+        Rows in dates.bin and factors.bin, one per date.
+    n_label_rows:
+        Rows in labels.bin, n_rows - horizon: the last horizon dates have no
+        future return to label them with.
+    label_format:
+        "packbits": one bit per ticker, rows padded to whole bytes
+        (np.packbits, big bit order). "uint8": one byte per ticker.
+    """
+    version: int = MANIFEST_VERSION
+    lookback: int = 60
+    horizon: int = 1
+    n_rows: int = 0
+    n_label_rows: int = 0
+    label_format: str = "packbits"
+    tickers: list[str] = field(default_factory=list)
+    factor_names: list[str] = field(default_factory=list)
+
+
+class MemmapDatasetWriter:
+    """
+    Builds a MemmapFactorDataset under root from chunks of rows in date
+    order, so neither the returns nor the factors ever have to be in memory
+    as a whole.
+
+    Layout under root:
+    - manifest.json: DatasetManifest
+    - dates.bin: int64 days since epoch, one per row
+    - factors.bin: C-ordered float32 (n_rows, K)
+    - labels.bin: (n_label_rows, ceil(N / 8)) packed bits or (n_label_rows, N)
+      uint8, label[t] = 1 if return[t + horizon] > 0
+
+    Chunks are appended to the files as they come. The dataset is written
+    to a temporary directory next to root and swapped in by close(), so a
+    failed build leaves the previous one in place.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        tickers: list[str],
+        factor_names: list[str],
+        spec: FactorDatasetSpec,
+        label_format: str = "packbits",
+    ) -> None:
+        if label_format not in LABEL_FORMATS:
+            raise ValueError(f"label_format must be one of {LABEL_FORMATS}, got {label_format!r}")
+        if spec.lookback <= 0:
+            raise ValueError("lookback must be > 0")
+        if spec.horizon <= 0:
+            raise ValueError("horizon must be > 0")
+        self._root = root
+        self._tmp = root.with_name(f".{root.name}.tmp")
+        self._manifest = DatasetManifest(
+            lookback=spec.lookback,
+            horizon=spec.horizon,
+            label_format=label_format,
+            tickers=list(tickers),
+            factor_names=list(factor_names),
+        )
+        #Returns rows seen so far, the first horizon of them label nothing
+        self._n_returns = 0
+
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        self._tmp.mkdir(parents=True)
+        self._dates = open(self._tmp / "dates.bin", "wb")
+        self._factors = open(self._tmp / "factors.bin", "wb")
+        self._labels = open(self._tmp / "labels.bin", "wb")
+
+    def append(self, factors: DataFrame, returns_wide: DataFrame) -> None:
+        """
+        Appends the next rows, factors and returns of the same dates with
+        the tickers given to the writer, dates after the rows already written
+        """
+        m = self._manifest
+        if not factors.index.equals(returns_wide.index):
+            raise ValueError("factors and returns_wide must have identical date index")
+        if list(returns_wide.columns) != m.tickers:
+            raise ValueError("returns_wide tickers differ from the dataset tickers/order.")
+        if factors.shape[1] != len(m.factor_names):
+            raise ValueError(f"Expected {len(m.factor_names)} factor columns, got {factors.shape[1]}")
+        if factors.empty:
+            return
+
+        days = factors.index.to_numpy(dtype="datetime64[D]").astype(np.int64)
+        self._dates.write(days.tobytes())
+        self._factors.write(np.ascontiguousarray(factors.to_numpy(dtype=np.float32)).tobytes())
+
+        # The direction of row j labels date j - horizon
+        skip = max(m.horizon - self._n_returns, 0)
+        up = returns_wide.to_numpy()[skip:] > 0.0
+        if m.label_format == "packbits":
+            up = np.packbits(up, axis=1)
+        self._labels.write(np.ascontiguousarray(up, dtype=np.uint8).tobytes())
+
+        self._n_returns += len(returns_wide)
+        m.n_rows += len(factors)
+        m.n_label_rows += len(up)
+
+    def close(self) -> "MemmapFactorDataset":
+        """
+        Finishes the files, replaces root with them and opens the dataset
+        """
+        for f in (self._dates, self._factors, self._labels):
+            f.close()
+        with open(self._tmp / "manifest.json", "w", encoding="utf-8") as fh:
+            json.dump(asdict(self._manifest), fh)
+        if self._root.exists():
+            shutil.rmtree(self._root)
+        os.replace(self._tmp, self._root)
+        logger.debug(f"Wrote {self._manifest.n_rows} rows to {self._root}")
+        return MemmapFactorDataset(self._root)
+
+    def abort(self) -> None:
+        """
+        Drops the partly written dataset
+        """
+        for f in (self._dates, self._factors, self._labels):
+            f.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+class MemmapFactorDataset(Dataset[Tuple[torch.Tensor, torch.Tensor]]):
+    """
+    FactorWindowDirectionDataset over the memory-mapped files written by
+    MemmapDatasetWriter, same samples and alignment.
+
+    Nothing is read until a sample or batch is asked for: windows are a
+    strided view on the mapped factors, and labels stay packed on disk and
+    are decoded to float32 one batch at a time. The OS pages the files in
+    and out, so the dataset can be larger than physical memory. Index it
+    with an int for one sample, or use batch() (and BatchedWindows with
+    WindowBatchSampler) for whole batches.
+    """
+
+    def __init__(self, root: Path) -> None:
+        with open(root / "manifest.json", "r", encoding="utf-8") as fh:
+            m = DatasetManifest(**json.load(fh))
+        if m.version != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported dataset version {m.version} in {root}")
+        self._root = root
+        self._manifest = m
+        n_tickers = len(m.tickers)
+        K = len(m.factor_names)
+
+        self._dates = np.memmap(root / "dates.bin", dtype=np.int64, mode="r", shape=(m.n_rows,))
+        self._X = np.memmap(root / "factors.bin", dtype=np.float32, mode="r", shape=(m.n_rows, K))
+        width = (n_tickers + 7) // 8 if m.label_format == "packbits" else n_tickers
+        self._y = np.memmap(root / "labels.bin", dtype=np.uint8, mode="r", shape=(m.n_label_rows, width))
+
+        self._lookback = m.lookback
+        self._n_samples = m.n_label_rows - (m.lookback - 1)
+        if self._n_samples <= 0:
+            raise ValueError(
+                f"Not enough rows for lookback={m.lookback} and horizon={m.horizon}. "
+                f"Need at least {m.lookback + m.horizon} rows total."
+            )
+        # (n_samples, lookback, K) view on the mapped factors, no reads
+        self._windows = np.lib.stride_tricks.as_strided(
+            self._X,
+            shape=(self._n_samples, m.lookback, K),
+            strides=(self._X.strides[0], self._X.strides[0], self._X.strides[1]),
+            writeable=False,
+        )
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def tickers(self) -> list[str]:
+        return self._manifest.tickers
+
+    @property
+    def factor_names(self) -> list[str]:
+        return self._manifest.factor_names
+
+    @property
+    def n_factors(self) -> int:
+        return len(self._manifest.factor_names)
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        """
+        Dates of the labelled rows, like FactorWindowDirectionDataset.dates
+        """
+        return pd.DatetimeIndex(self._dates[: self._manifest.n_label_rows].astype("datetime64[D]"))
+
+    @property
+    def last_date(self) -> pd.Timestamp:
+        return pd.Timestamp(self._dates[-1].astype("datetime64[D]"))
+
+    def __len__(self) -> int:
+        return self._n_samples
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        if self._manifest.label_format == "packbits":
+            rows = np.unpackbits(rows, axis=-1, count=len(self._manifest.tickers))
+        return rows.astype(np.float32)
+
+    def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        if idx < 0 or idx >= self._n_samples:
+            raise IndexError(idx)
+        x = np.array(self._windows[idx])                        # (lookback, K)
+        y = self._decode(self._y[idx + self._lookback - 1])     # (N,)
+        return torch.from_numpy(x), torch.from_numpy(y)
+
+    def batch(self, idx: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Gathers a whole batch, reading only its windows and label rows
+
+        Returns:
+        - X: (B, lookback, K), y: (B, N) float32
+        """
+        i = idx.numpy()
+        x = self._windows[i]                                    # (B, lookback, K)
+        y = self._decode(self._y[i + (self._lookback - 1)])     # (B, N)
+        return torch.from_numpy(x), torch.from_numpy(y)
+
+    def latest_window(self) -> torch.Tensor:
+        """
+        The last lookback factor rows, including the unlabelled last dates,
+        for predicting the day after last_date. (lookback, K)
+        """
+        if self._manifest.n_rows < self._lookback:
+            raise ValueError(f"Need at least {self._lookback} rows to predict latest.")
+        return torch.from_numpy(np.array(self._X[-self._lookback :]))
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class SharedMatrixRef:
+    """
+    Picklable reference to a SharedMatrix, for attach() in another process.
+
+    Attributes
+    ----------
+    name:
+        Name of the shared memory block.
+    shape, dtype:
+        Of the array in it.
+    """
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+class SharedMatrix:
+    """
+    A numpy array in a shared memory block, created by one process and
+    mapped by others from its ref, so a worker reads (or writes) the same
+    memory instead of a pickled copy.
+
+    The creating process owns the block: close() also unlinks it. Used as a
+    context manager, the block is released on exit. Views handed out by
+    array must be dropped before close(), a buffer with views cannot be
+    closed.
+
+    Params:
+    - shape, dtype: of the new array
+    - fill: value the array starts with, None leaves the block's zeros
+    """
+    def __init__(self, shape: tuple[int, ...], dtype: np.dtype | str, *, fill: float | None = None) -> None:
+        dt = np.dtype(dtype)
+        self._shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * dt.itemsize, 1))
+        self.ref = SharedMatrixRef(name=self._shm.name, shape=tuple(shape), dtype=dt.str)
+        self.array = np.ndarray(shape, dtype=dt, buffer=self._shm.buf)
+        if fill is not None:
+            self.array[:] = fill
+
+    @classmethod
+    def from_array(cls, a: np.ndarray) -> "SharedMatrix":
+        m = cls(a.shape, a.dtype)
+        m.array[:] = a
+        return m
+
+    def close(self) -> None:
+        #The view has to go before the buffer can be released
+        self.array = None  # type: ignore[assignment]
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self) -> "SharedMatrix":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach(ref: SharedMatrixRef, *, readonly: bool = False) -> tuple[SharedMemory, np.ndarray]:
+    """
+    Maps the array of a SharedMatrix created by another process. Keep the
+    returned SharedMemory for as long as the array is used, and close (not
+    unlink) it afterwards.
+    """
+    shm = SharedMemory(name=ref.name)
+    a = np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=shm.buf)
+    if readonly:
+        a.flags.writeable = False
+    return shm, a
@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import contextlib
+import itertools
+import logging
+import math
+import os
+import time
+from concurrent.futures import as_completed
+from dataclasses import dataclass, fields, replace
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+import torch
+from pandas import DataFrame
+
+from trilobite.analysis.backtest import direction_metrics, process_pool, worker_config
+from trilobite.analysis.factors import PCAReturnFactors
+from trilobite.analysis.sharedmatrix import SharedMatrix, SharedMatrixRef, attach
+from trilobite.analysis.trainers.nn_direction import NNDirectionsConfig, NNDirectionsTrainer
+
+logger = logging.getLogger(__name__)
+
+#NNDirectionsConfig fields a sweep can search
+SWEEP_FIELDS = (
+    "n_factors", "standardize", "lookback", "hidden_size", "num_layers",
+    "lr", "weight_decay", "epochs", "batch_size",
+)
+SEARCHES = ("grid", "random")
+#Validation metrics, and whether higher is better
+METRICS = {"auc": True, "hit_rate": True, "long_short": True, "loss": False}
+
+
+def parse_space(text: str) -> dict[str, list[Any] | tuple[Any, Any]]:
+    """
+    Parses a search space, e.g. "n_factors=16,32;lookback=20,60;lr=1e-4:1e-2".
+
+    Each field of SWEEP_FIELDS takes a comma separated list of values, or
+    for random search of a number field a range lo:hi (inclusive for ints,
+    log-uniform for floats). Values are converted to the field's type in
+    NNDirectionsConfig.
+
+    Returns:
+    - field -> list of values, or (lo, hi) of a range
+    """
+    types = {f.name: type(getattr(NNDirectionsConfig(), f.name)) for f in fields(NNDirectionsConfig)}
+    space: dict[str, list[Any] | tuple[Any, Any]] = {}
+    for part in filter(None, (p.strip() for p in text.split(";"))):
+        name, sep, values = part.partition("=")
+        name = name.strip()
+        if not sep or not values.strip():
+            raise ValueError(f"Expected field=values in the search space, got {part!r}")
+        if name not in SWEEP_FIELDS:
+            raise ValueError(f"Cannot sweep {name!r}, fields are {SWEEP_FIELDS}")
+        conv = _parse_bool if types[name] is bool else types[name]
+        if ":" in values:
+            if types[name] is bool:
+                raise ValueError(f"{name} takes values, not a range")
+            lo, hi = (conv(v.strip()) for v in values.split(":", 1))
+            #Floats are drawn log-uniform, so lo has to be > 0
+            if lo > hi or (types[name] is float and lo <= 0):
+                raise ValueError(f"Bad range {values!r} for {name}")
+            space[name] = (lo, hi)
+        else:
+            space[name] = [conv(v.strip()) for v in values.split(",")]
+    if not space:
+        raise ValueError("The search space is empty")
+    return space
+
+
+def _parse_bool(v: str) -> bool:
+    if v.lower() in ("1", "true", "yes"):
+        return True
+    if v.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Expected a bool, got {v!r}")
+
+
+def grid_trials(space: dict[str, list[Any] | tuple[Any, Any]]) -> list[dict[str, Any]]:
+    """
+    Every combination of the values of the space
+    """
+    ranges = [k for k, v in space.items() if isinstance(v, tuple)]
+    if ranges:
+        raise ValueError(f"Grid search needs lists of values, {ranges} are ranges")
+    names = list(space)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(space[k] for k in names))]
+
+
+def random_trials(space: dict[str, list[Any] | tuple[Any, Any]], n: int, *, seed: int = 0) -> list[dict[str, Any]]:
+    """
+    Up to n distinct trials drawn from the space, fewer when the space has
+    fewer combinations
+    """
+    rng = np.random.default_rng(seed)
+    trials: list[dict[str, Any]] = []
+    seen: set[tuple] = set()
+    for _ in range(n * 100):
+        if len(trials) == n:
+            break
+        t = {k: _draw(rng, v) for k, v in space.items()}
+        key = tuple(t.values())
+        if key not in seen:
+            seen.add(key)
+            trials.append(t)
+    return trials
+
+
+def _draw(rng: np.random.Generator, v: list[Any] | tuple[Any, Any]) -> Any:
+    if isinstance(v, list):
+        return v[int(rng.integers(len(v)))]
+    lo, hi = v
+    if isinstance(lo, int):
+        return int(rng.integers(lo, hi + 1))
+    return float(np.exp(rng.uniform(np.log(lo), np.log(hi))))
+
+
+@dataclass(frozen=True)
+class SweepSpec:
+    """
+    Hyperparameter sweep settings.
+
+    Attributes
+    ----------
+    search:
+        "grid" tries every combination of the space, "random" draws trials
+        of it.
+    trials:
+        Trials of a random search.
+    val_days:
+        Last dates of the returns matrix the trials are scored on, every
+        trial trains on the rows before them.
+    metric:
+        Validation metric the trials are ranked by, see METRICS.
+    rungs, eta:
+        Successive halving: every trial is trained with 1/eta**(rungs - 1)
+        of its epochs, the best 1/eta of them again with eta times more,
+        and so on until the last rung trains the survivors with all their
+        epochs. rungs=1 trains every trial fully.
+    workers:
+        Trials trained at the same time, each in its own process. 1 runs
+        them in this process, None uses one process per CPU.
+    trial_threads:
+        torch threads of each trial, None shares the CPUs between the
+        workers.
+    top_n:
+        Tickers in each leg of the long/short returns.
+    seed:
+        Of the random search, and (plus the trial number) of each trial's
+        torch initialization, so a trial starts the same in every rung.
+    """
+    search: str = "grid"
+    trials: int = 20
+    val_days: int = 126
+    metric: str = "auc"
+    rungs: int = 3
+    eta: int = 3
+    workers: int | None = None
+    trial_threads: int | None = None
+    top_n: int = 20
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.search not in SEARCHES:
+            raise ValueError(f"search must be one of {SEARCHES}, got {self.search!r}")
+        if self.metric not in METRICS:
+            raise ValueError(f"metric must be one of {tuple(METRICS)}, got {self.metric!r}")
+        if self.rungs < 1 or self.eta < 2:
+            raise ValueError("rungs must be >= 1 and eta >= 2")
+
+
+@dataclass(frozen=True)
+class TrialResult:
+    """
+    Validation scores of one trial in one rung.
+
+    Attributes
+    ----------
+    number:
+        Position of the trial in the search.
+    params:
+        The swept fields of the trial.
+    rung:
+        Successive halving rung, from 0.
+    epochs:
+        Epochs trained in this rung.
+    metrics:
+        Means of direction_metrics over the validation dates, and the
+        validation log loss.
+    seconds:
+        Wall time of the training and scoring, in the worker.
+    """
+    number: int
+    params: dict[str, Any]
+    rung: int
+    epochs: int
+    metrics: dict[str, float]
+    seconds: float
+
+
+class Sweep:
+    """
+    Hyperparameter search for NNDirectionsTrainer on one returns matrix.
+
+    The matrix is copied once into shared memory that the worker processes
+    map. PCA fits only depend on n_factors and standardize (solver and
+    dtype come from base_cfg), so each distinct pair is fitted once on the
+    training rows and sent to every worker with the pool's setup; the
+    trials pass theirs to fit(). Trials are run in a spawned process pool
+    with worker_config's thread limits, and losing trials are dropped by
+    successive halving (see SweepSpec).
+
+    Params:
+    - returns_wide: (dates, tickers) log returns without NaNs
+    - base_cfg: settings of the fields the space does not sweep
+    - space: see parse_space
+    - spec: sweep settings
+    """
+    def __init__(self,
+                 returns_wide: DataFrame,
+                 base_cfg: NNDirectionsConfig,
+                 space: dict[str, list[Any] | tuple[Any, Any]],
+                 spec: SweepSpec,
+                 ) -> None:
+        if returns_wide.isna().any().any():
+            raise ValueError("returns_wide contains NaNs (v1 requires no NaNs)")
+        self._returns = returns_wide
+        self._base = base_cfg
+        self._spec = spec
+        if spec.search == "grid":
+            self._trials = grid_trials(space)
+        else:
+            self._trials = random_trials(space, spec.trials, seed=spec.seed)
+
+        h = base_cfg.horizon
+        self._val_hi = len(returns_wide) - h
+        self._val_lo = self._val_hi - spec.val_days
+        longest = max(self.config(t).lookback for t in self._trials)
+        if self._val_lo <= longest + h:
+            raise ValueError(
+                f"Need more than {longest + 2 * h + spec.val_days} rows of returns for {spec.val_days} "
+                f"validation days and lookback {longest}, got {len(returns_wide)}"
+            )
+        self._results: list[TrialResult] = []
+
+    @property
+    def trials(self) -> list[dict[str, Any]]:
+        return list(self._trials)
+
+    def config(self, params: dict[str, Any]) -> NNDirectionsConfig:
+        return replace(self._base, **params)
+
+    def workers(self) -> int:
+        w = self._spec.workers or os.cpu_count() or 1
+        return max(1, min(w, len(self._trials)))
+
+    def rung_epochs(self, epochs: int, rung: int) -> int:
+        """
+        Epochs a trial of epochs trains in a rung
+        """
+        return max(1, math.ceil(epochs * self._spec.eta ** (rung - self._spec.rungs + 1)))
+
+    def fit_factors(self) -> dict[tuple[int, bool], PCAReturnFactors]:
+        """
+        PCA fits of the training rows, one per (n_factors, standardize) of
+        the trials
+        """
+        train = self._returns.iloc[: self._val_lo]
+        models: dict[tuple[int, bool], PCAReturnFactors] = {}
+        for t in self._trials:
+            cfg = self.config(t)
+            key = (cfg.n_factors, cfg.standardize)
+            if key not in models:
+                models[key] = PCAReturnFactors(NNDirectionsTrainer(cfg).factor_spec).fit(train)
+        return models
+
+    def run(self) -> Iterator[TrialResult]:
+        """
+        Runs the trials rung by rung, yielding each result as it finishes.
+        Call results() afterwards.
+        """
+        self._results = []
+        factors = self.fit_factors()
+        logger.info(f"{len(factors)} PCA fits for {len(self._trials)} trials")
+        R = self._returns.to_numpy()
+        workers = self.workers()
+        cfg = self._base
+        if self._spec.trial_threads is not None:
+            cfg = replace(cfg, num_threads=self._spec.trial_threads)
+        if workers > 1:
+            cfg = worker_config(cfg, workers)
+        with contextlib.ExitStack() as stack:
+            if workers == 1:
+                _attach(R, self._returns.index, self._returns.columns, cfg, factors, self._val_lo, self._val_hi, self._spec)
+                stack.callback(_detach)
+                submit = None
+            else:
+                shared = stack.enter_context(SharedMatrix.from_array(R))
+                initargs = (
+                    shared.ref, self._returns.index.to_numpy(), list(self._returns.columns), cfg, factors,
+                    self._val_lo, self._val_hi, self._spec,
+                )
+                ex = stack.enter_context(process_pool(workers, _init_worker, initargs))
+                submit = ex.submit
+
+            alive = list(range(len(self._trials)))
+            last: dict[int, TrialResult] = {}
+            for rung in range(self._spec.rungs):
+                tasks = []
+                reused = []
+                for n in alive:
+                    epochs = self.rung_epochs(self.config(self._trials[n]).epochs, rung)
+                    if n in last and last[n].epochs == epochs:
+                        #Seeded, the same epochs would train the same model again
+                        reused.append(replace(last[n], rung=rung))
+                    else:
+                        tasks.append((n, self._trials[n], rung, epochs))
+                if submit is None:
+                    results: Iterator[TrialResult] = (_run_trial(*task) for task in tasks)
+                else:
+                    results = (f.result() for f in as_completed([submit(_run_trial, *task) for task in tasks]))
+                rung_results = []
+                for res in itertools.chain(reused, results):
+                    rung_results.append(res)
+                    last[res.number] = res
+                    self._results.append(res)
+                    yield res
+                if rung < self._spec.rungs - 1:
+                    keep = max(1, math.ceil(len(alive) / self._spec.eta))
+                    ranked = sorted(rung_results, key=self._sort_key)
+                    alive = sorted(r.number for r in ranked[:keep])
+
+    def _sort_key(self, r: TrialResult) -> tuple:
+        v = r.metrics[self._spec.metric]
+        if math.isnan(v):
+            return (-r.rung, math.inf, r.number)
+        return (-r.rung, -v if METRICS[self._spec.metric] else v, r.number)
+
+    def results(self) -> DataFrame:
+        """
+        One row per trial, with the scores of the last rung it reached: the
+        trials of later rungs first (they trained longer), each rung sorted
+        by the metric, best first
+        """
+        last: dict[int, TrialResult] = {}
+        for r in self._results:
+            if r.number not in last or r.rung > last[r.number].rung:
+                last[r.number] = r
+        rows = [
+            {"trial": r.number, **r.params, "rung": r.rung, "epochs": r.epochs, **r.metrics, "seconds": r.seconds}
+            for r in sorted(last.values(), key=self._sort_key)
+        ]
+        return DataFrame(rows).set_index("trial") if rows else DataFrame()
+
+
+#State of the process running trials, set by _attach
+_worker: dict = {}
+
+
+def _attach(R: np.ndarray,
+            index: pd.Index,
+            columns: list[str],
+            cfg: NNDirectionsConfig,
+            factors: dict[tuple[int, bool], PCAReturnFactors],
+            val_lo: int,
+            val_hi: int,
+            spec: SweepSpec,
+            shms: tuple[SharedMemory, ...] = (),
+            ) -> None:
+    _worker.update(
+        returns=DataFrame(R, index=index, columns=columns, copy=False),
+        cfg=cfg, factors=factors, val_lo=val_lo, val_hi=val_hi, spec=spec, shms=shms,
+    )
+
+
+def _detach() -> None:
+    for shm in _worker.get("shms", ()):
+        shm.close()
+    _worker.clear()
+
+
+def _init_worker(ref: SharedMatrixRef,
+                 index: np.ndarray,
+                 columns: list[str],
+                 cfg: NNDirectionsConfig,
+                 factors: dict[tuple[int, bool], PCAReturnFactors],
+                 val_lo: int,
+                 val_hi: int,
+                 spec: SweepSpec,
+                 ) -> None:
+    shm, R = attach(ref, readonly=True)
+    _attach(R, pd.DatetimeIndex(index), columns, cfg, factors, val_lo, val_hi, spec, (shm,))
+
+
+def _run_trial(number: int, params: dict[str, Any], rung: int, epochs: int) -> TrialResult:
+    """
+    Trains the trial on the training rows with the cached PCA fit, and
+    scores it on the validation dates
+    """
+    t0 = time.perf_counter()
+    rets: DataFrame = _worker["returns"]
+    spec: SweepSpec = _worker["spec"]
+    val_lo, val_hi = _worker["val_lo"], _worker["val_hi"]
+    cfg = replace(_worker["cfg"], **params, epochs=epochs)
+    torch.manual_seed(spec.seed + number)
+    trainer = NNDirectionsTrainer(cfg)
+    trainer.fit(rets.iloc[:val_lo], factor_model=_worker["factors"][(cfg.n_factors, cfg.standardize)])
+    probs = trainer.score_dates(rets.iloc[val_lo - cfg.lookback + 1 : val_hi]).to_numpy()
+
+    realized = rets.to_numpy()[val_lo + cfg.horizon : val_hi + cfg.horizon]
+    metrics = direction_metrics(probs, realized, top_n=spec.top_n).mean().to_dict()
+    p = np.clip(probs, 1e-7, 1.0 - 1e-7)
+    metrics["loss"] = float(-np.where(realized > 0.0, np.log(p), np.log1p(-p)).mean())
+    seconds = time.perf_counter() - t0
+    logger.debug(f"Trial {number} rung {rung} ({epochs} epochs) {params}: {metrics} in {seconds:.1f}s")
+    return TrialResult(number=number, params=params, rung=rung, epochs=epochs, metrics=metrics, seconds=seconds)
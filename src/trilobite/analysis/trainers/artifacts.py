@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+#Layout version of an artifact directory, bumped when the files change
+ARTIFACT_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def list_artifacts(root: Path) -> list[Path]:
+    """
+    Returns the complete artifact directories under root, oldest first.
+    Artifacts are numbered directories (0001, 0002, ..), a directory without
+    a manifest is a write that did not finish and is left out.
+    """
+    if not root.exists():
+        return []
+    dirs = [p for p in root.iterdir() if p.is_dir() and p.name.isdigit() and (p / MANIFEST).exists()]
+    return sorted(dirs, key=lambda p: int(p.name))
+
+
+def latest_artifact(root: Path) -> Path | None:
+    """
+    Returns the newest artifact directory under root, None if there is none
+    """
+    artifacts = list_artifacts(root)
+    return artifacts[-1] if artifacts else None
+
+
+def write_artifact(root: Path, manifest: dict[str, Any], write_files: Callable[[Path], None]) -> Path:
+    """
+    Writes a new artifact under root, numbered after the highest numbered
+    directory, so a write that did not finish is never written over.
+
+    The files are written by write_files into a temporary directory, the
+    manifest (with version and created_at added) last, and the directory is
+    renamed into place, so a reader never sees a partial artifact.
+
+    Params:
+    - root: directory of the artifacts of one model
+    - manifest: JSON serializable description of the artifact
+    - write_files: writes the artifact's files into the directory it is given
+
+    Returns:
+    - the new artifact directory
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    number = max((int(p.name) for p in root.iterdir() if p.is_dir() and p.name.isdigit()), default=0) + 1
+    final = root / f"{number:04d}"
+    tmp = root / f".{final.name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    try:
+        write_files(tmp)
+        manifest = {
+            "version": ARTIFACT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **manifest,
+        }
+        with open(tmp / MANIFEST, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=2)
+        os.replace(tmp, final)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    logger.info(f"Wrote artifact {final}")
+    return final
+
+
+def read_manifest(path: Path) -> dict[str, Any]:
+    """
+    Reads the manifest of an artifact directory, checking its version
+    """
+    with open(path / MANIFEST, "r", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported artifact version {manifest.get('version')} in {path}")
+    return manifest
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import contextlib
+import hashlib
+from dataclasses import asdict, dataclass, fields
 import logging
-from typing import Optional
+import os
+from pathlib import Path
+import time
+from typing import Callable, Iterable, Optional
 
 import numpy as np
 import pandas as pd
@@ -12,8 +17,15 @@ from pandas import DataFrame
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 
-from trilobite.analysis.dataset import FactorDatasetSpec, FactorWindowDirectionDataset
+from trilobite.analysis.dataset import (
+    BatchedWindows,
+    FactorDatasetSpec,
+    FactorWindowDirectionDataset,
+    WindowBatchSampler,
+)
 from trilobite.analysis.factors import FactorSpec, PCAReturnFactors
+from trilobite.analysis.memmapdataset import MemmapDatasetWriter, MemmapFactorDataset
+from trilobite.analysis.trainers.artifacts import read_manifest, write_artifact
 from trilobite.analysis.trainers.base import Prediction
 
 logger = logging.getLogger(__name__)
@@ -35,17 +47,29 @@ class _FactorGRUToUniverse(nn.Module):
         self.head = nn.Linear(hidden_size, n_tickers)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        out, _ = self.gru(x)      # (B, T, H)
-        h = out[:, -1, :]         # (B, H)
-        logits = self.head(h)     # (B, N)
+        logits, _ = self.step(x)
         return logits
 
+    def step(self, x: torch.Tensor, h0: torch.Tensor | None = None) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        forward continuing from the hidden state h0 (zeros when None), also
+        returns the hidden state after the last step, (num_layers, B, H)
+        """
+        out, h_n = self.gru(x, h0)  # (B, T, H)
+        h = out[:, -1, :]           # (B, H)
+        logits = self.head(h)       # (B, N)
+        return logits, h_n
+
 
 @dataclass
 class NNDirectionsConfig:
     # factor model
     n_factors: int = 64
     standardize: bool = False
+    factor_solver: str = "auto"
+    factor_forgetting: float = 1.0
+    #Float dtype of the PCA, see FactorSpec.dtype
+    factor_dtype: str = "float64"
 
     # dataset
     lookback: int = 60
@@ -54,6 +78,9 @@ class NNDirectionsConfig:
     # training
     epochs: int = 10
     batch_size: int = 32
+    #Gather whole batches from a strided view of the windows (BatchedWindows)
+    #instead of collating one sample at a time
+    batched_windows: bool = True
     lr: float = 1e-3
     weight_decay: float = 1e-4
 
@@ -63,6 +90,89 @@ class NNDirectionsConfig:
 
     # runtime
     device: str = "cpu"
+    #torch intra-op and inter-op threads, None leaves torch's defaults. The
+    #inter-op count can only be set once per process, before any parallel work
+    num_threads: int | None = None
+    num_interop_threads: int | None = None
+    #Train a torch.compile'd copy of the model. The GRU is unrolled over the
+    #lookback steps, so the first step pays a long compile (minutes), and the
+    #last partial batch of an epoch is dropped so the shapes never change
+    compile: bool = False
+    compile_mode: str | None = None
+    #Forward pass and loss under bf16 autocast, on CPUs with bf16 support
+    bf16_autocast: bool = False
+    #Show the mean loss of the last log_every steps, every log_every steps.
+    #Reading the loss waits for the step, 0 only reads it at the end of an epoch
+    log_every: int = 50
+    #Days predict_incremental steps a carried GRU state before rebuilding it
+    #from a full window
+    hidden_max_steps: int = 20
+
+    # fine-tuning, see NNDirectionsTrainer.fine_tune
+    finetune_steps: int = 20
+    #Newest windows every fine-tune trains on, more when more days are new
+    finetune_recent: int = 20
+    #Share of each fine-tune batch drawn from the older windows
+    finetune_replay: float = 0.75
+    #Steps at the full lr move the whole ranking, not only what the new days add
+    finetune_lr: float = 1e-4
+
+
+#Fields a saved model was built with, a fine-tune needs them unchanged
+STRUCTURE_FIELDS = (
+    "n_factors", "standardize", "factor_solver", "factor_dtype",
+    "lookback", "horizon", "hidden_size", "num_layers",
+)
+
+
+@dataclass(frozen=True)
+class HiddenState:
+    """
+    GRU state carried between predict_incremental calls.
+
+    Attributes
+    ----------
+    date:
+        Last date of the returns the state has seen.
+    h:
+        Hidden state after that date, (num_layers, 1, H).
+    steps:
+        Days stepped since the state was built from a full window.
+    probs:
+        Up probabilities predicted from the state.
+    fingerprint:
+        Of the returns row of date, a revised row (e.g. a provisional close
+        replaced by the final one) does not match and rebuilds the state.
+    """
+    date: pd.Timestamp
+    h: torch.Tensor
+    steps: int
+    probs: np.ndarray
+    fingerprint: str | None = None
+
+
+@dataclass(frozen=True)
+class EpochStats:
+    """
+    Training statistics of one epoch, see NNDirectionsTrainer.history.
+
+    Attributes
+    ----------
+    loss:
+        Mean training loss over the epoch's batches.
+    seconds:
+        Wall time of the epoch, data loading included.
+    samples:
+        Windows trained on.
+    """
+    epoch: int
+    loss: float
+    seconds: float
+    samples: int
+
+    @property
+    def samples_per_sec(self) -> float:
+        return self.samples / self.seconds if self.seconds > 0 else 0.0
 
 
 class NNDirectionsTrainer:
@@ -79,13 +189,63 @@ class NNDirectionsTrainer:
         self.cfg = cfg or NNDirectionsConfig()
         self._factor_model: PCAReturnFactors | None = None
         self._model: _FactorGRUToUniverse | None = None
+        self._optimizer: torch.optim.Optimizer | None = None
         self._tickers: list[str] = []
+        self._history: list[EpochStats] = []
+        self._last_date: pd.Timestamp | None = None
+        #fine_tune calls since the last full fit
+        self._fine_tunes: int = 0
+        self._hidden: HiddenState | None = None
 
     @property
     def tickers(self) -> list[str]:
         return self._tickers
 
-    def fit(self, returns_wide: DataFrame) -> None:
+    @property
+    def last_date(self) -> pd.Timestamp | None:
+        """
+        Last date of the returns the model was trained on
+        """
+        return self._last_date
+
+    @property
+    def fine_tunes(self) -> int:
+        """
+        fine_tune calls since the last full fit
+        """
+        return self._fine_tunes
+
+    def structure_changes(self, cfg: NNDirectionsConfig) -> list[str]:
+        """
+        Returns the STRUCTURE_FIELDS that differ between cfg and the config
+        the model was built with, a model can only be fine-tuned without any
+        """
+        return [f for f in STRUCTURE_FIELDS if getattr(cfg, f) != getattr(self.cfg, f)]
+
+    @property
+    def history(self) -> list[EpochStats]:
+        """
+        Per epoch statistics of the last training
+        """
+        return self._history
+
+    @property
+    def factor_spec(self) -> FactorSpec:
+        return FactorSpec(
+            n_factors=self.cfg.n_factors,
+            standardize=self.cfg.standardize,
+            solver=self.cfg.factor_solver,
+            forgetting=self.cfg.factor_forgetting,
+            dtype=self.cfg.factor_dtype,
+        )
+
+    def fit(self, returns_wide: DataFrame, *, factor_model: PCAReturnFactors | None = None) -> None:
+        """
+        Fits the factor model and trains the GRU on its factors.
+
+        factor_model: optional factor model already fitted (or updated with
+        partial_fit) on returns_wide's tickers, used instead of a new fit
+        """
         if returns_wide.empty:
             raise ValueError("returns_wide is empty")
         if returns_wide.isna().any().any():
@@ -95,24 +255,124 @@ class NNDirectionsTrainer:
         n_tickers = len(self._tickers)
 
         # 1) Fit factor model on full training period returns
-        factor_spec = FactorSpec(n_factors=self.cfg.n_factors, standardize=self.cfg.standardize)
-        fm = PCAReturnFactors(factor_spec).fit(returns_wide)
+        if factor_model is None:
+            fm = PCAReturnFactors(self.factor_spec).fit(returns_wide)
+        elif factor_model.tickers != self._tickers:
+            raise ValueError("factor_model tickers differ from returns_wide tickers/order.")
+        else:
+            fm = factor_model
         factors = fm.transform(returns_wide)  # (T, K)
         logger.debug(f"factors.shape={factors.shape}, fm.n_factors={fm.n_factors}")
+        logger.info(f"PCA ({fm.solver}) explains {fm.explained_variance_ratio.sum():.1%} of return variance")
 
         # 2) Dataset
         ds_spec = FactorDatasetSpec(lookback=self.cfg.lookback, horizon=self.cfg.horizon)
         ds = FactorWindowDirectionDataset(factors=factors, returns_wide=returns_wide, spec=ds_spec)
-        loader = DataLoader(ds, batch_size=self.cfg.batch_size, shuffle=True, drop_last=False)
+
+        # 3) Model, 4) Train
+        self._model, self._optimizer = self._train(ds, n_factors=fm.n_factors, n_tickers=n_tickers)
+        self._factor_model = fm
+        self._last_date = pd.Timestamp(returns_wide.index[-1])
+        self._fine_tunes = 0
+        #A carried state belongs to the old weights
+        self._hidden = None
+
+    def fit_out_of_core(self,
+                        chunks: Callable[[], Iterable[DataFrame]],
+                        root: Path,
+                        *,
+                        label_format: str = "packbits",
+                        ) -> MemmapFactorDataset:
+        """
+        fit() for returns that do not fit in memory. Makes two passes over
+        the returns, given as date ordered chunks with the same columns:
+        the first fits the factor model (fit on the first chunks, then
+        partial_fit), the second writes factors and labels to a memory-mapped
+        dataset under root, which the GRU is then trained on.
+
+        Params:
+        - chunks: returns a new iterator over the chunks for every pass, see
+        MarketDataSource.iter_returns_chunks
+        - root: directory of the dataset, replaced
+        - label_format: "packbits" or "uint8", see MemmapDatasetWriter
+
+        Returns:
+        - the dataset, for predict_latest_from
+        """
+        # 1) Factor model, the first fit needs a few rows per factor
+        fm = PCAReturnFactors(self.factor_spec)
+        head: list[DataFrame] = []
+        for chunk in chunks():
+            if chunk.isna().any().any():
+                raise ValueError("returns chunk contains NaNs (v1 requires no NaNs)")
+            if fm.last_date is None:
+                head.append(chunk)
+                if sum(len(c) for c in head) >= 2 * self.cfg.n_factors:
+                    fm.fit(pd.concat(head))
+                    head = []
+            else:
+                fm.partial_fit(chunk)
+        if head:
+            fm.fit(pd.concat(head))
+        if fm.last_date is None:
+            raise ValueError("returns chunks are empty")
+        self._tickers = list(fm.tickers)
+        logger.info(f"PCA ({fm.solver}, {fm.drift().updates} updates) explains {fm.explained_variance_ratio.sum():.1%} of return variance")
+
+        # 2) Dataset
+        ds_spec = FactorDatasetSpec(lookback=self.cfg.lookback, horizon=self.cfg.horizon)
+        writer = None
+        try:
+            for chunk in chunks():
+                factors = fm.transform(chunk)
+                if writer is None:
+                    writer = MemmapDatasetWriter(
+                        root,
+                        tickers=self._tickers,
+                        factor_names=list(factors.columns),
+                        spec=ds_spec,
+                        label_format=label_format,
+                    )
+                writer.append(factors, chunk)
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is None:
+            raise ValueError("returns chunks are empty")
+        ds = writer.close()
+
+        # 3) Model, 4) Train
+        self._model, self._optimizer = self._train(ds, n_factors=fm.n_factors, n_tickers=len(self._tickers))
+        self._factor_model = fm
+        self._last_date = ds.last_date
+        self._fine_tunes = 0
+        self._hidden = None
+        return ds
+
+    def _train(self,
+               ds: FactorWindowDirectionDataset | MemmapFactorDataset,
+               *,
+               n_factors: int,
+               n_tickers: int,
+               ) -> tuple[_FactorGRUToUniverse, torch.optim.Optimizer]:
+        if self.cfg.batched_windows or isinstance(ds, MemmapFactorDataset):
+            sampler = WindowBatchSampler(len(ds), self.cfg.batch_size, shuffle=True, drop_last=self.cfg.compile)
+            loader = DataLoader(BatchedWindows(ds), sampler=sampler, batch_size=None)
+        else:
+            loader = DataLoader(ds, batch_size=self.cfg.batch_size, shuffle=True, drop_last=self.cfg.compile)
 
         # 3) Model
+        _set_threads(self.cfg)
         device = torch.device(self.cfg.device)
         model = _FactorGRUToUniverse(
-            n_factors=fm.n_factors,
+            n_factors=n_factors,
             hidden_size=self.cfg.hidden_size,
             num_layers=self.cfg.num_layers,
             n_tickers=n_tickers,
         ).to(device)
+        #The compiled module shares the parameters, model is what is kept
+        step_model = _compile(model, self.cfg.compile_mode) if self.cfg.compile else model
 
         opt = torch.optim.AdamW(model.parameters(), lr=self.cfg.lr, weight_decay=self.cfg.weight_decay)
         loss_fn = nn.BCEWithLogitsLoss()
@@ -132,25 +392,141 @@ class NNDirectionsTrainer:
         #         loss.backward()
         #         opt.step()
         model.train()
+        self._history = []
         for _epoch in range(1, self.cfg.epochs + 1):
             #Must remove pbar if using something else than terminal, see above
             #for clean without progerss updates.
             pbar= tqdm(loader, desc=f"Train epoch {_epoch}/{self.cfg.epochs}", leave=False)
+            t0 = time.perf_counter()
+            #Losses are summed on the device, reading one waits for the step
+            epoch_loss = torch.zeros((), device=device)
+            window_loss = torch.zeros((), device=device)
+            steps = samples = 0
             for x, y in pbar:
                 # x: (B, lookback, K)
                 # y: (B, N)
                 x = x.to(device)
                 y = y.to(device)
 
-                opt.zero_grad(set_to_none=True)
-                logits = model(x)
-                loss = loss_fn(logits, y)
-                loss.backward()
-                opt.step()
-                pbar.set_postfix(loss=float(loss.detach().cpu()))
+                loss = self._step(step_model, opt, loss_fn, x, y)
+                epoch_loss += loss
+                window_loss += loss
+                steps += 1
+                samples += len(x)
+                if self.cfg.log_every > 0 and steps % self.cfg.log_every == 0:
+                    pbar.set_postfix(loss=float(window_loss) / self.cfg.log_every)
+                    window_loss.zero_()
+            stats = EpochStats(
+                epoch=_epoch,
+                loss=float(epoch_loss) / max(steps, 1),
+                seconds=time.perf_counter() - t0,
+                samples=samples,
+            )
+            self._history.append(stats)
+            logger.debug(f"{stats}, {stats.samples_per_sec:.0f} samples/s")
+        return model, opt
+
+    def fine_tune(self,
+                  returns_wide: DataFrame,
+                  *,
+                  steps: int | None = None,
+                  recent: int | None = None,
+                  replay: float | None = None,
+                  ) -> int:
+        """
+        Continues training a fitted (or loaded) model and optimizer on the
+        days added to returns_wide since last_date, instead of a full fit.
+
+        Each of the steps batches mixes the newest windows (at least recent,
+        all new ones) with a replay share of windows drawn from the older
+        history, at the lower cfg.finetune_lr, so the model keeps what it
+        learned on the earlier years. The
+        factor model is kept as it is, the GRU was trained on its factors; a
+        full fit() refreshes both and should be scheduled regularly, see
+        fine_tunes.
+
+        Params:
+        - returns_wide: the returns the model was trained on plus the new
+        days, same tickers and order
+        - steps, recent, replay: default to the finetune_ settings of cfg
+
+        Returns:
+        - the number of new days, 0 when there was nothing to train on
+        """
+        if self._model is None or self._factor_model is None or self._optimizer is None:
+            raise RuntimeError("Nothing to fine-tune. Call fit() or load() a model with optimizer state first.")
+        if list(returns_wide.columns) != self._tickers:
+            raise ValueError("returns_wide tickers differ from training tickers/order.")
+        steps = self.cfg.finetune_steps if steps is None else steps
+        recent = self.cfg.finetune_recent if recent is None else recent
+        replay = self.cfg.finetune_replay if replay is None else replay
+        if not 0.0 <= replay < 1.0:
+            raise ValueError(f"replay must be in [0, 1), got {replay}")
 
-        self._factor_model = fm
-        self._model = model
+        n_new = len(returns_wide) if self._last_date is None else int((returns_wide.index > self._last_date).sum())
+        if n_new == 0:
+            return 0
+
+        factors = self._factor_model.transform(returns_wide)
+        ds_spec = FactorDatasetSpec(lookback=self.cfg.lookback, horizon=self.cfg.horizon)
+        ds = FactorWindowDirectionDataset(factors=factors, returns_wide=returns_wide, spec=ds_spec)
+
+        # The newest windows come last, the rest are the replay pool
+        n = len(ds)
+        n_recent = min(max(recent, n_new), n)
+        n_older = n - n_recent
+        batch = self.cfg.batch_size
+        b_replay = round(batch * replay) if n_older > 0 else 0
+        b_recent = batch - b_replay
+
+        _set_threads(self.cfg)
+        device = torch.device(self.cfg.device)
+        step_model = _compile(self._model, self.cfg.compile_mode) if self.cfg.compile else self._model
+        loss_fn = nn.BCEWithLogitsLoss()
+
+        for group in self._optimizer.param_groups:
+            group["lr"] = self.cfg.finetune_lr
+        self._model.train()
+        t0 = time.perf_counter()
+        total = torch.zeros((), device=device)
+        for _ in range(steps):
+            idx = torch.cat([
+                n_older + torch.randint(n_recent, (b_recent,)),
+                torch.randint(max(n_older, 1), (b_replay,)),
+            ])
+            x, y = ds.batch(idx)
+            total += self._step(step_model, self._optimizer, loss_fn, x.to(device), y.to(device))
+        self._model.eval()
+
+        self._history = [EpochStats(epoch=1, loss=float(total) / max(steps, 1), seconds=time.perf_counter() - t0, samples=steps * batch)]
+        self._last_date = pd.Timestamp(returns_wide.index[-1])
+        self._fine_tunes += 1
+        self._hidden = None
+        logger.debug(f"Fine-tuned on {n_new} new days, {n_recent} recent and {n_older} older windows: {self._history[0]}")
+        return n_new
+
+    def _step(self,
+              step_model: Callable[[torch.Tensor], torch.Tensor],
+              opt: torch.optim.Optimizer,
+              loss_fn: nn.Module,
+              x: torch.Tensor,
+              y: torch.Tensor,
+              ) -> torch.Tensor:
+        """
+        One optimizer step, returns the detached loss without reading it
+        """
+        opt.zero_grad(set_to_none=True)
+        with self._autocast(x.device):
+            logits = step_model(x)
+            loss = loss_fn(logits, y)
+        loss.backward()
+        opt.step()
+        return loss.detach()
+
+    def _autocast(self, device: torch.device):
+        if not self.cfg.bf16_autocast:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
 
     @torch.no_grad()
     def predict_latest(self, returns_wide: DataFrame) -> Prediction:
@@ -167,19 +543,191 @@ class NNDirectionsTrainer:
         if list(returns_wide.columns) != self._tickers:
             raise ValueError("returns_wide tickers differ from training tickers/order.")
 
-        if returns_wide.isna().any().any():
-            raise ValueError("returns_wide contains NaNs (v1 requires no NaNs)")
-
         lookback = self.cfg.lookback
         if len(returns_wide) < lookback + 1:
             raise ValueError(f"Need at least {lookback + 1} rows of returns to predict latest.")
 
-        # Transform all returns to factors, then take last lookback factor rows
-        factors = self._factor_model.transform(returns_wide)
-        window = factors.iloc[-lookback:, :]  # (lookback, K)
+        # The factors are a per-row projection, only the last lookback rows
+        # are transformed
+        x = self._factor_window(returns_wide.iloc[-lookback:, :])  # (1, T, K)
 
-        x = torch.from_numpy(window.to_numpy(dtype=np.float32)).unsqueeze(0)  # (1, T, K)
+        self._model.eval()
+        logits = self._model(x).squeeze(0)  # (N,)
+        probs = torch.sigmoid(logits).detach().cpu().numpy()
 
+        probs_s = pd.Series(probs, index=self._tickers, name="p_up")
+        pred_date = pd.Timestamp(returns_wide.index[-1])
+        return Prediction(date=pred_date, probs_up=probs_s)
+
+    @torch.no_grad()
+    def predict_incremental(self, returns_wide: DataFrame) -> Prediction:
+        """
+        predict_latest that carries the GRU hidden state from the previous
+        call, so a new day costs its factor projection and one recurrent
+        step instead of the whole window.
+
+        This is an approximation: the model is trained on windows started
+        from a zero state lookback days back, while a carried state has
+        seen every day since it was built, so its predictions drift away
+        from predict_latest's the longer it is carried. The state is rebuilt
+        from the last lookback rows (matching predict_latest exactly) when
+        there is none, when returns_wide does not continue it, and after
+        cfg.hidden_max_steps days. The state is dropped by every fit and
+        fine_tune, and a day whose returns changed since the state saw it is
+        not reused.
+
+        Params:
+        - returns_wide: returns up to the day to predict from, at least the
+        days since the previous call, or lookback + 1 rows to rebuild
+        """
+        if self._model is None or self._factor_model is None:
+            raise RuntimeError("Trainer not fitted. Call fit() first.")
+        if list(returns_wide.columns) != self._tickers:
+            raise ValueError("returns_wide tickers differ from training tickers/order.")
+
+        last = pd.Timestamp(returns_wide.index[-1])
+        state = self._hidden
+        #A state is only continued from its own day's returns as it saw them
+        if state is not None and (
+            state.date not in returns_wide.index
+            or _row_fingerprint(returns_wide.loc[state.date]) != state.fingerprint
+        ):
+            state = None
+        if state is not None and state.date == last:
+            return Prediction(date=last, probs_up=pd.Series(state.probs, index=self._tickers, name="p_up"))
+
+        self._model.eval()
+        new = None
+        if state is not None:
+            new = returns_wide.loc[returns_wide.index > state.date]
+            if state.steps + len(new) > self.cfg.hidden_max_steps:
+                new = None
+        if new is not None and state is not None:
+            logits, h = self._model.step(self._factor_window(new), state.h)
+            steps = state.steps + len(new)
+        else:
+            lookback = self.cfg.lookback
+            if len(returns_wide) < lookback + 1:
+                raise ValueError(f"Need at least {lookback + 1} rows of returns to predict latest.")
+            logits, h = self._model.step(self._factor_window(returns_wide.iloc[-lookback:, :]))
+            steps = 0
+
+        probs = torch.sigmoid(logits.squeeze(0)).cpu().numpy()
+        self._hidden = HiddenState(date=last, h=h, steps=steps, probs=probs, fingerprint=_row_fingerprint(returns_wide.iloc[-1]))
+        return Prediction(date=last, probs_up=pd.Series(probs, index=self._tickers, name="p_up"))
+
+    @torch.no_grad()
+    def score_dates(self,
+                    returns_wide: DataFrame,
+                    dates: Iterable[pd.Timestamp] | None = None,
+                    *,
+                    batch_size: int = 512,
+                    ) -> DataFrame:
+        """
+        predict_latest for many dates of returns_wide at once: the whole
+        matrix is projected once, and the windows ending on the dates are
+        gathered from a strided view and run through the model in batches.
+
+        Params:
+        - dates: dates of returns_wide to score, default every date with a
+        full window before it
+        - batch_size: windows per forward pass
+
+        Returns:
+        - (dates x tickers) up probabilities for the day after each date
+        """
+        if self._model is None or self._factor_model is None:
+            raise RuntimeError("Trainer not fitted. Call fit() first.")
+        if list(returns_wide.columns) != self._tickers:
+            raise ValueError("returns_wide tickers differ from training tickers/order.")
+
+        lookback = self.cfg.lookback
+        Z = np.ascontiguousarray(self._factor_model.transform(returns_wide).to_numpy(dtype=np.float32))  # (T, K)
+        T, K = Z.shape
+        if T < lookback:
+            raise ValueError(f"Need at least {lookback} rows of returns to score.")
+        index = pd.DatetimeIndex(returns_wide.index[lookback - 1 :] if dates is None else list(dates))
+        pos = returns_wide.index.get_indexer(index)
+        if (pos < 0).any():
+            raise ValueError("dates must be dates of returns_wide")
+        if (pos < lookback - 1).any():
+            raise ValueError(f"dates need {lookback - 1} rows of returns before them")
+
+        # (T - lookback + 1, lookback, K), windows[i] ends on row i + lookback - 1
+        windows = np.lib.stride_tricks.as_strided(
+            Z, shape=(T - lookback + 1, lookback, K), strides=(Z.strides[0], Z.strides[0], Z.strides[1]), writeable=False
+        )
+        device = torch.device(self.cfg.device)
+        self._model.eval()
+        out = np.empty((len(pos), len(self._tickers)), dtype=np.float32)
+        for lo in range(0, len(pos), batch_size):
+            x = torch.from_numpy(windows[pos[lo : lo + batch_size] - (lookback - 1)]).to(device)
+            out[lo : lo + batch_size] = torch.sigmoid(self._model(x)).cpu().numpy()
+        return pd.DataFrame(out, index=index, columns=self._tickers, copy=False)
+
+    def _factor_window(self, returns_rows: DataFrame) -> torch.Tensor:
+        """
+        Factors of the rows as a model input, (1, rows, K)
+        """
+        assert self._factor_model is not None
+        if returns_rows.isna().any().any():
+            raise ValueError("returns_wide contains NaNs (v1 requires no NaNs)")
+        factors = self._factor_model.transform(returns_rows)
+        x = torch.from_numpy(np.require(factors.to_numpy(dtype=np.float32), requirements=["C", "W"])).unsqueeze(0)
+        return x.to(torch.device(self.cfg.device))
+
+    @property
+    def hidden_steps(self) -> int | None:
+        """
+        Days the state of predict_incremental has been carried since it was
+        built from a full window, None without a state
+        """
+        return self._hidden.steps if self._hidden is not None else None
+
+    def save_hidden(self, path: Path) -> None:
+        """
+        Saves the state carried by predict_incremental, to continue it in a
+        later process with load_hidden
+        """
+        if self._hidden is None:
+            raise RuntimeError("No hidden state, call predict_incremental() first.")
+        st = self._hidden
+        tmp = path.with_name(path.name + ".tmp")
+        torch.save({
+            "date": st.date.isoformat(),
+            "h": st.h.cpu(),
+            "steps": st.steps,
+            "probs": torch.from_numpy(st.probs),
+            "fingerprint": st.fingerprint,
+        }, tmp)
+        os.replace(tmp, path)
+
+    def load_hidden(self, path: Path) -> None:
+        """
+        Loads a state saved by save_hidden, for the same model. A state saved
+        without a fingerprint is rebuilt by the next predict_incremental.
+        """
+        d = torch.load(path, map_location=torch.device(self.cfg.device), weights_only=True)
+        self._hidden = HiddenState(
+            date=pd.Timestamp(d["date"]),
+            h=d["h"],
+            steps=int(d["steps"]),
+            probs=d["probs"].numpy(),
+            fingerprint=d.get("fingerprint"),
+        )
+
+    @torch.no_grad()
+    def predict_latest_from(self, ds: MemmapFactorDataset) -> Prediction:
+        """
+        predict_latest for a model trained with fit_out_of_core, from the
+        last lookback factor rows of its dataset
+        """
+        if self._model is None:
+            raise RuntimeError("Trainer not fitted. Call fit() first.")
+        if ds.tickers != self._tickers:
+            raise ValueError("dataset tickers differ from training tickers/order.")
+
+        x = ds.latest_window().unsqueeze(0)  # (1, T, K)
         device = torch.device(self.cfg.device)
         x = x.to(device)
 
@@ -188,6 +736,100 @@ class NNDirectionsTrainer:
         probs = torch.sigmoid(logits).detach().cpu().numpy()
 
         probs_s = pd.Series(probs, index=self._tickers, name="p_up")
-        pred_date = pd.Timestamp(returns_wide.index[-1])
-        return Prediction(date=pred_date, probs_up=probs_s)
+        return Prediction(date=ds.last_date, probs_up=probs_s)
+
+    def save(self, root: Path) -> Path:
+        """
+        Saves the fitted trainer as a new numbered artifact under root, see
+        artifacts.write_artifact. The artifact holds:
+        - manifest.json: the config, the ticker order and the last date
+        - model.pt: the GRU state dict
+        - optimizer.pt: the optimizer state, for fine_tune
+        - factors.npz: the factor model, see PCAReturnFactors.save
+
+        Returns:
+        - the artifact directory, for load()
+        """
+        if self._model is None or self._factor_model is None:
+            raise RuntimeError("Trainer not fitted. Call fit() first.")
+        model, opt, fm = self._model, self._optimizer, self._factor_model
+
+        def write_files(path: Path) -> None:
+            torch.save(model.state_dict(), path / "model.pt")
+            if opt is not None:
+                torch.save(opt.state_dict(), path / "optimizer.pt")
+            fm.save(path / "factors.npz")
+
+        last_date = self.last_date
+        manifest = {
+            "model": "nn_direction",
+            "config": asdict(self.cfg),
+            "tickers": self._tickers,
+            "n_factors": fm.n_factors,
+            "last_date": None if last_date is None else last_date.isoformat(),
+            "fine_tunes": self._fine_tunes,
+        }
+        return write_artifact(root, manifest, write_files)
+
+    @classmethod
+    def load(cls, path: Path) -> "NNDirectionsTrainer":
+        """
+        Loads a trainer saved by save(), ready for predict_latest, and for
+        fine_tune when the artifact has optimizer state
+        """
+        manifest = read_manifest(path)
+        if manifest.get("model") != "nn_direction":
+            raise ValueError(f"{path} is not an nn_direction artifact")
+        known = {f.name for f in fields(NNDirectionsConfig)}
+        cfg = NNDirectionsConfig(**{k: v for k, v in manifest["config"].items() if k in known})
+        trainer = cls(cfg)
+        trainer._tickers = list(manifest["tickers"])
+        trainer._factor_model = PCAReturnFactors.load(path / "factors.npz")
+        if trainer._factor_model.tickers != trainer._tickers:
+            raise ValueError(f"Factor model tickers differ from the manifest in {path}")
+
+        device = torch.device(cfg.device)
+        model = _FactorGRUToUniverse(
+            n_factors=int(manifest["n_factors"]),
+            hidden_size=cfg.hidden_size,
+            num_layers=cfg.num_layers,
+            n_tickers=len(trainer._tickers),
+        ).to(device)
+        model.load_state_dict(torch.load(path / "model.pt", map_location=device, weights_only=True))
+        model.eval()
+        trainer._model = model
+        if (path / "optimizer.pt").exists():
+            opt = torch.optim.AdamW(model.parameters(), lr=cfg.lr, weight_decay=cfg.weight_decay)
+            opt.load_state_dict(torch.load(path / "optimizer.pt", map_location=device, weights_only=True))
+            trainer._optimizer = opt
+        trainer._last_date = None if manifest["last_date"] is None else pd.Timestamp(manifest["last_date"])
+        trainer._fine_tunes = int(manifest.get("fine_tunes", 0))
+        return trainer
+
+
+def _row_fingerprint(row: pd.Series) -> str:
+    """
+    Digest of one returns row, see HiddenState.fingerprint
+    """
+    return hashlib.blake2b(np.ascontiguousarray(row.to_numpy(dtype=np.float64)).tobytes(), digest_size=16).hexdigest()
+
+
+def _compile(model: nn.Module, mode: str | None) -> Callable[[torch.Tensor], torch.Tensor]:
+    compiled = torch.compile(model, mode=mode)
+
+    def forward(x: torch.Tensor) -> torch.Tensor:
+        #Dynamo leaves RNN modules to eager (the whole forward here) unless allowed
+        with torch._dynamo.config.patch(allow_rnn=True):
+            return compiled(x)
+    return forward
+
 
+def _set_threads(cfg: NNDirectionsConfig) -> None:
+    if cfg.num_threads is not None and cfg.num_threads != torch.get_num_threads():
+        torch.set_num_threads(cfg.num_threads)
+    if cfg.num_interop_threads is not None and cfg.num_interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(cfg.num_interop_threads)
+        except RuntimeError as e:
+            #Already set, or parallel work has already started in this process
+            logger.warning(f"Could not set {cfg.num_interop_threads} inter-op threads: {e}")
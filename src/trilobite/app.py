@@ -9,12 +9,19 @@ import logging
 from trilobite.cli.runtimeflags import CliFlags
 from trilobite.ui.cli.clicontroller import CLIController
 from trilobite.config.config import AppConfig, CFGTickerService, CFGDataBase
-from trilobite.db.connect import DbSettings, connect
+from trilobite.db.connect import DbSettings, connect, open_pool
+from trilobite.db.cache import ReadCache
+from trilobite.db.fanout import ParallelReader
+from trilobite.db.metrics import QueryMetrics
 from trilobite.db.repo import MarketRepo
 from trilobite.db.schema import create_schema
+from trilobite.db.duck.connect import connect as connect_duckdb
+from trilobite.db.duck.repo import DuckMarketRepo
+from trilobite.db.duck.schema import create_schema as create_duckdb_schema
 from trilobite.handlers.uihandlers import Handler
 from trilobite.marketdata.yfclient import YFClient
 from trilobite.marketdata.marketservice import MarketService
+from trilobite.mirror.mirror import ColumnarMirror
 from trilobite.state.state import AppState
 from trilobite.tickers.tickerclient import TickerClient
 from trilobite.tickers.tickerservice import Ticker, TickerService
@@ -43,15 +50,51 @@ class App:
         self._cfg = cfg
 
         # DB wiring
-        self._conn = connect(DbSettings(
-            dbname=cfg.db.dbname,
-            host=cfg.db.host,
-            user=cfg.db.user,
-            port=cfg.db.port,
-        ))
-        logger.info(f"DB connection created")
-        create_schema(self._conn)
-        repo = MarketRepo(self._conn)
+        repo: MarketRepo | DuckMarketRepo
+        self._pool = None
+        if cfg.db.backend == "duckdb":
+            self._conn = connect_duckdb(cfg.db.duckdb_path)
+            logger.info(f"DuckDB connection created")
+            create_duckdb_schema(self._conn)
+            repo = DuckMarketRepo(self._conn)
+        elif cfg.db.backend == "postgres":
+            settings = DbSettings(
+                dbname=cfg.db.dbname,
+                host=cfg.db.host,
+                user=cfg.db.user,
+                port=cfg.db.port,
+            )
+            self._conn = connect(settings)
+            logger.info(f"DB connection created")
+            create_schema(self._conn)
+            cache = None
+            if cfg.db.read_cache:
+                cache = ReadCache(
+                    max_entries=cfg.db.read_cache_entries,
+                    max_bytes=cfg.db.read_cache_mb * 1024 * 1024,
+                )
+            metrics = None
+            if cfg.db.query_metrics:
+                metrics = QueryMetrics(
+                    slow_ms=cfg.db.slow_query_ms,
+                    summary_interval_s=cfg.db.metrics_summary_s,
+                )
+            fanout = None
+            if cfg.db.fanout_width > 1:
+                #One extra connection holds the shared snapshot
+                self._pool = open_pool(settings, min_size=1, max_size=cfg.db.fanout_width + 1)
+                fanout = ParallelReader(
+                    self._pool,
+                    width=cfg.db.fanout_width,
+                    min_tickers=cfg.db.fanout_min_tickers,
+                    shard_by=cfg.db.fanout_shard_by,
+                )
+                logger.info(f"Fan-out reads enabled, width {cfg.db.fanout_width}")
+            repo = MarketRepo(self._conn, cache=cache, metrics=metrics, fanout=fanout)
+        else:
+            raise ValueError(f"Unknown DB backend: {cfg.db.backend!r}")
+
+        self._repo = repo
 
         # Market wiring
         yfclient = YFClient()
@@ -61,8 +104,11 @@ class App:
         tickerclient = TickerClient()
         ticker = TickerService(repo=repo, tickerclient=tickerclient, cfg_ts=self._cfg.ticker, cfg_dev= self._cfg.dev)
 
+        # Mirror wiring
+        mirror = ColumnarMirror()
+
         #Create AppState
-        self._state = AppState(repo=repo, market=market, ticker=ticker)
+        self._state = AppState(repo=repo, market=market, ticker=ticker, mirror=mirror)
 
         #Handler wiring
         self._handler = Handler(self._state, self._cfg)
@@ -73,10 +119,21 @@ class App:
         """
         Attempts to close the connection to the db
         """
+        cache = getattr(self._repo, "cache", None)
+        if cache is not None:
+            logger.info(f"Read cache: {cache.stats()}")
+        metrics = getattr(self._repo, "metrics", None)
+        if metrics is not None:
+            metrics.flush()
         try:
             self._conn.close()
         except Exception:
             logger.exception("Failed at closing DB connection")
+        if self._pool is not None:
+            try:
+                self._pool.close()
+            except Exception:
+                logger.exception("Failed at closing DB pool")
 
     def run_headless(self, flags: CliFlags) -> None:
         """
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import argparse
-from trilobite.config.config import AppConfig, CFGAnalysis, CFGDataBase, CFGDev, CFGMisc, CFGTickerService
+from trilobite.config.config import AppConfig, CFGAnalysis, CFGDataBase, CFGDev, CFGExport, CFGIntraday, CFGMirror, CFGMisc, CFGScreen, CFGTickerService
 from trilobite.cli.runtimeflags import CliFlags
 
 def parse_args(argv: list[str]) -> tuple[AppConfig, CliFlags]:
@@ -19,15 +19,70 @@ def parse_args(argv: list[str]) -> tuple[AppConfig, CliFlags]:
     p.add_argument("--top-n", type=int, help="Top N tickers to display")
     p.add_argument("--n-factors", type=int, help="Components for PCA extraction")
     #p.add_argument("--min-days", type=int, help="Minimum trading days required in DB")
+    p.add_argument("--factor-solver", type=str, choices=["auto", "full", "randomized", "gram"], help="Solver for the PCA factors")
+    p.add_argument("--refit-factors", action="store_true", help="Refit the PCA factors from scratch instead of updating the saved state")
+    p.add_argument("--dtype", type=str, choices=["float32", "float64"], help="Float dtype of the returns matrix and the PCA factors")
+    p.add_argument("--memmap-dataset", action="store_true", help="Build the NN training set on disk chunk by chunk, for universes larger than memory")
+    p.add_argument("--memmap-labels", type=str, choices=["packbits", "uint8"], help="Label storage of the on-disk training set")
+    p.add_argument("--train-threads", type=int, help="torch threads for NN training")
+    p.add_argument("--train-interop-threads", type=int, help="torch inter-op threads for NN training")
+    p.add_argument("--train-compile", action="store_true", help="Train a torch.compile'd NN model, slow first step")
+    p.add_argument("--train-compile-mode", type=str, choices=["default", "reduce-overhead", "max-autotune", "max-autotune-no-cudagraphs"], help="torch.compile mode of '--train-compile'")
+    p.add_argument("--train-bf16", action="store_true", help="Train the NN under bf16 autocast")
+    p.add_argument("--fine-tune", action="store_true", help="'--train-nn' fine-tunes the latest saved model on the new days, falling back to a full training")
     p.add_argument("--lookback", type=int, help="Lookback window (days)")
     p.add_argument("--horizon", type=int, help="Prediction horizon (days)")
     p.add_argument("--epochs", type=int, help="Training epochs")
     p.add_argument("--period", type=str, help="Period to use, e.g. '30d', '2w', '4m', '6y'")
     p.add_argument("--ticker", type=str, help="Ticker to use")
+    p.add_argument("--backend", type=str, choices=["postgres", "duckdb"], help="Storage backend to read from and write to")
+    p.add_argument("--duckdb-path", type=str, help="DuckDB database file, default data/trilobite.duckdb")
+    p.add_argument("--read-cache", action="store_true", help="Cache repeated DB reads in memory until the data is written again")
+    p.add_argument("--query-metrics", action="store_true", help="Time every DB statement and log a summary")
+    p.add_argument("--slow-query-ms", type=float, help="Statements slower than this are written to logs/slow_queries.log")
+    p.add_argument("--fanout-width", type=int, help="Split large matrix reads into this many shards read in parallel, 1 turns it off")
+    p.add_argument("--fanout-shard-by", type=str, choices=["ticker", "date"], help="Split fan-out reads by ticker ranges or date ranges")
+    p.add_argument("--active-only", action="store_true", help="Screen: only tickers marked as active")
+    p.add_argument("--min-coverage", type=float, help="Screen: least share (0-1) of the period's trading days a ticker needs data on")
+    p.add_argument("--max-gap", type=int, help="Screen: most consecutive trading days a ticker may miss")
+    p.add_argument("--min-price", type=float, help="Screen: least last close in the period")
+    p.add_argument("--min-volume", type=float, help="Screen: least average volume over '--volume-days'")
+    p.add_argument("--min-dollar-volume", type=float, help="Screen: least average close*volume over '--volume-days'")
+    p.add_argument("--volume-days", type=int, help="Screen: trading days the volume filters average over")
+    p.add_argument("--export-datasets", type=str, help="Comma separated datasets for '--export': ohlcv, returns, adjclose_matrix, returns_matrix")
+    p.add_argument("--export-format", type=str, choices=["parquet", "arrow"], help="File format of '--export'")
+    p.add_argument("--export-partition", type=str, choices=["ticker", "year"], help="Partition the exported files by ticker or year")
+    p.add_argument("--incremental", action="store_true", help="Only export rows newer than the last export")
+    p.add_argument("--intraday-interval", type=str, choices=["1m", "5m", "1h"], help="Bar length used by '--update-intraday'")
+    p.add_argument("--retry-failed", action="store_true", help="Fetch tickers '--updateall' would skip after repeated failures")
+    p.add_argument("--use-mirror", action="store_true", help="Read prices from the local columnar mirror, and sync it after '--updateall'")
 
+    p.add_argument("--predict", action="store_true", help="Rank with the latest model saved by '--train-nn', without training")
+    p.add_argument("--carry-state", action="store_true", help="'--predict' continues the model's GRU state from the previous '--predict' instead of rerunning the window")
+    p.add_argument("--backtest", action="store_true", help="Walk-forward backtest of the NN over '--period', refitting every '--refit-every' days")
+    p.add_argument("--backtest-window", type=str, choices=["expanding", "rolling"], help="'--backtest' trains on all earlier days or on the last '--train-days'")
+    p.add_argument("--train-days", type=int, help="Days of the first (or every rolling) '--backtest' training set")
+    p.add_argument("--refit-every", type=int, help="Days '--backtest' scores with a model before refitting")
+    p.add_argument("--backtest-workers", type=int, help="Processes '--backtest' runs its folds in")
+    p.add_argument("--backtest-seed", type=int, help="Torch seed of the '--backtest' folds, plus the fold number")
+    p.add_argument("--sweep", action="store_true", help="Hyperparameter search of the NN over '--sweep-space', results written to data/sweeps")
+    p.add_argument("--sweep-space", type=str, help="Search space, e.g. 'n_factors=16,32;lookback=20,60;lr=1e-4:1e-2' (ranges for random search)")
+    p.add_argument("--sweep-search", type=str, choices=["grid", "random"], help="Try every combination of '--sweep-space', or '--sweep-trials' drawn from it")
+    p.add_argument("--sweep-trials", type=int, help="Trials of a random '--sweep'")
+    p.add_argument("--sweep-metric", type=str, choices=["auc", "hit_rate", "long_short", "loss"], help="Validation metric '--sweep' ranks the trials by")
+    p.add_argument("--sweep-rungs", type=int, help="Successive halving rungs of '--sweep', 1 trains every trial fully")
+    p.add_argument("--sweep-workers", type=int, help="Processes '--sweep' runs its trials in")
+    p.add_argument("--trial-threads", type=int, help="torch threads of each '--sweep' trial")
     p.add_argument("--display-graph", action="store_true", help="Displays a graph of '--ticker' adjusted close over '--period'")
     p.add_argument("--updateall", action="store_true", help="Updates all tickers to today")
+    p.add_argument("--update-intraday", action="store_true", help="Fetches intraday bars for all active tickers, rolls them up to daily bars and applies retention")
     p.add_argument("--train-nn", action="store_true", help="Train NN and print ranked predictioN")
+    p.add_argument("--rebuild-stats", action="store_true", help="Rebuilds the instrument_stats and returns_daily tables from stored OHLCV data")
+    p.add_argument("--sync-mirror", action="store_true", help="Syncs the local columnar mirror with the DB")
+    p.add_argument("--compact-cold", action="store_true", help="Moves sealed years of OHLCV data into the compressed cold tier")
+    p.add_argument("--vacuum-full", action="store_true", help="'--compact-cold' rewrites the price tables with VACUUM FULL, locking them meanwhile")
+    p.add_argument("--sync-duckdb", action="store_true", help="Copies the PostgreSQL tables into the DuckDB file")
+    p.add_argument("--export", action="store_true", help="Streams prices and returns to Parquet or Arrow files in exports/")
 
 
     ns = p.parse_args(argv)
@@ -46,9 +101,19 @@ def parse_args(argv: list[str]) -> tuple[AppConfig, CliFlags]:
     tickerservice = CFGTickerService(
         default_date = _use_cli_or_cfg(ns.default_date, CFGTickerService.default_date),
         default_timedelta = _use_cli_or_cfg(ns.default_timedelta, CFGTickerService.default_timedelta),
+        retry_failed = ns.retry_failed or CFGTickerService.retry_failed,
+    )
+    #Might need to create flags for the connection settings later
+    db = CFGDataBase(
+        backend = _use_cli_or_cfg(ns.backend, CFGDataBase.backend),
+        duckdb_path = _use_cli_or_cfg(ns.duckdb_path, CFGDataBase.duckdb_path),
+        read_cache = ns.read_cache or CFGDataBase.read_cache,
+        query_metrics = ns.query_metrics or CFGDataBase.query_metrics,
+        vacuum_full = ns.vacuum_full or CFGDataBase.vacuum_full,
+        slow_query_ms = _use_cli_or_cfg(ns.slow_query_ms, CFGDataBase.slow_query_ms),
+        fanout_width = _use_cli_or_cfg(ns.fanout_width, CFGDataBase.fanout_width),
+        fanout_shard_by = _use_cli_or_cfg(ns.fanout_shard_by, CFGDataBase.fanout_shard_by),
     )
-    #Might need to create flags for these two later
-    db = CFGDataBase()
     misc = CFGMisc()
     analysis = CFGAnalysis(
         top_n = _use_cli_or_cfg(ns.top_n, CFGAnalysis.top_n),
@@ -58,6 +123,51 @@ def parse_args(argv: list[str]) -> tuple[AppConfig, CliFlags]:
         epochs = _use_cli_or_cfg(ns.epochs, CFGAnalysis.epochs),
         period = _use_cli_or_cfg(ns.period, CFGAnalysis.period),
         ticker = _use_cli_or_cfg(ns.ticker, CFGAnalysis.ticker),
+        factor_solver = _use_cli_or_cfg(ns.factor_solver, CFGAnalysis.factor_solver),
+        factor_updates = CFGAnalysis.factor_updates and not ns.refit_factors,
+        dtype = _use_cli_or_cfg(ns.dtype, CFGAnalysis.dtype),
+        train_threads = _use_cli_or_cfg(ns.train_threads, CFGAnalysis.train_threads),
+        train_interop_threads = _use_cli_or_cfg(ns.train_interop_threads, CFGAnalysis.train_interop_threads),
+        train_compile = ns.train_compile or CFGAnalysis.train_compile,
+        train_compile_mode = _use_cli_or_cfg(ns.train_compile_mode, CFGAnalysis.train_compile_mode),
+        train_bf16 = ns.train_bf16 or CFGAnalysis.train_bf16,
+        fine_tune = ns.fine_tune or CFGAnalysis.fine_tune,
+        carry_state = ns.carry_state or CFGAnalysis.carry_state,
+        backtest_window = _use_cli_or_cfg(ns.backtest_window, CFGAnalysis.backtest_window),
+        backtest_train_days = _use_cli_or_cfg(ns.train_days, CFGAnalysis.backtest_train_days),
+        backtest_refit_every = _use_cli_or_cfg(ns.refit_every, CFGAnalysis.backtest_refit_every),
+        backtest_workers = _use_cli_or_cfg(ns.backtest_workers, CFGAnalysis.backtest_workers),
+        backtest_seed = _use_cli_or_cfg(ns.backtest_seed, CFGAnalysis.backtest_seed),
+        sweep_space = _use_cli_or_cfg(ns.sweep_space, CFGAnalysis.sweep_space),
+        sweep_search = _use_cli_or_cfg(ns.sweep_search, CFGAnalysis.sweep_search),
+        sweep_trials = _use_cli_or_cfg(ns.sweep_trials, CFGAnalysis.sweep_trials),
+        sweep_metric = _use_cli_or_cfg(ns.sweep_metric, CFGAnalysis.sweep_metric),
+        sweep_rungs = _use_cli_or_cfg(ns.sweep_rungs, CFGAnalysis.sweep_rungs),
+        sweep_workers = _use_cli_or_cfg(ns.sweep_workers, CFGAnalysis.sweep_workers),
+        sweep_trial_threads = _use_cli_or_cfg(ns.trial_threads, CFGAnalysis.sweep_trial_threads),
+        memmap_dataset = ns.memmap_dataset or CFGAnalysis.memmap_dataset,
+        memmap_labels = _use_cli_or_cfg(ns.memmap_labels, CFGAnalysis.memmap_labels),
+    )
+    mirror = CFGMirror(
+        enabled = ns.use_mirror or CFGMirror.enabled,
+    )
+    intraday = CFGIntraday(
+        interval = _use_cli_or_cfg(ns.intraday_interval, CFGIntraday.interval),
+    )
+    screen = CFGScreen(
+        active_only = ns.active_only or CFGScreen.active_only,
+        min_coverage = _use_cli_or_cfg(ns.min_coverage, CFGScreen.min_coverage),
+        max_gap_days = _use_cli_or_cfg(ns.max_gap, CFGScreen.max_gap_days),
+        min_price = _use_cli_or_cfg(ns.min_price, CFGScreen.min_price),
+        min_volume = _use_cli_or_cfg(ns.min_volume, CFGScreen.min_volume),
+        min_dollar_volume = _use_cli_or_cfg(ns.min_dollar_volume, CFGScreen.min_dollar_volume),
+        volume_days = _use_cli_or_cfg(ns.volume_days, CFGScreen.volume_days),
+    )
+    export = CFGExport(
+        datasets = tuple(ns.export_datasets.split(",")) if ns.export_datasets else CFGExport.datasets,
+        format = _use_cli_or_cfg(ns.export_format, CFGExport.format),
+        partition_by = _use_cli_or_cfg(ns.export_partition, CFGExport.partition_by),
+        incremental = ns.incremental or CFGExport.incremental,
     )
     cfg = AppConfig(
         dev=dev,
@@ -65,12 +175,25 @@ def parse_args(argv: list[str]) -> tuple[AppConfig, CliFlags]:
         db=db,
         misc=misc,
         analysis=analysis,
+        mirror=mirror,
+        intraday=intraday,
+        screen=screen,
+        export=export,
     )
     #Cliflags
     cliflags = CliFlags(
         updateall=ns.updateall,
+        update_intraday=ns.update_intraday,
         train_nn=ns.train_nn,
-        display_graph=ns.display_graph
+        predict=ns.predict,
+        backtest=ns.backtest,
+        sweep=ns.sweep,
+        display_graph=ns.display_graph,
+        rebuild_stats=ns.rebuild_stats,
+        sync_mirror=ns.sync_mirror,
+        sync_duckdb=ns.sync_duckdb,
+        compact_cold=ns.compact_cold,
+        export=ns.export,
     )
     return cfg, cliflags
 
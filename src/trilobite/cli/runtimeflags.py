@@ -24,7 +24,16 @@ class ConfigFlags:
 class CliFlags:
     #Commands
     updateall: bool = False
+    update_intraday: bool = False
     train_nn: bool = False
+    predict: bool = False
+    backtest: bool = False
+    sweep: bool = False
     display_graph: bool = False
+    rebuild_stats: bool = False
+    sync_mirror: bool = False
+    sync_duckdb: bool = False
+    compact_cold: bool = False
+    export: bool = False
 
 
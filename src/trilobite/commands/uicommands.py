@@ -9,12 +9,38 @@ class CmdQuit(Command): ...
 @dataclass(frozen=True)
 class CmdUpdateAll(Command): ...
 
+@dataclass(frozen=True)
+class CmdUpdateIntraday(Command): ...
+
 @dataclass(frozen=True)
 class CmdNotAnOption(Command): ...
 
 @dataclass(frozen=True)
 class CmdTrainNN(Command): ...
 
+@dataclass(frozen=True)
+class CmdPredict(Command): ...
+
+@dataclass(frozen=True)
+class CmdBacktest(Command): ...
+
+@dataclass(frozen=True)
+class CmdSweep(Command): ...
+
 @dataclass(frozen=True)
 class CmdDisplayGraph(Command): ...
 
+@dataclass(frozen=True)
+class CmdRebuildStats(Command): ...
+
+@dataclass(frozen=True)
+class CmdSyncMirror(Command): ...
+
+@dataclass(frozen=True)
+class CmdSyncDuckDB(Command): ...
+
+@dataclass(frozen=True)
+class CmdCompactCold(Command): ...
+
+@dataclass(frozen=True)
+class CmdExport(Command): ...
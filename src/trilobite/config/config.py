@@ -17,6 +17,14 @@ class CFGTickerService:
     """
     default_date: date = date(1975,1,1)
     default_timedelta: int = 1
+    #Negative cache of failing tickers, see fetch_failure in db/schema.py.
+    #From failure_min_streak failures in a row a ticker is skipped by 
+    #--updateall for failure_ttl_hours, doubled for every further failure up 
+    #to failure_max_ttl_days. retry_failed (--retry-failed) fetches them all
+    failure_min_streak: int = 2
+    failure_ttl_hours: float = 24.0
+    failure_max_ttl_days: float = 30.0
+    retry_failed: bool = False
 
 @dataclass(frozen=True)
 class CFGDataBase:
@@ -24,6 +32,32 @@ class CFGDataBase:
     host: str  = "/run/postgresql"
     user: str | None = None
     port: int = 5432
+    #Storage backend, "postgres" or "duckdb" (embedded file, see db/duck)
+    backend: str = "postgres"
+    #DuckDB database file, None uses data/trilobite.duckdb
+    duckdb_path: str | None = None
+    #In-process LRU cache of repo reads, for long running processes
+    read_cache: bool = False
+    read_cache_entries: int = 256
+    read_cache_mb: int = 64
+    #Per statement timing in the repo, summary logged every interval and at 
+    #exit, statements slower than slow_query_ms go to logs/slow_queries.log
+    query_metrics: bool = False
+    #Full years kept in ohlcv_daily before the current one, older years are
+    #moved to the cold tier by --compact-cold
+    hot_years: int = 5
+    #--compact-cold ends with a VACUUM FULL instead of a plain VACUUM, to give
+    #the freed space back to the OS. Locks both price tables while it runs
+    vacuum_full: bool = False
+    slow_query_ms: float = 250.0
+    metrics_summary_s: float = 60.0
+    #Parallel fan-out of large matrix reads, see db/fanout.py. Shards run on
+    #fanout_width pooled connections sharing one snapshot, 1 turns it off.
+    #Reads of fewer than fanout_min_tickers tickers are not split, shards are
+    #ticker ranges ("ticker") or date ranges ("date")
+    fanout_width: int = 1
+    fanout_min_tickers: int = 200
+    fanout_shard_by: str = "ticker"
 
 @dataclass(frozen=True)
 class CFGMisc:
@@ -33,6 +67,67 @@ class CFGMisc:
     stagger_start: float = 0.1
     stagger_amount: float = 0.2
 
+@dataclass(frozen=True)
+class CFGMirror:
+    """
+    Stores config settings for the local columnar mirror of the price history
+    """
+    #Read analysis and graphs from the mirror, and sync it after --updateall
+    enabled: bool = False
+    #Tickers fetched per query when syncing
+    sync_chunk_size: int = 250
+
+@dataclass(frozen=True)
+class CFGIntraday:
+    """
+    Stores config settings for the intraday bar ingestion, see 
+    --update-intraday
+    """
+    #Bar length fetched and stored, "1m", "5m" or "1h"
+    interval: str = "5m"
+    #Bars per bulk write, several tickers are written in one COPY
+    batch_rows: int = 200_000
+    #Days of bars kept per interval, older months are dropped after an update
+    retention_1m_days: int = 30
+    retention_5m_days: int = 180
+    retention_1h_days: int = 730
+    #Aggregate the bars into provisional daily rows (ohlcv_daily_provisional,
+    #not ohlcv_daily) for days that have no daily bar yet, cut at midnight in
+    #exchange_tz
+    rollup_daily: bool = True
+    exchange_tz: str = "America/New_York"
+
+@dataclass(frozen=True)
+class CFGScreen:
+    """
+    Stores the universe screen the analysis loads its tickers with, see 
+    db.screen.Screen. Unset filters are not applied, the defaults select 
+    the tickers with full coverage over the period.
+    """
+    active_only: bool = False
+    min_coverage: float | None = 1.0
+    max_gap_days: int | None = None
+    min_price: float | None = None
+    min_volume: float | None = None
+    min_dollar_volume: float | None = None
+    #Trading days the volume filters average over
+    volume_days: int = 20
+
+@dataclass(frozen=True)
+class CFGExport:
+    """
+    Stores config settings for --export, see export/exporter.py
+    """
+    #Any of "ohlcv", "returns", "adjclose_matrix", "returns_matrix"
+    datasets: tuple[str, ...] = ("ohlcv", "returns")
+    #"parquet" or "arrow" (IPC file)
+    format: str = "parquet"
+    #None, "ticker" or "year"
+    partition_by: str | None = None
+    #Only rows newer than the last export of each dataset
+    incremental: bool = False
+    batch_rows: int = 65_536
+
 @dataclass(frozen=True)
 class CFGAnalysis:
     top_n: int = 20
@@ -44,6 +139,63 @@ class CFGAnalysis:
     epochs: int = 10
     period: str = "3y"
     ticker: str = "AAPL"
+    #PCA solver, "auto", "full", "randomized" or "gram", see FactorSpec
+    factor_solver: str = "auto"
+    #Update the saved PCA state with the new days (partial_fit) instead of a
+    #full refit, a refit still happens on drift or a universe change
+    factor_updates: bool = True
+    factor_forgetting: float = 1.0
+    #Float dtype of the returns matrix and the PCA, "float32" or "float64"
+    dtype: str = "float32"
+    #Build the NN training set as memory-mapped files under data/datasets,
+    #chunk by chunk, instead of in memory
+    memmap_dataset: bool = False
+    #"packbits" (1 bit per ticker) or "uint8"
+    memmap_labels: str = "packbits"
+    memmap_chunk_days: int = 365
+    #NN training runtime, see NNDirectionsConfig. None threads leaves torch's default
+    train_threads: int | None = None
+    train_interop_threads: int | None = None
+    train_compile: bool = False
+    #torch.compile mode, None is torch's "default"
+    train_compile_mode: str | None = None
+    train_bf16: bool = False
+    train_log_every: int = 50
+    #Save every trained model under data/models for '--predict'
+    save_model: bool = True
+    #Fine-tune the latest saved model on the new days instead of training
+    #from scratch, with a full training after finetune_max fine-tunes
+    fine_tune: bool = False
+    finetune_max: int = 20
+    #Each fine-tune, see NNDirectionsTrainer.fine_tune: finetune_steps
+    #optimizer steps on the windows of the last finetune_recent days, a
+    #finetune_replay share of each batch replays older windows
+    finetune_steps: int = 20
+    finetune_recent: int = 20
+    finetune_replay: float = 0.75
+    finetune_lr: float = 1e-4
+    #'--predict' carries the model's GRU state from the previous run, so a new
+    #day is one recurrent step, see NNDirectionsTrainer.predict_incremental
+    carry_state: bool = False
+    #Days the carried state steps before it is rebuilt from a full window
+    hidden_max_steps: int = 20
+    #'--backtest', see analysis.backtest.BacktestSpec. None workers uses one
+    #process per CPU, the seed (plus the fold number) seeds each fold's torch
+    backtest_window: str = "expanding"
+    backtest_train_days: int = 504
+    backtest_refit_every: int = 63
+    backtest_workers: int | None = None
+    backtest_seed: int = 0
+    #'--sweep', see analysis.sweep.parse_space and SweepSpec. Random search
+    #draws sweep_trials trials, the best of the last sweep_val_days rank first
+    sweep_space: str = "n_factors=16,32,64;lookback=20,60;hidden_size=64,128;lr=3e-4,1e-3"
+    sweep_search: str = "grid"
+    sweep_trials: int = 20
+    sweep_metric: str = "auc"
+    sweep_val_days: int = 126
+    sweep_rungs: int = 3
+    sweep_workers: int | None = None
+    sweep_trial_threads: int | None = None
 
 @dataclass(frozen=True)
 class AppConfig:
@@ -52,4 +204,8 @@ class AppConfig:
     db: CFGDataBase
     misc: CFGMisc
     analysis: CFGAnalysis
+    mirror: CFGMirror
+    intraday: CFGIntraday
+    screen: CFGScreen
+    export: CFGExport
 
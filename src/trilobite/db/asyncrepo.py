@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Mapping, Sequence
+
+import pandas as pd
+from pandas import DataFrame
+from psycopg.rows import tuple_row
+from psycopg_pool import AsyncConnectionPool
+
+from trilobite.db import queries as q
+from trilobite.db.repo import (
+    _adjclose_long_frame,
+    _adjclose_series_frame,
+    _clean_ticker,
+    _clean_tickers,
+    _first_date,
+    _last_date,
+    _logret_long_frame,
+    _ohlcv_rows,
+)
+from trilobite.db.screen import Screen
+from trilobite.utils.utils import period_to_date
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class AsyncMarketRepo:
+    """
+    Async repository for market-data persistence, mirrors the MarketRepo API.
+
+    Every call borrows a connection from the pool for the duration of one
+    transaction, so coroutines running in the same event loop can fetch and
+    write at the same time, up to the pool size.
+
+    Params:
+    - pool: an open psycopg_pool.AsyncConnectionPool, see
+    db.connect.open_async_pool
+    """
+    pool: AsyncConnectionPool
+
+    #Local methods
+    async def _execute(self, sql: str, params: tuple | None = None) -> int:
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, params or ()) #type: ignore[]
+                rc = cur.rowcount
+        return 0 if rc is None or rc < 0 else int(rc)
+
+    async def _fetchone(self, sql: str, params: tuple | None = None) -> tuple[Any, ...] | None:
+        async with self.pool.connection() as conn:
+            async with conn.cursor(row_factory=tuple_row) as cur:
+                await cur.execute(sql, params or ()) #type: ignore[]
+                return await cur.fetchone()
+
+    async def _fetchall(self, sql: str, params: tuple | None = None) -> list[tuple[Any, ...]]:
+        async with self.pool.connection() as conn:
+            async with conn.cursor(row_factory=tuple_row) as cur:
+                await cur.execute(sql, params or ()) #type: ignore[]
+                return await cur.fetchall()
+
+    async def _scalar(self, sql: str, params: tuple | None = None):
+        row = await self._fetchone(sql, params)
+        return None if row is None else row[0]
+
+    async def _reaches_cold(self, start_date: date | None) -> bool:
+        last_year = await self._scalar(q.COLD_TIER_LAST_YEAR)
+        if last_year is None:
+            return False
+        return start_date is None or start_date.year <= last_year
+
+    # Methods
+    async def current_date(self) -> date:
+        """
+        Returns CURRENT_DATE of the DB
+        """
+        today = await self._scalar("SELECT CURRENT_DATE;")
+        if today is None:
+            raise RuntimeError("DB returned NULL for CURRENT_DATE")
+        return today
+
+    async def ensure_instrument(self, ticker: str) -> int:
+        """
+        Ensure a row exists in instrument for the given ticker and return its id
+
+        Params:
+        - ticker: ticker symbol
+
+        Returns:
+        - int: the instrument id
+        """
+        t = _clean_ticker(ticker)
+        instrument_id = await self._scalar(q.ENSURE_INSTRUMENT, (t,))
+        if instrument_id is None:
+            raise RuntimeError(f"Failed to fetch instrument id after upsert")
+        return int(instrument_id)
+
+    async def upsert_ohlcv_daily(self, instrument_id: int, df: DataFrame) -> int:
+        """
+        Upsert daily OHLCV rows into ohlcv_daily for given instrument, and
+        refresh its instrument_stats and returns_daily rows in the same
+        transaction
+
+        Params:
+        - instrument_id: the id of the instrument in the instrument table
+        - df: dataframe containing the daily data.
+
+        Returns:
+        - int: number of affected rows, 0 if the DataFrame is empty.
+        """
+        if df.empty:
+            return 0
+        rows = list(_ohlcv_rows(instrument_id, df))
+        since = _first_date(df)
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                #Only the sealed years the rows fall in, see MarketRepo.upsert_ohlcv_daily
+                if await self._reaches_cold(since):
+                    await cur.execute(q.UNPACK_COLD_SEGMENTS, (instrument_id, since.year, _last_date(df).year))
+                await cur.executemany(q.UPSERT_OHLCV_DAILY, rows)
+                rc = cur.rowcount
+                await cur.execute(q.REFRESH_INSTRUMENT_STATS, (instrument_id,) * 4)
+                await cur.execute(q.REFRESH_RETURNS_DAILY, (instrument_id, instrument_id, since, since, since))
+        return 0 if rc is None or rc < 0 else int(rc)
+
+    async def last_ohlcv_date_for_ticker(self, ticker: str) -> date | None:
+        """
+        Returns the latest stored OHLCV date for a single ticker
+        """
+        return await self._scalar(q.LAST_OHLCV_DATE_FOR_TICKER, (_clean_ticker(ticker),))
+
+    async def last_ohlcv_date_for_all_tickers(self) -> dict[str, date | None]:
+        """
+        Returns the latest stored OHLCV date per ticker, None if the ticker has
+        no OHLCV rows yet
+        """
+        rows = await self._fetchall(q.LAST_OHLCV_DATE_FOR_ALL_TICKERS)
+        return {ticker: last_date for (ticker, last_date) in rows}
+
+    async def list_active_tickers(self) -> list[str]:
+        """
+        Returns all tickers currently marked as active in the DB
+        """
+        return [t for (t,) in await self._fetchall(q.LIST_ACTIVE_TICKERS)]
+
+    async def deactivate_tickers(self, tickers: list[str]) -> int:
+        """
+        Marks the given tickers as inactive, if currently active
+
+        Returns number of rows updated
+        """
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return 0
+        return await self._execute(q.DEACTIVATE_TICKERS, (cleaned,))
+
+    async def fetch_adjclose_long(self, tickers: Sequence[str], *, start_date: date, end_date: date) -> DataFrame:
+        """
+        Fetch adjclose as a long dataframe with columns ticker, date, adjclose
+        """
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return pd.DataFrame(columns=["ticker", "date", "adjclose"]) #type: ignore
+        if await self._reaches_cold(start_date):
+            params = (cleaned, start_date, end_date, cleaned, start_date, end_date, start_date, end_date)
+            rows = await self._fetchall(q.FETCH_ADJCLOSE_LONG_TIERED, params)
+        else:
+            rows = await self._fetchall(q.FETCH_ADJCLOSE_LONG, (cleaned, start_date, end_date))
+        return _adjclose_long_frame(rows)
+
+    async def fetch_logret_long(self, tickers: Sequence[str], *, start_date: date, end_date: date) -> DataFrame:
+        """
+        Fetch the stored daily log returns as a long dataframe with columns
+        ticker, date, logret
+        """
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return pd.DataFrame(columns=["ticker", "date", "logret"]) #type: ignore
+        rows = await self._fetchall(q.FETCH_LOGRET_LONG, (cleaned, start_date, end_date))
+        return _logret_long_frame(rows)
+
+    async def fetch_adjclose_series(self, ticker: str, period: str) -> DataFrame:
+        """
+        Fetch a single tickers adjclose series, see MarketRepo.fetch_adjclose_series
+        """
+        cleaned = _clean_ticker(ticker)
+        end_date = await self.last_ohlcv_date_for_ticker(cleaned)
+        if end_date is None:
+            return pd.DataFrame(columns=["date", "adjclose"]) #type: ignore
+
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        cold = await self._reaches_cold(start_date)
+        if start_date is None:
+            sql = q.FETCH_ADJCLOSE_SERIES_LEQ_TIERED if cold else q.FETCH_ADJCLOSE_SERIES_LEQ
+            rows = await self._fetchall(sql, (cleaned, end_date))
+        else:
+            sql = q.FETCH_ADJCLOSE_SERIES_BETWEEN_TIERED if cold else q.FETCH_ADJCLOSE_SERIES_BETWEEN
+            rows = await self._fetchall(sql, (cleaned, start_date, end_date))
+        return _adjclose_series_frame(rows)
+
+    async def list_tickers_with_full_ohlcv_coverage(self, period: str, *, end_date: date | None = None) -> list[str]:
+        """
+        Returns the tickers that have data for every trading day in the
+        period, see MarketRepo.list_tickers_with_full_ohlcv_coverage
+        """
+        if end_date is None:
+            end_date = await self.current_date()
+
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        if start_date is None:
+            logger.warning(f"Period needs a start date when comparing tickers, start_date is None")
+            raise RuntimeError
+
+        if await self._reaches_cold(start_date):
+            rows = await self._fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE_TIERED, (start_date, end_date))
+        else:
+            rows = await self._fetchall(
+                q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE,
+                (start_date, end_date, end_date),
+            )
+        return [t for (t,) in rows]
+
+    async def screen_tickers(self, screen: Screen, *, start_date: date, end_date: date) -> list[str]:
+        """
+        Returns the tickers that pass a universe screen over the date range,
+        see MarketRepo.screen_tickers
+        """
+        cold = await self._reaches_cold(start_date)
+        if screen.is_full_coverage_only:
+            if cold:
+                rows = await self._fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE_TIERED, (start_date, end_date))
+            else:
+                rows = await self._fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE, (start_date, end_date, end_date))
+            return [t for (t,) in rows]
+        sql, params = screen.compile(start_date, end_date, source="ohlcv_daily_all" if cold else "ohlcv_daily")
+        return [t for (t,) in await self._fetchall(sql, params)]
+
+    async def list_trading_dates(self, *, since: date | None = None) -> list[date]:
+        """
+        Returns every distinct date with OHLCV rows, optionally from a given
+        date (inclusive)
+        """
+        sql = q.LIST_TRADING_DATES_SINCE_TIERED if await self._reaches_cold(since) else q.LIST_TRADING_DATES_SINCE
+        rows = await self._fetchall(sql, (since or date.min,))
+        return [d for (d,) in rows]
+
+    async def fetch_ohlcv_since(self, since: Mapping[str, date | None]) -> DataFrame:
+        """
+        Fetch OHLCV rows for several tickers, each from its own start date, see
+        MarketRepo.fetch_ohlcv_since
+        """
+        cols = ["ticker", "date", "open", "high", "low", "close", "adjclose", "volume"]
+        cleaned = {_clean_ticker(t): d for t, d in since.items()}
+        if not cleaned:
+            return pd.DataFrame(columns=cols) #type: ignore
+        tickers = sorted(cleaned)
+        earliest = None if any(d is None for d in cleaned.values()) else min(cleaned.values()) #type: ignore
+        sql = q.FETCH_OHLCV_SINCE_TIERED if await self._reaches_cold(earliest) else q.FETCH_OHLCV_SINCE
+        rows = await self._fetchall(sql, (tickers, [cleaned[t] for t in tickers]))
+        return pd.DataFrame(rows, columns=cols) #type: ignore
+
+    async def rebuild_instrument_stats(self) -> int:
+        """
+        Recomputes instrument_stats from ohlcv_daily for every instrument
+
+        Returns:
+        - int: number of instruments with stats after the rebuild
+        """
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(q.CLEAR_INSTRUMENT_STATS)
+                await cur.execute(q.REBUILD_INSTRUMENT_STATS)
+                rc = cur.rowcount
+        return 0 if rc is None or rc < 0 else int(rc)
+
+    async def rebuild_returns_daily(self) -> int:
+        """
+        Recomputes returns_daily from ohlcv_daily for every instrument
+
+        Returns:
+        - int: number of return rows after the rebuild
+        """
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(q.CLEAR_RETURNS_DAILY)
+                await cur.execute(q.REBUILD_RETURNS_DAILY)
+                rc = cur.rowcount
+        return 0 if rc is None or rc < 0 else int(rc)
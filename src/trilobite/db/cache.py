@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Iterable
+
+logger = logging.getLogger(__name__)
+
+#Tag for entries that depend on every instrument, e.g. the coverage query
+ALL = "*"
+
+def _freeze(params: tuple | None) -> tuple:
+    """
+    Makes query parameters hashable, lists (ticker arrays) become tuples
+    """
+    if not params:
+        return ()
+    return tuple(tuple(p) if isinstance(p, (list, set)) else p for p in params)
+
+def _sizeof(rows: Any) -> int:
+    """
+    Estimates the size of a cached result in bytes. Rows from one query have
+    the same shape, so the first row is measured and scaled by the row count.
+    """
+    if not isinstance(rows, list):
+        return sys.getsizeof(rows)
+    if not rows:
+        return sys.getsizeof(rows)
+    first = rows[0]
+    per_row = sys.getsizeof(first) + sum(sys.getsizeof(v) for v in first)
+    return sys.getsizeof(rows) + per_row * len(rows)
+
+@dataclass(frozen=True)
+class CacheStats:
+    """
+    Counters of a ReadCache, see ReadCache.stats
+    """
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    entries: int
+    bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    tags: frozenset[str]
+
+@dataclass
+class ReadCache:
+    """
+    LRU cache of query results for the repository layer.
+
+    Entries are keyed by (sql, params) and tagged with the tickers they were
+    read for, or ALL when the result depends on every instrument. Writes
+    invalidate by ticker, which also drops every ALL entry. The cache is
+    bounded both by entry count and by the estimated size of the cached rows,
+    and the least recently used entries are evicted first.
+
+    Params:
+    - max_entries: most entries kept
+    - max_bytes: most bytes kept, estimated from the cached rows
+    """
+    max_entries: int = 256
+    max_bytes: int = 64 * 1024 * 1024
+    _entries: OrderedDict[Hashable, _Entry] = field(default_factory=OrderedDict, init=False, repr=False)
+    _by_tag: dict[str, set[Hashable]] = field(default_factory=dict, init=False, repr=False)
+    _bytes: int = field(default=0, init=False)
+    _hits: int = field(default=0, init=False)
+    _misses: int = field(default=0, init=False)
+    _evictions: int = field(default=0, init=False)
+    _invalidations: int = field(default=0, init=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    #Local methods
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._drop(key)
+            self._evictions += 1
+
+    # Methods
+    @staticmethod
+    def key(sql: str, params: tuple | None = None) -> Hashable:
+        """
+        Returns the cache key of a query and its parameters
+        """
+        return (sql, _freeze(params))
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """
+        Looks up a key and marks it as recently used
+
+        Returns:
+        - (found, value), value is None when not found
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True, entry.value
+
+    def put(self, key: Hashable, value: Any, *, tickers: Iterable[str] | None = None) -> None:
+        """
+        Stores a result, evicting least recently used entries if over a bound
+
+        Params:
+        - key: see ReadCache.key
+        - value: the rows, callers must not mutate them after storing
+        - tickers: the tickers the result was read for, None if it depends on
+        every instrument
+        """
+        tags = frozenset(tickers) if tickers is not None else frozenset((ALL,))
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(value=value, size=size, tags=tags)
+            self._bytes += size
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            self._evict()
+
+    def invalidate(self, tickers: Iterable[str]) -> int:
+        """
+        Drops every entry read for any of the given tickers, and every entry
+        that depends on all instruments
+
+        Returns:
+        - int: number of entries dropped
+        """
+        with self._lock:
+            keys: set[Hashable] = set(self._by_tag.get(ALL, ()))
+            for t in tickers:
+                keys |= self._by_tag.get(t, set())
+            for key in keys:
+                self._drop(key)
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        """
+        Drops every entry, the counters are kept
+        """
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+
+    def stats(self) -> CacheStats:
+        """
+        Returns the hit, miss, eviction and invalidation counters and the
+        current size
+        """
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                entries=len(self._entries),
+                bytes=self._bytes,
+            )
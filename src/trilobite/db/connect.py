@@ -6,6 +6,8 @@ import os
 from typing import Optional
 
 import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +28,29 @@ class DbSettings:
     user: Optional[str] = None # None means use current OS user
     port: int = 5432
 
+def _settings_or_env(settings: DbSettings | None) -> DbSettings:
+    """
+    Returns the given settings, or settings constructed from env variables 
+    with module defaults as fallback
+    """
+    return settings or DbSettings(
+        dbname=os.getenv("TRILOBITE_DBNAME", "trilobite"),
+        host=os.getenv("TRILOBITE_DBHOST", "/run/postgresql"),
+        user=os.getenv("TRILOBITE_DBUSER") or None,
+        port=int(os.getenv("TRILOBITE_DBPORT", "5432")),
+    )
+
+def conninfo(settings: DbSettings | None = None) -> str:
+    """
+    Builds a libpq connection string from the settings, leaving out the user 
+    when it is None so libpq falls back to the current OS user
+    """
+    s = _settings_or_env(settings)
+    params: dict[str, str | int] = {"dbname": s.dbname, "host": s.host, "port": s.port}
+    if s.user is not None:
+        params["user"] = s.user
+    return make_conninfo(**params)
+
 def connect(settings: DbSettings | None = None) -> psycopg.Connection:
     """
     Creates a psycopg connection using explicit settings or env defaults
@@ -38,12 +63,7 @@ def connect(settings: DbSettings | None = None) -> psycopg.Connection:
     - psycopg.Connection: a new database connection with autocommit disabled
     """
     logger.debug("Start ..")
-    s = settings or DbSettings(
-        dbname=os.getenv("TRILOBITE_DBNAME", "trilobite"),
-        host=os.getenv("TRILOBITE_DBHOST", "/run/postgresql"),
-        user=os.getenv("TRILOBITE_DBUSER") or None,
-        port=int(os.getenv("TRILOBITE_DBPORT", "5432")),
-    )
+    s = _settings_or_env(settings)
 
     logger.debug("End ..")
     return psycopg.connect(
@@ -54,3 +74,58 @@ def connect(settings: DbSettings | None = None) -> psycopg.Connection:
         autocommit=False,
     )
 
+async def connect_async(settings: DbSettings | None = None) -> psycopg.AsyncConnection:
+    """
+    Async counterpart of connect()
+
+    Returns:
+    - psycopg.AsyncConnection: a new database connection with autocommit 
+    disabled
+    """
+    return await psycopg.AsyncConnection.connect(conninfo(settings), autocommit=False)
+
+async def open_async_pool(settings: DbSettings | None = None, *, min_size: int = 1, max_size: int = 8) -> AsyncConnectionPool:
+    """
+    Opens a pool of async connections, used by AsyncMarketRepo so several
+    coroutines can talk to the DB at the same time
+
+    Params:
+    - settings: optional explicit dbsettings, see connect()
+    - min_size: connections kept open
+    - max_size: upper limit of connections, and of concurrent DB calls
+
+    Returns:
+    - AsyncConnectionPool: an opened pool, close it with `await pool.close()`
+    """
+    pool = AsyncConnectionPool(
+        conninfo(settings),
+        min_size=min_size,
+        max_size=max_size,
+        kwargs={"autocommit": False},
+        open=False,
+    )
+    await pool.open(wait=True)
+    return pool
+
+def open_pool(settings: DbSettings | None = None, *, min_size: int = 1, max_size: int = 8) -> ConnectionPool:
+    """
+    Opens a pool of sync connections, used by db.fanout.ParallelReader to
+    read shards of one query on several connections at the same time
+
+    Params:
+    - settings: optional explicit dbsettings, see connect()
+    - min_size: connections kept open
+    - max_size: upper limit of connections
+
+    Returns:
+    - ConnectionPool: an opened pool, close it with `pool.close()`
+    """
+    pool = ConnectionPool(
+        conninfo(settings),
+        min_size=min_size,
+        max_size=max_size,
+        kwargs={"autocommit": False},
+        open=False,
+    )
+    pool.open(wait=True)
+    return pool
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from trilobite.utils.paths import data_dir
+
+if TYPE_CHECKING:
+    import duckdb
+
+logger = logging.getLogger(__name__)
+
+def default_path() -> Path:
+    """
+    Returns the default location of the embedded DuckDB database file
+    """
+    return data_dir() / "trilobite.duckdb"
+
+def connect(path: str | Path | None = None, *, read_only: bool = False) -> "duckdb.DuckDBPyConnection":
+    """
+    Opens (and creates if missing) the embedded DuckDB database.
+
+    DuckDB is an optional dependency, install it with 
+    `pip install -e '.[duckdb]'`.
+
+    Params:
+    - path: database file, defaults to data/trilobite.duckdb
+    - read_only: open without taking the write lock
+
+    Returns:
+    - duckdb.DuckDBPyConnection
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise RuntimeError("The duckdb backend needs the duckdb package: pip install -e '.[duckdb]'") from e
+    p = Path(path) if path is not None else default_path()
+    logger.debug(f"Opening DuckDB at {p}")
+    return duckdb.connect(str(p), read_only=read_only)
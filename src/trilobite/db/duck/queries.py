@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+from trilobite.db import queries as pg
+
+def _qmark(sql: str) -> str:
+    """
+    Converts a PostgreSQL statement from db/queries.py to DuckDB's ?
+    placeholders, for the statements that are otherwise identical
+    """
+    return sql.replace("%s", "?")
+
+ENSURE_INSTRUMENT = """
+INSERT INTO instrument (id, ticker, is_active, last_seen, deactivated_at)
+SELECT COALESCE(MAX(id), 0) + 1, ?, TRUE, today(), NULL
+FROM instrument
+ON CONFLICT (ticker) DO UPDATE SET
+    is_active = TRUE,
+    last_seen = today(),
+    deactivated_at = NULL
+RETURNING id;
+"""
+
+LIST_ACTIVE_TICKERS = pg.LIST_ACTIVE_TICKERS
+
+DEACTIVATE_TICKERS = """
+UPDATE instrument
+SET is_active = FALSE,
+    deactivated_at = today()
+WHERE list_contains(?, ticker)
+  AND is_active = TRUE;
+"""
+
+LAST_OHLCV_DATE_FOR_ALL_TICKERS = pg.LAST_OHLCV_DATE_FOR_ALL_TICKERS
+
+LAST_OHLCV_DATE_FOR_TICKER = _qmark(pg.LAST_OHLCV_DATE_FOR_TICKER)
+
+#Upserts a whole registered dataframe (`batch`) in one vectorized statement
+UPSERT_OHLCV_DAILY_BATCH = """
+INSERT INTO ohlcv_daily (
+    instrument_id, date, open, high, low, close, adjclose, volume, dividends, stocksplits
+)
+SELECT instrument_id, date, open, high, low, close, adjclose, volume, dividends, stocksplits
+FROM batch
+ON CONFLICT (instrument_id, date) DO UPDATE SET
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    adjclose = EXCLUDED.adjclose,
+    volume = EXCLUDED.volume,
+    dividends = EXCLUDED.dividends,
+    stocksplits = EXCLUDED.stocksplits;
+"""
+
+FETCH_ADJCLOSE_LONG = """
+SELECT i.ticker, o.date, o.adjclose
+FROM instrument AS i
+JOIN ohlcv_daily AS o ON o.instrument_id = i.id
+WHERE list_contains(?, i.ticker)
+  AND o.date BETWEEN ? AND ?
+ORDER BY i.ticker, o.date;
+"""
+
+FETCH_ADJCLOSE_SERIES_BETWEEN = _qmark(pg.FETCH_ADJCLOSE_SERIES_BETWEEN)
+
+FETCH_ADJCLOSE_SERIES_LEQ = _qmark(pg.FETCH_ADJCLOSE_SERIES_LEQ)
+
+#A single columnar scan of the date range, no calendar probing needed
+LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE = """
+WITH r AS (
+    SELECT instrument_id, date
+    FROM ohlcv_daily
+    WHERE date BETWEEN ? AND ?
+),
+expected AS (
+    SELECT COUNT(DISTINCT date) AS n
+    FROM r
+)
+SELECT i.ticker
+FROM r
+JOIN instrument AS i ON i.id = r.instrument_id
+GROUP BY i.ticker
+HAVING COUNT(*) = (SELECT n FROM expected)
+ORDER BY i.ticker;
+"""
+
+REFRESH_INSTRUMENT_STATS = """
+INSERT INTO instrument_stats (instrument_id, first_date, last_date, n_rows, last_volume)
+SELECT
+    ?,
+    MIN(o.date),
+    MAX(o.date),
+    COUNT(*),
+    (
+        SELECT l.volume
+        FROM ohlcv_daily AS l
+        WHERE l.instrument_id = ?
+        ORDER BY l.date DESC
+        LIMIT 1
+    )
+FROM ohlcv_daily AS o
+WHERE o.instrument_id = ?
+ON CONFLICT (instrument_id) DO UPDATE SET
+    first_date = EXCLUDED.first_date,
+    last_date = EXCLUDED.last_date,
+    n_rows = EXCLUDED.n_rows,
+    last_volume = EXCLUDED.last_volume;
+"""
+
+CLEAR_INSTRUMENT_STATS = pg.CLEAR_INSTRUMENT_STATS
+
+REBUILD_INSTRUMENT_STATS = """
+INSERT INTO instrument_stats (instrument_id, first_date, last_date, n_rows, last_volume)
+SELECT
+    a.instrument_id,
+    a.first_date,
+    a.last_date,
+    a.n_rows,
+    l.volume
+FROM (
+    SELECT instrument_id, MIN(date) AS first_date, MAX(date) AS last_date, COUNT(*) AS n_rows
+    FROM ohlcv_daily
+    GROUP BY instrument_id
+) AS a
+JOIN (
+    SELECT DISTINCT ON (instrument_id) instrument_id, volume
+    FROM ohlcv_daily
+    ORDER BY instrument_id, date DESC
+) AS l ON l.instrument_id = a.instrument_id
+ON CONFLICT (instrument_id) DO UPDATE SET
+    first_date = EXCLUDED.first_date,
+    last_date = EXCLUDED.last_date,
+    n_rows = EXCLUDED.n_rows,
+    last_volume = EXCLUDED.last_volume;
+"""
+
+#No cold tier in DuckDB, the previous day is always in ohlcv_daily
+REFRESH_RETURNS_DAILY = _qmark(pg.REFRESH_RETURNS_DAILY).replace("::float8", "::DOUBLE").replace("ohlcv_daily_all", "ohlcv_daily")
+
+CLEAR_RETURNS_DAILY = pg.CLEAR_RETURNS_DAILY
+
+REBUILD_RETURNS_DAILY = """
+INSERT INTO returns_daily (instrument_id, date, logret)
+SELECT instrument_id, date, logret
+FROM (
+    SELECT
+        o.instrument_id,
+        o.date,
+        CASE
+            WHEN o.adjclose > 0 AND LAG(o.adjclose) OVER w > 0
+            THEN ln(o.adjclose / LAG(o.adjclose) OVER w)::DOUBLE
+        END AS logret,
+        LAG(o.date) OVER w AS prev_date
+    FROM ohlcv_daily AS o
+    WINDOW w AS (PARTITION BY o.instrument_id ORDER BY o.date)
+) AS r
+WHERE r.prev_date IS NOT NULL
+ON CONFLICT (instrument_id, date) DO UPDATE SET
+    logret = EXCLUDED.logret;
+"""
+
+FETCH_LOGRET_LONG = """
+SELECT i.ticker, r.date, r.logret
+FROM instrument AS i
+JOIN returns_daily AS r ON r.instrument_id = i.id
+WHERE list_contains(?, i.ticker)
+  AND r.date BETWEEN ? AND ?
+ORDER BY i.ticker, r.date;
+"""
+
+FETCH_OHLCV_SINCE = """
+SELECT
+    i.ticker,
+    o.date,
+    o.open,
+    o.high,
+    o.low,
+    o.close,
+    o.adjclose,
+    o.volume::DOUBLE AS volume
+FROM (
+    SELECT unnest(?::VARCHAR[]) AS ticker, unnest(?::DATE[]) AS since
+) AS s
+JOIN instrument AS i ON i.ticker = s.ticker
+JOIN ohlcv_daily AS o ON o.instrument_id = i.id
+WHERE s.since IS NULL OR o.date >= s.since
+ORDER BY i.ticker, o.date;
+"""
+
+LIST_TRADING_DATES_SINCE = """
+SELECT DISTINCT date
+FROM ohlcv_daily
+WHERE date >= ?
+ORDER BY date;
+"""
+
+#Used by sync.py, `incoming` and `plan` are registered dataframes
+UPSERT_INSTRUMENTS_BATCH = """
+INSERT INTO instrument (id, ticker, is_active, last_seen, deactivated_at)
+SELECT id, ticker, is_active, last_seen, deactivated_at
+FROM incoming
+ON CONFLICT (id) DO UPDATE SET
+    is_active = EXCLUDED.is_active,
+    last_seen = EXCLUDED.last_seen,
+    deactivated_at = EXCLUDED.deactivated_at;
+"""
+
+DELETE_OHLCV_FROM_PLAN = """
+DELETE FROM ohlcv_daily
+WHERE EXISTS (
+    SELECT 1
+    FROM plan AS p
+    WHERE p.instrument_id = ohlcv_daily.instrument_id
+      AND ohlcv_daily.date >= p.since
+);
+"""
+
+INSERT_OHLCV_BATCH = """
+INSERT INTO ohlcv_daily
+SELECT instrument_id, date, open, high, low, close, adjclose, volume, dividends, stocksplits
+FROM batch;
+"""
+
+LIST_INSTRUMENT_STATS = """
+SELECT instrument_id, first_date, last_date, n_rows
+FROM instrument_stats;
+"""
+
+EXPORT_OHLCV_BY_TICKER = _qmark(pg.EXPORT_OHLCV_BY_TICKER)
+
+EXPORT_OHLCV_BY_DATE = _qmark(pg.EXPORT_OHLCV_BY_DATE)
+
+EXPORT_LOGRET_BY_TICKER = _qmark(pg.EXPORT_LOGRET_BY_TICKER)
+
+EXPORT_LOGRET_BY_DATE = _qmark(pg.EXPORT_LOGRET_BY_DATE)
+
+LIST_TICKERS_WITH_ROWS_AFTER = _qmark(pg.LIST_TICKERS_WITH_ROWS_AFTER)
+
+LIST_FETCH_FAILURES = pg.LIST_FETCH_FAILURES
+
+RECORD_FETCH_FAILURE = _qmark(pg.RECORD_FETCH_FAILURE)
+
+CLEAR_FETCH_FAILURES = """
+DELETE FROM fetch_failure
+WHERE instrument_id IN (
+    SELECT id
+    FROM instrument
+    WHERE list_contains(?, ticker)
+);
+"""
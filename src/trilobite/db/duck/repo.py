@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import TYPE_CHECKING, Any, Iterator, Mapping, Sequence
+
+import pandas as pd
+from pandas import DataFrame
+
+from trilobite.db.duck import queries as q
+from trilobite.db.screen import Screen
+from trilobite.db.repo import (
+    OHLCV_COLUMNS,
+    FetchFailure,
+    _adjclose_series_frame,
+    _clean_ticker,
+    _clean_tickers,
+    _first_date,
+)
+from trilobite.utils.utils import period_to_date
+
+if TYPE_CHECKING:
+    import duckdb
+
+logger = logging.getLogger(__name__)
+
+def _ohlcv_batch(instrument_id: int, df: DataFrame) -> DataFrame:
+    """
+    Builds the dataframe registered as `batch` for UPSERT_OHLCV_DAILY_BATCH,
+    with the column types of the ohlcv_daily table
+
+    Raises:
+    - ValueError if any of the OHLCV columns are missing
+    """
+    missing = [c for c in OHLCV_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing requires columns for upsert: {missing}")
+    batch = pd.DataFrame({
+        "instrument_id": instrument_id,
+        "date": pd.to_datetime(df["date"]).dt.date,
+    })
+    for c in ("open", "high", "low", "close", "adjclose", "dividends", "stocksplits"):
+        batch[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    batch["volume"] = pd.to_numeric(df["volume"], errors="coerce").round().astype("Int64")
+    #Last row wins if yfinance sends the same date twice, like executemany does
+    return batch.drop_duplicates(subset="date", keep="last")
+
+@dataclass
+class DuckMarketRepo:
+    """
+    Repository for market-data persistence in an embedded DuckDB file, same
+    API as MarketRepo.
+
+    DuckDB stores the tables column by column, so the wide range scans the
+    analysis does (adjclose for every ticker over years) read only the columns
+    they need, without a server round trip. Writes go through registered
+    dataframes instead of executemany.
+
+    Params:
+    - conn: an open duckdb connection, see db.duck.connect.connect
+    """
+    conn: "duckdb.DuckDBPyConnection"
+
+    #Local methods
+    def _execute(self, sql: str, params: tuple | None = None) -> int:
+        rows = self.conn.execute(sql, params or ()).fetchall()
+        #DuckDB reports the affected row count as a result row
+        if len(rows) == 1 and len(rows[0]) == 1 and isinstance(rows[0][0], int):
+            return int(rows[0][0])
+        return 0
+
+    def _fetchone(self, sql: str, params: tuple | None = None) -> tuple[Any, ...] | None:
+        return self.conn.execute(sql, params or ()).fetchone()
+
+    def _fetchall(self, sql: str, params: tuple | None = None) -> list[tuple[Any, ...]]:
+        return self.conn.execute(sql, params or ()).fetchall()
+
+    def _scalar(self, sql: str, params: tuple | None = None):
+        row = self._fetchone(sql, params)
+        return None if row is None else row[0]
+
+    def _fetch_df(self, sql: str, params: tuple | None = None) -> DataFrame:
+        return self.conn.execute(sql, params or ()).df()
+
+
+    # Methods
+    def current_date(self) -> date:
+        """
+        Returns today's date as seen by DuckDB
+        """
+        today = self._scalar("SELECT today();")
+        if today is None:
+            raise RuntimeError("DuckDB returned NULL for today()")
+        return today
+
+    def ensure_instrument(self, ticker: str) -> int:
+        """
+        Ensure a row exists in instrument for the given ticker and return its id
+
+        Params:
+        - ticker: ticker symbol
+
+        Returns:
+        - int: the instrument id
+        """
+        t = _clean_ticker(ticker)
+        instrument_id = self._scalar(q.ENSURE_INSTRUMENT, (t,))
+        if instrument_id is None:
+            raise RuntimeError(f"Failed to fetch instrument id after upsert")
+        return int(instrument_id)
+
+    def upsert_ohlcv_daily(self, instrument_id: int, df: DataFrame) -> int:
+        """
+        Upsert daily OHLCV rows into ohlcv_daily for given instrument, and
+        refresh its instrument_stats and returns_daily rows in the same
+        transaction
+
+        Params:
+        - instrument_id: the id of the instrument in the instrument table
+        - df: dataframe containing the daily data.
+
+        Returns:
+        - int: number of upserted rows, 0 if the DataFrame is empty.
+        """
+        if df.empty:
+            return 0
+        batch = _ohlcv_batch(instrument_id, df)
+        since = _first_date(df)
+        self.conn.begin()
+        try:
+            self.conn.register("batch", batch)
+            self.conn.execute(q.UPSERT_OHLCV_DAILY_BATCH)
+            self.conn.execute(q.REFRESH_INSTRUMENT_STATS, (instrument_id, instrument_id, instrument_id))
+            self.conn.execute(q.REFRESH_RETURNS_DAILY, (instrument_id, instrument_id, since, since, since))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.unregister("batch")
+        return len(batch)
+
+    def last_ohlcv_date_for_ticker(self, ticker: str) -> date | None:
+        """
+        Returns the latest stored OHLCV date for a single ticker
+        """
+        return self._scalar(q.LAST_OHLCV_DATE_FOR_TICKER, (_clean_ticker(ticker),))
+
+    def last_ohlcv_date_for_all_tickers(self) -> dict[str, date | None]:
+        """
+        Returns the latest stored OHLCV date per ticker, None if the ticker has
+        no OHLCV rows yet
+        """
+        rows = self._fetchall(q.LAST_OHLCV_DATE_FOR_ALL_TICKERS)
+        return {ticker: last_date for (ticker, last_date) in rows}
+
+    def list_active_tickers(self) -> list[str]:
+        """
+        Returns all tickers currently marked as active in the DB
+        """
+        return [t for (t,) in self._fetchall(q.LIST_ACTIVE_TICKERS)]
+
+    def deactivate_tickers(self, tickers: list[str]) -> int:
+        """
+        Marks the given tickers as inactive, if currently active
+
+        Returns number of rows updated
+        """
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return 0
+        return self._execute(q.DEACTIVATE_TICKERS, (cleaned,))
+
+    def fetch_adjclose_long(self, tickers: Sequence[str], *, start_date: date, end_date: date) -> DataFrame:
+        """
+        Fetch adjclose as a long dataframe with columns ticker, date, adjclose
+        """
+        logger.debug("Start ..")
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return pd.DataFrame(columns=["ticker", "date", "adjclose"]) #type: ignore
+        df = self._fetch_df(q.FETCH_ADJCLOSE_LONG, (cleaned, start_date, end_date))
+        df["ticker"] = df["ticker"].astype(str)
+        df["date"] = pd.to_datetime(df["date"])
+        logger.debug("End ..")
+        return df
+
+    def fetch_logret_long(self, tickers: Sequence[str], *, start_date: date, end_date: date) -> DataFrame:
+        """
+        Fetch the stored daily log returns as a long dataframe with columns
+        ticker, date, logret
+        """
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return pd.DataFrame(columns=["ticker", "date", "logret"]) #type: ignore
+        df = self._fetch_df(q.FETCH_LOGRET_LONG, (cleaned, start_date, end_date))
+        df["ticker"] = df["ticker"].astype(str)
+        df["date"] = pd.to_datetime(df["date"])
+        return df
+
+    def fetch_adjclose_series(self, ticker: str, period: str) -> DataFrame:
+        """
+        Fetch a single tickers adjclose series, see
+        MarketRepo.fetch_adjclose_series
+        """
+        cleaned = _clean_ticker(ticker)
+        end_date = self.last_ohlcv_date_for_ticker(cleaned)
+        if end_date is None:
+            return pd.DataFrame(columns=["date", "adjclose"]) #type: ignore
+
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        if start_date is None:
+            rows = self._fetchall(q.FETCH_ADJCLOSE_SERIES_LEQ, (cleaned, end_date))
+        else:
+            rows = self._fetchall(q.FETCH_ADJCLOSE_SERIES_BETWEEN, (cleaned, start_date, end_date))
+        return _adjclose_series_frame(rows)
+
+    def list_tickers_with_full_ohlcv_coverage(self, period: str, *, end_date: date | None = None) -> list[str]:
+        """
+        Returns the tickers that have data for every trading day in the
+        period, see MarketRepo.list_tickers_with_full_ohlcv_coverage
+        """
+        if end_date is None:
+            end_date = self.current_date()
+
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        if start_date is None:
+            logger.warning(f"Period needs a start date when comparing tickers, start_date is None")
+            raise RuntimeError
+
+        rows = self._fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE, (start_date, end_date))
+        return [t for (t,) in rows]
+
+    def screen_tickers(self, screen: Screen, *, start_date: date, end_date: date) -> list[str]:
+        """
+        Returns the tickers that pass a universe screen over the date range,
+        see MarketRepo.screen_tickers
+        """
+        if screen.is_full_coverage_only:
+            rows = self._fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE, (start_date, end_date))
+        else:
+            sql, params = screen.compile(start_date, end_date)
+            rows = self._fetchall(sql.replace("%s", "?"), params)
+        return [t for (t,) in rows]
+
+    def stream_export_rows(self, dataset: str, *, since: date, by: str, batch_rows: int) -> Iterator[list[tuple]]:
+        """
+        Streams a whole table out `batch_rows` rows at a time, see 
+        MarketRepo.stream_export_rows
+        """
+        if by not in ("ticker", "date"):
+            raise ValueError(f"by must be 'ticker' or 'date', got {by}")
+        if dataset == "ohlcv":
+            sql = q.EXPORT_OHLCV_BY_TICKER if by == "ticker" else q.EXPORT_OHLCV_BY_DATE
+        elif dataset == "logret":
+            sql = q.EXPORT_LOGRET_BY_TICKER if by == "ticker" else q.EXPORT_LOGRET_BY_DATE
+        else:
+            raise ValueError(f"Unknown export dataset: {dataset}")
+        #A cursor of its own, so the stream survives other statements on conn
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql, (since,))
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cur.close()
+
+    def list_tickers_with_rows_after(self, since: date) -> list[str]:
+        """
+        Returns the tickers with OHLCV rows after a date
+        """
+        return [t for (t,) in self._fetchall(q.LIST_TICKERS_WITH_ROWS_AFTER, (since,))]
+
+    def list_fetch_failures(self) -> dict[str, FetchFailure]:
+        """
+        Returns the negative cache, a FetchFailure per ticker whose last fetch
+        failed
+        """
+        rows = self._fetchall(q.LIST_FETCH_FAILURES)
+        return {
+            t: FetchFailure(t, reason, streak, *(ts.replace(tzinfo=timezone.utc) for ts in times))
+            for (t, reason, streak, *times) in rows
+        }
+
+    def record_fetch_failure(self, ticker: str, reason: str, *, streak: int, failed_at: datetime, retry_after: datetime) -> int:
+        """
+        Records a failed fetch of a ticker in the negative cache, see
+        MarketRepo.record_fetch_failure. Times are stored as UTC.
+        """
+        t = _clean_ticker(ticker)
+        failed_at, retry_after = (ts.astimezone(timezone.utc).replace(tzinfo=None) for ts in (failed_at, retry_after))
+        return self._execute(q.RECORD_FETCH_FAILURE, (reason[:500], streak, failed_at, failed_at, retry_after, t))
+
+    def clear_fetch_failures(self, tickers: Sequence[str]) -> int:
+        """
+        Removes tickers from the negative cache, after a successful fetch
+
+        Returns number of rows deleted
+        """
+        cleaned = _clean_tickers(tickers)
+        if not cleaned:
+            return 0
+        return self._execute(q.CLEAR_FETCH_FAILURES, (cleaned,))
+
+    def list_trading_dates(self, *, since: date | None = None) -> list[date]:
+        """
+        Returns every distinct date with OHLCV rows, optionally from a given
+        date (inclusive)
+        """
+        rows = self._fetchall(q.LIST_TRADING_DATES_SINCE, (since or date.min,))
+        return [d for (d,) in rows]
+
+    def fetch_ohlcv_since(self, since: Mapping[str, date | None]) -> DataFrame:
+        """
+        Fetch OHLCV rows for several tickers, each from its own start date, see
+        MarketRepo.fetch_ohlcv_since
+        """
+        cols = ["ticker", "date", "open", "high", "low", "close", "adjclose", "volume"]
+        cleaned = {_clean_ticker(t): d for t, d in since.items()}
+        if not cleaned:
+            return pd.DataFrame(columns=cols) #type: ignore
+        tickers = sorted(cleaned)
+        rows = self._fetchall(q.FETCH_OHLCV_SINCE, (tickers, [cleaned[t] for t in tickers]))
+        return pd.DataFrame(rows, columns=cols) #type: ignore
+
+    def rebuild_instrument_stats(self) -> int:
+        """
+        Recomputes instrument_stats from ohlcv_daily for every instrument
+
+        Returns:
+        - int: number of instruments with stats after the rebuild
+        """
+        logger.debug("Start ..")
+        self.conn.begin()
+        try:
+            self.conn.execute(q.CLEAR_INSTRUMENT_STATS)
+            self.conn.execute(q.REBUILD_INSTRUMENT_STATS)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        n = int(self._scalar("SELECT COUNT(*) FROM instrument_stats;") or 0)
+        logger.debug("End ..")
+        return n
+
+    def rebuild_returns_daily(self) -> int:
+        """
+        Recomputes returns_daily from ohlcv_daily for every instrument
+
+        Returns:
+        - int: number of return rows after the rebuild
+        """
+        logger.debug("Start ..")
+        self.conn.begin()
+        try:
+            self.conn.execute(q.CLEAR_RETURNS_DAILY)
+            self.conn.execute(q.REBUILD_RETURNS_DAILY)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        n = int(self._scalar("SELECT COUNT(*) FROM returns_daily;") or 0)
+        logger.debug("End ..")
+        return n
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import duckdb
+
+#Same tables and keys as db/schema.py. Prices are DOUBLE instead of NUMERIC, 
+#and instrument ids are assigned by ENSURE_INSTRUMENT instead of a sequence so
+#ids copied from PostgreSQL keep their values. DuckDB keeps its own min/max 
+#zone maps per row group, so the PostgreSQL secondary indexes have no 
+#counterpart here.
+DDL = """
+CREATE TABLE IF NOT EXISTS instrument (
+    id BIGINT PRIMARY KEY,
+    ticker TEXT NOT NULL UNIQUE,
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    last_seen DATE,
+    deactivated_at DATE
+);
+
+CREATE TABLE IF NOT EXISTS ohlcv_daily (
+    instrument_id BIGINT NOT NULL,
+    date DATE NOT NULL,
+
+    open DOUBLE,
+    high DOUBLE,
+    low DOUBLE,
+    close DOUBLE,
+    adjclose DOUBLE,
+
+    volume BIGINT,
+    dividends DOUBLE,
+    stocksplits DOUBLE,
+
+    PRIMARY KEY (instrument_id, date)
+);
+
+CREATE TABLE IF NOT EXISTS instrument_stats (
+    instrument_id BIGINT PRIMARY KEY,
+    first_date DATE,
+    last_date DATE,
+    n_rows BIGINT NOT NULL DEFAULT 0,
+    last_volume BIGINT
+);
+
+CREATE TABLE IF NOT EXISTS returns_daily (
+    instrument_id BIGINT NOT NULL,
+    date DATE NOT NULL,
+    logret DOUBLE,
+
+    PRIMARY KEY (instrument_id, date)
+);
+
+-- Times in UTC without a zone, DuckDB needs pytz to return TIMESTAMPTZ
+CREATE TABLE IF NOT EXISTS fetch_failure (
+    instrument_id BIGINT PRIMARY KEY,
+    reason TEXT NOT NULL,
+    streak INT NOT NULL,
+    first_failed_at TIMESTAMP NOT NULL,
+    last_failed_at TIMESTAMP NOT NULL,
+    retry_after TIMESTAMP NOT NULL
+);
+"""
+
+def create_schema(conn: "duckdb.DuckDBPyConnection") -> None:
+    """
+    Creates the DuckDB tables if they do not already exist.
+
+    Params:
+    - conn: open DuckDB connection
+    """
+    conn.execute(DDL)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Iterator
+
+import pandas as pd
+import psycopg
+
+from trilobite.db import queries as pgq
+from trilobite.db.duck import queries as q
+
+if TYPE_CHECKING:
+    import duckdb
+
+logger = logging.getLogger(__name__)
+
+BATCH_COLUMNS = [
+    "instrument_id",
+    "date",
+    "open",
+    "high",
+    "low",
+    "close",
+    "adjclose",
+    "volume",
+    "dividends",
+    "stocksplits",
+]
+
+@dataclass(frozen=True)
+class SyncResult:
+    """
+    Summary of one PostgreSQL -> DuckDB sync
+
+    Attributes:
+    - instruments: instruments copied or refreshed
+    - refreshed: instruments whose price rows were (partly) rewritten
+    - rows: price rows written to DuckDB
+    """
+    instruments: int
+    refreshed: int
+    rows: int
+
+def _plan(pg_rows: list[tuple], duck_stats: dict[int, tuple], *, full: bool, overlap_days: int) -> dict[int, date]:
+    """
+    Picks the date each instrument has to be rewritten from.
+
+    An instrument is copied in full when DuckDB has nothing for it or its
+    first date moved (backfilled history). If only newer rows exist in
+    PostgreSQL, the copy restarts `overlap_days` before the last DuckDB date
+    so late corrections to the tail are picked up as well.
+
+    Returns:
+    - dict[instrument_id, since], instruments that are up to date are left out
+    """
+    plan: dict[int, date] = {}
+    for (iid, _t, _a, _ls, _da, first_date, last_date, n_rows) in pg_rows:
+        if last_date is None:
+            continue
+        have = duck_stats.get(iid)
+        if full or have is None or have[0] != first_date:
+            plan[iid] = date.min
+        elif have[1] != last_date or have[2] != n_rows:
+            plan[iid] = min(have[1], last_date) - timedelta(days=overlap_days)
+    return plan
+
+def _stream(pg: psycopg.Connection, plan: dict[int, date], batch_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Streams the planned rows out of PostgreSQL with a server side cursor,
+    `batch_rows` rows at a time. Reads both the hot and the cold tier.
+    """
+    ids = sorted(plan)
+    with pg.cursor(name="trilobite_duck_sync") as cur:
+        cur.itersize = batch_rows
+        cur.execute(pgq.FETCH_OHLCV_ROWS_SINCE_BY_ID_TIERED, (ids, [plan[i] for i in ids]))
+        while True:
+            rows = cur.fetchmany(batch_rows)
+            if not rows:
+                break
+            df = pd.DataFrame(rows, columns=BATCH_COLUMNS) #type: ignore
+            df["volume"] = df["volume"].astype("Int64")
+            yield df
+    pg.rollback()
+
+def sync_from_postgres(pg: psycopg.Connection,
+                       duck: "duckdb.DuckDBPyConnection",
+                       *,
+                       full: bool = False,
+                       overlap_days: int = 7,
+                       batch_rows: int = 100_000,
+                       ) -> SyncResult:
+    """
+    Copies the PostgreSQL tables into the embedded DuckDB file.
+
+    Instruments keep their PostgreSQL ids, and only the price rows that are
+    missing or may have changed are rewritten, see _plan. Rows are streamed in
+    batches so memory stays flat however large the history is. The DuckDB
+    file should not be written to by DuckMarketRepo.ensure_instrument while
+    it is kept in sync this way, or the ids can clash.
+
+    Params:
+    - pg: open psycopg connection
+    - duck: open DuckDB connection with the schema created
+    - full: rewrite every instrument
+    - overlap_days: days before the last DuckDB date that are recopied
+    - batch_rows: rows per streamed batch
+
+    Returns:
+    - SyncResult
+    """
+    logger.debug("Start ..")
+    with pg.cursor() as cur:
+        cur.execute(pgq.LIST_INSTRUMENTS_WITH_STATS)
+        pg_rows = cur.fetchall()
+    pg.rollback()
+
+    duck_stats = {
+        iid: (first_date, last_date, n_rows)
+        for (iid, first_date, last_date, n_rows) in duck.execute(q.LIST_INSTRUMENT_STATS).fetchall()
+    }
+    plan = _plan(pg_rows, duck_stats, full=full, overlap_days=overlap_days)
+
+    incoming = pd.DataFrame(
+        [r[:5] for r in pg_rows],
+        columns=["id", "ticker", "is_active", "last_seen", "deactivated_at"], #type: ignore
+    )
+    n_rows = 0
+    duck.begin()
+    try:
+        duck.register("incoming", incoming)
+        duck.execute(q.UPSERT_INSTRUMENTS_BATCH)
+        duck.unregister("incoming")
+        if plan:
+            duck.register("plan", pd.DataFrame({"instrument_id": list(plan), "since": list(plan.values())}))
+            duck.execute(q.DELETE_OHLCV_FROM_PLAN)
+            duck.unregister("plan")
+            for batch in _stream(pg, plan, batch_rows):
+                duck.register("batch", batch)
+                duck.execute(q.INSERT_OHLCV_BATCH)
+                duck.unregister("batch")
+                n_rows += len(batch)
+                logger.debug(f"Copied {n_rows} rows")
+            duck.execute(q.CLEAR_INSTRUMENT_STATS)
+            duck.execute(q.REBUILD_INSTRUMENT_STATS)
+            #Cheap on DuckDB, so recomputed in full instead of copied
+            duck.execute(q.CLEAR_RETURNS_DAILY)
+            duck.execute(q.REBUILD_RETURNS_DAILY)
+        duck.commit()
+    except Exception:
+        duck.rollback()
+        raise
+    logger.debug("End ..")
+    return SyncResult(instruments=len(pg_rows), refreshed=len(plan), rows=n_rows)
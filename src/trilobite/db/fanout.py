@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Callable, Sequence
+
+from psycopg import IsolationLevel, sql as pgsql
+from psycopg.rows import tuple_row
+from psycopg_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+def ticker_shards(tickers: Sequence[str], width: int) -> list[list[str]]:
+    """
+    Splits sorted tickers into at most `width` contiguous ranges of about the
+    same size, so the shards read disjoint parts of the primary key
+    """
+    n = len(tickers)
+    width = max(1, min(width, n))
+    bounds = [round(i * n / width) for i in range(width + 1)]
+    return [list(tickers[bounds[i]:bounds[i + 1]]) for i in range(width) if bounds[i] < bounds[i + 1]]
+
+def date_shards(start_date: date, end_date: date, width: int) -> list[tuple[date, date]]:
+    """
+    Splits an inclusive date range into at most `width` contiguous inclusive
+    ranges of about the same length
+    """
+    days = (end_date - start_date).days + 1
+    width = max(1, min(width, days))
+    bounds = [start_date + timedelta(days=round(i * days / width)) for i in range(width + 1)]
+    return [(bounds[i], bounds[i + 1] - timedelta(days=1)) for i in range(width) if bounds[i] < bounds[i + 1]]
+
+@dataclass
+class ParallelReader:
+    """
+    Runs one read as several shards in parallel, each on its own pooled
+    connection.
+
+    A coordinator transaction exports its snapshot with pg_export_snapshot,
+    and every shard imports it with SET TRANSACTION SNAPSHOT before reading,
+    so the shards see exactly the same data even while ingest is writing.
+    The coordinator stays open until the last shard is done, which is what
+    keeps the snapshot importable.
+
+    The shards are run on threads: psycopg releases the GIL while it waits
+    for the server, so the backends work in parallel, while the client side
+    parsing of the rows is still shared by one interpreter.
+
+    Params:
+    - pool: open psycopg_pool.ConnectionPool with at least width + 1
+    connections, see db.connect.open_pool
+    - width: most shards run at the same time
+    - min_tickers: reads of fewer tickers are not worth splitting, see
+    MarketRepo.fetch_adjclose_long
+    - shard_by: "ticker" (ticker ranges) or "date" (date ranges)
+    """
+    pool: ConnectionPool
+    width: int = 4
+    min_tickers: int = 200
+    shard_by: str = "ticker"
+
+    def __post_init__(self) -> None:
+        if self.shard_by not in ("ticker", "date"):
+            raise ValueError(f"shard_by must be 'ticker' or 'date', got {self.shard_by}")
+
+    def plan(self, tickers: Sequence[str], start_date: date, end_date: date) -> list[tuple[list[str], date, date]]:
+        """
+        Returns the (tickers, start_date, end_date) of every shard
+        """
+        if self.shard_by == "ticker":
+            return [(s, start_date, end_date) for s in ticker_shards(tickers, self.width)]
+        return [(list(tickers), s, e) for s, e in date_shards(start_date, end_date, self.width)]
+
+    def _run_shard(self, snapshot: str, sql: str, params: tuple) -> list[tuple[Any, ...]]:
+        with self.pool.connection() as conn:
+            conn.isolation_level = IsolationLevel.REPEATABLE_READ
+            try:
+                with conn.cursor(row_factory=tuple_row, binary=True) as cur:
+                    #Has to be the first statement of the transaction
+                    cur.execute(pgsql.SQL("SET TRANSACTION SNAPSHOT {};").format(pgsql.Literal(snapshot)))
+                    cur.execute(sql, params) #type: ignore[]
+                    return cur.fetchall()
+            finally:
+                conn.rollback()
+                conn.isolation_level = None
+
+    def fetchall(self, sql: str, shard_params: Sequence[tuple]) -> list[list[tuple[Any, ...]]]:
+        """
+        Runs sql once per parameter tuple, in parallel on one snapshot
+
+        Params:
+        - sql: the statement every shard runs
+        - shard_params: parameters of each shard
+
+        Returns:
+        - the rows of each shard, in the order of shard_params
+        """
+        logger.debug("Start ..")
+        with self.pool.connection() as coordinator:
+            coordinator.isolation_level = IsolationLevel.REPEATABLE_READ
+            try:
+                row = coordinator.execute("SELECT pg_export_snapshot();").fetchone()
+                if row is None:
+                    raise RuntimeError("pg_export_snapshot returned no rows")
+                snapshot = row[0]
+                with ThreadPoolExecutor(max_workers=self.width, thread_name_prefix="trilobite-shard") as ex:
+                    futures = [ex.submit(self._run_shard, snapshot, sql, p) for p in shard_params]
+                    results = [f.result() for f in futures]
+            finally:
+                coordinator.rollback()
+                coordinator.isolation_level = None
+        logger.debug(f"End .. {len(shard_params)} shards, {sum(len(r) for r in results)} rows")
+        return results
+
+    def fetch_tickers(self,
+                      sql: str,
+                      tickers: Sequence[str],
+                      *,
+                      start_date: date,
+                      end_date: date,
+                      params: Callable[[list[str], date, date], tuple],
+                      ) -> list[tuple[Any, ...]]:
+        """
+        Runs a (ticker, date, ..) read of many tickers over a date range as
+        shards and stitches the rows back in ticker, date order
+
+        Params:
+        - sql: statement returning rows that start with ticker and date
+        - tickers: sorted tickers
+        - start_date, end_date: the inclusive date range
+        - params: builds the statement parameters of one shard from its
+        tickers and date range
+
+        Returns:
+        - the rows, as the unsharded statement sorted by ticker, date would
+        """
+        shards = self.plan(tickers, start_date, end_date)
+        results = self.fetchall(sql, [params(t, s, e) for (t, s, e) in shards])
+        rows = [r for part in results for r in part]
+        if self.shard_by == "date":
+            #Each date shard is in ticker order on its own
+            rows.sort(key=lambda r: (r[0], r[1]))
+        return rows
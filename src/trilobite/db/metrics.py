@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from trilobite.db import queries as q
+from trilobite.db.cache import _sizeof
+
+logger = logging.getLogger(__name__)
+#Separate logger so the slow queries can go to their own file, see
+#logging/setup.py
+slow_logger = logging.getLogger("trilobite.db.slow")
+
+#Upper bounds (ms) of the histogram buckets, the last bucket is open ended
+BUCKETS_MS: tuple[float, ...] = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _statement_names() -> dict[str, str]:
+    """
+    Returns the name of every statement in db/queries.py, keyed by its SQL
+    """
+    return {
+        sql: name
+        for name, sql in vars(q).items()
+        if name.isupper() and isinstance(sql, str)
+    }
+
+def _param_bytes(params: Any) -> int:
+    """
+    Estimates the size of the parameters sent with a statement, a list of
+    rows for executemany or a tuple of values, from the sys.getsizeof of the
+    Python objects. Not the bytes on the wire, which psycopg does not expose
+    per statement, but proportional enough to compare statements.
+    """
+    if not params:
+        return 0
+    if isinstance(params, list):
+        return _sizeof(params)
+    return sum(
+        _sizeof(list(p)) if isinstance(p, (list, tuple)) else sys.getsizeof(p)
+        for p in params
+    )
+
+def redact(params: Any) -> str:
+    """
+    Describes query parameters without their values, e.g. (str, date,
+    list[500]), so the slow-query log never holds tickers or prices
+    """
+    if params is None:
+        return "()"
+    if isinstance(params, list):
+        return f"{len(params)} rows"
+    if isinstance(params, tuple):
+        parts = []
+        for p in params:
+            if isinstance(p, (list, tuple)):
+                parts.append(f"list[{len(p)}]")
+            else:
+                parts.append(type(p).__name__)
+        return "(" + ", ".join(parts) + ")"
+    return type(params).__name__
+
+@dataclass
+class StatementStats:
+    """
+    Histogram and totals for one statement
+
+    Attributes:
+    - calls: number of executions
+    - total_ms: summed wall time
+    - max_ms: slowest execution
+    - rows: rows returned or affected
+    - est_bytes: estimated size of the parameters out and rows back, from
+    the Python objects, see _param_bytes
+    - buckets: execution counts per BUCKETS_MS bucket
+    """
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    est_bytes: int = 0
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS_MS) + 1))
+
+    def add(self, ms: float, rows: int, nbytes: int) -> None:
+        self.calls += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+        self.est_bytes += nbytes
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the p-th percentile (0-1),
+        the slowest execution for the open ended bucket
+        """
+        if self.calls == 0:
+            return 0.0
+        target = p * self.calls
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+@dataclass
+class QueryMetrics:
+    """
+    In-process timing of the repository choke points.
+
+    Every statement is recorded under its name in db/queries.py (ad hoc SQL
+    under "adhoc") with its wall time, rows and estimated size. A summary is
+    logged every `summary_interval_s` seconds while statements run (and by
+    flush() when the app closes, for the last interval), and
+    statements slower than `slow_ms` are written to the trilobite.db.slow
+    logger with their parameters redacted.
+
+    Params:
+    - slow_ms: threshold for the slow-query log, None disables it
+    - summary_interval_s: seconds between logged summaries, None disables them
+    """
+    slow_ms: float | None = 250.0
+    summary_interval_s: float | None = 60.0
+    _stats: dict[str, StatementStats] = field(default_factory=dict, init=False, repr=False)
+    _names: dict[str, str] = field(default_factory=_statement_names, init=False, repr=False)
+    _last_summary: float = field(default_factory=time.monotonic, init=False, repr=False)
+    #Statements recorded since the last logged summary
+    _unreported: int = field(default=0, init=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def name_of(self, sql: str) -> str:
+        """
+        Returns the queries.py name of a statement, "adhoc" if it has none
+        """
+        return self._names.get(sql, "adhoc")
+
+    def record(self, sql: str, params: Any, ms: float, *, rows: int, result: Any = None) -> None:
+        """
+        Records one execution
+
+        Params:
+        - sql: the statement
+        - params: its parameters, only used for the byte estimate and the
+        redacted slow-query entry
+        - ms: wall time
+        - rows: rows returned or affected
+        - result: fetched rows, for the byte estimate
+        """
+        name = self.name_of(sql)
+        nbytes = _param_bytes(params) + (_sizeof(result) if result is not None else 0)
+        with self._lock:
+            self._stats.setdefault(name, StatementStats()).add(ms, rows, nbytes)
+            self._unreported += 1
+            due = (
+                self.summary_interval_s is not None
+                and time.monotonic() - self._last_summary >= self.summary_interval_s
+            )
+            if due:
+                self._last_summary = time.monotonic()
+                self._unreported = 0
+        if self.slow_ms is not None and ms >= self.slow_ms:
+            slow_logger.warning(f"{name} took {ms:.1f}ms, rows={rows}, params={redact(params)}")
+        if due:
+            logger.info(f"Query summary:\n{self.summary()}")
+
+    def flush(self) -> None:
+        """
+        Logs the summary if statements were recorded since the last one, so
+        the last interval of a run is reported too
+        """
+        with self._lock:
+            due = self._unreported > 0
+            self._last_summary = time.monotonic()
+            self._unreported = 0
+        if due:
+            logger.info(f"Query summary:\n{self.summary()}")
+
+    def snapshot(self) -> dict[str, StatementStats]:
+        """
+        Returns a copy of the per-statement stats
+        """
+        with self._lock:
+            return {
+                name: StatementStats(s.calls, s.total_ms, s.max_ms, s.rows, s.est_bytes, list(s.buckets))
+                for name, s in self._stats.items()
+            }
+
+    def summary(self, top: int | None = None) -> str:
+        """
+        Returns a table of the statements, by total time spent
+
+        Params:
+        - top: only the `top` most expensive statements
+        """
+        stats = sorted(self.snapshot().items(), key=lambda kv: kv[1].total_ms, reverse=True)
+        if top is not None:
+            stats = stats[:top]
+        lines = [f"{'statement':<42} {'calls':>7} {'total ms':>10} {'p50':>7} {'p95':>7} {'max':>9} {'rows':>10} {'est MB':>8}"]
+        for name, s in stats:
+            lines.append(
+                f"{name:<42} {s.calls:>7} {s.total_ms:>10.1f} {s.percentile(0.5):>7g} "
+                f"{s.percentile(0.95):>7g} {s.max_ms:>9.1f} {s.rows:>10} {s.est_bytes / 1e6:>8.2f}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._unreported = 0
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import re
+
 ENSURE_INSTRUMENT = """
 INSERT INTO instrument (ticker, is_active, last_seen, deactivated_at)
 VALUES (%s, TRUE, CURRENT_DATE, NULL)
@@ -26,20 +28,25 @@ WHERE ticker = ANY(%s)
   AND is_active = TRUE;
 """
 
+TICKER_FOR_INSTRUMENT = """
+SELECT ticker
+FROM instrument
+WHERE id = %s;
+"""
+
 LAST_OHLCV_DATE_FOR_ALL_TICKERS = """
 SELECT
     i.ticker,
-    MAX(o.date) AS last_date
+    s.last_date
 FROM instrument AS i
-LEFT JOIN ohlcv_daily AS o ON o.instrument_id = i.id
-GROUP BY i.ticker
+LEFT JOIN instrument_stats AS s ON s.instrument_id = i.id
 ORDER BY i.ticker;
 """
 
 LAST_OHLCV_DATE_FOR_TICKER = """
-SELECT MAX(o.date) AS last_date
+SELECT s.last_date
 FROM instrument AS i
-JOIN ohlcv_daily AS o ON o.instrument_id = i.id
+JOIN instrument_stats AS s ON s.instrument_id = i.id
 WHERE i.ticker = %s;
 """
 
@@ -96,18 +103,603 @@ WHERE i.ticker = %s
 ORDER BY o.date;
 """
 
+# The trading calendar of the range is collected with a loose index scan over
+# the date index (one probe per trading day instead of one row per ticker and
+# day). Only instruments whose stats span the whole calendar are counted.
 LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE = """
-WITH expected AS (
-  SELECT COUNT(DISTINCT date) AS n
-  FROM ohlcv_daily
-  WHERE date BETWEEN %s AND %s
+WITH RECURSIVE calendar AS (
+    SELECT MIN(date) AS d
+    FROM ohlcv_daily
+    WHERE date BETWEEN %s AND %s
+  UNION ALL
+    SELECT (
+        SELECT MIN(o.date)
+        FROM ohlcv_daily AS o
+        WHERE o.date > c.d
+          AND o.date <= %s
+    )
+    FROM calendar AS c
+    WHERE c.d IS NOT NULL
+),
+expected AS (
+    SELECT COUNT(d) AS n, MIN(d) AS first_day, MAX(d) AS last_day
+    FROM calendar
 )
 SELECT i.ticker
-FROM instrument i
-JOIN ohlcv_daily o ON o.instrument_id = i.id
-WHERE o.date BETWEEN %s AND %s
+FROM expected AS e
+JOIN instrument_stats AS s
+  ON s.first_date <= e.first_day
+ AND s.last_date >= e.last_day
+ AND s.n_rows >= e.n
+JOIN instrument AS i ON i.id = s.instrument_id
+WHERE (
+    SELECT COUNT(*)
+    FROM ohlcv_daily AS o
+    WHERE o.instrument_id = s.instrument_id
+      AND o.date BETWEEN e.first_day AND e.last_day
+) = e.n
+ORDER BY i.ticker;
+"""
+
+#Hot rows are aggregated, cold segments only contribute their array bounds.
+#Params: (id, id, id, id)
+REFRESH_INSTRUMENT_STATS = """
+INSERT INTO instrument_stats (instrument_id, first_date, last_date, n_rows, last_volume)
+SELECT
+    %s,
+    LEAST(h.first_date, c.first_date),
+    GREATEST(h.last_date, c.last_date),
+    h.n_rows + c.n_rows,
+    CASE
+        WHEN h.n_rows > 0 THEN (
+            SELECT l.volume
+            FROM ohlcv_daily AS l
+            WHERE l.instrument_id = %s
+            ORDER BY l.date DESC
+            LIMIT 1
+        )
+        ELSE c.last_volume
+    END
+FROM (
+    SELECT MIN(o.date) AS first_date, MAX(o.date) AS last_date, COUNT(*) AS n_rows
+    FROM ohlcv_daily AS o
+    WHERE o.instrument_id = %s
+) AS h
+CROSS JOIN (
+    SELECT
+        MIN(s.dates[1]) AS first_date,
+        MAX(s.dates[cardinality(s.dates)]) AS last_date,
+        COALESCE(SUM(cardinality(s.dates)), 0) AS n_rows,
+        (array_agg(s.volume[cardinality(s.volume)] ORDER BY s.year DESC))[1] AS last_volume
+    FROM ohlcv_cold AS s
+    WHERE s.instrument_id = %s
+) AS c
+ON CONFLICT (instrument_id) DO UPDATE SET
+    first_date = EXCLUDED.first_date,
+    last_date = EXCLUDED.last_date,
+    n_rows = EXCLUDED.n_rows,
+    last_volume = EXCLUDED.last_volume;
+"""
+
+CLEAR_INSTRUMENT_STATS = """
+DELETE FROM instrument_stats;
+"""
+
+REBUILD_INSTRUMENT_STATS = """
+INSERT INTO instrument_stats (instrument_id, first_date, last_date, n_rows, last_volume)
+SELECT
+    t.instrument_id,
+    MIN(t.first_date),
+    MAX(t.last_date),
+    SUM(t.n_rows),
+    (array_agg(t.last_volume ORDER BY t.last_date DESC))[1]
+FROM (
+    SELECT a.instrument_id, a.first_date, a.last_date, a.n_rows, l.volume AS last_volume
+    FROM (
+        SELECT instrument_id, MIN(date) AS first_date, MAX(date) AS last_date, COUNT(*) AS n_rows
+        FROM ohlcv_daily
+        GROUP BY instrument_id
+    ) AS a
+    JOIN (
+        SELECT DISTINCT ON (instrument_id) instrument_id, volume
+        FROM ohlcv_daily
+        ORDER BY instrument_id, date DESC
+    ) AS l ON l.instrument_id = a.instrument_id
+  UNION ALL
+    SELECT
+        instrument_id,
+        MIN(dates[1]),
+        MAX(dates[cardinality(dates)]),
+        SUM(cardinality(dates)),
+        (array_agg(volume[cardinality(volume)] ORDER BY year DESC))[1]
+    FROM ohlcv_cold
+    GROUP BY instrument_id
+) AS t
+GROUP BY t.instrument_id
+ON CONFLICT (instrument_id) DO UPDATE SET
+    first_date = EXCLUDED.first_date,
+    last_date = EXCLUDED.last_date,
+    n_rows = EXCLUDED.n_rows,
+    last_volume = EXCLUDED.last_volume;
+"""
+
+FETCH_OHLCV_SINCE = """
+SELECT
+    i.ticker,
+    o.date,
+    o.open::float8,
+    o.high::float8,
+    o.low::float8,
+    o.close::float8,
+    o.adjclose::float8,
+    o.volume::float8
+FROM unnest(%s::text[], %s::date[]) AS s(ticker, since)
+JOIN instrument AS i ON i.ticker = s.ticker
+JOIN ohlcv_daily AS o ON o.instrument_id = i.id
+WHERE o.date >= COALESCE(s.since, '-infinity'::date)
+ORDER BY i.ticker, o.date;
+"""
+
+LIST_TRADING_DATES_SINCE = """
+WITH RECURSIVE calendar AS (
+    SELECT MIN(date) AS d
+    FROM ohlcv_daily
+    WHERE date >= %s
+  UNION ALL
+    SELECT (
+        SELECT MIN(o.date)
+        FROM ohlcv_daily AS o
+        WHERE o.date > c.d
+    )
+    FROM calendar AS c
+    WHERE c.d IS NOT NULL
+)
+SELECT d
+FROM calendar
+WHERE d IS NOT NULL
+ORDER BY d;
+"""
+
+LIST_INSTRUMENTS_WITH_STATS = """
+SELECT
+    i.id,
+    i.ticker,
+    i.is_active,
+    i.last_seen,
+    i.deactivated_at,
+    s.first_date,
+    s.last_date,
+    s.n_rows
+FROM instrument AS i
+LEFT JOIN instrument_stats AS s ON s.instrument_id = i.id
+ORDER BY i.id;
+"""
+
+#Streams the rows the DuckDB copy is missing, from a per-instrument start date
+FETCH_OHLCV_ROWS_SINCE_BY_ID = """
+SELECT
+    o.instrument_id,
+    o.date,
+    o.open::float8,
+    o.high::float8,
+    o.low::float8,
+    o.close::float8,
+    o.adjclose::float8,
+    o.volume,
+    o.dividends::float8,
+    o.stocksplits::float8
+FROM unnest(%s::bigint[], %s::date[]) AS p(instrument_id, since)
+JOIN ohlcv_daily AS o ON o.instrument_id = p.instrument_id AND o.date >= p.since
+ORDER BY o.instrument_id, o.date;
+"""
+
+#Recomputes the log returns of one instrument from a date on, the window also
+#reads the last stored day before that date so the first changed day gets its
+#return. Read through ohlcv_daily_all, as that day may be in a cold segment
+#(the filter on the instrument reaches both tiers of the view).
+#Params: (id, id, since, since, since)
+REFRESH_RETURNS_DAILY = """
+INSERT INTO returns_daily (instrument_id, date, logret)
+SELECT instrument_id, date, logret
+FROM (
+    SELECT
+        o.instrument_id,
+        o.date,
+        CASE
+            WHEN o.adjclose > 0 AND LAG(o.adjclose) OVER w > 0
+            THEN ln(o.adjclose / LAG(o.adjclose) OVER w)::float8
+        END AS logret,
+        LAG(o.date) OVER w AS prev_date
+    FROM ohlcv_daily_all AS o
+    WHERE o.instrument_id = %s
+      AND o.date >= COALESCE(
+          (SELECT MAX(p.date) FROM ohlcv_daily_all AS p WHERE p.instrument_id = %s AND p.date < %s),
+          %s
+      )
+    WINDOW w AS (ORDER BY o.date)
+) AS r
+WHERE r.prev_date IS NOT NULL
+  AND r.date >= %s
+ON CONFLICT (instrument_id, date) DO UPDATE SET
+    logret = EXCLUDED.logret;
+"""
+
+CLEAR_RETURNS_DAILY = """
+DELETE FROM returns_daily;
+"""
+
+REBUILD_RETURNS_DAILY = """
+INSERT INTO returns_daily (instrument_id, date, logret)
+SELECT instrument_id, date, logret
+FROM (
+    SELECT
+        o.instrument_id,
+        o.date,
+        CASE
+            WHEN o.adjclose > 0 AND LAG(o.adjclose) OVER w > 0
+            THEN ln(o.adjclose / LAG(o.adjclose) OVER w)::float8
+        END AS logret,
+        LAG(o.date) OVER w AS prev_date
+    FROM ohlcv_daily_all AS o
+    WINDOW w AS (PARTITION BY o.instrument_id ORDER BY o.date)
+) AS r
+WHERE r.prev_date IS NOT NULL
+ON CONFLICT (instrument_id, date) DO UPDATE SET
+    logret = EXCLUDED.logret;
+"""
+
+FETCH_LOGRET_LONG = """
+SELECT i.ticker, r.date, r.logret
+FROM instrument AS i
+JOIN returns_daily AS r ON r.instrument_id = i.id
+WHERE i.ticker = ANY(%s)
+  AND r.date BETWEEN %s AND %s
+ORDER BY i.ticker, r.date;
+"""
+
+#Cold tier, see ohlcv_cold in schema.py. The *_TIERED variants read both tiers
+#and are only used when the range reaches a cold year, see 
+#MarketRepo._reaches_cold
+def _tiered(sql: str) -> str:
+    #Whole identifiers only, ohlcv_daily_provisional and ohlcv_daily_all stay
+    tiered, n = re.subn(r"\bohlcv_daily\b", "ohlcv_daily_all", sql)
+    if n == 0:
+        raise ValueError("Query does not read ohlcv_daily")
+    return tiered
+
+COLD_TIER_LAST_YEAR = """
+SELECT MAX(year)
+FROM ohlcv_cold;
+"""
+
+#Moves the hot rows of one instrument set and date range into the cold tier,
+#merging with segments already there. Params: (start, end), end exclusive
+COMPACT_OHLCV_RANGE = """
+WITH moved AS (
+    DELETE FROM ohlcv_daily
+    WHERE date >= %s AND date < %s
+    RETURNING
+        instrument_id,
+        date,
+        open::float8 AS open,
+        high::float8 AS high,
+        low::float8 AS low,
+        close::float8 AS close,
+        adjclose::float8 AS adjclose,
+        volume,
+        dividends::float8 AS dividends,
+        stocksplits::float8 AS stocksplits
+),
+touched AS (
+    SELECT DISTINCT instrument_id, extract(year FROM date)::int AS year
+    FROM moved
+),
+merged AS (
+    SELECT * FROM moved
+  UNION ALL
+    SELECT c.instrument_id, u.*
+    FROM ohlcv_cold AS c
+    JOIN touched AS t ON t.instrument_id = c.instrument_id AND t.year = c.year
+    CROSS JOIN LATERAL unnest(
+        c.dates, c.open, c.high, c.low, c.close, c.adjclose, c.volume, c.dividends, c.stocksplits
+    ) AS u(date, open, high, low, close, adjclose, volume, dividends, stocksplits)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM moved AS m WHERE m.instrument_id = c.instrument_id AND m.date = u.date
+    )
+)
+INSERT INTO ohlcv_cold (
+    instrument_id, year, dates, open, high, low, close, adjclose, volume, dividends, stocksplits
+)
+SELECT
+    instrument_id,
+    extract(year FROM date)::int,
+    array_agg(date ORDER BY date),
+    array_agg(open ORDER BY date),
+    array_agg(high ORDER BY date),
+    array_agg(low ORDER BY date),
+    array_agg(close ORDER BY date),
+    array_agg(adjclose ORDER BY date),
+    array_agg(volume ORDER BY date),
+    array_agg(dividends ORDER BY date),
+    array_agg(stocksplits ORDER BY date)
+FROM merged
+GROUP BY instrument_id, extract(year FROM date)::int
+ON CONFLICT (instrument_id, year) DO UPDATE SET
+    dates = EXCLUDED.dates,
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    adjclose = EXCLUDED.adjclose,
+    volume = EXCLUDED.volume,
+    dividends = EXCLUDED.dividends,
+    stocksplits = EXCLUDED.stocksplits;
+"""
+
+#Moves the cold segments of one instrument in a range of years back into 
+#ohlcv_daily, before an upsert rewrites them. Params: (id, first year, last year)
+UNPACK_COLD_SEGMENTS = """
+WITH gone AS (
+    DELETE FROM ohlcv_cold
+    WHERE instrument_id = %s AND year BETWEEN %s AND %s
+    RETURNING *
+)
+INSERT INTO ohlcv_daily (
+    instrument_id, date, open, high, low, close, adjclose, volume, dividends, stocksplits
+)
+SELECT g.instrument_id, u.*
+FROM gone AS g
+CROSS JOIN LATERAL unnest(
+    g.dates, g.open, g.high, g.low, g.close, g.adjclose, g.volume, g.dividends, g.stocksplits
+) AS u(date, open, high, low, close, adjclose, volume, dividends, stocksplits)
+ON CONFLICT (instrument_id, date) DO NOTHING;
+"""
+
+#Only unnests the adjclose arrays of the segments in the year range.
+#Params: (tickers, start, end, tickers, start, end, start, end)
+FETCH_ADJCLOSE_LONG_TIERED = """
+SELECT i.ticker, o.date, o.adjclose::float8 AS adjclose
+FROM instrument AS i
+JOIN ohlcv_daily AS o ON o.instrument_id = i.id
+WHERE i.ticker = ANY(%s)
+  AND o.date BETWEEN %s AND %s
+UNION ALL
+SELECT i.ticker, u.date, u.adjclose
+FROM instrument AS i
+JOIN ohlcv_cold AS c ON c.instrument_id = i.id
+CROSS JOIN LATERAL unnest(c.dates, c.adjclose) AS u(date, adjclose)
+WHERE i.ticker = ANY(%s)
+  AND c.year BETWEEN extract(year FROM %s::date) AND extract(year FROM %s::date)
+  AND u.date BETWEEN %s AND %s
+ORDER BY 1, 2;
+"""
+
+FETCH_ADJCLOSE_SERIES_BETWEEN_TIERED = _tiered(FETCH_ADJCLOSE_SERIES_BETWEEN)
+
+FETCH_ADJCLOSE_SERIES_LEQ_TIERED = _tiered(FETCH_ADJCLOSE_SERIES_LEQ)
+
+FETCH_OHLCV_SINCE_TIERED = _tiered(FETCH_OHLCV_SINCE)
+
+FETCH_OHLCV_ROWS_SINCE_BY_ID_TIERED = _tiered(FETCH_OHLCV_ROWS_SINCE_BY_ID)
+
+#Params: (start, end)
+LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE_TIERED = """
+WITH r AS (
+    SELECT instrument_id, date
+    FROM ohlcv_daily_all
+    WHERE date BETWEEN %s AND %s
+),
+expected AS (
+    SELECT COUNT(DISTINCT date) AS n
+    FROM r
+)
+SELECT i.ticker
+FROM r
+JOIN instrument AS i ON i.id = r.instrument_id
 GROUP BY i.ticker
-HAVING COUNT(DISTINCT o.date) = (SELECT n FROM expected)
+HAVING COUNT(*) = (SELECT n FROM expected)
+ORDER BY i.ticker;
+"""
+
+LIST_TRADING_DATES_SINCE_TIERED = """
+SELECT DISTINCT date
+FROM ohlcv_daily_all
+WHERE date >= %s
+ORDER BY date;
+"""
+
+FIRST_HOT_OHLCV_DATE = """
+SELECT MIN(date)
+FROM ohlcv_daily;
+"""
+
+#Latest stored bar per active ticker for one bar length, NULL when there is
+#none yet. One backward index probe per instrument and partition.
+LAST_INTRADAY_TS_FOR_ALL_TICKERS = """
+SELECT
+    i.ticker,
+    (
+        SELECT MAX(b.ts)
+        FROM ohlcv_intraday AS b
+        WHERE b.instrument_id = i.id
+          AND b.interval_min = %s
+    ) AS last_ts
+FROM instrument AS i
+WHERE i.is_active = TRUE
+ORDER BY i.ticker;
+"""
+
+FETCH_INTRADAY_BARS = """
+SELECT b.ts, b.open::float8, b.high::float8, b.low::float8, b.close::float8, b.volume
+FROM ohlcv_intraday AS b
+JOIN instrument AS i ON i.id = b.instrument_id
+WHERE i.ticker = %s
+  AND b.interval_min = %s
+  AND b.ts >= %s
+  AND b.ts < %s
+ORDER BY b.ts;
+"""
+
+#Daily bars aggregated from the intraday bars into ohlcv_daily_provisional,
+#one per instrument and exchange day (the bars' ts in the exchange time 
+#zone), for the days after the last ohlcv_daily row. Instruments without
+#daily history are left out. Params: (interval_min, tz, interval_min, since)
+ROLLUP_INTRADAY_DAILY = """
+INSERT INTO ohlcv_daily_provisional (instrument_id, date, open, high, low, close, volume, interval_min)
+SELECT r.instrument_id, r.day, r.open, r.high, r.low, r.close, r.volume, %s
+FROM (
+    SELECT
+        b.instrument_id,
+        (b.ts AT TIME ZONE %s)::date AS day,
+        (array_agg(b.open ORDER BY b.ts))[1]::float8 AS open,
+        MAX(b.high)::float8 AS high,
+        MIN(b.low)::float8 AS low,
+        (array_agg(b.close ORDER BY b.ts DESC))[1]::float8 AS close,
+        SUM(b.volume)::bigint AS volume
+    FROM ohlcv_intraday AS b
+    WHERE b.interval_min = %s
+      AND b.ts >= %s
+    GROUP BY b.instrument_id, day
+) AS r
+JOIN instrument_stats AS s ON s.instrument_id = r.instrument_id
+WHERE r.day > s.last_date
+ON CONFLICT (instrument_id, date) DO UPDATE SET
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    volume = EXCLUDED.volume,
+    interval_min = EXCLUDED.interval_min,
+    rolled_up_at = now();
+"""
+
+#Provisional bars of the days ohlcv_daily now has a provider bar for
+PRUNE_PROVISIONAL_DAILY = """
+DELETE FROM ohlcv_daily_provisional AS p
+USING instrument_stats AS s
+WHERE s.instrument_id = p.instrument_id
+  AND p.date <= s.last_date;
+"""
+
+#Skips the rows PRUNE_PROVISIONAL_DAILY has not removed yet
+FETCH_PROVISIONAL_DAILY = """
+SELECT i.ticker, p.date, p.open, p.high, p.low, p.close, p.volume
+FROM instrument AS i
+JOIN ohlcv_daily_provisional AS p ON p.instrument_id = i.id
+JOIN instrument_stats AS s ON s.instrument_id = i.id
+WHERE i.ticker = ANY(%s)
+  AND p.date > s.last_date
+ORDER BY i.ticker, p.date;
+"""
+
+#Bars older than the cutoff in the partitions retention did not drop whole
+DELETE_EXPIRED_INTRADAY = """
+DELETE FROM ohlcv_intraday
+WHERE interval_min = %s
+  AND ts < %s;
+"""
+
+LIST_INTRADAY_PARTITIONS = """
+SELECT c.relname
+FROM pg_inherits AS h
+JOIN pg_class AS c ON c.oid = h.inhrelid
+WHERE h.inhparent = %s::regclass
+ORDER BY c.relname;
+"""
+
+#Streams of the full tables for the Parquet/Arrow export, rows after a date,
+#sorted so each partition (ticker or date) is contiguous
+EXPORT_OHLCV_BY_TICKER = """
+SELECT
+    i.ticker,
+    o.date,
+    o.open::float8,
+    o.high::float8,
+    o.low::float8,
+    o.close::float8,
+    o.adjclose::float8,
+    o.volume,
+    o.dividends::float8,
+    o.stocksplits::float8
+FROM ohlcv_daily AS o
+JOIN instrument AS i ON i.id = o.instrument_id
+WHERE o.date > %s
+ORDER BY i.ticker, o.date;
+"""
+
+EXPORT_OHLCV_BY_DATE = """
+SELECT
+    i.ticker,
+    o.date,
+    o.open::float8,
+    o.high::float8,
+    o.low::float8,
+    o.close::float8,
+    o.adjclose::float8,
+    o.volume,
+    o.dividends::float8,
+    o.stocksplits::float8
+FROM ohlcv_daily AS o
+JOIN instrument AS i ON i.id = o.instrument_id
+WHERE o.date > %s
+ORDER BY o.date, i.ticker;
+"""
+
+EXPORT_OHLCV_BY_TICKER_TIERED = _tiered(EXPORT_OHLCV_BY_TICKER)
+
+EXPORT_OHLCV_BY_DATE_TIERED = _tiered(EXPORT_OHLCV_BY_DATE)
+
+EXPORT_LOGRET_BY_TICKER = """
+SELECT i.ticker, r.date, r.logret
+FROM returns_daily AS r
+JOIN instrument AS i ON i.id = r.instrument_id
+WHERE r.date > %s
+ORDER BY i.ticker, r.date;
+"""
+
+EXPORT_LOGRET_BY_DATE = """
+SELECT i.ticker, r.date, r.logret
+FROM returns_daily AS r
+JOIN instrument AS i ON i.id = r.instrument_id
+WHERE r.date > %s
+ORDER BY r.date, i.ticker;
+"""
+
+#Tickers with rows after a date, the columns of the exported matrices
+LIST_TICKERS_WITH_ROWS_AFTER = """
+SELECT i.ticker
+FROM instrument_stats AS s
+JOIN instrument AS i ON i.id = s.instrument_id
+WHERE s.last_date > %s
+ORDER BY i.ticker;
+"""
+
+#Negative cache of failing fetches, see fetch_failure in schema.py
+LIST_FETCH_FAILURES = """
+SELECT i.ticker, f.reason, f.streak, f.first_failed_at, f.last_failed_at, f.retry_after
+FROM fetch_failure AS f
+JOIN instrument AS i ON i.id = f.instrument_id
 ORDER BY i.ticker;
 """
 
+#Params: (reason, streak, failed_at, failed_at, retry_after, ticker)
+RECORD_FETCH_FAILURE = """
+INSERT INTO fetch_failure (instrument_id, reason, streak, first_failed_at, last_failed_at, retry_after)
+SELECT id, %s, %s, %s, %s, %s
+FROM instrument
+WHERE ticker = %s
+ON CONFLICT (instrument_id) DO UPDATE SET
+    reason = EXCLUDED.reason,
+    streak = EXCLUDED.streak,
+    last_failed_at = EXCLUDED.last_failed_at,
+    retry_after = EXCLUDED.retry_after;
+"""
+
+CLEAR_FETCH_FAILURES = """
+DELETE FROM fetch_failure
+WHERE instrument_id IN (
+    SELECT id
+    FROM instrument
+    WHERE ticker = ANY(%s)
+);
+"""
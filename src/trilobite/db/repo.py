@@ -1,18 +1,25 @@
 from __future__ import annotations
 
 import logging
-from datetime import date, timedelta
-from dataclasses import dataclass
-from typing import Any, Iterable, Mapping, Sequence
+import time
+from datetime import date, datetime, timedelta, timezone
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, Mapping, Sequence
 
 import pandas as pd
 import psycopg
+from psycopg import sql as pgsql
 from psycopg.rows import tuple_row
 from pandas import DataFrame, to_numeric
 from torch import TupleType
 
 from trilobite.utils.utils import period_to_date
 from trilobite.db import queries as q
+from trilobite.db import schema
+from trilobite.db.cache import ReadCache
+from trilobite.db.fanout import ParallelReader
+from trilobite.db.metrics import QueryMetrics
+from trilobite.db.screen import Screen
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +47,168 @@ def _float_or_none(x: Any) -> float | None:
         return None
     return float(x)
 
+def _clean_ticker(ticker: str) -> str:
+    """
+    Strips and capitalizes all letters in a ticker.
+
+    Params:
+    -ticker, a string
+
+    Returns:
+    - string, ticker
+    """
+    t = ticker.strip().upper()
+    if not t:
+        raise ValueError(f"Ticker cannot be empty")
+    return t
+
+def _clean_tickers(tickers: Sequence[str]) -> list[str]:
+    """
+    Strips and capitalizes all letters in a sequence of tickers. 
+
+    Params
+    - tickers: a sequence of strings
+
+    Returns
+    - List, sorted. 
+    """
+    return sorted({t.strip().upper() for t in tickers if t and t.strip()})
+
+OHLCV_COLUMNS = [
+    "date",
+    "open", 
+    "high",
+    "low",
+    "close",
+    "adjclose",
+    "volume",
+    "dividends",
+    "stocksplits",
+]
+
+def _ohlcv_rows(instrument_id: int, df: DataFrame) -> Iterable[tuple]:
+    """
+    Builds the UPSERT_OHLCV_DAILY parameter rows, one tuple per dataframe row
+
+    Raises:
+    - ValueError if any of the OHLCV columns are missing
+    """
+    missing = [c for c in OHLCV_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing requires columns for upsert: {missing}")
+    return (
+        (
+            instrument_id,
+            r["date"], #This comes in as a python date from YFClient
+            _float_or_none(r["open"]),
+            _float_or_none(r["high"]),
+            _float_or_none(r["low"]),
+            _float_or_none(r["close"]),
+            _float_or_none(r["adjclose"]),
+            _int_or_none(r["volume"]),
+            _float_or_none(r["dividends"]),
+            _float_or_none(r["stocksplits"]),
+        )
+        for _, r in df[OHLCV_COLUMNS].iterrows()
+    )
+
+INTRADAY_COLUMNS = ["ts", "open", "high", "low", "close", "volume"]
+
+def _interval_min(interval: str) -> int:
+    """
+    Returns the bar length in minutes of an intraday interval name
+
+    Raises:
+    - ValueError for intervals that are not stored, see 
+    schema.INTRADAY_INTERVALS
+    """
+    try:
+        return schema.INTRADAY_INTERVALS[interval]
+    except KeyError:
+        raise ValueError(f"Unknown intraday interval: {interval}") from None
+
+def _intraday_rows(instrument_id: int, interval_min: int, df: DataFrame) -> list[tuple]:
+    """
+    Builds the COPY_INTRADAY_STAGE rows, column by column instead of with
+    iterrows as intraday batches run to millions of rows
+
+    Raises:
+    - ValueError if any of the intraday columns are missing
+    """
+    missing = [c for c in INTRADAY_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing requires columns for upsert: {missing}")
+    ts = pd.to_datetime(df["ts"], utc=True).dt.to_pydatetime()
+    prices = [
+        [None if v != v else v for v in pd.to_numeric(df[c], errors="coerce").astype("float64").tolist()]
+        for c in ("open", "high", "low", "close")
+    ]
+    volume = [_int_or_none(v) for v in df["volume"].tolist()]
+    return [
+        (t, instrument_id, v, o, h, l, c, interval_min)
+        for t, v, o, h, l, c in zip(ts, volume, *prices)
+    ]
+
+def _adjclose_long_frame(rows: list[tuple[Any, ...]]) -> DataFrame:
+    """
+    Builds the fetch_adjclose_long dataframe from (ticker, date, adjclose) rows
+    """
+    df = pd.DataFrame(rows, columns = ["ticker", "date", "adjclose"]) #type: ignore
+    df["ticker"] = df["ticker"].astype(str)
+    df["date"] = pd.to_datetime(df["date"])
+    df["adjclose"] = pd.to_numeric(df["adjclose"], errors="coerce")
+    return df
+
+def _first_date(df: DataFrame) -> date:
+    """
+    Returns the earliest date of an OHLCV dataframe as a python date
+    """
+    return pd.Timestamp(df["date"].min()).date()
+
+def _last_date(df: DataFrame) -> date:
+    """
+    Returns the latest date of an OHLCV dataframe as a python date
+    """
+    return pd.Timestamp(df["date"].max()).date()
+
+def _logret_long_frame(rows: list[tuple[Any, ...]]) -> DataFrame:
+    """
+    Builds the fetch_logret_long dataframe from (ticker, date, logret) rows
+    """
+    df = pd.DataFrame(rows, columns = ["ticker", "date", "logret"]) #type: ignore
+    df["ticker"] = df["ticker"].astype(str)
+    df["date"] = pd.to_datetime(df["date"])
+    df["logret"] = pd.to_numeric(df["logret"], errors="coerce")
+    return df
+
+def _adjclose_series_frame(rows: list[tuple[Any, ...]]) -> DataFrame:
+    """
+    Builds the fetch_adjclose_series dataframe from (date, adjclose) rows
+    """
+    df = pd.DataFrame(rows, columns=["date", "adjclose"])#type: ignore
+    df["date"] = pd.to_datetime(df["date"])
+    df["adjclose"] = pd.to_numeric(df["adjclose"], errors="coerce")
+    return df
+
+@dataclass(frozen=True)
+class FetchFailure:
+    """
+    A row of the fetch_failure negative cache
+
+    Attributes:
+    - ticker: ticker symbol
+    - reason: what the last failed fetch ran into
+    - streak: failed fetches in a row
+    - first_failed_at, last_failed_at: first and last failure of the streak
+    - retry_after: the ticker is skipped by --updateall until then
+    """
+    ticker: str
+    reason: str
+    streak: int
+    first_failed_at: datetime
+    last_failed_at: datetime
+    retry_after: datetime
+
 @dataclass
 class MarketRepo:
     """
@@ -47,38 +216,129 @@ class MarketRepo:
 
     Params:
     - conn: an open psycipg connection.
+    - cache: optional ReadCache for the read methods, entries are invalidated
+    per ticker by ensure_instrument, upsert_ohlcv_daily and 
+    deactivate_tickers. Only safe while this repo is the only writer.
+    - metrics: optional QueryMetrics, times every statement
+    - fanout: optional ParallelReader, large matrix reads (fetch_adjclose_long,
+    fetch_logret_long) are split into shards read in parallel on its pool
     """
     conn: psycopg.Connection
+    cache: ReadCache | None = None
+    metrics: QueryMetrics | None = None
+    fanout: ParallelReader | None = None
+    _tickers_by_id: dict[int, str] = field(default_factory=dict, init=False, repr=False)
 
     #Local methods
-    def _execute(self, sql: str, params: tuple | None = None) -> int:
+    def _execute(self, sql: str, params: tuple | None = None, *, commit: bool = True) -> int:
+        t0 = time.perf_counter()
         with self.conn.cursor() as cur:
             cur.execute(sql, params or ()) #type: ignore[]
             rc = cur.rowcount
-        self.conn.commit()
-        return 0 if rc is None or rc < 0 else int(rc)
-
-    def _executemany(self, sql: str, rows) -> int:
+        if commit:
+            self.conn.commit()
+        n = 0 if rc is None or rc < 0 else int(rc)
+        if self.metrics is not None:
+            self.metrics.record(sql, params, (time.perf_counter() - t0) * 1000, rows=n)
+        return n
+
+    def _executemany(self, sql: str, rows, *, commit: bool = True) -> int:
+        if self.metrics is not None:
+            rows = list(rows)
+        t0 = time.perf_counter()
         with self.conn.cursor() as cur:
             cur.executemany(sql, rows)#type: ignore[]
             rc = cur.rowcount
-        self.conn.commit()
-        return 0 if rc is None or rc < 0 else int(rc)
+        if commit:
+            self.conn.commit()
+        n = 0 if rc is None or rc < 0 else int(rc)
+        if self.metrics is not None:
+            self.metrics.record(sql, rows, (time.perf_counter() - t0) * 1000, rows=n)
+        return n
 
     def _fetchone(self, sql: str, params: tuple | None = None) -> tuple[Any, ...] | None:
+        t0 = time.perf_counter()
         with self.conn.cursor(row_factory=tuple_row) as cur:
             cur.execute(sql, params or ())#type: ignore[]
-            return cur.fetchone()
+            row = cur.fetchone()
+        if self.metrics is not None:
+            self.metrics.record(sql, params, (time.perf_counter() - t0) * 1000, rows=int(row is not None), result=row)
+        return row
 
     def _fetchall(self, sql: str, params: tuple | None = None) -> list[tuple[Any, ...]]:
+        t0 = time.perf_counter()
         with self.conn.cursor(row_factory=tuple_row) as cur:
             cur.execute(sql, params or ())#type: ignore[]
-            return cur.fetchall()
+            rows = cur.fetchall()
+        if self.metrics is not None:
+            self.metrics.record(sql, params, (time.perf_counter() - t0) * 1000, rows=len(rows), result=rows)
+        return rows
 
     def _scalar(self, sql: str, params: tuple | None = None):
         row = self._fetchone(sql, params)
         return None if row is None else row[0]
 
+    def _cached_fetchall(self, sql: str, params: tuple | None = None, *, tickers: Iterable[str] | None = None) -> list[tuple[Any, ...]]:
+        """
+        _fetchall through the read cache, if there is one. tickers are the
+        tickers the result depends on, None if it depends on all of them.
+        """
+        if self.cache is None:
+            return self._fetchall(sql, params)
+        key = self.cache.key(sql, params)
+        found, rows = self.cache.get(key)
+        if not found:
+            rows = self._fetchall(sql, params)
+            self.cache.put(key, rows, tickers=tickers)
+        return rows
+
+    def _cached_scalar(self, sql: str, params: tuple | None = None, *, tickers: Iterable[str] | None = None):
+        rows = self._cached_fetchall(sql, params, tickers=tickers)
+        return rows[0][0] if rows else None
+
+    def _matrix_fetchall(self,
+                         sql: str,
+                         tickers: list[str],
+                         start_date: date,
+                         end_date: date,
+                         params: Callable[[list[str], date, date], tuple],
+                         ) -> list[tuple[Any, ...]]:
+        """
+        _cached_fetchall of a (ticker, date, ..) read, split into shards on the
+        fanout reader when there is one and the read is large enough. The
+        cache key and the metrics entry are those of the unsharded statement.
+        """
+        if self.fanout is None or len(tickers) < self.fanout.min_tickers or self.fanout.width < 2:
+            return self._cached_fetchall(sql, params(tickers, start_date, end_date), tickers=tickers)
+        full = params(tickers, start_date, end_date)
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(sql, full)
+            found, rows = self.cache.get(key)
+            if found:
+                return rows
+        t0 = time.perf_counter()
+        rows = self.fanout.fetch_tickers(sql, tickers, start_date=start_date, end_date=end_date, params=params)
+        if self.metrics is not None:
+            self.metrics.record(sql, full, (time.perf_counter() - t0) * 1000, rows=len(rows), result=rows)
+        if self.cache is not None:
+            self.cache.put(key, rows, tickers=tickers)
+        return rows
+
+    def _invalidate(self, tickers: Iterable[str]) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(tickers)
+
+    def _reaches_cold(self, start_date: date | None) -> bool:
+        """
+        True if a read starting at start_date (None for all history) has to
+        include the cold tier
+        """
+        last_year = self._cached_scalar(q.COLD_TIER_LAST_YEAR)
+        if last_year is None:
+            return False
+        return start_date is None or start_date.year <= last_year
+
 
     #Local helpers
     def _clean_ticker(self, ticker: str) -> str:
@@ -91,10 +351,7 @@ class MarketRepo:
         Returns:
         - string, ticker
         """
-        t = ticker.strip().upper()
-        if not t:
-            raise ValueError(f"Ticker cannot be empty")
-        return t
+        return _clean_ticker(ticker)
 
     def _clean_tickers(self, tickers: Sequence[str]) -> list[str]:
         """
@@ -106,10 +363,19 @@ class MarketRepo:
         Returns
         - List, sorted. 
         """
-        return sorted({t.strip().upper() for t in tickers if t and t.strip()})
+        return _clean_tickers(tickers)
 
 
     # Methods
+    def current_date(self) -> date:
+        """
+        Returns CURRENT_DATE of the DB
+        """
+        today = self._scalar("SELECT CURRENT_DATE;")
+        if today is None:
+            raise RuntimeError("DB returned NULL for CURRENT_DATE")
+        return today
+
     def ensure_instrument(self, ticker: str) -> int:
         """
         Ensure a row exists in instrument for the given ticker and return its id
@@ -129,6 +395,9 @@ class MarketRepo:
         instrument_id = self._scalar(q.ENSURE_INSTRUMENT, (t,))
         if instrument_id is None:
             raise RuntimeError(f"Failed to fetch instrument id after upsert")
+        if self.cache is not None:
+            self._tickers_by_id[int(instrument_id)] = t
+            self._invalidate((t,))
         return int(instrument_id)
 
 
@@ -136,6 +405,13 @@ class MarketRepo:
         """
         Upsert daily OHLCV rows into ahlcv_daily table for given instrument
 
+        The instrument_stats row and the returns_daily rows from the first 
+        upserted date on are refreshed in the same transaction, so readers 
+        never see stats or returns that disagree with the prices. A corporate
+        action refetch rewrites the whole history of one ticker, and so only
+        recomputes that ticker's returns. Cold segments of the years being 
+        rewritten (only those) are moved back to ohlcv_daily first.
+
         Params:
         - instrument_id: the id of the instrument in the instrument table
         - df: dataframe containing the daily data.
@@ -146,38 +422,25 @@ class MarketRepo:
         """
         if df.empty:
             return 0
-        cols = [
-            "date",
-            "open", 
-            "high",
-            "low",
-            "close",
-            "adjclose",
-            "volume",
-            "dividends",
-            "stocksplits",
-        ]
-        missing = [c for c in cols if c not in df.columns]
-        if missing:
-            raise ValueError(f"Missing requires columns for upsert: {missing}")
-
-        #Build the rows iterable, one tuple per dataframe row
-        rows: Iterable[tuple] = (
-            (
-                instrument_id,
-                r["date"], #This comes in as a python date from YFClient
-                _float_or_none(r["open"]),
-                _float_or_none(r["high"]),
-                _float_or_none(r["low"]),
-                _float_or_none(r["close"]),
-                _float_or_none(r["adjclose"]),
-                _int_or_none(r["volume"]),
-                _float_or_none(r["dividends"]),
-                _float_or_none(r["stocksplits"]),
-            )
-            for _, r in df[cols].iterrows()
-        )
-        return self._executemany(q.UPSERT_OHLCV_DAILY, rows)
+        rows = _ohlcv_rows(instrument_id, df)
+        since = _first_date(df)
+        #Only the sealed years the rows fall in, the returns refresh reads the
+        #day before since through both tiers
+        if self._reaches_cold(since):
+            until = _last_date(df)
+            self._execute(q.UNPACK_COLD_SEGMENTS, (instrument_id, since.year, until.year), commit=False)
+        affected = self._executemany(q.UPSERT_OHLCV_DAILY, rows, commit=False)
+        self._execute(q.REFRESH_INSTRUMENT_STATS, (instrument_id,) * 4, commit=False)
+        self._execute(q.REFRESH_RETURNS_DAILY, (instrument_id, instrument_id, since, since, since))
+        if self.cache is not None:
+            t = self._tickers_by_id.get(instrument_id)
+            if t is None:
+                t = self._scalar(q.TICKER_FOR_INSTRUMENT, (instrument_id,))
+            if t is None:
+                self.cache.clear()
+            else:
+                self._invalidate((t,))
+        return affected
 
     def last_ohlcv_date_for_ticker(self, ticker: str) -> date | None:
         """
@@ -185,23 +448,24 @@ class MarketRepo:
         (as opposed to all tickers)
         """
         t = self._clean_ticker(ticker)
-        return self._scalar(q.LAST_OHLCV_DATE_FOR_TICKER, (t,))
+        return self._cached_scalar(q.LAST_OHLCV_DATE_FOR_TICKER, (t,), tickers=(t,))
 
     def last_ohlcv_date_for_all_tickers(self) -> dict[str, date | None]:
         """
-        Returns the latest stored OHLCV date per ticker
+        Returns the latest stored OHLCV date per ticker, read from 
+        instrument_stats
 
         Returns: a dict[ticker, date | None] for each instrument ticker, the max
         date in ohlcv_daily, or None if the ticker has no OHLCV rows yet
         """
-        rows = self._fetchall(q.LAST_OHLCV_DATE_FOR_ALL_TICKERS)
+        rows = self._cached_fetchall(q.LAST_OHLCV_DATE_FOR_ALL_TICKERS)
         return {ticker: last_date for (ticker, last_date) in rows}
 
     def list_active_tickers(self) -> list[str]:
         """
         Returns all tickers currently marked as active in the DB
         """
-        return [t for (t,) in self._fetchall(q.LIST_ACTIVE_TICKERS)]
+        return [t for (t,) in self._cached_fetchall(q.LIST_ACTIVE_TICKERS)]
 
     def deactivate_tickers(self, tickers: list[str]) -> int:
         """
@@ -212,7 +476,9 @@ class MarketRepo:
         cleaned = self._clean_tickers(tickers)
         if not cleaned:
             return 0
-        return self._execute(q.DEACTIVATE_TICKERS, (cleaned,))
+        n = self._execute(q.DEACTIVATE_TICKERS, (cleaned,))
+        self._invalidate(cleaned)
+        return n
 
     def fetch_adjclose_long(self, tickers: Sequence[str], *, start_date: date, end_date: date) -> DataFrame:
         """
@@ -223,15 +489,33 @@ class MarketRepo:
         cleaned = self._clean_tickers(tickers)
         if not cleaned:
             return pd.DataFrame(columns=["ticker", "date", "adjclose"]) #type: ignore
-        rows = self._fetchall(q.FETCH_ADJCLOSE_LONG, (cleaned, start_date, end_date))
-        df = pd.DataFrame(rows, columns = ["ticker", "date", "adjclose"]) #type: ignore
-        df["ticker"] = df["ticker"].astype(str)
-        df["date"] = pd.to_datetime(df["date"])
-        df["adjclose"] = pd.to_numeric(df["adjclose"], errors="coerce")
+        if self._reaches_cold(start_date):
+            rows = self._matrix_fetchall(
+                q.FETCH_ADJCLOSE_LONG_TIERED, cleaned, start_date, end_date,
+                lambda t, s, e: (t, s, e, t, s, e, s, e),
+            )
+        else:
+            rows = self._matrix_fetchall(q.FETCH_ADJCLOSE_LONG, cleaned, start_date, end_date, lambda t, s, e: (t, s, e))
+        df = _adjclose_long_frame(rows)
         logger.debug("End ..")
         return df
 
 
+    def fetch_logret_long(self, tickers: Sequence[str], *, start_date: date, end_date: date) -> DataFrame:
+        """
+        Fetch the stored daily log returns as a long dataframe with columns:
+        - ticker (str), date(datetime64), logret(float, NaN when a price was 
+        missing or not positive)
+        """
+        logger.debug("Start ..")
+        cleaned = self._clean_tickers(tickers)
+        if not cleaned:
+            return pd.DataFrame(columns=["ticker", "date", "logret"]) #type: ignore
+        rows = self._matrix_fetchall(q.FETCH_LOGRET_LONG, cleaned, start_date, end_date, lambda t, s, e: (t, s, e))
+        df = _logret_long_frame(rows)
+        logger.debug("End ..")
+        return df
+
     def fetch_adjclose_series(self, ticker: str, period: str) -> DataFrame:
         """
         Fetch a single tickers adjclose sereis from the DB.
@@ -250,15 +534,15 @@ class MarketRepo:
         
         start_date, end_date = period_to_date(period, end_date=end_date)
 
+        cold = self._reaches_cold(start_date)
         if start_date is None:
-            rows = self._fetchall(q.FETCH_ADJCLOSE_SERIES_LEQ, (cleaned, end_date))
+            sql = q.FETCH_ADJCLOSE_SERIES_LEQ_TIERED if cold else q.FETCH_ADJCLOSE_SERIES_LEQ
+            rows = self._cached_fetchall(sql, (cleaned, end_date), tickers=(cleaned,))
         else:
-            rows = self._fetchall(q.FETCH_ADJCLOSE_SERIES_BETWEEN, (cleaned, start_date, end_date))
+            sql = q.FETCH_ADJCLOSE_SERIES_BETWEEN_TIERED if cold else q.FETCH_ADJCLOSE_SERIES_BETWEEN
+            rows = self._cached_fetchall(sql, (cleaned, start_date, end_date), tickers=(cleaned,))
 
-        df = pd.DataFrame(rows, columns=["date", "adjclose"])#type: ignore
-        df["date"] = pd.to_datetime(df["date"])
-        df["adjclose"] = pd.to_numeric(df["adjclose"], errors="coerce")
-        return df
+        return _adjclose_series_frame(rows)
 
     def list_tickers_with_full_ohlcv_coverage(self, period: str, *, end_date: date | None = None) -> list[str]:
         """
@@ -275,9 +559,7 @@ class MarketRepo:
 
         """
         if end_date is None:
-            end_date = self._scalar("SELECT CURRENT_DATE;")
-            if end_date is None:
-                raise RuntimeError("DB returned NULL for CURRENT_DATE")
+            end_date = self.current_date()
 
         start_date, end_date = period_to_date(period, end_date=end_date)
         if start_date is None:
@@ -286,9 +568,365 @@ class MarketRepo:
             logger.warning(f"Period needs a start date when comparing tickers, start_date is None")
             raise RuntimeError
 
-        rows = self._fetchall(
-            q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE,
-            (start_date, end_date, start_date, end_date),
-        )
+        if self._reaches_cold(start_date):
+            rows = self._cached_fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE_TIERED, (start_date, end_date))
+        else:
+            rows = self._cached_fetchall(
+                q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE,
+                (start_date, end_date, end_date),
+            )
         return [t for (t,) in rows]
 
+    def screen_tickers(self, screen: Screen, *, start_date: date, end_date: date) -> list[str]:
+        """
+        Returns the tickers that pass a universe screen over the date range,
+        evaluated in a single query on the server
+
+        Params:
+        - screen: see db.screen.Screen
+        - start_date, end_date: the date range (inclusive)
+
+        Returns:
+        - list of strings, tickers in order
+        """
+        if screen.is_full_coverage_only:
+            if self._reaches_cold(start_date):
+                rows = self._cached_fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE_TIERED, (start_date, end_date))
+            else:
+                rows = self._cached_fetchall(q.LIST_TICKERS_WITH_FULL_COVERAGE_IN_RANGE, (start_date, end_date, end_date))
+            return [t for (t,) in rows]
+        source = "ohlcv_daily_all" if self._reaches_cold(start_date) else "ohlcv_daily"
+        sql, params = screen.compile(start_date, end_date, source=source)
+        return [t for (t,) in self._cached_fetchall(sql, params)]
+
+    def stream_export_rows(self, dataset: str, *, since: date, by: str, batch_rows: int) -> Iterator[list[tuple]]:
+        """
+        Streams a whole table out with a server side cursor, `batch_rows`
+        rows at a time, so memory stays flat however large it is
+
+        Params:
+        - dataset: "ohlcv" for (ticker, date, open, high, low, close, 
+        adjclose, volume, dividends, stocksplits) rows of both tiers, or 
+        "logret" for (ticker, date, logret) rows of returns_daily
+        - since: only rows after this date
+        - by: "ticker" or "date", the sort order of the rows
+        - batch_rows: rows per yielded list
+
+        Returns:
+        - iterator of row lists
+        """
+        if by not in ("ticker", "date"):
+            raise ValueError(f"by must be 'ticker' or 'date', got {by}")
+        if dataset == "ohlcv":
+            cold = self._reaches_cold(since)
+            if by == "ticker":
+                sql = q.EXPORT_OHLCV_BY_TICKER_TIERED if cold else q.EXPORT_OHLCV_BY_TICKER
+            else:
+                sql = q.EXPORT_OHLCV_BY_DATE_TIERED if cold else q.EXPORT_OHLCV_BY_DATE
+        elif dataset == "logret":
+            sql = q.EXPORT_LOGRET_BY_TICKER if by == "ticker" else q.EXPORT_LOGRET_BY_DATE
+        else:
+            raise ValueError(f"Unknown export dataset: {dataset}")
+
+        t0 = time.perf_counter()
+        n = 0
+        try:
+            with self.conn.cursor(name="trilobite_export", row_factory=tuple_row) as cur:
+                cur.itersize = batch_rows
+                cur.execute(sql, (since,))
+                while True:
+                    rows = cur.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    n += len(rows)
+                    yield rows
+        finally:
+            self.conn.rollback()
+            if self.metrics is not None:
+                self.metrics.record(sql, (since,), (time.perf_counter() - t0) * 1000, rows=n)
+
+    def list_tickers_with_rows_after(self, since: date) -> list[str]:
+        """
+        Returns the tickers with OHLCV rows after a date
+        """
+        return [t for (t,) in self._fetchall(q.LIST_TICKERS_WITH_ROWS_AFTER, (since,))]
+
+    def list_fetch_failures(self) -> dict[str, FetchFailure]:
+        """
+        Returns the negative cache, a FetchFailure per ticker whose last fetch 
+        failed
+        """
+        rows = self._fetchall(q.LIST_FETCH_FAILURES)
+        return {r[0]: FetchFailure(*r) for r in rows}
+
+    def record_fetch_failure(self, ticker: str, reason: str, *, streak: int, failed_at: datetime, retry_after: datetime) -> int:
+        """
+        Records a failed fetch of a ticker in the negative cache, the first
+        failure of a streak is kept
+
+        Params:
+        - ticker: ticker symbol, must exist in the instrument table
+        - reason: short description of the failure
+        - streak: failed fetches in a row, including this one
+        - failed_at: time of the failure
+        - retry_after: time the ticker may be fetched again
+
+        Returns:
+        - int: 1 if the row was written, 0 if the ticker is unknown
+        """
+        t = self._clean_ticker(ticker)
+        return self._execute(q.RECORD_FETCH_FAILURE, (reason[:500], streak, failed_at, failed_at, retry_after, t))
+
+    def clear_fetch_failures(self, tickers: Sequence[str]) -> int:
+        """
+        Removes tickers from the negative cache, after a successful fetch
+
+        Returns number of rows deleted
+        """
+        cleaned = self._clean_tickers(tickers)
+        if not cleaned:
+            return 0
+        return self._execute(q.CLEAR_FETCH_FAILURES, (cleaned,))
+
+    def list_trading_dates(self, *, since: date | None = None) -> list[date]:
+        """
+        Returns every distinct date with OHLCV rows, optionally from a given 
+        date (inclusive)
+        """
+        sql = q.LIST_TRADING_DATES_SINCE_TIERED if self._reaches_cold(since) else q.LIST_TRADING_DATES_SINCE
+        rows = self._cached_fetchall(sql, (since or date.min,))
+        return [d for (d,) in rows]
+
+    def fetch_ohlcv_since(self, since: Mapping[str, date | None]) -> DataFrame:
+        """
+        Fetch OHLCV rows for several tickers, each from its own start date.
+
+        Params:
+        - since: dict[ticker, date | None], None fetches the whole history of 
+        the ticker
+
+        Returns:
+        - long dataframe with columns ticker, date(python date), open, high, 
+        low, close, adjclose, volume (all float)
+        """
+        cols = ["ticker", "date", "open", "high", "low", "close", "adjclose", "volume"]
+        cleaned = {self._clean_ticker(t): d for t, d in since.items()}
+        if not cleaned:
+            return pd.DataFrame(columns=cols) #type: ignore
+        tickers = sorted(cleaned)
+        earliest = None if any(d is None for d in cleaned.values()) else min(cleaned.values()) #type: ignore
+        sql = q.FETCH_OHLCV_SINCE_TIERED if self._reaches_cold(earliest) else q.FETCH_OHLCV_SINCE
+        rows = self._cached_fetchall(sql, (tickers, [cleaned[t] for t in tickers]), tickers=tickers)
+        return pd.DataFrame(rows, columns=cols) #type: ignore
+
+    def rebuild_instrument_stats(self) -> int:
+        """
+        Recomputes instrument_stats from ohlcv_daily for every instrument. Used
+        to repair the table if it ever drifts from the price history.
+
+        Returns:
+        - int: number of instruments with stats after the rebuild
+        """
+        logger.debug("Start ..")
+        self._execute(q.CLEAR_INSTRUMENT_STATS, commit=False)
+        n = self._execute(q.REBUILD_INSTRUMENT_STATS)
+        if self.cache is not None:
+            self.cache.clear()
+        logger.debug("End ..")
+        return n
+
+    def rebuild_returns_daily(self) -> int:
+        """
+        Recomputes returns_daily from ohlcv_daily for every instrument
+
+        Returns:
+        - int: number of return rows after the rebuild
+        """
+        logger.debug("Start ..")
+        self._execute(q.CLEAR_RETURNS_DAILY, commit=False)
+        n = self._execute(q.REBUILD_RETURNS_DAILY)
+        if self.cache is not None:
+            self.cache.clear()
+        logger.debug("End ..")
+        return n
+
+    def first_hot_date(self) -> date | None:
+        """
+        Returns the earliest date still in ohlcv_daily, None if it is empty
+        """
+        return self._scalar(q.FIRST_HOT_OHLCV_DATE)
+
+    def compact_cold_year(self, year: int) -> int:
+        """
+        Moves one year of ohlcv_daily into the cold tier, one ohlcv_cold row 
+        per instrument, merged with the segments of that year already there.
+        Only meant for sealed years, an upsert into a cold year moves its 
+        segments back to ohlcv_daily.
+
+        Params:
+        - year: the year to move
+
+        Returns:
+        - int: number of cold segments written
+        """
+        logger.debug("Start ..")
+        n = self._execute(q.COMPACT_OHLCV_RANGE, (date(year, 1, 1), date(year + 1, 1, 1)))
+        if self.cache is not None:
+            self.cache.clear()
+        logger.debug("End ..")
+        return n
+
+    def vacuum_ohlcv(self, *, full: bool = False) -> None:
+        """
+        VACUUM ANALYZE of the two price tiers, so the space freed by a 
+        compaction is reused and the planner sees the new row counts
+
+        Params:
+        - full: VACUUM FULL, rewrites the tables to give the freed space back
+        to the OS. Holds an exclusive lock on the tables while it runs.
+        """
+        self.conn.commit()
+        self.conn.autocommit = True
+        try:
+            opts = "FULL, ANALYZE" if full else "ANALYZE"
+            self.conn.execute(f"VACUUM ({opts}) ohlcv_daily, ohlcv_cold;")
+        finally:
+            self.conn.autocommit = False
+
+    def upsert_ohlcv_intraday(self, interval: str, bars: Mapping[int, DataFrame]) -> int:
+        """
+        Bulk upsert of intraday bars for several instruments in one 
+        transaction. The rows are COPYed into a session temp table and merged
+        into ohlcv_intraday with a single INSERT .. ON CONFLICT, instead of one
+        statement per row. The monthly partitions the bars fall in are created
+        first if missing.
+
+        Params:
+        - interval: "1m", "5m" or "1h"
+        - bars: dataframes with the columns of YFClient.get_intraday, by 
+        instrument id
+
+        Returns:
+        - int: number of bars written
+        """
+        interval_min = _interval_min(interval)
+        rows: list[tuple] = []
+        for instrument_id, df in bars.items():
+            if not df.empty:
+                rows.extend(_intraday_rows(instrument_id, interval_min, df))
+        if not rows:
+            return 0
+        first = min(r[0] for r in rows)
+        last = max(r[0] for r in rows)
+        t0 = time.perf_counter()
+        try:
+            schema.ensure_intraday_partitions(self.conn, interval, first, last)
+            with self.conn.cursor() as cur:
+                cur.execute(schema.CREATE_INTRADAY_STAGE)
+                with cur.copy(schema.COPY_INTRADAY_STAGE) as copy:
+                    copy.set_types(["timestamptz", "int8", "int8", "float4", "float4", "float4", "float4", "int2"])
+                    for r in rows:
+                        copy.write_row(r)
+            if self.metrics is not None:
+                self.metrics.record(schema.COPY_INTRADAY_STAGE, rows, (time.perf_counter() - t0) * 1000, rows=len(rows))
+            n = self._execute(schema.MERGE_INTRADAY_STAGE)
+        except Exception:
+            self.conn.rollback()
+            raise
+        return n
+
+    def last_intraday_ts_for_all_tickers(self, interval: str) -> dict[str, datetime | None]:
+        """
+        Returns the latest stored bar time per active ticker for an interval,
+        None if the ticker has no bars of that interval yet
+        """
+        rows = self._fetchall(q.LAST_INTRADAY_TS_FOR_ALL_TICKERS, (_interval_min(interval),))
+        return {ticker: last_ts for (ticker, last_ts) in rows}
+
+    def fetch_intraday(self, ticker: str, interval: str, *, start: datetime, end: datetime | None = None) -> DataFrame:
+        """
+        Fetch the stored intraday bars of one ticker
+
+        Params:
+        - ticker: ticker symbol
+        - interval: "1m", "5m" or "1h"
+        - start: first bar (inclusive)
+        - end: last bar (exclusive), None for up to now
+
+        Returns:
+        - pandas.DataFrame with columns ts (UTC), open, high, low, close, volume
+        """
+        if end is None:
+            end = datetime.now(timezone.utc)
+        rows = self._fetchall(q.FETCH_INTRADAY_BARS, (self._clean_ticker(ticker), _interval_min(interval), start, end))
+        df = pd.DataFrame(rows, columns=INTRADAY_COLUMNS) #type: ignore
+        df["ts"] = pd.to_datetime(df["ts"], utc=True)
+        return df
+
+    def rollup_intraday_to_daily(self, interval: str, *, since: datetime, tz: str) -> int:
+        """
+        Aggregates intraday bars into daily bars for the exchange days after 
+        the last ohlcv_daily row, typically the current session, into 
+        ohlcv_daily_provisional. Instruments without daily history are skipped.
+
+        The rollup is provisional: it carries no adjustment (no adjclose, 
+        dividends or splits), so it is kept out of ohlcv_daily, and with it out
+        of instrument_stats, returns_daily, the mirror and the exports. Rows of
+        days that ohlcv_daily has since got a provider bar for are removed.
+
+        Params:
+        - interval: bars to aggregate, "1m", "5m" or "1h"
+        - since: first bar time considered
+        - tz: exchange time zone the days are cut in, e.g. "America/New_York"
+
+        Returns:
+        - int: number of provisional daily rows written
+        """
+        logger.debug("Start ..")
+        minutes = _interval_min(interval)
+        self._execute(q.PRUNE_PROVISIONAL_DAILY, commit=False)
+        n = self._execute(q.ROLLUP_INTRADAY_DAILY, (minutes, tz, minutes, since))
+        logger.debug("End ..")
+        return n
+
+    def fetch_provisional_daily(self, tickers: Sequence[str]) -> DataFrame:
+        """
+        Returns the provisional daily bars rolled up from intraday bars, see
+        rollup_intraday_to_daily. Columns ticker, date, open, high, low, close,
+        volume.
+        """
+        rows = self._fetchall(q.FETCH_PROVISIONAL_DAILY, (self._clean_tickers(tickers),))
+        return pd.DataFrame(rows, columns=["ticker", "date", "open", "high", "low", "close", "volume"]) #type: ignore
+
+    def apply_intraday_retention(self, interval: str, *, keep_days: int, now: datetime | None = None) -> tuple[int, int]:
+        """
+        Drops the intraday bars of an interval older than keep_days. Monthly 
+        partitions that lie wholly before the cutoff are dropped, which frees 
+        the space at once without a VACUUM, and the older bars of the 
+        partition holding the cutoff are deleted.
+
+        Params:
+        - interval: "1m", "5m" or "1h"
+        - keep_days: days of bars to keep
+        - now: reference time, defaults to the current time
+
+        Returns:
+        - (partitions dropped, bars deleted)
+        """
+        logger.debug("Start ..")
+        interval_min = _interval_min(interval)
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=keep_days)
+        utc = cutoff.astimezone(timezone.utc)
+        cutoff_month = date(utc.year, utc.month, 1)
+        names = [n for (n,) in self._fetchall(q.LIST_INTRADAY_PARTITIONS, (f"ohlcv_intraday_{interval}",))]
+        dropped = 0
+        with self.conn.cursor() as cur:
+            for name in names:
+                month = schema.intraday_partition_month(name)
+                if month is not None and month < cutoff_month:
+                    cur.execute(pgsql.SQL("DROP TABLE IF EXISTS {};").format(pgsql.Identifier(name)))
+                    dropped += 1
+        deleted = self._execute(q.DELETE_EXPIRED_INTRADAY, (interval_min, cutoff))
+        logger.debug("End ..")
+        return dropped, deleted
+
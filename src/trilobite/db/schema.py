@@ -1,6 +1,12 @@
 from __future__ import annotations
 
+from datetime import date, datetime, timezone
+
 import psycopg
+from psycopg import sql
+
+#Bar lengths stored in ohlcv_intraday, by yfinance interval name, in minutes
+INTRADAY_INTERVALS: dict[str, int] = {"1m": 1, "5m": 5, "1h": 60}
 
 DDL= """
 CREATE TABLE IF NOT EXISTS instrument (
@@ -29,16 +35,295 @@ CREATE TABLE IF NOT EXISTS ohlcv_daily (
 
 );
 
+CREATE TABLE IF NOT EXISTS instrument_stats (
+    instrument_id BIGINT PRIMARY KEY REFERENCES instrument(id) ON DELETE CASCADE,
+    first_date DATE,
+    last_date DATE,
+    n_rows BIGINT NOT NULL DEFAULT 0,
+    last_volume BIGINT
+);
+
+-- Log return of adjclose against the previous stored day of the instrument,
+-- maintained by MarketRepo.upsert_ohlcv_daily. NULL when either price is 
+-- missing or not positive, no row for the first day of an instrument.
+CREATE TABLE IF NOT EXISTS returns_daily (
+    instrument_id BIGINT NOT NULL REFERENCES instrument(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    logret DOUBLE PRECISION,
+
+    PRIMARY KEY (instrument_id, date)
+);
+
+-- Cold tier, one row per instrument and sealed year with every field packed
+-- into an array in date order. Filled by MarketRepo.compact_cold_year, the 
+-- rows of a year live either here or in ohlcv_daily, never in both. Arrays 
+-- larger than a page are compressed by TOAST.
+-- The prices are float8, not the NUMERIC of ohlcv_daily, which is lossy: a
+-- price keeps 15 significant digits when it is moved back to ohlcv_daily 
+-- (float8 to NUMERIC). Prices are written to ohlcv_daily as float8 in the 
+-- first place, so they have no more than that and come back unchanged.
+CREATE TABLE IF NOT EXISTS ohlcv_cold (
+    instrument_id BIGINT NOT NULL REFERENCES instrument(id) ON DELETE CASCADE,
+    year INT NOT NULL,
+
+    dates DATE[] NOT NULL,
+    open DOUBLE PRECISION[],
+    high DOUBLE PRECISION[],
+    low DOUBLE PRECISION[],
+    close DOUBLE PRECISION[],
+    adjclose DOUBLE PRECISION[],
+    volume BIGINT[],
+    dividends DOUBLE PRECISION[],
+    stocksplits DOUBLE PRECISION[],
+
+    PRIMARY KEY (instrument_id, year)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ohlcv_cold_year
+    ON ohlcv_cold(year);
+
+-- Negative cache of --updateall, one row per instrument whose last fetch 
+-- failed. streak counts the failures in a row and sets how long the 
+-- instrument is skipped (retry_after), the next successful fetch removes the
+-- row.
+CREATE TABLE IF NOT EXISTS fetch_failure (
+    instrument_id BIGINT PRIMARY KEY REFERENCES instrument(id) ON DELETE CASCADE,
+    reason TEXT NOT NULL,
+    streak INT NOT NULL,
+    first_failed_at TIMESTAMPTZ NOT NULL,
+    last_failed_at TIMESTAMPTZ NOT NULL,
+    retry_after TIMESTAMPTZ NOT NULL
+);
+
+-- Both tiers as daily rows, for the reads whose range reaches the cold tier
+CREATE OR REPLACE VIEW ohlcv_daily_all AS
+SELECT
+    instrument_id,
+    date,
+    open::float8 AS open,
+    high::float8 AS high,
+    low::float8 AS low,
+    close::float8 AS close,
+    adjclose::float8 AS adjclose,
+    volume,
+    dividends::float8 AS dividends,
+    stocksplits::float8 AS stocksplits
+FROM ohlcv_daily
+UNION ALL
+SELECT
+    c.instrument_id,
+    u.date,
+    u.open,
+    u.high,
+    u.low,
+    u.close,
+    u.adjclose,
+    u.volume,
+    u.dividends,
+    u.stocksplits
+FROM ohlcv_cold AS c
+CROSS JOIN LATERAL unnest(
+    c.dates, c.open, c.high, c.low, c.close, c.adjclose, c.volume, c.dividends, c.stocksplits
+) AS u(date, open, high, low, close, adjclose, volume, dividends, stocksplits);
+
+-- Intraday bars, list partitioned by bar length (minutes) and range 
+-- partitioned by month below that. The monthly partitions are created on 
+-- demand by ensure_intraday_partitions and retention drops them whole. 
+-- Columns are ordered widest first so rows carry no alignment padding, and
+-- prices are REAL, enough digits for a bar and half the width of float8.
+CREATE TABLE IF NOT EXISTS ohlcv_intraday (
+    ts TIMESTAMPTZ NOT NULL,
+    instrument_id BIGINT NOT NULL REFERENCES instrument(id) ON DELETE CASCADE,
+    volume BIGINT,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    interval_min SMALLINT NOT NULL,
+
+    PRIMARY KEY (instrument_id, interval_min, ts)
+) PARTITION BY LIST (interval_min);
+
+CREATE TABLE IF NOT EXISTS ohlcv_intraday_1m
+    PARTITION OF ohlcv_intraday FOR VALUES IN (1) PARTITION BY RANGE (ts);
+CREATE TABLE IF NOT EXISTS ohlcv_intraday_5m
+    PARTITION OF ohlcv_intraday FOR VALUES IN (5) PARTITION BY RANGE (ts);
+CREATE TABLE IF NOT EXISTS ohlcv_intraday_1h
+    PARTITION OF ohlcv_intraday FOR VALUES IN (60) PARTITION BY RANGE (ts);
+
+-- Daily bars rolled up from the intraday bars for the sessions that have no
+-- provider daily bar yet. Unadjusted and provisional, so kept apart from
+-- ohlcv_daily: stats, returns, the mirror and the exports never see them. A
+-- row is dropped once ohlcv_daily has its date.
+CREATE TABLE IF NOT EXISTS ohlcv_daily_provisional (
+    instrument_id BIGINT NOT NULL REFERENCES instrument(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open DOUBLE PRECISION,
+    high DOUBLE PRECISION,
+    low DOUBLE PRECISION,
+    close DOUBLE PRECISION,
+    volume BIGINT,
+    interval_min SMALLINT NOT NULL,
+    rolled_up_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    PRIMARY KEY (instrument_id, date)
+);
+
 CREATE INDEX IF NOT EXISTS idx_ohlcv_daily_date
     ON ohlcv_daily(date);
 
-CREATE INDEX IF NOT EXISTS idx_instrument_ticker
-    ON instrument(ticker);
+-- Lets the adjclose range reads run as index-only scans
+CREATE INDEX IF NOT EXISTS idx_ohlcv_daily_instrument_date_adjclose
+    ON ohlcv_daily(instrument_id, date) INCLUDE (adjclose);
+
+-- Small summary index for cross-ticker date range scans
+CREATE INDEX IF NOT EXISTS idx_ohlcv_daily_date_brin
+    ON ohlcv_daily USING BRIN (date);
+
+-- Redundant with the UNIQUE constraint on instrument(ticker) and the primary
+-- key of ohlcv_daily, only cost writes. Dropped on databases that have them.
+DROP INDEX IF EXISTS idx_instrument_ticker;
+DROP INDEX IF EXISTS idx_ohlcv_daily_instrument_date;
+"""
+
+#Fills instrument_stats from both price tiers the first time the table is 
+#created on a database that already holds price history. No-op once stats 
+#exist.
+BACKFILL_INSTRUMENT_STATS = """
+INSERT INTO instrument_stats (instrument_id, first_date, last_date, n_rows, last_volume)
+SELECT
+    a.instrument_id,
+    a.first_date,
+    a.last_date,
+    a.n_rows,
+    l.volume
+FROM (
+    SELECT instrument_id, MIN(date) AS first_date, MAX(date) AS last_date, COUNT(*) AS n_rows
+    FROM ohlcv_daily_all
+    GROUP BY instrument_id
+) AS a
+JOIN (
+    SELECT DISTINCT ON (instrument_id) instrument_id, volume
+    FROM ohlcv_daily_all
+    ORDER BY instrument_id, date DESC
+) AS l ON l.instrument_id = a.instrument_id
+WHERE NOT EXISTS (SELECT 1 FROM instrument_stats);
+"""
+
+#Fills returns_daily from both price tiers the first time it is created on a
+#database that already holds price history. No-op once returns exist.
+BACKFILL_RETURNS_DAILY = """
+INSERT INTO returns_daily (instrument_id, date, logret)
+SELECT instrument_id, date, logret
+FROM (
+    SELECT
+        o.instrument_id,
+        o.date,
+        CASE
+            WHEN o.adjclose > 0 AND LAG(o.adjclose) OVER w > 0
+            THEN ln(o.adjclose / LAG(o.adjclose) OVER w)::float8
+        END AS logret,
+        LAG(o.date) OVER w AS prev_date
+    FROM ohlcv_daily_all AS o
+    WINDOW w AS (PARTITION BY o.instrument_id ORDER BY o.date)
+) AS r
+WHERE r.prev_date IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM returns_daily);
+"""
+
+#Session scoped staging for the bulk intraday writes, rows are COPYed in and
+#merged with one INSERT .. ON CONFLICT. Kept here and not in queries.py as 
+#they need the temp table of the session.
+CREATE_INTRADAY_STAGE = """
+CREATE TEMP TABLE IF NOT EXISTS ohlcv_intraday_stage (
+    ts TIMESTAMPTZ NOT NULL,
+    instrument_id BIGINT NOT NULL,
+    volume BIGINT,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    interval_min SMALLINT NOT NULL
+) ON COMMIT DELETE ROWS;
+"""
+
+COPY_INTRADAY_STAGE = """
+COPY ohlcv_intraday_stage (ts, instrument_id, volume, open, high, low, close, interval_min)
+FROM STDIN (FORMAT BINARY)
+"""
 
-CREATE INDEX IF NOT EXISTS idx_ohlcv_daily_instrument_date
-    ON ohlcv_daily(instrument_id, date);
+#DISTINCT ON so a bar sent twice in one batch does not hit the same row twice
+MERGE_INTRADAY_STAGE = """
+INSERT INTO ohlcv_intraday (ts, instrument_id, volume, open, high, low, close, interval_min)
+SELECT DISTINCT ON (instrument_id, interval_min, ts)
+    ts, instrument_id, volume, open, high, low, close, interval_min
+FROM ohlcv_intraday_stage
+ORDER BY instrument_id, interval_min, ts
+ON CONFLICT (instrument_id, interval_min, ts) DO UPDATE SET
+    volume = EXCLUDED.volume,
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close;
 """
 
+def intraday_partition_name(interval: str, month: date) -> str:
+    """
+    Returns the name of the monthly ohlcv_intraday partition holding month,
+    e.g. ohlcv_intraday_5m_2024_05
+    """
+    return f"ohlcv_intraday_{interval}_{month.year:04d}_{month.month:02d}"
+
+def intraday_partition_month(name: str) -> date | None:
+    """
+    Returns the first day of the month of a partition named by 
+    intraday_partition_name, None for other names
+    """
+    parts = name.rsplit("_", 2)
+    if len(parts) != 3 or not (parts[1].isdigit() and parts[2].isdigit()):
+        return None
+    return date(int(parts[1]), int(parts[2]), 1)
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def ensure_intraday_partitions(conn: psycopg.Connection, interval: str, start: datetime, end: datetime) -> list[str]:
+    """
+    Creates the monthly ohlcv_intraday partitions of an interval covering
+    start to end (inclusive), if they do not exist. Partition bounds are UTC
+    months. Does not commit.
+
+    Params:
+    - conn: open psycopg connection
+    - interval: key of INTRADAY_INTERVALS
+    - start, end: timezone aware range the partitions have to cover
+
+    Returns:
+    - list of the partition names covering the range
+    """
+    if interval not in INTRADAY_INTERVALS:
+        raise ValueError(f"Unknown intraday interval: {interval}")
+    start = start.astimezone(timezone.utc)
+    end = end.astimezone(timezone.utc)
+    month = date(start.year, start.month, 1)
+    names = []
+    with conn.cursor() as cur:
+        while month <= end.date():
+            name = intraday_partition_name(interval, month)
+            nxt = _next_month(month)
+            cur.execute(sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} "
+                "FOR VALUES FROM ({}) TO ({});"
+            ).format(
+                sql.Identifier(name),
+                sql.Identifier(f"ohlcv_intraday_{interval}"),
+                sql.Literal(f"{month.isoformat()} 00:00+00"),
+                sql.Literal(f"{nxt.isoformat()} 00:00+00"),
+            ))
+            names.append(name)
+            month = nxt
+    return names
+
 def create_schema(conn: psycopg.Connection) -> None:
     """
     Creates database tables and indexes if they do not already exist.
@@ -48,4 +333,6 @@ def create_schema(conn: psycopg.Connection) -> None:
     """
     with conn.cursor() as cur:
         cur.execute(DDL)
+        cur.execute(BACKFILL_INSTRUMENT_STATS)
+        cur.execute(BACKFILL_RETURNS_DAILY)
     conn.commit()
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from datetime import date
+
+#Per instrument aggregates over the rows of the date range. `cal` numbers the
+#trading days of the range (days with a row for any instrument), so a gap is
+#the number of trading days skipped between two rows of an instrument, the
+#leading gap comes from LAG's default and the trailing gap from n - MAX(k).
+_SCREEN_SQL = """
+WITH r AS (
+    SELECT instrument_id, date, close, volume
+    FROM {source}
+    WHERE date BETWEEN %s AND %s
+),
+cal AS (
+    SELECT date, ROW_NUMBER() OVER (ORDER BY date) AS k, COUNT(*) OVER () AS n
+    FROM (SELECT DISTINCT date FROM r) AS d
+),
+w AS (
+    SELECT
+        r.instrument_id,
+        r.close::float8 AS close,
+        r.volume,
+        r.close::float8 * r.volume AS dollar_volume,
+        c.k,
+        c.n,
+        c.k - LAG(c.k, 1, 0) OVER o - 1 AS gap_before,
+        LAST_VALUE(r.close::float8) OVER (o ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS last_close
+    FROM r
+    JOIN cal AS c ON c.date = r.date
+    WINDOW o AS (PARTITION BY r.instrument_id ORDER BY r.date)
+),
+a AS (
+    SELECT
+        instrument_id,
+        COUNT(*) AS n_rows,
+        MAX(n) AS n_days,
+        GREATEST(MAX(gap_before), MAX(n) - MAX(k)) AS max_gap,
+        MAX(last_close) AS last_close{aggregates}
+    FROM w
+    GROUP BY instrument_id
+)
+SELECT i.ticker
+FROM a
+JOIN instrument AS i ON i.id = a.instrument_id
+WHERE {conditions}
+ORDER BY i.ticker;
+"""
+
+@dataclass(frozen=True)
+class _VolumeFilter:
+    """
+    Volume or dollar volume over the last `days` trading days of the range,
+    averaged ("avg", missing days count as 0) or the lowest day ("min", any
+    missing day fails)
+    """
+    column: str
+    threshold: float
+    days: int
+    how: str
+
+    def aggregate(self, alias: str) -> tuple[str, tuple]:
+        last = "k > n - %s"
+        if self.how == "avg":
+            sql = f"COALESCE(SUM({self.column}) FILTER (WHERE {last}), 0)::float8 / LEAST(%s, MAX(n)) AS {alias}"
+            return sql, (self.days, self.days)
+        sql = (
+            f"CASE WHEN COUNT({self.column}) FILTER (WHERE {last}) >= LEAST(%s, MAX(n)) "
+            f"THEN MIN({self.column}) FILTER (WHERE {last}) ELSE 0 END AS {alias}"
+        )
+        return sql, (self.days, self.days, self.days)
+
+@dataclass(frozen=True)
+class Screen:
+    """
+    Composable universe screen, compiled into a single SQL query so only the
+    tickers that pass are ever sent back. Build one by chaining the filter
+    methods, each returns a new Screen:
+
+        Screen().active().min_coverage(0.98).max_gap(3).min_price(5)
+            .min_dollar_volume(1e6, days=20)
+
+    Every filter is evaluated over the rows of the date range given to
+    MarketRepo.screen_tickers, and a ticker needs at least one row in the
+    range to pass any screen.
+    """
+    active_only: bool = False
+    coverage: float | None = None
+    gap_days: int | None = None
+    price: float | None = None
+    volume: tuple[_VolumeFilter, ...] = ()
+
+    def active(self) -> Screen:
+        """
+        Only tickers marked as active in the instrument table
+        """
+        return replace(self, active_only=True)
+
+    def min_coverage(self, ratio: float) -> Screen:
+        """
+        Rows on at least `ratio` (0-1) of the trading days in the range, 1.0
+        is full coverage
+        """
+        if not 0.0 <= ratio <= 1.0:
+            raise ValueError(f"Coverage ratio must be in [0, 1], got {ratio}")
+        return replace(self, coverage=ratio)
+
+    def max_gap(self, days: int) -> Screen:
+        """
+        At most `days` consecutive trading days without a row, counting the
+        start and end of the range
+        """
+        if days < 0:
+            raise ValueError(f"Gap length cannot be negative, got {days}")
+        return replace(self, gap_days=days)
+
+    def min_price(self, price: float) -> Screen:
+        """
+        Last close in the range (unadjusted) of at least `price`
+        """
+        return replace(self, price=price)
+
+    def min_volume(self, volume: float, *, days: int, how: str = "avg") -> Screen:
+        """
+        Share volume of at least `volume` over the last `days` trading days,
+        averaged (how="avg") or on every day (how="min")
+        """
+        return self._add_volume("volume", volume, days, how)
+
+    def min_dollar_volume(self, dollars: float, *, days: int, how: str = "avg") -> Screen:
+        """
+        Close times volume of at least `dollars` over the last `days` trading
+        days, averaged (how="avg") or on every day (how="min")
+        """
+        return self._add_volume("dollar_volume", dollars, days, how)
+
+    def _add_volume(self, column: str, threshold: float, days: int, how: str) -> Screen:
+        if how not in ("avg", "min"):
+            raise ValueError(f"how must be 'avg' or 'min', got {how}")
+        if days < 1:
+            raise ValueError(f"days must be at least 1, got {days}")
+        return replace(self, volume=self.volume + (_VolumeFilter(column, threshold, days, how),))
+
+    @property
+    def is_full_coverage_only(self) -> bool:
+        """
+        True when the screen is exactly full coverage, which the repos answer
+        with their dedicated coverage query
+        """
+        return self == FULL_COVERAGE
+
+    @property
+    def allows_gaps(self) -> bool:
+        """
+        True when a passing ticker can miss days in the range, i.e. the
+        screen asks for less than full coverage (min_coverage below 1.0, a
+        max_gap above 0, or no coverage filter at all)
+        """
+        return self.coverage != 1.0 and self.gap_days != 0
+
+    def compile(self, start_date: date, end_date: date, *, source: str = "ohlcv_daily") -> tuple[str, tuple]:
+        """
+        Compiles the screen into one query returning the passing tickers in
+        order
+
+        Params:
+        - start_date, end_date: the date range (inclusive) filters look at
+        - source: table or view with the daily rows, ohlcv_daily_all when the
+        range reaches the cold tier
+
+        Returns:
+        - (sql, params), with %s placeholders
+        """
+        aggregates: list[str] = []
+        agg_params: list = []
+        conditions: list[str] = []
+        cond_params: list = []
+        if self.active_only:
+            conditions.append("i.is_active = TRUE")
+        if self.coverage is not None:
+            conditions.append("a.n_rows >= %s * a.n_days")
+            cond_params.append(self.coverage)
+        if self.gap_days is not None:
+            conditions.append("a.max_gap <= %s")
+            cond_params.append(self.gap_days)
+        if self.price is not None:
+            conditions.append("a.last_close >= %s")
+            cond_params.append(self.price)
+        for j, f in enumerate(self.volume):
+            alias = f"vol_{j}"
+            sql, params = f.aggregate(alias)
+            aggregates.append(sql)
+            agg_params.extend(params)
+            conditions.append(f"a.{alias} >= %s")
+            cond_params.append(f.threshold)
+
+        sql = _SCREEN_SQL.format(
+            source=source,
+            aggregates="".join(f",\n        {a}" for a in aggregates),
+            conditions="\n  AND ".join(conditions) or "TRUE",
+        )
+        return sql, (start_date, end_date, *agg_params, *cond_params)
+
+#Tickers with a row on every trading day of the range, the default universe
+FULL_COVERAGE = Screen().min_coverage(1.0)
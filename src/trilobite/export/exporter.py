@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import os
+import shutil
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Protocol
+
+import numpy as np
+
+from trilobite.utils.paths import exports_dir
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DATASETS: tuple[str, ...] = ("ohlcv", "returns", "adjclose_matrix", "returns_matrix")
+FORMATS: tuple[str, ...] = ("parquet", "arrow")
+PARTITIONS: tuple[str, ...] = ("ticker", "year")
+STATE_FILE = "_export.json"
+
+class ExportSource(Protocol):
+    """
+    Protocol for the repository the export reads from, implemented by
+    MarketRepo and DuckMarketRepo
+    """
+    def stream_export_rows(self, dataset: str, *, since: date, by: str, batch_rows: int) -> Iterator[list[tuple]]:
+        ...
+
+    def list_tickers_with_rows_after(self, since: date) -> list[str]:
+        ...
+
+@dataclass
+class ExportState:
+    """
+    What the last export of a dataset wrote, stored as _export.json in the
+    dataset directory and read by the incremental mode
+
+    Attributes:
+    - last_date: 'YYYY-MM-DD' of the newest row exported
+    - tickers: column order of the matrix datasets
+    """
+    format: str
+    partition_by: str | None
+    last_date: str | None = None
+    tickers: list[str] = field(default_factory=list)
+    exported_at: str | None = None
+
+@dataclass(frozen=True)
+class ExportResult:
+    """
+    Summary of one dataset export
+
+    Attributes:
+    - rows: record batch rows written (dates for the matrices)
+    - files: files written
+    - last_date: newest date in the dataset after the export
+    - incremental: False when the dataset was rewritten in full
+    """
+    dataset: str
+    path: Path
+    rows: int
+    files: int
+    last_date: date | None
+    incremental: bool
+
+def _pyarrow():
+    """
+    Imports pyarrow, an optional dependency
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("The export needs the pyarrow package: pip install -e '.[export]'") from e
+    return pyarrow
+
+def _read_state(path: Path) -> ExportState | None:
+    f = path / STATE_FILE
+    if not f.exists():
+        return None
+    with f.open("r", encoding="utf-8") as fh:
+        return ExportState(**json.load(fh))
+
+def _write_state(path: Path, state: ExportState) -> None:
+    tmp = path / f"{STATE_FILE}.tmp"
+    with tmp.open("w", encoding="utf-8") as fh:
+        json.dump(asdict(state), fh)
+    os.replace(tmp, path / STATE_FILE)
+
+class _PartitionWriter:
+    """
+    Writes record batches into one file per partition key and run, hive
+    style (ticker=AAPL/, year=2024/). The rows arrive sorted by the key, so
+    only one file is open at a time.
+    """
+    def __init__(self, root: Path, fmt: str, schema: "pa.Schema", partition_by: str | None, stamp: str) -> None:
+        self._pa = _pyarrow()
+        self._root = root
+        self._fmt = fmt
+        self._schema = schema
+        self._partition_by = partition_by
+        self._stamp = stamp
+        self._key: Any = None
+        self._writer: Any = None
+        self._seen: dict[Any, int] = {}
+        self.files: list[Path] = []
+
+    def _open(self, key: Any) -> None:
+        folder = self._root if self._partition_by is None else self._root / f"{self._partition_by}={key}"
+        folder.mkdir(parents=True, exist_ok=True)
+        #A key seen before gets a new file, nothing already written is replaced
+        n = self._seen.get(key, 0)
+        ext = "parquet" if self._fmt == "parquet" else "arrow"
+        path = folder / f"part-{self._stamp}-{n}.{ext}"
+        while path.exists():
+            n += 1
+            path = folder / f"part-{self._stamp}-{n}.{ext}"
+        self._seen[key] = n + 1
+        if self._fmt == "parquet":
+            self._writer = self._pa.parquet.ParquetWriter(str(path), self._schema, compression="zstd")
+        else:
+            self._writer = self._pa.ipc.new_file(str(path), self._schema)
+        self._key = key
+        self.files.append(path)
+
+    def write(self, key: Any, batch: "pa.RecordBatch") -> None:
+        if self._writer is None or key != self._key:
+            self.close()
+            self._open(key)
+        self._writer.write_batch(batch)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+def _long_schema(dataset: str, partition_by: str | None) -> "pa.Schema":
+    pa = _pyarrow()
+    fields = [("ticker", pa.string()), ("date", pa.date32())]
+    if dataset == "ohlcv":
+        fields += [(c, pa.float64()) for c in ("open", "high", "low", "close", "adjclose")]
+        fields += [("volume", pa.int64()), ("dividends", pa.float64()), ("stocksplits", pa.float64())]
+    else:
+        fields += [("logret", pa.float64())]
+    if partition_by == "ticker":
+        #Carried by the directory name
+        fields = fields[1:]
+    return pa.schema(fields)
+
+def _long_batches(chunks: Iterable[list[tuple]], schema: "pa.Schema", key: Callable[[tuple], Any], drop_ticker: bool) -> Iterator[tuple[Any, "pa.RecordBatch"]]:
+    """
+    Turns the streamed row lists into record batches, split where the
+    partition key changes
+    """
+    pa = _pyarrow()
+    for rows in chunks:
+        for k, group in itertools.groupby(rows, key=key):
+            cols = list(zip(*group))
+            if drop_ticker:
+                cols = cols[1:]
+            arrays = [pa.array(c, type=f.type) for c, f in zip(cols, schema)]
+            yield k, pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _wide_batches(chunks: Iterable[list[tuple]],
+                  tickers: list[str],
+                  value_idx: int,
+                  dates_per_batch: int,
+                  key: Callable[[date], Any],
+                  ) -> Iterator[tuple[Any, list[date], np.ndarray]]:
+    """
+    Pivots rows sorted by date into (dates, tickers) blocks of at most
+    dates_per_batch dates, a block never spans two partition keys. Rows of
+    tickers that are not columns are ignored.
+    """
+    col = {t: j for j, t in enumerate(tickers)}
+    dates: list[date] = []
+    block = np.full((dates_per_batch, len(tickers)), np.nan)
+    for rows in chunks:
+        for r in rows:
+            d = r[1]
+            if not dates or dates[-1] != d:
+                if dates and (len(dates) == dates_per_batch or key(d) != key(dates[0])):
+                    yield key(dates[0]), dates, block[:len(dates)]
+                    dates = []
+                    block = np.full((dates_per_batch, len(tickers)), np.nan)
+                dates.append(d)
+            j = col.get(r[0])
+            v = r[value_idx]
+            if j is not None and v is not None:
+                block[len(dates) - 1, j] = v
+    if dates:
+        yield key(dates[0]), dates, block[:len(dates)]
+
+def export_dataset(source: ExportSource,
+                   dataset: str,
+                   *,
+                   root: Path | None = None,
+                   fmt: str = "parquet",
+                   partition_by: str | None = None,
+                   incremental: bool = False,
+                   batch_rows: int = 65_536,
+                   ) -> ExportResult:
+    """
+    Streams one dataset to Parquet or Arrow IPC files under
+    exports/<dataset>, in record batches of `batch_rows` rows (cells for the
+    matrices), so memory stays flat however large the tables are.
+
+    Datasets:
+    - ohlcv: long (ticker, date, open, .., stocksplits) rows of both tiers
+    - returns: long (ticker, date, logret) rows of returns_daily
+    - adjclose_matrix, returns_matrix: one row per trading date and one column
+    per ticker, NaN where a ticker has no value
+
+    A full export writes into a temporary directory that replaces the old
+    dataset when done. An incremental export adds files with the rows after
+    the last exported date, older rows that were rewritten since (e.g. a
+    refetch after a split) are only picked up by a full export. It falls back
+    to a full export when there is no previous one, the format or
+    partitioning changed, or new tickers would add matrix columns.
+
+    Params:
+    - source: MarketRepo or DuckMarketRepo
+    - dataset: one of DATASETS
+    - root: export directory, defaults to exports_dir()
+    - fmt: "parquet" (zstd) or "arrow" (IPC file)
+    - partition_by: None, "ticker" or "year", the matrices can only be
+    partitioned by year
+    - incremental: only export rows newer than the last export
+    - batch_rows: rows per record batch
+
+    Returns:
+    - ExportResult
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown export dataset: {dataset}, use one of {list(DATASETS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}, use one of {list(FORMATS)}")
+    if partition_by is not None and partition_by not in PARTITIONS:
+        raise ValueError(f"Unknown partitioning: {partition_by}, use one of {list(PARTITIONS)}")
+    matrix = dataset.endswith("_matrix")
+    if matrix and partition_by == "ticker":
+        raise ValueError(f"{dataset} has a column per ticker and can only be partitioned by year")
+    pa = _pyarrow()
+    logger.debug("Start ..")
+
+    root = root if root is not None else exports_dir()
+    target = root / dataset
+    stream = "ohlcv" if dataset in ("ohlcv", "adjclose_matrix") else "logret"
+    by = "ticker" if partition_by == "ticker" else "date"
+
+    previous = _read_state(target)
+    since = date.min
+    if incremental and previous is not None and previous.last_date is not None:
+        if previous.format != fmt or previous.partition_by != partition_by:
+            logger.warning(f"{dataset}: format or partitioning changed since the last export, exporting in full")
+        else:
+            since = date.fromisoformat(previous.last_date)
+    tickers: list[str] = []
+    if matrix:
+        tickers = source.list_tickers_with_rows_after(since)
+        if since != date.min and previous is not None and not set(tickers) <= set(previous.tickers):
+            logger.warning(f"{dataset}: new tickers since the last export, exporting in full")
+            since = date.min
+            tickers = source.list_tickers_with_rows_after(since)
+        elif since != date.min and previous is not None:
+            tickers = previous.tickers
+    is_incremental = since != date.min
+
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    out = target if is_incremental else root / f".{dataset}.tmp-{stamp}"
+    out.mkdir(parents=True, exist_ok=True)
+    chunks = source.stream_export_rows(stream, since=since, by=by, batch_rows=batch_rows)
+
+    last_date: date | None = None
+    n_rows = 0
+    writer: _PartitionWriter | None = None
+    try:
+        if matrix:
+            schema = pa.schema([("date", pa.date32())] + [(t, pa.float64()) for t in tickers])
+            writer = _PartitionWriter(out, fmt, schema, partition_by, stamp)
+            year_key = (lambda d: d.year) if partition_by == "year" else (lambda d: None)
+            value_idx = 6 if stream == "ohlcv" else 2
+            dates_per_batch = max(1, batch_rows // max(1, len(tickers)))
+            for k, dates, block in _wide_batches(chunks, tickers, value_idx, dates_per_batch, year_key):
+                arrays = [pa.array(dates, type=pa.date32())] + [pa.array(block[:, j]) for j in range(block.shape[1])]
+                writer.write(k, pa.RecordBatch.from_arrays(arrays, schema=schema))
+                n_rows += len(dates)
+                last_date = dates[-1]
+        else:
+            schema = _long_schema(dataset, partition_by)
+            if partition_by == "ticker":
+                key: Callable[[tuple], Any] = lambda r: r[0]
+            elif partition_by == "year":
+                key = lambda r: r[1].year
+            else:
+                key = lambda r: None
+            writer = _PartitionWriter(out, fmt, schema, partition_by, stamp)
+            for k, batch in _long_batches(chunks, schema, key, drop_ticker=partition_by == "ticker"):
+                writer.write(k, batch)
+                n_rows += batch.num_rows
+                d = batch.column("date")[-1].as_py()
+                last_date = d if last_date is None or d > last_date else last_date
+        writer.close()
+    except Exception:
+        if writer is not None:
+            writer.close()
+        if is_incremental:
+            for f in writer.files if writer is not None else []:
+                f.unlink(missing_ok=True)
+        else:
+            shutil.rmtree(out, ignore_errors=True)
+        raise
+
+    if last_date is None and is_incremental and previous is not None and previous.last_date is not None:
+        last_date = date.fromisoformat(previous.last_date)
+    state = ExportState(
+        format=fmt,
+        partition_by=partition_by,
+        last_date=last_date.isoformat() if last_date is not None else None,
+        tickers=tickers,
+        exported_at=datetime.now().isoformat(timespec="seconds"),
+    )
+    _write_state(out, state)
+    if not is_incremental:
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(out, target)
+    logger.debug("End ..")
+    return ExportResult(
+        dataset=dataset,
+        path=target,
+        rows=n_rows,
+        files=len(writer.files),
+        last_date=last_date,
+        incremental=is_incremental,
+    )
@@ -4,21 +4,43 @@ import logging
 import os
 import time
 from dataclasses import replace
+from pathlib import Path
+from datetime import date, datetime, timedelta, timezone
 
 from pandas import DataFrame
 
+from trilobite.analysis.backtest import BacktestSpec, WalkForwardBacktest
 from trilobite.analysis.datasource import MarketDataSource
-from trilobite.analysis.features import prices_to_log_returns
+from trilobite.analysis.factors import FactorSpec, PCAReturnFactors
+from trilobite.analysis.sweep import Sweep, SweepSpec, parse_space
+from trilobite.analysis.trainers.artifacts import latest_artifact
 from trilobite.analysis.trainers.nn_direction import NNDirectionsConfig, NNDirectionsTrainer
+from trilobite.db.connect import DbSettings, connect
+from trilobite.db.duck.connect import connect as connect_duckdb
+from trilobite.db.duck.repo import DuckMarketRepo
+from trilobite.db.duck.schema import create_schema as create_duckdb_schema
+from trilobite.db.duck.sync import sync_from_postgres
+from trilobite.db.repo import FetchFailure
+from trilobite.db.screen import Screen
+from trilobite.export.exporter import export_dataset
 from trilobite.state.state import AppState
 from trilobite.config.config import AppConfig
 from trilobite.tickers.tickerservice import Ticker
 from trilobite.commands.uicommands import (
+    CmdBacktest,
+    CmdCompactCold,
     CmdDisplayGraph,
+    CmdExport,
     CmdTrainNN,
     CmdNotAnOption, 
+    CmdPredict,
     CmdQuit, 
+    CmdRebuildStats,
+    CmdSyncDuckDB,
+    CmdSweep,
+    CmdSyncMirror,
     CmdUpdateAll,
+    CmdUpdateIntraday,
     Command, 
 )
 from trilobite.events.uievents import (
@@ -30,7 +52,7 @@ from trilobite.events.uievents import (
     Event, 
 )
 from trilobite.utils.paths import data_dir
-from trilobite.utils.utils import stagger_requests
+from trilobite.utils.utils import failure_backoff, stagger_requests
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +74,10 @@ class Handler:
             yield from self._handle_update_all()
             return
 
+        elif isinstance(cmd, CmdUpdateIntraday):
+            yield from self._handle_update_intraday()
+            return
+
         elif isinstance(cmd, CmdNotAnOption):
             yield EvtStatus("Not an option...", waittime=1)
             return
@@ -59,74 +85,335 @@ class Handler:
         elif isinstance(cmd, CmdTrainNN):
             yield from self._handle_train_nn(cmd)
 
+        elif isinstance(cmd, CmdBacktest):
+            yield from self._handle_backtest()
+
+        elif isinstance(cmd, CmdSweep):
+            yield from self._handle_sweep()
+
+        elif isinstance(cmd, CmdPredict):
+            yield from self._handle_predict()
+
         elif isinstance(cmd, CmdDisplayGraph):
             yield from self._handle_display_graph_of_period(cmd)
 
+        elif isinstance(cmd, CmdRebuildStats):
+            yield from self._handle_rebuild_stats()
+
+        elif isinstance(cmd, CmdSyncMirror):
+            yield from self._handle_sync_mirror()
+
+        elif isinstance(cmd, CmdSyncDuckDB):
+            yield from self._handle_sync_duckdb()
+
+        elif isinstance(cmd, CmdCompactCold):
+            yield from self._handle_compact_cold()
+
+        elif isinstance(cmd, CmdExport):
+            yield from self._handle_export()
+
         else:
             yield EvtStatus(f"Unknown command: {cmd!r}")
 
     def _handle_update_all(self):
         """
-        Handles update all situation
+        Handles update all situation. Tickers in the negative cache are
+        skipped until their retry time unless cfg.ticker.retry_failed, failed
+        and empty fetches are recorded in it and successful ones removed.
         """
         tickers = self._state.ticker.update()
         logger.info(f"Tickermap returned ..")
+
+        failures = self._state.repo.list_fetch_failures()
+        skipped: list[str] = []
+        if not self._cfg.ticker.retry_failed:
+            now = datetime.now(timezone.utc)
+            skipped = [t.tickersymbol for t in tickers if t.tickersymbol in failures and failures[t.tickersymbol].retry_after > now]
+            if skipped:
+                skip = set(skipped)
+                tickers = [t for t in tickers if t.tickersymbol not in skip]
+                logger.info(f"Skipping {len(skipped)} tickers in the negative cache: {skipped}")
         total = len(tickers)
 
-        if total == 0:
+        if total == 0 and not skipped:
             yield EvtStatus("No tickers found", waittime=1)
             return
 
         yield EvtStatus("Starting update of all tickers", waittime=1)
         error_tickers = []
+        empty_tickers = []
+        recovered = []
+        changed: dict[str, date] = {}
         for i, ticker, in enumerate(tickers, start=1):
             if self._cfg.misc.stagger_requests:
                 time.sleep(stagger_requests())
             yield EvtProgress(f"{ticker.tickersymbol}", i, total)
 
             try:
-                self.update_ticker(ticker)
+                first = self.update_ticker(ticker)
             except Exception as e:
-                logger.exception(f"Error updating {ticker.tickersymbol}: {e}")
+                #Known failures only get a line, the traceback was logged before
+                if ticker.tickersymbol in failures:
+                    logger.warning(f"Error updating {ticker.tickersymbol} again: {e}")
+                else:
+                    logger.exception(f"Error updating {ticker.tickersymbol}: {e}")
+                self._record_fetch_failure(ticker.tickersymbol, f"{type(e).__name__}: {e}", failures)
                 error_tickers.append(ticker.tickersymbol)
                 continue
+            if first is None:
+                #Delisted and unservable symbols come back empty
+                self._record_fetch_failure(ticker.tickersymbol, "No data returned", failures)
+                empty_tickers.append(ticker.tickersymbol)
+                continue
+            changed[ticker.tickersymbol] = first
+            if ticker.tickersymbol in failures:
+                recovered.append(ticker.tickersymbol)
+
+        if recovered:
+            self._state.repo.clear_fetch_failures(recovered)
 
         if len(error_tickers) > 0:
             yield EvtStatus(f"Following tickers failed to update: {error_tickers}", waittime=5)
-        else:
+        elif len(empty_tickers) == 0:
             yield EvtStatus("All tickers updated", waittime=1)
+        yield EvtStatus(
+            f"{len(changed)} updated, {len(error_tickers)} failed, {len(empty_tickers)} returned no data, "
+            f"{len(skipped)} skipped after earlier failures, {len(recovered)} recovered",
+            waittime=0,
+        )
 
-    def _handle_train_nn(self, cmd: CmdTrainNN):
-        yield EvtStatus("Loading data for NN training...", waittime=0)
+        if self._cfg.mirror.enabled:
+            yield from self._handle_sync_mirror(since=changed)
 
-        ds = MarketDataSource(self._state.repo)
+    def _record_fetch_failure(self, ticker: str, reason: str, failures: dict[str, FetchFailure]) -> None:
+        """
+        Records a failed fetch in the negative cache, continuing the streak of 
+        the ticker's earlier failures, and sets how long it is skipped
 
-        yield EvtStatus(f"Building adjclose matrix ..", waittime=0)
-        adj = ds.load_adjclose_matrix(period=self._cfg.analysis.period)
-        yield EvtStatus(f"Qualified tickers(min_days={self._cfg.analysis.period}): {adj.shape[1]}", waittime=0)
+        Params:
+        - ticker: ticker symbol
+        - reason: short description of the failure
+        - failures: the negative cache as loaded at the start of the update
+        """
+        cfg = self._cfg.ticker
+        prev = failures.get(ticker)
+        streak = 1 if prev is None else prev.streak + 1
+        now = datetime.now(timezone.utc)
+        ttl = failure_backoff(
+            streak,
+            min_streak=cfg.failure_min_streak,
+            ttl_hours=cfg.failure_ttl_hours,
+            max_ttl_days=cfg.failure_max_ttl_days,
+        )
+        self._state.repo.record_fetch_failure(ticker, reason, streak=streak, failed_at=now, retry_after=now + ttl)
 
-        yield EvtStatus("Computing log returns...", waittime=0)
-        rets = prices_to_log_returns(adj)
+    def _handle_update_intraday(self):
+        """
+        Handles the intraday update of all active tickers. Each ticker is 
+        fetched from its last stored bar, the bars of several tickers are
+        written together in batches of cfg.intraday.batch_rows, then the bars
+        are rolled up to daily rows and the retention of the interval applied.
+        """
+        cfg = self._cfg.intraday
+        if isinstance(self._state.repo, DuckMarketRepo):
+            yield EvtStatus("Intraday bars are only stored in PostgreSQL, skipping", waittime=0)
+            return
+        tickers = self._state.repo.list_active_tickers()
+        total = len(tickers)
+        if total == 0:
+            yield EvtStatus("No tickers found", waittime=1)
+            return
 
-        yield EvtStatus("Training NN (PCA factors + GRU)...", waittime=0)
+        yield EvtStatus(f"Starting {cfg.interval} intraday update of all tickers", waittime=1)
+        started = datetime.now(timezone.utc)
+        last_ts = self._state.repo.last_intraday_ts_for_all_tickers(cfg.interval)
+        pending: dict[int, DataFrame] = {}
+        pending_rows = 0
+        written = 0
+        error_tickers = []
+        for i, ticker in enumerate(tickers, start=1):
+            if self._cfg.misc.stagger_requests:
+                time.sleep(stagger_requests())
+            yield EvtProgress(f"{ticker}", i, total)
 
-        cfg = NNDirectionsConfig(
-            n_factors=self._cfg.analysis.n_factors,
-            lookback=self._cfg.analysis.lookback,
-            horizon=self._cfg.analysis.horizon,
-            epochs=self._cfg.analysis.epochs,
-            device="cpu",
+            try:
+                #From the last stored bar, it may have been written unfinished
+                df = self._state.market.get_intraday(ticker, cfg.interval, last_ts.get(ticker))
+            except Exception as e:
+                logger.exception(f"Error fetching intraday bars for {ticker}: {e}")
+                error_tickers.append(ticker)
+                continue
+            if df.empty:
+                continue
+            pending[self._state.repo.ensure_instrument(ticker)] = df
+            pending_rows += len(df)
+            if pending_rows >= cfg.batch_rows:
+                written += self._state.repo.upsert_ohlcv_intraday(cfg.interval, pending)
+                pending, pending_rows = {}, 0
+        if pending:
+            written += self._state.repo.upsert_ohlcv_intraday(cfg.interval, pending)
+
+        if len(error_tickers) > 0:
+            yield EvtStatus(f"Following tickers failed to update: {error_tickers}", waittime=5)
+        yield EvtStatus(f"{written} {cfg.interval} bars written", waittime=0)
+
+        if cfg.rollup_daily:
+            #Only the last sessions can be missing a daily bar
+            since = started - timedelta(days=7)
+            days = self._state.repo.rollup_intraday_to_daily(cfg.interval, since=since, tz=cfg.exchange_tz)
+            yield EvtStatus(f"{days} provisional daily bars rolled up", waittime=0)
+
+        keep_days = {
+            "1m": cfg.retention_1m_days,
+            "5m": cfg.retention_5m_days,
+            "1h": cfg.retention_1h_days,
+        }[cfg.interval]
+        dropped, deleted = self._state.repo.apply_intraday_retention(cfg.interval, keep_days=keep_days)
+        yield EvtStatus(f"Retention of {keep_days} days: {dropped} partitions dropped, {deleted} bars deleted", waittime=0)
+
+    def _handle_sync_mirror(self, since: dict[str, date] | None = None):
+        """
+        Handles the sync of the local columnar mirror
+
+        Params:
+        - since: dict[ticker, date] of the first date written per ticker in 
+        the update that just ran
+        """
+        yield EvtStatus("Syncing local mirror ..", waittime=0)
+        rows = self._state.mirror.sync(
+            self._state.repo,
+            since=since,
+            chunk_size=self._cfg.mirror.sync_chunk_size,
         )
-        trainer = NNDirectionsTrainer(cfg)
-        logger.debug(f"adj.shape={adj.shape}, rets.shape={rets.shape}")
+        yield EvtStatus(f"Local mirror synced, {rows} rows written", waittime=0)
+
+    def _handle_sync_duckdb(self):
+        """
+        Handles the copy of the PostgreSQL tables into the DuckDB file
+        """
+        yield EvtStatus("Syncing DuckDB from PostgreSQL ..", waittime=0)
+        if isinstance(self._state.repo, DuckMarketRepo):
+            duck = self._state.repo.conn
+        else:
+            duck = connect_duckdb(self._cfg.db.duckdb_path)
+            create_duckdb_schema(duck)
+        pg = connect(DbSettings(
+            dbname=self._cfg.db.dbname,
+            host=self._cfg.db.host,
+            user=self._cfg.db.user,
+            port=self._cfg.db.port,
+        ))
+        try:
+            res = sync_from_postgres(pg, duck)
+        finally:
+            pg.close()
+            if not isinstance(self._state.repo, DuckMarketRepo):
+                duck.close()
         yield EvtStatus(
-        f"n_factors={self._cfg.analysis.n_factors} | "
-        f"lookback={self._cfg.analysis.lookback} | "
-        f"horizon={self._cfg.analysis.horizon} | "
-        f"epochs={self._cfg.analysis.epochs} | "
-        f"device=cpu"
+            f"DuckDB synced, {res.refreshed}/{res.instruments} instruments refreshed, {res.rows} rows written",
+            waittime=0,
         )
-        trainer.fit(rets)
+
+    def _handle_compact_cold(self):
+        """
+        Handles the move of sealed years from ohlcv_daily into the cold tier,
+        one year per transaction. Ends with a VACUUM (ANALYZE) of the price
+        tables when anything was moved, a VACUUM FULL with '--vacuum-full'.
+        """
+        if isinstance(self._state.repo, DuckMarketRepo):
+            yield EvtStatus("DuckDB already stores prices compressed by column, nothing to compact", waittime=0)
+            return
+        first = self._state.repo.first_hot_date()
+        seal_before = self._state.repo.current_date().year - self._cfg.db.hot_years
+        if first is None or first.year >= seal_before:
+            yield EvtStatus("No sealed years in ohlcv_daily", waittime=0)
+            return
+
+        years = list(range(first.year, seal_before))
+        yield EvtStatus(f"Compacting {len(years)} years ({years[0]}-{years[-1]}) into the cold tier ..", waittime=0)
+        segments = 0
+        for i, year in enumerate(years, start=1):
+            yield EvtProgress(f"{year}", i, len(years))
+            segments += self._state.repo.compact_cold_year(year)
+        if segments == 0:
+            yield EvtStatus("Nothing to compact, the sealed years had no rows", waittime=0)
+            return
+        if self._cfg.db.vacuum_full:
+            yield EvtStatus("Rewriting ohlcv_daily to free the moved rows (VACUUM FULL, tables locked) ..", waittime=0)
+        else:
+            yield EvtStatus("Vacuuming ohlcv_daily so the moved rows' space is reused ..", waittime=0)
+        self._state.repo.vacuum_ohlcv(full=self._cfg.db.vacuum_full)
+        yield EvtStatus(f"Cold tier compacted, {segments} segments written", waittime=0)
+
+    def _handle_export(self):
+        """
+        Handles the export of the configured datasets to exports/
+        """
+        cfg = self._cfg.export
+        for i, dataset in enumerate(cfg.datasets, start=1):
+            yield EvtStatus(f"Exporting {dataset} ({i}/{len(cfg.datasets)}) ..", waittime=0)
+            res = export_dataset(
+                self._state.repo,
+                dataset,
+                fmt=cfg.format,
+                partition_by=cfg.partition_by,
+                incremental=cfg.incremental,
+                batch_rows=cfg.batch_rows,
+            )
+            mode = "incremental" if res.incremental else "full"
+            yield EvtStatus(
+                f"{dataset}: {res.rows} rows in {res.files} files ({mode}), up to {res.last_date}, at {res.path}",
+                waittime=0,
+            )
+
+    def _handle_rebuild_stats(self):
+        """
+        Handles the rebuild of the instrument_stats table
+        """
+        yield EvtStatus("Rebuilding instrument stats ..", waittime=0)
+        n = self._state.repo.rebuild_instrument_stats()
+        yield EvtStatus(f"Instrument stats rebuilt for {n} instruments", waittime=0)
+        yield EvtStatus("Rebuilding daily returns ..", waittime=0)
+        n = self._state.repo.rebuild_returns_daily()
+        yield EvtStatus(f"Daily returns rebuilt, {n} rows", waittime=0)
+
+    def _handle_train_nn(self, cmd: CmdTrainNN):
+        yield EvtStatus("Loading data for NN training...", waittime=0)
+
+        mirror = self._state.mirror if self._cfg.mirror.enabled else None
+        ds = MarketDataSource(self._state.repo, mirror=mirror, dtype=self._cfg.analysis.dtype)
+        if self._cfg.analysis.memmap_dataset:
+            yield from self._train_nn_memmap(ds)
+            return
+
+        yield EvtStatus(f"Loading log returns matrix ..", waittime=0)
+        rets = ds.load_returns_matrix(period=self._cfg.analysis.period, screen=self._screen())
+        yield EvtStatus(f"Qualified tickers(min_days={self._cfg.analysis.period}): {rets.shape[1]}", waittime=0)
+
+        tuned = None
+        if self._cfg.analysis.fine_tune:
+            tuned = yield from self._fine_tune(rets)
+        if tuned is not None:
+            trainer, n_new = tuned
+            if n_new > 0:
+                yield EvtStatus(self._training_summary(trainer), waittime=0)
+                yield from self._save_model(trainer)
+        else:
+            yield EvtStatus("Training NN (PCA factors + GRU)...", waittime=0)
+
+            trainer = NNDirectionsTrainer(self._nn_config())
+            logger.debug(f"rets.shape={rets.shape}")
+            yield EvtStatus(
+            f"n_factors={self._cfg.analysis.n_factors} | "
+            f"lookback={self._cfg.analysis.lookback} | "
+            f"horizon={self._cfg.analysis.horizon} | "
+            f"epochs={self._cfg.analysis.epochs} | "
+            f"device=cpu"
+            )
+            fm = yield from self._factor_model(rets, trainer.factor_spec)
+            trainer.fit(rets, factor_model=fm)
+            yield EvtStatus(self._training_summary(trainer), waittime=0)
+            yield from self._save_model(trainer)
 
         yield EvtStatus("Predicting latest...", waittime=0)
         pred = trainer.predict_latest(rets)
@@ -134,11 +421,335 @@ class Handler:
         ranked = pred.ranked(self._cfg.analysis.top_n)
         yield EvtPredictionRanked(topn=self._cfg.analysis.top_n, date=pred.date, ranked=ranked)
 
+    def _train_nn_memmap(self, ds: MarketDataSource):
+        """
+        _handle_train_nn with the training set built on disk: the returns are
+        read in chunks of memmap_chunk_days, twice (PCA, then factors and
+        labels), and the GRU is trained from the memory-mapped dataset. The
+        PCA is fitted on the chunks, the saved state of _factor_model is not
+        used.
+        """
+        a = self._cfg.analysis
+        screen = self._screen()
+        #Both passes must read the same dates
+        end_date = self._state.repo.current_date()
+
+        def chunks():
+            return ds.iter_returns_chunks(period=a.period, end_date=end_date, screen=screen, chunk_days=a.memmap_chunk_days)
+
+        root = data_dir(create=True) / "datasets" / "nn_direction"
+        yield EvtStatus(f"Training NN (PCA factors + GRU) from {a.memmap_labels} dataset at {root} ..", waittime=0)
+        trainer = NNDirectionsTrainer(self._nn_config())
+        dataset = trainer.fit_out_of_core(chunks, root, label_format=a.memmap_labels)
+        yield EvtStatus(f"Trained on {len(dataset)} windows of {len(dataset.tickers)} tickers", waittime=0)
+        yield EvtStatus(self._training_summary(trainer), waittime=0)
+        yield from self._save_model(trainer)
+
+        yield EvtStatus("Predicting latest...", waittime=0)
+        pred = trainer.predict_latest_from(dataset)
+
+        ranked = pred.ranked(a.top_n)
+        yield EvtPredictionRanked(topn=a.top_n, date=pred.date, ranked=ranked)
+
+    def _fine_tune(self, rets: DataFrame):
+        """
+        Fine-tunes the latest saved model on the new days of the returns
+        matrix, see NNDirectionsTrainer.fine_tune. Returns the trainer and the
+        number of new days, or None when a full training is needed instead:
+        no saved model, changed model settings or universe, or finetune_max
+        fine-tunes since the last full training.
+        """
+        cfg = self._nn_config()
+        path = latest_artifact(self._models_root())
+        trainer = None
+        reason = None
+        if path is None:
+            reason = "no saved model"
+        else:
+            trainer = NNDirectionsTrainer.load(path)
+            changed = trainer.structure_changes(cfg)
+            if changed:
+                reason = f"model settings changed: {', '.join(changed)}"
+            elif trainer.tickers != list(rets.columns):
+                reason = "universe changed"
+            elif trainer.last_date is None or not rets.index[0] <= trainer.last_date <= rets.index[-1]:
+                reason = "saved model does not overlap the returns"
+            elif trainer.fine_tunes >= self._cfg.analysis.finetune_max:
+                reason = f"scheduled after {trainer.fine_tunes} fine-tunes"
+        if reason is not None:
+            yield EvtStatus(f"Full training ({reason}) ..", waittime=0)
+            return None
+        assert trainer is not None and path is not None
+
+        #Structure is unchanged, the current runtime and fine-tune settings apply
+        trainer.cfg = cfg
+        try:
+            n_new = trainer.fine_tune(rets)
+        except RuntimeError as e:
+            yield EvtStatus(f"Full training ({e}) ..", waittime=0)
+            return None
+        if n_new == 0:
+            yield EvtStatus(f"Model {path.name} is up to date with {trainer.last_date:%Y-%m-%d}", waittime=0)
+        else:
+            yield EvtStatus(f"Fine-tuned model {path.name} on {n_new} new days (fine-tune {trainer.fine_tunes})", waittime=0)
+        return trainer, n_new
+
+    def _handle_predict(self):
+        """
+        Ranks the tickers with the latest model saved by '--train-nn', on the
+        returns matrix of the current period and screen. The model is
+        rejected when that universe is not the one it was trained on.
+        """
+        root = self._models_root()
+        path = latest_artifact(root)
+        if path is None:
+            yield EvtStatus(f"No saved model in {root}, run '--train-nn' first", waittime=0)
+            return
+        trainer = NNDirectionsTrainer.load(path)
+        if trainer.last_date is None:
+            yield EvtStatus(f"Model {path.name} rejected, it has no training date. Run '--train-nn' to retrain", waittime=0)
+            return
+        yield EvtStatus(f"Loaded model {path.name}, trained on returns up to {trainer.last_date:%Y-%m-%d}", waittime=0)
+
+        mirror = self._state.mirror if self._cfg.mirror.enabled else None
+        ds = MarketDataSource(self._state.repo, mirror=mirror, dtype=self._cfg.analysis.dtype)
+        yield EvtStatus(f"Loading log returns matrix ..", waittime=0)
+        rets = ds.load_returns_matrix(period=self._cfg.analysis.period, screen=self._screen())
+
+        gone = set(trainer.tickers) - set(rets.columns)
+        new = set(rets.columns) - set(trainer.tickers)
+        if gone or new:
+            yield EvtStatus(
+                f"Model {path.name} rejected, the universe has drifted since training: "
+                f"{len(gone)} tickers gone, {len(new)} new. Run '--train-nn' to retrain",
+                waittime=0,
+            )
+            return
+
+        yield EvtStatus("Predicting latest...", waittime=0)
+        if self._cfg.analysis.carry_state:
+            pred = yield from self._predict_carried(trainer, path, rets.loc[:, trainer.tickers])
+        else:
+            pred = trainer.predict_latest(rets.loc[:, trainer.tickers])
+        ranked = pred.ranked(self._cfg.analysis.top_n)
+        yield EvtPredictionRanked(topn=self._cfg.analysis.top_n, date=pred.date, ranked=ranked)
+
+    def _predict_carried(self, trainer: NNDirectionsTrainer, path: Path, rets: DataFrame):
+        """
+        Predicts with the GRU state saved beside the model's directory by the
+        previous '--carry-state' run, see NNDirectionsTrainer.predict_incremental,
+        and saves the new state. The state is kept out of the artifact, which
+        is not written to after it is created.
+
+        Params:
+        - trainer: the model loaded from path
+        - path: the model's artifact directory
+        - rets: returns matrix in the model's tickers
+
+        Returns:
+        - the prediction
+        """
+        #The rebuild interval is a runtime setting, not the one saved with the model
+        trainer.cfg = replace(trainer.cfg, hidden_max_steps=self._cfg.analysis.hidden_max_steps)
+        state = self._models_root() / f"hidden-{path.name}.pt"
+        if state.exists():
+            trainer.load_hidden(state)
+        pred = trainer.predict_incremental(rets)
+        trainer.save_hidden(state)
+        yield EvtStatus(f"GRU state carried {trainer.hidden_steps} days since its last full window", waittime=0)
+        return pred
+
+    def _handle_backtest(self):
+        """
+        Walk-forward backtest of the NN on the returns matrix of the current
+        period and screen, see analysis.backtest.WalkForwardBacktest. Shows
+        each fold as it finishes, then the fold table and the summary.
+        """
+        a = self._cfg.analysis
+        mirror = self._state.mirror if self._cfg.mirror.enabled else None
+        ds = MarketDataSource(self._state.repo, mirror=mirror, dtype=a.dtype)
+        yield EvtStatus(f"Loading log returns matrix ..", waittime=0)
+        rets = ds.load_returns_matrix(period=a.period, screen=self._screen())
+
+        spec = BacktestSpec(
+            window=a.backtest_window,
+            train_days=a.backtest_train_days,
+            refit_every=a.backtest_refit_every,
+            top_n=a.top_n,
+            workers=a.backtest_workers,
+            seed=a.backtest_seed,
+        )
+        try:
+            bt = WalkForwardBacktest(rets, self._nn_config(), spec)
+        except ValueError as e:
+            yield EvtStatus(f"Cannot backtest: {e}", waittime=0)
+            return
+        folds = bt.folds
+        yield EvtStatus(
+            f"Backtesting {rets.shape[1]} tickers over {rets.shape[0]} days: {len(folds)} {spec.window} folds, "
+            f"refit every {spec.refit_every} days, {bt.workers()} workers ..",
+            waittime=0,
+        )
+        for i, st in enumerate(bt.run(), start=1):
+            f = st.fold
+            yield EvtStatus(
+                f"Fold {f.number} ({i}/{len(folds)}): trained on {rets.index[f.train_lo]:%Y-%m-%d}..{rets.index[f.train_hi - 1]:%Y-%m-%d}, "
+                f"scored {f.test_hi - f.test_lo} days in {st.seconds:.1f}s",
+                waittime=0,
+            )
+        res = bt.result()
+
+        #Metrics of every fold's test dates
+        table = DataFrame([
+            {
+                "fold": st.fold.number,
+                "from": rets.index[st.fold.test_lo].date(),
+                "to": rets.index[st.fold.test_hi - 1].date(),
+                "loss": st.loss,
+                **res.daily.iloc[st.fold.test_lo - folds[0].test_lo : st.fold.test_hi - folds[0].test_lo].mean().to_dict(),
+            }
+            for st in res.folds
+        ]).set_index("fold")
+        yield EvtStatus(f"Backtest folds (top/bottom {spec.top_n}):\n{table.to_string(float_format='{:.4f}'.format)}", waittime=0)
+        yield EvtStatus(f"Backtest summary:\n{res.summary().to_string(float_format='{:.4f}'.format)}", waittime=0)
+
+    def _handle_sweep(self):
+        """
+        Hyperparameter search of the NN on the returns matrix of the current
+        period and screen, loaded once for every trial, see
+        analysis.sweep.Sweep. The fields the space does not sweep come from
+        CFGAnalysis. The results table is written to data/sweeps.
+        """
+        a = self._cfg.analysis
+        mirror = self._state.mirror if self._cfg.mirror.enabled else None
+        ds = MarketDataSource(self._state.repo, mirror=mirror, dtype=a.dtype)
+        yield EvtStatus(f"Loading log returns matrix ..", waittime=0)
+        rets = ds.load_returns_matrix(period=a.period, screen=self._screen())
+
+        try:
+            spec = SweepSpec(
+                search=a.sweep_search,
+                trials=a.sweep_trials,
+                val_days=a.sweep_val_days,
+                metric=a.sweep_metric,
+                rungs=a.sweep_rungs,
+                workers=a.sweep_workers,
+                trial_threads=a.sweep_trial_threads,
+                top_n=a.top_n,
+            )
+            sweep = Sweep(rets, self._nn_config(), parse_space(a.sweep_space), spec)
+        except ValueError as e:
+            yield EvtStatus(f"Cannot sweep: {e}", waittime=0)
+            return
+        n = len(sweep.trials)
+        yield EvtStatus(
+            f"Sweeping {n} {spec.search} trials over {rets.shape[1]} tickers, validated on the last {spec.val_days} days "
+            f"by {spec.metric}, {spec.rungs} rungs, {sweep.workers()} workers ..",
+            waittime=0,
+        )
+        for r in sweep.run():
+            yield EvtStatus(
+                f"Trial {r.number} rung {r.rung} ({r.epochs} epochs) {r.params}: "
+                f"{spec.metric}={r.metrics[spec.metric]:.4f} in {r.seconds:.1f}s",
+                waittime=0,
+            )
+        table = sweep.results()
+
+        root = data_dir(create=True) / "sweeps"
+        root.mkdir(parents=True, exist_ok=True)
+        path = root / f"sweep_{datetime.now():%Y%m%d_%H%M%S}.csv"
+        table.to_csv(path)
+        yield EvtStatus(f"Sweep results written to {path}", waittime=0)
+        yield EvtStatus(f"Best trials by {spec.metric}:\n{table.head(10).to_string(float_format='{:.4f}'.format)}", waittime=0)
+
+    def _models_root(self) -> Path:
+        return data_dir() / "models" / "nn_direction"
+
+    def _save_model(self, trainer: NNDirectionsTrainer):
+        if not self._cfg.analysis.save_model:
+            return
+        path = trainer.save(self._models_root())
+        yield EvtStatus(f"Model saved to {path}", waittime=0)
+
+    def _training_summary(self, trainer: NNDirectionsTrainer) -> str:
+        h = trainer.history
+        if not h:
+            return "No training epochs run"
+        seconds = sum(e.seconds for e in h)
+        rate = sum(e.samples for e in h) / seconds if seconds > 0 else 0.0
+        return f"Trained {len(h)} epochs in {seconds:.1f}s ({rate:.0f} samples/s), final loss {h[-1].loss:.4f}"
+
+    def _nn_config(self) -> NNDirectionsConfig:
+        return NNDirectionsConfig(
+            n_factors=self._cfg.analysis.n_factors,
+            factor_solver=self._cfg.analysis.factor_solver,
+            factor_forgetting=self._cfg.analysis.factor_forgetting,
+            factor_dtype=self._cfg.analysis.dtype,
+            lookback=self._cfg.analysis.lookback,
+            horizon=self._cfg.analysis.horizon,
+            epochs=self._cfg.analysis.epochs,
+            device="cpu",
+            num_threads=self._cfg.analysis.train_threads,
+            num_interop_threads=self._cfg.analysis.train_interop_threads,
+            compile=self._cfg.analysis.train_compile,
+            compile_mode=self._cfg.analysis.train_compile_mode,
+            bf16_autocast=self._cfg.analysis.train_bf16,
+            log_every=self._cfg.analysis.train_log_every,
+            finetune_steps=self._cfg.analysis.finetune_steps,
+            finetune_recent=self._cfg.analysis.finetune_recent,
+            finetune_replay=self._cfg.analysis.finetune_replay,
+            finetune_lr=self._cfg.analysis.finetune_lr,
+            hidden_max_steps=self._cfg.analysis.hidden_max_steps,
+        )
+
+    def _factor_model(self, rets: DataFrame, spec: FactorSpec):
+        """
+        Returns the PCA factor model for the returns matrix. The state saved
+        by the previous run is updated with the new days when it was fitted 
+        with the same spec on the same tickers and its drift is small, 
+        otherwise the model is refitted. The result is saved for the next run.
+        """
+        path = data_dir() / "factors" / "pca_state.npz"
+        fm = None
+        if self._cfg.analysis.factor_updates and path.exists():
+            try:
+                fm = PCAReturnFactors.load(path)
+            except Exception as e:
+                logger.warning(f"Could not load PCA state {path}: {e}")
+        reason = None
+        if fm is None:
+            reason = "no saved state" if self._cfg.analysis.factor_updates else "refit requested"
+        elif fm.spec != spec:
+            reason = "factor settings changed"
+        elif fm.tickers != list(rets.columns):
+            reason = "universe changed"
+        elif fm.last_date is None or not rets.index[0] <= fm.last_date <= rets.index[-1]:
+            reason = "saved state does not overlap the returns"
+        else:
+            n_new = int((rets.index > fm.last_date).sum())
+            fm.partial_fit(rets)
+            drift = fm.drift()
+            logger.info(f"PCA updated with {n_new} days: {drift}")
+            if drift.refit:
+                reason = f"drift (overlap {drift.overlap:.3f}, {drift.updates} updates)"
+            else:
+                yield EvtStatus(f"PCA factors updated with {n_new} new days, subspace overlap {drift.overlap:.3f}", waittime=0)
+
+        if reason is not None:
+            yield EvtStatus(f"Fitting PCA factors ({reason}) ..", waittime=0)
+            fm = PCAReturnFactors(spec).fit(rets)
+        assert fm is not None
+        fm.save(path)
+        return fm
+
     def _handle_display_graph_of_period(self, cmd: CmdDisplayGraph):
         """
         Handles the request for graph display of a single ticker
         """
-        df = self._state.repo.fetch_adjclose_series(self._cfg.analysis.ticker, self._cfg.analysis.period)
+        if self._cfg.mirror.enabled and self._state.mirror.exists:
+            df = self._state.mirror.fetch_adjclose_series(self._cfg.analysis.ticker, self._cfg.analysis.period)
+        else:
+            df = self._state.repo.fetch_adjclose_series(self._cfg.analysis.ticker, self._cfg.analysis.period)
         #create plot here for now
         import matplotlib.pyplot as plt
         import subprocess
@@ -195,13 +806,36 @@ class Handler:
 
 
 
-    def update_ticker(self, ticker: Ticker) -> None:
+    def _screen(self) -> Screen:
+        """
+        Builds the universe screen from the screen config
+        """
+        c = self._cfg.screen
+        screen = Screen()
+        if c.active_only:
+            screen = screen.active()
+        if c.min_coverage is not None:
+            screen = screen.min_coverage(c.min_coverage)
+        if c.max_gap_days is not None:
+            screen = screen.max_gap(c.max_gap_days)
+        if c.min_price is not None:
+            screen = screen.min_price(c.min_price)
+        if c.min_volume is not None:
+            screen = screen.min_volume(c.min_volume, days=c.volume_days)
+        if c.min_dollar_volume is not None:
+            screen = screen.min_dollar_volume(c.min_dollar_volume, days=c.volume_days)
+        return screen
+
+    def update_ticker(self, ticker: Ticker) -> date | None:
         """
         Performs an update of the data for the given ticker
 
         Params:
         - Ticker object containing ticker symbol, update_date, 
         check_for_corporate_actions flag
+
+        Returns:
+        - date: the first date written, or None if nothing was returned
         """
         df = self._state.market.get_ohlcv(ticker.tickersymbol, ticker.update_date)
 
@@ -218,6 +852,7 @@ class Handler:
         affected = self._state.repo.upsert_ohlcv_daily(instrument_id=instrument_id, df = df)
         count = affected if affected > 0 else len(df.index)
         logger.debug(f"Updated: {ticker.tickersymbol} , from date {ticker.update_date}, with {count} rows added")
+        return None if df.empty else min(df["date"])
 
     def detect_corporate_action(self, df: DataFrame) -> bool:
         """
@@ -48,6 +48,18 @@ def setup_logging(level: int = logging.INFO, console: None | bool = False) -> No
     last_run_handler.setLevel(level)
     last_run_handler.setFormatter(formatter)
     root_logger.addHandler(last_run_handler)
+
+    #Slow queries from db/metrics.py also get their own file
+    slow_handler = RotatingFileHandler(
+            logs_dir() / "slow_queries.log",
+            maxBytes=10_000_000,
+            backupCount=2,
+            encoding="utf-8",
+    )
+    slow_handler.setLevel(logging.WARNING)
+    slow_handler.setFormatter(formatter)
+    logging.getLogger("trilobite.db.slow").handlers.clear()
+    logging.getLogger("trilobite.db.slow").addHandler(slow_handler)
     if console:
         console_handler = logging.StreamHandler(sys.stderr)
         console_handler.setLevel(level)
@@ -1,11 +1,15 @@
 import logging
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 
 from pandas import DataFrame
 from trilobite.marketdata.yfclient import YFClient
 
 logger = logging.getLogger(__name__)
 
+#How far back Yahoo serves each intraday interval, in days. 1m bars are 
+#served for the last 30 days but at most 7 days per request.
+INTRADAY_MAX_LOOKBACK_DAYS: dict[str, int] = {"1m": 7, "5m": 59, "1h": 729}
+
 class MarketService:
     """
     Service wrapper for the market data retrieval.
@@ -31,15 +35,52 @@ class MarketService:
         - pandas.DataFrame containing the OHLCV data
         """
         logger.debug("Start ..")
+        ticker = self._validate_ticker(ticker)
+        logger.debug("End ..")
+        return self._client.get_ohlcv(ticker, start_date = start_date)
+
+    def get_intraday(self, ticker: str, interval: str, start: datetime | None = None) -> DataFrame:
+        """
+        Normalizes and validates the ticker and interval, then delegates the
+        fetch of intraday bars to the client.
+
+        Params:
+        - ticker: the instrument ticker symbol
+        - interval: "1m", "5m" or "1h"
+        - start: first bar (inclusive), clamped to the history the provider
+        serves for the interval. None requests all of it.
+
+        Returns:
+        - pandas.DataFrame with columns ts (UTC), open, high, low, close, 
+        volume
+        """
+        logger.debug("Start ..")
+        ticker = self._validate_ticker(ticker)
+        if interval not in INTRADAY_MAX_LOOKBACK_DAYS:
+            logger.warning(f"Invalid intraday interval: {interval}")
+            raise ValueError(f"Invalid intraday interval: {interval}, use one of {list(INTRADAY_MAX_LOOKBACK_DAYS)}")
+
+        floor = datetime.now(timezone.utc) - timedelta(days=INTRADAY_MAX_LOOKBACK_DAYS[interval])
+        if start is None or start < floor:
+            start = floor
+        logger.debug("End ..")
+        return self._client.get_intraday(ticker, interval, start)
+
+    def _validate_ticker(self, ticker: str) -> str:
+        """
+        Strips and capitalizes the ticker
+
+        Raises:
+        - ValueError if the ticker is empty or has characters other than
+        letters, digits, "." and "-"
+        """
         ticker = ticker.strip().upper()
         if not ticker:
-            logger.warning("get_ohlcv was called with empty ticker")
+            logger.warning("MarketService was called with empty ticker")
             raise ValueError("Ticker cannot be empty")
 
         if not ticker.replace(".", "").replace("-", "").isalnum():
             logger.warning(f"Invalid ticker format: {ticker}")
             raise ValueError(f"Invalid ticker format: {ticker}")
-
-        logger.debug("End ..")
-        return self._client.get_ohlcv(ticker, start_date = start_date)
+        return ticker
 
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 import logging
 import yfinance as yf
 from pandas import DataFrame
@@ -50,3 +50,44 @@ class YFClient:
         #strip the time and leave the date
         df["date"] = df["date"].dt.date
         return df
+
+    def get_intraday(self, ticker: str, interval: str, start: datetime) -> DataFrame:
+        """
+        Download intraday OHLCV bars for ticker from start until now.
+
+        Yahoo only serves recent intraday history, see 
+        marketservice.INTRADAY_MAX_LOOKBACK_DAYS.
+
+        Params:
+        - ticker: Ticker symbol accepted by Yahoo Finance
+        - interval: "1m", "5m" or "1h"
+        - start: first bar (inclusive), timezone aware
+
+        Returns:
+        - pandas.DataFrame with columns ts (UTC), open, high, low, close,
+        volume
+        """
+        t = yf.Ticker(ticker)
+        df = t.history(
+            start=start,
+            end=None,
+            interval=interval,
+            actions=False,
+            auto_adjust=False,
+            prepost=False,
+        )
+        df = (
+            df
+            .reset_index()
+            .rename(columns={
+                "Datetime": "ts",
+                "Date": "ts",
+                "Open": "open",
+                "High": "high",
+                "Low": "low",
+                "Close": "close",
+                "Volume": "volume",
+                })
+        )
+        df["ts"] = df["ts"].dt.tz_convert("UTC")
+        return df[["ts", "open", "high", "low", "close", "volume"]]
@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Mapping, Protocol
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from trilobite.utils.paths import data_dir
+from trilobite.utils.utils import period_to_date
+
+logger = logging.getLogger(__name__)
+
+FIELDS: tuple[str, ...] = ("open", "high", "low", "close", "adjclose", "volume")
+MANIFEST_VERSION = 1
+
+class MirrorSource(Protocol):
+    """
+    Protocol for the repository the mirror is synced from
+    """
+    def last_ohlcv_date_for_all_tickers(self) -> dict[str, date | None]:
+        ...
+
+    def list_trading_dates(self, *, since: date | None = None) -> list[date]:
+        ...
+
+    def fetch_ohlcv_since(self, since: Mapping[str, date | None]) -> DataFrame:
+        ...
+
+@dataclass
+class MirrorManifest:
+    """
+    Describes the on-disk layout of the mirror.
+
+    Attributes:
+    - n_dates: rows in dates.bin and in every field file
+    - capacity: allocated columns in every field file, >= len(tickers)
+    - tickers: column order of the field files
+    - last_synced: dict[ticker, 'YYYY-MM-DD'] of the last date copied
+    """
+    version: int = MANIFEST_VERSION
+    dtype: str = "float64"
+    n_dates: int = 0
+    capacity: int = 0
+    tickers: list[str] = field(default_factory=list)
+    last_synced: dict[str, str] = field(default_factory=dict)
+    synced_at: str | None = None
+
+
+class ColumnarMirror:
+    """
+    Local, memory-mapped columnar copy of the daily OHLCV history.
+
+    Layout under root (default data/mirror):
+    - manifest.json: MirrorManifest
+    - dates.bin: int64 days since epoch, one per trading date, ascending
+    - <field>.bin: C-ordered (n_dates, capacity) matrix per field, NaN where a
+    ticker has no row that day
+
+    New trading days are appended to the end of the files, so a daily sync
+    only writes the new rows. Columns are allocated with spare capacity so new
+    tickers rarely force a rewrite. Reads return DataFrames that are views on
+    the mapped files, nothing is copied until the caller selects columns.
+    """
+    def __init__(self, root: Path | None = None) -> None:
+        self._root = root if root is not None else data_dir() / "mirror"
+        self._manifest: MirrorManifest | None = None
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def exists(self) -> bool:
+        return (self._root / "manifest.json").exists()
+
+    @property
+    def manifest(self) -> MirrorManifest:
+        if self._manifest is None:
+            self._manifest = self._read_manifest()
+        return self._manifest
+
+    @property
+    def tickers(self) -> list[str]:
+        return self.manifest.tickers
+
+    #Local helpers
+    def _path(self, name: str) -> Path:
+        return self._root / f"{name}.bin"
+
+    def _read_manifest(self) -> MirrorManifest:
+        path = self._root / "manifest.json"
+        if not path.exists():
+            return MirrorManifest()
+        with path.open(encoding="utf-8") as fh:
+            raw = json.load(fh)
+        if raw.get("version") != MANIFEST_VERSION:
+            logger.warning(f"Mirror manifest version {raw.get('version')} is not supported, starting over")
+            return MirrorManifest()
+        return MirrorManifest(**raw)
+
+    def _write_manifest(self, manifest: MirrorManifest) -> None:
+        """
+        Writes the manifest atomically, it is always the last file written by
+        a sync so a crash leaves the previous manifest in place
+        """
+        tmp = self._root / "manifest.json.tmp"
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(asdict(manifest), fh)
+        os.replace(tmp, self._root / "manifest.json")
+        self._manifest = manifest
+
+    def _days(self, manifest: MirrorManifest) -> np.ndarray:
+        if manifest.n_dates == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self._path("dates"), dtype=np.int64, mode="r", shape=(manifest.n_dates,))
+
+    def _matrix(self, name: str, manifest: MirrorManifest, mode: str = "r") -> np.memmap:
+        return np.memmap(
+            self._path(name),
+            dtype=np.dtype(manifest.dtype),
+            mode=mode,
+            shape=(manifest.n_dates, manifest.capacity),
+        )
+
+    def _relayout(self, manifest: MirrorManifest, new_days: np.ndarray, capacity: int, chunk_rows: int = 4096) -> None:
+        """
+        Rewrites every field file for a new date axis and/or column capacity.
+        Only needed when dates are inserted before the end of the axis or when
+        the ticker count outgrows the capacity.
+        """
+        dtype = np.dtype(manifest.dtype)
+        old_days = self._days(manifest)
+        rows = np.searchsorted(new_days, old_days)
+        n_cols = min(len(manifest.tickers), manifest.capacity)
+        for name in FIELDS:
+            tmp = self._root / f"{name}.bin.tmp"
+            new = np.memmap(tmp, dtype=dtype, mode="w+", shape=(max(len(new_days), 1), capacity))
+            new[:] = np.nan
+            if manifest.n_dates:
+                old = self._matrix(name, manifest)
+                for a in range(0, manifest.n_dates, chunk_rows):
+                    b = min(a + chunk_rows, manifest.n_dates)
+                    new[rows[a:b], :n_cols] = old[a:b, :n_cols]
+                del old
+            new.flush()
+            del new
+            os.replace(tmp, self._path(name))
+        np.asarray(new_days, dtype=np.int64).tofile(self._path("dates"))
+        manifest.n_dates = len(new_days)
+        manifest.capacity = capacity
+
+    def _append_days(self, manifest: MirrorManifest, days: np.ndarray) -> None:
+        """
+        Appends NaN rows for new trading days at the end of every field file
+        """
+        dtype = np.dtype(manifest.dtype)
+        row_bytes = manifest.capacity * dtype.itemsize
+        filler = np.full((len(days), manifest.capacity), np.nan, dtype=dtype)
+        for name in FIELDS:
+            path = self._path(name)
+            #Drop rows left behind by an interrupted sync before appending
+            os.truncate(path, manifest.n_dates * row_bytes)
+            with path.open("ab") as fh:
+                filler.tofile(fh)
+        path = self._path("dates")
+        os.truncate(path, manifest.n_dates * 8)
+        with path.open("ab") as fh:
+            np.asarray(days, dtype=np.int64).tofile(fh)
+        manifest.n_dates += len(days)
+
+    def _plan(self, manifest: MirrorManifest, last_dates: Mapping[str, date | None], since: Mapping[str, date | None]) -> dict[str, date | None]:
+        """
+        Decides which tickers need syncing and from which date, None meaning
+        the whole history
+        """
+        plan: dict[str, date | None] = {}
+        for ticker, last in last_dates.items():
+            if last is None:
+                continue
+            synced_raw = manifest.last_synced.get(ticker)
+            synced = date.fromisoformat(synced_raw) if synced_raw else None
+            forced = since.get(ticker)
+            if synced is None:
+                plan[ticker] = None
+            elif forced is not None and forced <= synced:
+                plan[ticker] = forced
+            elif last > synced:
+                plan[ticker] = synced + timedelta(days=1)
+        return plan
+
+    def _write_rows(self, manifest: MirrorManifest, df: DataFrame, plan: Mapping[str, date | None]) -> int:
+        """
+        Writes a long dataframe of OHLCV rows into the field files. The part of
+        each ticker column covered by the sync is cleared first, so rows that
+        were removed from the DB do not linger in the mirror.
+        """
+        days = self._days(manifest)
+        cols_index = pd.Index(manifest.tickers)
+        mats = {name: self._matrix(name, manifest, mode="r+") for name in FIELDS}
+
+        for ticker in df["ticker"].unique():
+            col = cols_index.get_loc(ticker)
+            start = plan.get(ticker)
+            row0 = 0 if start is None else int(np.searchsorted(days, _to_days([start])[0]))
+            for name in FIELDS:
+                mats[name][row0:, col] = np.nan
+
+        rows = np.searchsorted(days, _to_days(df["date"]))
+        cols = cols_index.get_indexer(df["ticker"])
+        for name in FIELDS:
+            mats[name][rows, cols] = pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=manifest.dtype)
+            mats[name].flush()
+        return len(df)
+
+    # Methods
+    def sync(self, repo: MirrorSource, *, since: Mapping[str, date | None] | None = None, chunk_size: int = 250) -> int:
+        """
+        Brings the mirror up to date with the DB.
+
+        Params:
+        - repo: the repository to copy from
+        - since: optional dict[ticker, date] of the earliest date rewritten
+        during the last update, forces those tickers to be re-copied from that
+        date (e.g. after a corporate action rewrote the history)
+        - chunk_size: tickers fetched per query
+
+        Returns:
+        - int: number of rows written
+        """
+        logger.debug("Start ..")
+        self._root.mkdir(parents=True, exist_ok=True)
+        manifest = self._read_manifest()
+        plan = self._plan(manifest, repo.last_ohlcv_date_for_all_tickers(), since or {})
+        if not plan:
+            logger.info("Mirror is up to date")
+            return 0
+
+        #Extend the date axis
+        starts = [d for d in plan.values() if d is not None]
+        earliest = None if len(starts) < len(plan) else min(starts)
+        incoming = _to_days(repo.list_trading_dates(since=earliest))
+        days = np.asarray(self._days(manifest))
+        merged = np.union1d(days, incoming)
+
+        #Extend the ticker columns
+        known = set(manifest.tickers)
+        new_tickers = sorted(t for t in plan if t not in known)
+        manifest.tickers = manifest.tickers + new_tickers
+        capacity = manifest.capacity
+        if len(manifest.tickers) > capacity:
+            capacity = max(len(manifest.tickers), int(capacity * 1.5) + 64)
+
+        if capacity != manifest.capacity or (len(days) and len(merged) > len(days) and merged[len(days) - 1] != days[-1]):
+            logger.info(f"Mirror relayout: dates {len(days)} -> {len(merged)}, capacity {manifest.capacity} -> {capacity}")
+            self._relayout(manifest, merged, capacity)
+        elif len(merged) > len(days):
+            self._append_days(manifest, merged[len(days):])
+
+        #Copy rows in ticker chunks to keep memory bounded
+        written = 0
+        tickers = sorted(plan)
+        for i in range(0, len(tickers), chunk_size):
+            chunk = {t: plan[t] for t in tickers[i:i + chunk_size]}
+            df = repo.fetch_ohlcv_since(chunk)
+            if df.empty:
+                continue
+            written += self._write_rows(manifest, df, chunk)
+            last = df.groupby("ticker")["date"].max()
+            for ticker, d in last.items():
+                manifest.last_synced[str(ticker)] = d.isoformat()
+
+        manifest.synced_at = datetime.now().isoformat(timespec="seconds")
+        self._write_manifest(manifest)
+        logger.info(f"Mirror synced: {len(plan)} tickers, {written} rows")
+        logger.debug("End ..")
+        return written
+
+    def frame(self, name: str, *, start_date: date | None = None, end_date: date | None = None) -> DataFrame:
+        """
+        Returns a wide (dates x tickers) DataFrame for one field between two
+        dates (inclusive). The values are a read-only view on the mapped file.
+        """
+        if name not in FIELDS:
+            raise ValueError(f"Unknown mirror field: {name}")
+        manifest = self.manifest
+        if manifest.n_dates == 0:
+            return DataFrame()
+        days = self._days(manifest)
+        a = 0 if start_date is None else int(np.searchsorted(days, _to_days([start_date])[0], side="left"))
+        b = len(days) if end_date is None else int(np.searchsorted(days, _to_days([end_date])[0], side="right"))
+        values = self._matrix(name, manifest)[a:b, :len(manifest.tickers)]
+        index = pd.DatetimeIndex(np.asarray(days[a:b]).astype("datetime64[D]").astype("datetime64[ns]"), name="date")
+        columns = pd.Index(manifest.tickers, name="ticker")
+        return DataFrame(values, index=index, columns=columns, copy=False)
+
+    def fetch_adjclose_series(self, ticker: str, period: str) -> DataFrame:
+        """
+        Mirror counterpart of MarketRepo.fetch_adjclose_series.
+
+        Params:
+        - ticker: e.g. "AAPL"
+        - period: eg.. "30d", "6m"
+
+        Returns:
+        - dataframe with columns date and adjclose(float)
+        """
+        t = ticker.strip().upper()
+        manifest = self.manifest
+        if t not in manifest.tickers or manifest.n_dates == 0:
+            return pd.DataFrame(columns=["date", "adjclose"]) #type: ignore
+        col = manifest.tickers.index(t)
+        values = self._matrix("adjclose", manifest)[:, col]
+        present = np.flatnonzero(~np.isnan(values))
+        if len(present) == 0:
+            return pd.DataFrame(columns=["date", "adjclose"]) #type: ignore
+        days = self._days(manifest)
+        end_date = _from_days(days[present[-1]])
+        start_date, end_date = period_to_date(period, end_date=end_date)
+        if start_date is not None:
+            present = present[days[present] >= _to_days([start_date])[0]]
+        return pd.DataFrame({
+            "date": pd.to_datetime(np.asarray(days[present]).astype("datetime64[D]")),
+            "adjclose": values[present],
+        })
+
+
+def _to_days(dates) -> np.ndarray:
+    """
+    Converts an iterable of dates to int64 days since epoch
+    """
+    return np.asarray(list(dates) if not hasattr(dates, "dtype") else dates, dtype="datetime64[D]").astype(np.int64)
+
+def _from_days(days: int) -> date:
+    return date(1970, 1, 1) + timedelta(days=int(days))
@@ -1,7 +1,9 @@
 from dataclasses import dataclass
 
+from trilobite.db.duck.repo import DuckMarketRepo
 from trilobite.db.repo import MarketRepo
 from trilobite.marketdata.marketservice import MarketService
+from trilobite.mirror.mirror import ColumnarMirror
 from trilobite.tickers.tickerservice import TickerService
 
 @dataclass
@@ -9,6 +11,7 @@ class AppState:
     """
     Stores the state of different objects needed by App
     """
-    repo: MarketRepo
+    repo: MarketRepo | DuckMarketRepo
     market: MarketService
     ticker: TickerService
+    mirror: ColumnarMirror
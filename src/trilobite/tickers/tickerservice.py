@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 from typing import Protocol
 from datetime import date, timedelta
@@ -27,6 +28,23 @@ class TickerRepo(Protocol):
     def deactivate_tickers(self, tickers: list[str]) -> int:
         ...
 
+class AsyncTickerRepo(Protocol):
+    """
+    Async counterpart of TickerRepo, implemented by AsyncMarketRepo and used
+    by AsyncTickerService
+    """
+    async def last_ohlcv_date_for_all_tickers(self) -> dict[str, date | None]:
+        ...
+
+    async def ensure_instrument(self, ticker: str) -> int:
+        ...
+
+    async def list_active_tickers(self) -> list[str]:
+        ...
+
+    async def deactivate_tickers(self, tickers: list[str]) -> int:
+        ...
+
 @dataclass(frozen=True)
 class Ticker:
     """
@@ -37,12 +55,11 @@ class Ticker:
     check_corporate_actions: bool
 
 
-class TickerService:
+class _TickerServiceBase:
     """
-    Keeps track of currently active tickers on the market
+    Repo independent parts of TickerService and AsyncTickerService
     """
-    def __init__(self, repo: TickerRepo, tickerclient: TickerClient, cfg_ts: CFGTickerService, cfg_dev: CFGDev) -> None:
-        self._repo = repo
+    def __init__(self, tickerclient: TickerClient, cfg_ts: CFGTickerService, cfg_dev: CFGDev) -> None:
         self._tickerclient = tickerclient
         self._cfg_ts = cfg_ts
         self._cfg_dev = cfg_dev
@@ -104,6 +121,43 @@ class TickerService:
             check_corporate_actions = self._flag_lastdate(lastdate),
             )
 
+    def _todays_tickers(self) -> list[str]:
+        """
+        Gets todays list of tickers from tickerclient, or the fixed dev list
+        """
+        tickers = self._tickerclient.get_todays_tickers()
+        if self._cfg_dev.dev:
+            tickers = ["AAPL", "GOOGL", "DIS", "NVDA", "CAT", "META", "TSLA"]
+        logger.info(f"Retrieved updated list of tickers(dev={self._cfg_dev.dev})")
+        return tickers
+
+    def _build_tickermap(self, fullupdate: bool) -> list[Ticker]:
+        """
+        Turns _ticker_dict (as returned by the repo) into Ticker objects, after
+        adding new tickers and pruning tickers no longer in _ticker_list
+        """
+        self._populate_missing_tickers()
+        self._prune_missing_tickers()
+
+        if fullupdate:
+            logger.info(f"fullupdate True: Resetting all dates to None")
+            for key, val in self._ticker_dict.items():
+                self._ticker_dict[key] = None
+
+        tickermap = []
+        for key, val in self._ticker_dict.items():
+            tickermap.append(self._build_ticker_objects(tickersymbol=key, lastdate=val))
+        return tickermap
+
+
+class TickerService(_TickerServiceBase):
+    """
+    Keeps track of currently active tickers on the market
+    """
+    def __init__(self, repo: TickerRepo, tickerclient: TickerClient, cfg_ts: CFGTickerService, cfg_dev: CFGDev) -> None:
+        super().__init__(tickerclient=tickerclient, cfg_ts=cfg_ts, cfg_dev=cfg_dev)
+        self._repo = repo
+
     def _reconsile_instruments(self, todays_tickers: list[str]) -> list[str]:
         """
         Ensure todays tickers exist, and are active in the DB, and deactivate DB
@@ -142,31 +196,61 @@ class TickerService:
         - dict{key:ticker, value:date_of_last_entry}
         """
         logger.debug("Start ..")
-        self._ticker_list = self._tickerclient.get_todays_tickers()
+        self._ticker_list = self._todays_tickers()
 
-        if self._cfg_dev.dev:
-            self._ticker_list = ["AAPL", "GOOGL", "DIS", "NVDA", "CAT", "META", "TSLA"]
-        else:
-            self._ticker_list = self._ticker_list
-        
-        logger.info(f"Retrieved updated list of tickers(dev={self._cfg_dev.dev})")
         deactivated = self._reconsile_instruments(self._ticker_list)
         logger.info(f"The following tickers were deactivated: {deactivated}")
 
         self._ticker_dict = self._repo.last_ohlcv_date_for_all_tickers()
+        tickermap = self._build_tickermap(fullupdate)
 
-        self._populate_missing_tickers()
-        self._prune_missing_tickers()
+        #Update to dataclass object later?
+        logger.debug("End ..")
+        return tickermap
 
-        if fullupdate:
-            logger.info(f"fullupdate True: Resetting all dates to None")
-            for key, val in self._ticker_dict.items():
-                self._ticker_dict[key] = None
 
-        tickermap = []
-        for key, val in self._ticker_dict.items():
-            tickermap.append(self._build_ticker_objects(tickersymbol=key, lastdate=val))
+class AsyncTickerService(_TickerServiceBase):
+    """
+    TickerService on top of an AsyncTickerRepo. The instrument upserts of the
+    reconciliation run concurrently, bounded by the repo's connection pool.
+    """
+    def __init__(self, repo: AsyncTickerRepo, tickerclient: TickerClient, cfg_ts: CFGTickerService, cfg_dev: CFGDev) -> None:
+        super().__init__(tickerclient=tickerclient, cfg_ts=cfg_ts, cfg_dev=cfg_dev)
+        self._repo = repo
 
-        #Update to dataclass object later?
+    async def _reconsile_instruments(self, todays_tickers: list[str]) -> list[str]:
+        """
+        Async version of TickerService._reconsile_instruments
+
+        Returns:
+        - list: tickers that were missing and got deactivated
+        """
+        todays_set = {t.strip().upper() for t in todays_tickers if t and t.strip()}
+        await asyncio.gather(*(self._repo.ensure_instrument(t) for t in todays_set))
+
+        active_db = set(await self._repo.list_active_tickers())
+        missing = sorted(active_db - todays_set)
+
+        if missing:
+            await self._repo.deactivate_tickers(missing)
+
+        return missing
+
+    async def update(self, fullupdate=False) -> list[Ticker]:
+        """
+        Async version of TickerService.update, the ticker list download runs 
+        in a worker thread so it doesn't block the event loop
+
+        Returns:
+        - list of Ticker objects
+        """
+        logger.debug("Start ..")
+        self._ticker_list = await asyncio.to_thread(self._todays_tickers)
+
+        deactivated = await self._reconsile_instruments(self._ticker_list)
+        logger.info(f"The following tickers were deactivated: {deactivated}")
+
+        self._ticker_dict = await self._repo.last_ohlcv_date_for_all_tickers()
+        tickermap = self._build_tickermap(fullupdate)
         logger.debug("End ..")
         return tickermap
@@ -8,11 +8,20 @@ from tqdm import tqdm
 
 from trilobite.cli.runtimeflags import CliFlags
 from trilobite.commands.uicommands import (
+    CmdBacktest,
+    CmdCompactCold,
     CmdDisplayGraph,
+    CmdExport,
     CmdNotAnOption, 
+    CmdPredict,
     CmdQuit,
+    CmdRebuildStats,
+    CmdSyncDuckDB,
+    CmdSweep,
+    CmdSyncMirror,
     CmdTrainNN, 
     CmdUpdateAll,
+    CmdUpdateIntraday,
     Command, 
 )
 from trilobite.config.config import CFGAnalysis
@@ -39,12 +48,39 @@ class CLIController:
         if self._flags.updateall:
             self._flags.updateall = False
             return CmdUpdateAll()
+        elif self._flags.update_intraday:
+            self._flags.update_intraday = False
+            return CmdUpdateIntraday()
         elif self._flags.train_nn:
             self._flags.train_nn = False
             return CmdTrainNN()
+        elif self._flags.predict:
+            self._flags.predict = False
+            return CmdPredict()
+        elif self._flags.backtest:
+            self._flags.backtest = False
+            return CmdBacktest()
+        elif self._flags.sweep:
+            self._flags.sweep = False
+            return CmdSweep()
         elif self._flags.display_graph:
             self._flags.display_graph = False
             return CmdDisplayGraph()
+        elif self._flags.rebuild_stats:
+            self._flags.rebuild_stats = False
+            return CmdRebuildStats()
+        elif self._flags.sync_mirror:
+            self._flags.sync_mirror = False
+            return CmdSyncMirror()
+        elif self._flags.sync_duckdb:
+            self._flags.sync_duckdb = False
+            return CmdSyncDuckDB()
+        elif self._flags.compact_cold:
+            self._flags.compact_cold = False
+            return CmdCompactCold()
+        elif self._flags.export:
+            self._flags.export = False
+            return CmdExport()
         else:
             return CmdQuit()
 
@@ -14,6 +14,18 @@ def stagger_requests(mintime: float = 0.1, maxtime: float = 0.3) -> float:
         mintime, maxtime = maxtime, mintime
     return random.uniform(mintime, maxtime)
 
+def failure_backoff(streak: int, *, min_streak: int, ttl_hours: float, max_ttl_days: float) -> timedelta:
+    """
+    How long a ticker that failed `streak` times in a row is skipped. Nothing
+    below min_streak, then ttl_hours doubled for every failure after that, 
+    capped at max_ttl_days.
+    """
+    if streak < min_streak:
+        return timedelta(0)
+    #Capped before the timedelta is built, which overflows past ~2.7M years
+    hours = min(ttl_hours * 2 ** min(streak - min_streak, 32), max_ttl_days * 24)
+    return timedelta(hours=hours)
+
 def period_to_date(period: str, *, end_date: date) -> Tuple[Optional[date], date]:
     """
     Converts a period like '12d', '12w', '12m', '12y' 'max' into start_date
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+#Trading days of the fixture data
+DAYS = pd.bdate_range("2024-01-02", "2024-02-29")
+
+
+def ohlcv_frame(days: pd.DatetimeIndex, *, close: float = 10.0, volume: int = 1000, drift: float = 0.01) -> pd.DataFrame:
+    """
+    Daily OHLCV rows in the yfinance layout the repos upsert, with a close
+    growing by `drift` a day
+    """
+    px = close * np.cumprod(np.full(len(days), 1.0 + drift))
+    return pd.DataFrame({
+        "date": days,
+        "open": px,
+        "high": px,
+        "low": px,
+        "close": px,
+        "adjclose": px,
+        "volume": volume,
+        "dividends": 0.0,
+        "stocksplits": 0.0,
+    })
+
+
+@pytest.fixture
+def duck_repo():
+    """
+    DuckMarketRepo on an empty in-memory database
+    """
+    duckdb = pytest.importorskip("duckdb")
+    from trilobite.db.duck.repo import DuckMarketRepo
+    from trilobite.db.duck.schema import create_schema
+
+    conn = duckdb.connect(":memory:")
+    create_schema(conn)
+    yield DuckMarketRepo(conn)
+    conn.close()
+
+
+@pytest.fixture
+def pg_repo():
+    """
+    MarketRepo on a scratch schema of the Postgres database given by the
+    libpq connection string in TRILOBITE_TEST_DSN, skipped when it is not
+    set. The schema is dropped afterwards.
+    """
+    dsn = os.getenv("TRILOBITE_TEST_DSN")
+    if not dsn:
+        pytest.skip("TRILOBITE_TEST_DSN is not set")
+    psycopg = pytest.importorskip("psycopg")
+    from trilobite.db.repo import MarketRepo
+    from trilobite.db.schema import create_schema
+
+    schema = f"trilobite_test_{uuid.uuid4().hex[:12]}"
+    conn = psycopg.connect(dsn)
+    conn.execute(f"CREATE SCHEMA {schema}")
+    conn.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    try:
+        create_schema(conn)
+        yield MarketRepo(conn)
+    finally:
+        conn.rollback()
+        conn.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def fill_market(repo):
+    """
+    Four tickers over DAYS:
+    - AAA: every day
+    - BBB: every day but the 6th
+    - CCC: from the 4th day on, at a price of 2
+    - DDD: every day, low volume and inactive
+    """
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("AAA"), ohlcv_frame(DAYS))
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("BBB"), ohlcv_frame(DAYS.delete(5), drift=-0.005))
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("CCC"), ohlcv_frame(DAYS[3:], close=2.0, drift=0.02))
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("DDD"), ohlcv_frame(DAYS, volume=10, drift=0.0))
+    repo.deactivate_tickers(["DDD"])
+    return repo
+
+
+@pytest.fixture
+def market(duck_repo):
+    """
+    duck_repo filled by fill_market
+    """
+    return fill_market(duck_repo)
+
+
+@pytest.fixture
+def pg_market(pg_repo):
+    """
+    pg_repo filled by fill_market
+    """
+    return fill_market(pg_repo)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.conftest import DAYS
+from trilobite.analysis.datasource import MarketDataSource
+from trilobite.analysis.features import check_dtype, prices_to_log_returns
+from trilobite.db.screen import Screen
+from trilobite.mirror.mirror import ColumnarMirror
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_check_dtype(dtype):
+    assert check_dtype(dtype) == np.dtype(dtype)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int64", "double", np.float32, ""])
+def test_check_dtype_rejects(dtype):
+    with pytest.raises(ValueError):
+        check_dtype(dtype)
+
+
+def test_log_returns_float32_matches_float64():
+    rng = np.random.default_rng(0)
+    px = pd.DataFrame(
+        100 * np.exp(np.cumsum(rng.normal(0, 0.02, (250, 30)), axis=0)),
+        index=pd.bdate_range("2023-01-02", periods=250),
+    )
+    px.iloc[40, 3] = np.nan
+    px.iloc[90, 7] = 0.0
+    f64 = prices_to_log_returns(px)
+    f32 = prices_to_log_returns(px, dtype="float32")
+    assert f64.dtypes.unique().tolist() == [np.dtype("float64")]
+    assert f32.dtypes.unique().tolist() == [np.dtype("float32")]
+    #The days next to the missing and the zero price are dropped in both
+    assert len(f64) == 249 - 4
+    assert f32.index.equals(f64.index)
+    np.testing.assert_allclose(f32.to_numpy(), f64.to_numpy(), rtol=0, atol=1e-6)
+    with np.errstate(divide="ignore"):
+        ref = np.log(px / px.shift(1))
+    np.testing.assert_allclose(f64.to_numpy(), ref.loc[f64.index], rtol=1e-12)
+
+
+def test_log_returns_of_a_read_only_view():
+    values = np.linspace(1.0, 2.0, 20).reshape(10, 2)
+    values.flags.writeable = False
+    rets = prices_to_log_returns(pd.DataFrame(values, copy=False), dtype="float32")
+    np.testing.assert_allclose(rets.to_numpy(), np.log(values[1:] / values[:-1]), rtol=1e-6)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+@pytest.mark.parametrize("use_mirror", [False, True])
+def test_datasource_returns_its_dtype(market, tmp_path, dtype, use_mirror):
+    mirror = None
+    if use_mirror:
+        mirror = ColumnarMirror(tmp_path / "mirror")
+        mirror.sync(market)
+    ds = MarketDataSource(market, mirror, dtype=dtype)
+    assert ds.dtype == dtype
+    end = DAYS[-1].date()
+    frames = [
+        ds.load_adjclose_matrix(period="90d", end_date=end),
+        ds.load_adjclose_matrix(period="90d", end_date=end, screen=Screen().min_coverage(0.5)),
+        ds.load_returns_matrix(period="90d", end_date=end),
+        *ds.iter_returns_chunks(period="90d", end_date=end, chunk_days=20),
+    ]
+    for wide in frames:
+        assert not wide.empty
+        assert wide.dtypes.unique().tolist() == [np.dtype(dtype)]
+
+
+def test_datasource_rejects_other_dtypes(duck_repo):
+    with pytest.raises(ValueError):
+        MarketDataSource(duck_repo, dtype="float16")
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from trilobite.analysis.trainers.artifacts import (
+    ARTIFACT_VERSION,
+    MANIFEST,
+    latest_artifact,
+    list_artifacts,
+    read_manifest,
+    write_artifact,
+)
+
+
+def write(root, **manifest):
+    return write_artifact(root, manifest, lambda path: (path / "data.txt").write_text("x"))
+
+
+def test_write_artifact_numbers_and_manifest(tmp_path):
+    root = tmp_path / "models"
+    assert latest_artifact(root) is None
+    first, second = write(root, n=1), write(root, n=2)
+    assert (first.name, second.name) == ("0001", "0002")
+    assert list_artifacts(root) == [first, second]
+    assert latest_artifact(root) == second
+    manifest = read_manifest(second)
+    assert manifest["version"] == ARTIFACT_VERSION
+    assert manifest["n"] == 2
+    assert "created_at" in manifest
+    assert (second / "data.txt").read_text() == "x"
+    assert sorted(p.name for p in root.iterdir()) == ["0001", "0002"]
+
+
+def test_latest_artifact_skips_unfinished_writes(tmp_path):
+    root = tmp_path / "models"
+    done = write(root)
+    (root / ".0002.tmp").mkdir()
+    (root / "0003").mkdir()
+    (root / "notes").mkdir()
+    assert list_artifacts(root) == [done]
+    assert latest_artifact(root) == done
+    #The next artifact goes past the unfinished one instead of onto it
+    assert write(root).name == "0004"
+
+
+def test_failed_write_leaves_nothing(tmp_path):
+    root = tmp_path / "models"
+
+    def fail(path):
+        (path / "data.txt").write_text("x")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_artifact(root, {}, fail)
+    assert list(root.iterdir()) == []
+
+
+def test_read_manifest_rejects_other_versions(tmp_path):
+    path = write(tmp_path / "models")
+    manifest = read_manifest(path)
+    manifest["version"] = ARTIFACT_VERSION + 1
+    (path / MANIFEST).write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        read_manifest(path)
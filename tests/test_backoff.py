@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+from trilobite.utils.utils import failure_backoff
+
+
+def backoff(streak: int) -> timedelta:
+    return failure_backoff(streak, min_streak=2, ttl_hours=6, max_ttl_days=7)
+
+
+def test_no_backoff_below_min_streak():
+    assert backoff(0) == timedelta(0)
+    assert backoff(1) == timedelta(0)
+
+
+def test_backoff_doubles_per_failure():
+    assert backoff(2) == timedelta(hours=6)
+    assert backoff(3) == timedelta(hours=12)
+    assert backoff(4) == timedelta(hours=24)
+
+
+def test_backoff_is_capped():
+    assert backoff(7) == timedelta(days=7)
+    #The exponent is bounded, a long streak does not overflow timedelta
+    assert backoff(10_000) == timedelta(days=7)
+
+
+def test_fetch_failures_round_trip(duck_repo):
+    repo = duck_repo
+    repo.ensure_instrument("AAA")
+    repo.ensure_instrument("BBB")
+    now = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+
+    repo.record_fetch_failure("aaa", "no data", streak=1, failed_at=now, retry_after=now)
+    later = now + timedelta(days=1)
+    repo.record_fetch_failure("AAA", "timeout", streak=2, failed_at=later, retry_after=later + backoff(2))
+    repo.record_fetch_failure("BBB", "no data", streak=1, failed_at=now, retry_after=now)
+
+    failures = repo.list_fetch_failures()
+    assert set(failures) == {"AAA", "BBB"}
+    f = failures["AAA"]
+    assert (f.reason, f.streak) == ("timeout", 2)
+    assert f.first_failed_at == now
+    assert f.last_failed_at == later
+    assert f.retry_after == later + timedelta(hours=6)
+
+    assert repo.clear_fetch_failures(["AAA"]) == 1
+    assert set(repo.list_fetch_failures()) == {"BBB"}
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from trilobite.analysis.backtest import BacktestSpec, WalkForwardBacktest, direction_metrics, plan_folds
+from trilobite.analysis.trainers.nn_direction import NNDirectionsConfig
+
+
+def test_plan_folds_expanding():
+    folds = plan_folds(300, BacktestSpec(train_days=100, refit_every=60), lookback=20, horizon=1)
+    assert [(f.train_lo, f.train_hi, f.test_lo, f.test_hi) for f in folds] == [
+        (0, 100, 100, 160),
+        (0, 160, 160, 220),
+        (0, 220, 220, 280),
+        (0, 280, 280, 299),
+    ]
+    assert [f.number for f in folds] == [0, 1, 2, 3]
+
+
+def test_plan_folds_rolling():
+    folds = plan_folds(300, BacktestSpec(window="rolling", train_days=100, refit_every=60), lookback=20, horizon=5)
+    for f in folds:
+        assert f.train_hi - f.train_lo == 100
+        assert f.test_lo == f.train_hi
+    #The last test date still has a return horizon rows later
+    assert folds[-1].test_hi == 295
+
+
+def test_plan_folds_needs_enough_rows():
+    with pytest.raises(ValueError):
+        plan_folds(300, BacktestSpec(train_days=21), lookback=20, horizon=1)
+    with pytest.raises(ValueError):
+        plan_folds(101, BacktestSpec(train_days=100), lookback=20, horizon=1)
+
+
+@pytest.mark.parametrize("kwargs", [{"window": "sliding"}, {"refit_every": 0}, {"top_n": 0}])
+def test_invalid_spec(kwargs):
+    with pytest.raises(ValueError):
+        BacktestSpec(**kwargs)
+
+
+def brute_auc(p: np.ndarray, up: np.ndarray) -> float:
+    pos, neg = p[up], p[~up]
+    pairs = [(a > b) + 0.5 * (a == b) for a in pos for b in neg]
+    return float(np.mean(pairs))
+
+
+def test_direction_metrics():
+    probs = np.array([
+        [0.9, 0.8, 0.2, 0.1],
+        [0.6, 0.6, 0.4, 0.7],
+        [0.5, 0.5, 0.5, 0.5],
+    ])
+    realized = np.array([
+        [0.01, 0.02, -0.01, -0.03],
+        [0.01, -0.02, 0.01, -0.01],
+        [0.01, 0.01, 0.02, 0.03],
+    ])
+    m = direction_metrics(probs, realized, top_n=1)
+    np.testing.assert_allclose(m["hit_rate"], [1.0, 0.25, 0.0])
+    assert m["auc"].iloc[0] == 1.0
+    assert m["auc"].iloc[1] == pytest.approx(brute_auc(probs[1], realized[1] > 0))
+    #Every ticker went up on the last date
+    assert np.isnan(m["auc"].iloc[2])
+    #Ties keep the ticker order, like Prediction.ranked
+    np.testing.assert_allclose(m["long"], np.expm1([0.01, -0.01, 0.01]))
+    np.testing.assert_allclose(m["short"], np.expm1([-0.03, 0.01, 0.03]))
+    np.testing.assert_allclose(m["long_short"], m["long"] - m["short"])
+
+
+def test_direction_metrics_random_auc():
+    rng = np.random.default_rng(0)
+    probs = rng.random((5, 30)).round(1)
+    realized = rng.normal(0, 0.01, (5, 30))
+    m = direction_metrics(probs, realized, top_n=50)
+    for d in range(5):
+        assert m["auc"].iloc[d] == pytest.approx(brute_auc(probs[d], realized[d] > 0))
+    #top_n is capped at half the tickers
+    np.testing.assert_allclose(m["long"] + m["short"], 2 * np.expm1(realized).mean(axis=1))
+
+
+def test_direction_metrics_shape_mismatch():
+    with pytest.raises(ValueError):
+        direction_metrics(np.zeros((2, 3)), np.zeros((3, 2)), top_n=1)
+
+
+def test_backtest_is_seeded():
+    rng = np.random.default_rng(1)
+    rets = pd.DataFrame(
+        rng.normal(0, 0.01, (90, 8)),
+        index=pd.bdate_range("2023-01-02", periods=90),
+        columns=[f"T{i}" for i in range(8)],
+    )
+    cfg = NNDirectionsConfig(n_factors=3, lookback=5, epochs=1, hidden_size=4)
+
+    def run(seed: int):
+        bt = WalkForwardBacktest(rets, cfg, BacktestSpec(train_days=40, refit_every=20, top_n=2, seed=seed))
+        stats = list(bt.run())
+        assert [s.fold.number for s in stats] == [0, 1, 2]
+        return bt.result()
+
+    a, b, c = run(0), run(0), run(1)
+    pd.testing.assert_frame_equal(a.probs, b.probs)
+    assert not a.probs.equals(c.probs)
+    assert a.probs.index[0] == rets.index[40]
+    assert len(a.daily) == len(rets) - 40 - 1
+    assert a.probs.notna().all().all()
@@ -0,0 +1,92 @@
+from trilobite.db.cache import ReadCache
+
+
+def test_get_miss_then_hit():
+    cache = ReadCache()
+    key = ReadCache.key("SELECT 1", (["AAPL", "MSFT"],))
+    assert cache.get(key) == (False, None)
+    cache.put(key, [(1,)], tickers=["AAPL", "MSFT"])
+    assert cache.get(key) == (True, [(1,)])
+    st = cache.stats()
+    assert (st.hits, st.misses, st.entries) == (1, 1, 1)
+    assert st.hit_rate == 0.5
+
+
+def test_key_freezes_list_params():
+    assert ReadCache.key("q", (["A", "B"], 1)) == ReadCache.key("q", (("A", "B"), 1))
+    hash(ReadCache.key("q", (["A"],)))
+
+
+def test_evicts_least_recently_used_entry():
+    cache = ReadCache(max_entries=2)
+    cache.put("a", [(1,)], tickers=["A"])
+    cache.put("b", [(2,)], tickers=["B"])
+    #Touching a makes b the least recently used
+    cache.get("a")
+    cache.put("c", [(3,)], tickers=["C"])
+    assert cache.get("b") == (False, None)
+    assert cache.get("a")[0] and cache.get("c")[0]
+    assert cache.stats().evictions == 1
+
+
+def test_evicts_by_size():
+    rows = [(i, float(i)) for i in range(100)]
+    cache = ReadCache()
+    cache.put("probe", rows, tickers=["A"])
+    size = cache.stats().bytes
+
+    cache = ReadCache(max_bytes=size * 2)
+    cache.put("a", rows, tickers=["A"])
+    cache.put("b", rows, tickers=["B"])
+    cache.put("c", rows, tickers=["C"])
+    st = cache.stats()
+    assert st.entries == 2
+    assert st.bytes <= size * 2
+    assert cache.get("a") == (False, None)
+
+
+def test_result_over_the_size_bound_is_not_stored():
+    cache = ReadCache(max_bytes=10)
+    cache.put("a", [(i,) for i in range(100)], tickers=["A"])
+    assert cache.stats().entries == 0
+
+
+def test_invalidate_drops_ticker_and_all_entries():
+    cache = ReadCache()
+    cache.put("a", [(1,)], tickers=["A"])
+    cache.put("ab", [(1,)], tickers=["A", "B"])
+    cache.put("b", [(1,)], tickers=["B"])
+    cache.put("coverage", [(1,)])
+
+    assert cache.invalidate(["A"]) == 3
+    assert cache.get("b") == (True, [(1,)])
+    for key in ("a", "ab", "coverage"):
+        assert cache.get(key) == (False, None)
+    st = cache.stats()
+    assert st.invalidations == 3
+    assert st.entries == 1
+
+
+def test_invalidate_unknown_ticker_still_drops_all_entries():
+    cache = ReadCache()
+    cache.put("a", [(1,)], tickers=["A"])
+    cache.put("coverage", [(1,)])
+    assert cache.invalidate(["ZZZ"]) == 1
+    assert cache.get("a")[0]
+
+
+def test_put_replaces_entry_and_its_tags():
+    cache = ReadCache()
+    cache.put("k", [(1,)], tickers=["A"])
+    cache.put("k", [(2,)], tickers=["B"])
+    assert cache.invalidate(["A"]) == 0
+    assert cache.get("k") == (True, [(2,)])
+
+
+def test_clear_keeps_counters():
+    cache = ReadCache()
+    cache.put("a", [(1,)], tickers=["A"])
+    cache.get("a")
+    cache.clear()
+    st = cache.stats()
+    assert (st.entries, st.bytes, st.hits, st.invalidations) == (0, 0, 1, 1)
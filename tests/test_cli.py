@@ -0,0 +1,22 @@
+from trilobite.cli.cli import parse_args
+from trilobite.config.config import CFGAnalysis
+
+
+def test_training_runtime_flags():
+    cfg, _ = parse_args([
+        "--train-threads", "3",
+        "--train-interop-threads", "2",
+        "--train-compile",
+        "--train-compile-mode", "reduce-overhead",
+    ])
+    a = cfg.analysis
+    assert (a.train_threads, a.train_interop_threads) == (3, 2)
+    assert a.train_compile
+    assert a.train_compile_mode == "reduce-overhead"
+
+
+def test_training_runtime_defaults_come_from_the_config():
+    a = parse_args([])[0].analysis
+    assert a.train_threads == CFGAnalysis.train_threads
+    assert a.train_interop_threads == CFGAnalysis.train_interop_threads
+    assert a.train_compile_mode == CFGAnalysis.train_compile_mode
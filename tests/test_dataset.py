@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from torch.utils.data import DataLoader
+
+from trilobite.analysis.dataset import (
+    BatchedWindows,
+    FactorDatasetSpec,
+    FactorWindowDirectionDataset,
+    WindowBatchSampler,
+)
+
+
+def dataset(T: int = 60, N: int = 5, K: int = 3, *, lookback: int = 7, horizon: int = 1) -> FactorWindowDirectionDataset:
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range("2023-01-02", periods=T)
+    #Every other column of a wider array, so the factor values are not contiguous
+    values = rng.standard_normal((T, 2 * K))[:, ::2]
+    factors = pd.DataFrame(values, index=index, columns=[f"F{i + 1:02d}" for i in range(K)])
+    rets = pd.DataFrame(rng.normal(0, 0.01, (T, N)), index=index, columns=[f"T{i}" for i in range(N)])
+    return FactorWindowDirectionDataset(factors, rets, FactorDatasetSpec(lookback=lookback, horizon=horizon))
+
+
+@pytest.mark.parametrize("horizon", [1, 3])
+def test_batch_equals_stacked_samples(horizon):
+    ds = dataset(horizon=horizon)
+    assert not ds._windows.is_contiguous()
+    idx = torch.tensor([0, 5, len(ds) - 1, 5, 17])
+    x, y = ds.batch(idx)
+    assert x.shape == (5, 7, 3) and y.shape == (5, 5)
+    torch.testing.assert_close(x, torch.stack([ds[int(i)][0] for i in idx]), rtol=0, atol=0)
+    torch.testing.assert_close(y, torch.stack([ds[int(i)][1] for i in idx]), rtol=0, atol=0)
+
+
+def test_samples_follow_the_frames():
+    ds = dataset(lookback=4, horizon=2)
+    assert len(ds) == 60 - 2 - 3
+    assert ds.dates[0] == pd.Timestamp("2023-01-02")
+    x, y = ds[0]
+    assert x.shape == (4, 3) and y.shape == (5,)
+
+
+def test_sampler_covers_every_index_once_per_epoch():
+    gen = torch.Generator().manual_seed(0)
+    sampler = WindowBatchSampler(103, 10, shuffle=True, generator=gen)
+    assert len(sampler) == 11
+    epochs = []
+    for _ in range(3):
+        batches = list(sampler)
+        assert [len(b) for b in batches] == [10] * 10 + [3]
+        seen = torch.cat(batches)
+        assert sorted(seen.tolist()) == list(range(103))
+        epochs.append(seen)
+    #Each epoch is shuffled anew
+    assert not torch.equal(epochs[0], epochs[1])
+
+
+def test_sampler_drop_last_and_order():
+    sampler = WindowBatchSampler(103, 10, shuffle=True, drop_last=True)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 10
+    assert len(set(torch.cat(batches).tolist())) == 100
+    ordered = torch.cat(list(WindowBatchSampler(23, 5, shuffle=False)))
+    assert torch.equal(ordered, torch.arange(23))
+    with pytest.raises(ValueError):
+        WindowBatchSampler(10, 0)
+
+
+def test_batched_loader_yields_the_dataset():
+    ds = dataset()
+    loader = DataLoader(BatchedWindows(ds), sampler=WindowBatchSampler(len(ds), 8), batch_size=None)
+    xs, ys = zip(*loader)
+    assert sum(len(x) for x in xs) == len(ds)
+    #Each sample once, in some order: compare sorted by the window's last row
+    ref = torch.stack([ds[i][0] for i in range(len(ds))])
+    got = torch.cat(xs)
+    key = lambda t: t[:, -1, 0]
+    torch.testing.assert_close(got[key(got).argsort()], ref[key(ref).argsort()])
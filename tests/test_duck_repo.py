@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.conftest import DAYS, ohlcv_frame
+
+
+def stats(repo) -> dict[str, tuple]:
+    rows = repo._fetchall(
+        "SELECT i.ticker, s.first_date, s.last_date, s.n_rows, s.last_volume "
+        "FROM instrument_stats AS s JOIN instrument AS i ON i.id = s.instrument_id ORDER BY i.ticker;"
+    )
+    return {t: rest for (t, *rest) in rows}
+
+
+def returns(repo) -> pd.DataFrame:
+    return repo._fetch_df(
+        "SELECT i.ticker, r.date, r.logret FROM returns_daily AS r "
+        "JOIN instrument AS i ON i.id = r.instrument_id ORDER BY i.ticker, r.date;"
+    )
+
+
+def test_ensure_instrument_is_idempotent(duck_repo):
+    a = duck_repo.ensure_instrument(" aapl ")
+    assert duck_repo.ensure_instrument("AAPL") == a
+    assert duck_repo.ensure_instrument("MSFT") != a
+    assert duck_repo.list_active_tickers() == ["AAPL", "MSFT"]
+
+
+def test_upsert_inserts_then_updates(duck_repo):
+    repo = duck_repo
+    iid = repo.ensure_instrument("AAA")
+    assert repo.upsert_ohlcv_daily(iid, ohlcv_frame(DAYS[:10])) == 10
+    assert repo.upsert_ohlcv_daily(iid, ohlcv_frame(DAYS[5:15], close=20.0)) == 10
+    assert repo.upsert_ohlcv_daily(iid, ohlcv_frame(DAYS[:0])) == 0
+
+    df = repo.fetch_ohlcv_since({"AAA": None})
+    assert len(df) == 15
+    assert df["close"].iloc[5] == pytest.approx(20.0 * 1.01)
+    assert repo.last_ohlcv_date_for_ticker("aaa") == DAYS[14].date()
+
+
+def test_upsert_keeps_last_duplicate_date(duck_repo):
+    iid = duck_repo.ensure_instrument("AAA")
+    df = ohlcv_frame(DAYS[:3])
+    dup = df.iloc[[-1]].assign(close=99.0)
+    assert duck_repo.upsert_ohlcv_daily(iid, pd.concat([df, dup])) == 3
+    assert duck_repo.fetch_ohlcv_since({"AAA": None})["close"].iloc[-1] == 99.0
+
+
+def test_upsert_rejects_missing_columns(duck_repo):
+    iid = duck_repo.ensure_instrument("AAA")
+    with pytest.raises(ValueError):
+        duck_repo.upsert_ohlcv_daily(iid, ohlcv_frame(DAYS[:3]).drop(columns=["volume"]))
+
+
+def test_stats_follow_upserts(market):
+    s = stats(market)
+    assert s["AAA"] == [DAYS[0].date(), DAYS[-1].date(), len(DAYS), 1000]
+    assert s["BBB"][2] == len(DAYS) - 1
+    assert s["CCC"][0] == DAYS[3].date()
+    assert s["DDD"][3] == 10
+    assert market.last_ohlcv_date_for_all_tickers()["CCC"] == DAYS[-1].date()
+
+
+def test_returns_are_log_returns_against_the_previous_row(market):
+    r = returns(market)
+    #The first row of a ticker has no previous close
+    assert len(r) == 4 * len(DAYS) - 4 - 4
+    aaa = r.loc[r["ticker"] == "AAA", "logret"].to_numpy()
+    np.testing.assert_allclose(aaa, np.log(1.01))
+    #BBB has no row on its missing day, the next row's return is taken
+    #against the close before the gap
+    bbb = r.loc[r["ticker"] == "BBB"].set_index("date")["logret"]
+    assert DAYS[5] not in bbb.index
+    assert bbb.loc[DAYS[6]] == pytest.approx(np.log(0.995))
+
+
+def test_incremental_updates_match_rebuilds(market):
+    more = pd.bdate_range(DAYS[-1] + pd.Timedelta(days=1), periods=5)
+    market.upsert_ohlcv_daily(market.ensure_instrument("AAA"), ohlcv_frame(more, close=50.0))
+    market.upsert_ohlcv_daily(market.ensure_instrument("BBB"), ohlcv_frame(DAYS[10:20], close=3.0))
+    incremental_stats, incremental_returns = stats(market), returns(market)
+
+    assert market.rebuild_instrument_stats() == 4
+    market.rebuild_returns_daily()
+    assert stats(market) == incremental_stats
+    pd.testing.assert_frame_equal(returns(market), incremental_returns)
+
+
+def test_returns_matrix(market):
+    from trilobite.analysis.datasource import MarketDataSource
+
+    end = DAYS[-1].date()
+    wide = MarketDataSource(market, dtype="float32").load_returns_matrix(period="90d", end_date=end)
+    #Only the full coverage tickers, and the first day has no return
+    assert list(wide.columns) == ["AAA", "DDD"]
+    assert len(wide) == len(DAYS) - 1
+    assert wide.dtypes.unique().tolist() == [np.dtype("float32")]
+    np.testing.assert_allclose(wide["AAA"], np.log(1.01), rtol=1e-5)
+
+
+def test_deactivate_tickers(market):
+    assert market.deactivate_tickers(["AAA", "DDD"]) == 1
+    assert market.list_active_tickers() == ["BBB", "CCC"]
+    assert market.deactivate_tickers([]) == 0
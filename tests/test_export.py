@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.conftest import DAYS, ohlcv_frame
+
+pytest.importorskip("pyarrow")
+import pyarrow.dataset as pads
+
+from trilobite.export.exporter import STATE_FILE, _read_state, export_dataset
+
+
+def read(path, fmt: str = "parquet", partitioning: str | None = None) -> pd.DataFrame:
+    ds = pads.dataset(path, format="ipc" if fmt == "arrow" else fmt, partitioning=partitioning, exclude_invalid_files=True)
+    return ds.to_table().to_pandas()
+
+
+def add_days(repo, ticker: str, n: int) -> pd.DatetimeIndex:
+    days = pd.bdate_range(DAYS[-1] + pd.Timedelta(days=1), periods=n)
+    repo.upsert_ohlcv_daily(repo.ensure_instrument(ticker), ohlcv_frame(days, close=30.0))
+    return days
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_full_long_export(market, tmp_path, fmt):
+    res = export_dataset(market, "ohlcv", root=tmp_path, fmt=fmt, batch_rows=50)
+    assert not res.incremental
+    assert res.rows == 4 * len(DAYS) - 4
+    assert res.last_date == DAYS[-1].date()
+    assert res.files == 1
+    df = read(res.path, fmt)
+    assert len(df) == res.rows
+    assert sorted(df["ticker"].unique()) == ["AAA", "BBB", "CCC", "DDD"]
+    assert (res.path / STATE_FILE).exists()
+    #The temporary directory was moved into place
+    assert [p.name for p in tmp_path.iterdir()] == ["ohlcv"]
+
+
+def test_partitioned_by_ticker(market, tmp_path):
+    res = export_dataset(market, "returns", root=tmp_path, partition_by="ticker")
+    assert sorted(p.name for p in res.path.iterdir() if p.is_dir()) == ["ticker=AAA", "ticker=BBB", "ticker=CCC", "ticker=DDD"]
+    df = read(res.path, partitioning="hive")
+    aaa = df.loc[df["ticker"] == "AAA", "logret"].to_numpy()
+    np.testing.assert_allclose(aaa, np.log(1.01))
+
+
+def test_incremental_long_export(market, tmp_path):
+    export_dataset(market, "ohlcv", root=tmp_path, partition_by="year")
+    new_days = add_days(market, "AAA", 3)
+
+    res = export_dataset(market, "ohlcv", root=tmp_path, partition_by="year", incremental=True)
+    assert res.incremental
+    assert res.rows == 3
+    assert res.last_date == new_days[-1].date()
+    df = read(res.path, partitioning="hive")
+    assert len(df) == 4 * len(DAYS) - 4 + 3
+    assert not df.duplicated(subset=["ticker", "date"]).any()
+
+    nothing = export_dataset(market, "ohlcv", root=tmp_path, partition_by="year", incremental=True)
+    assert (nothing.rows, nothing.files, nothing.last_date) == (0, 0, new_days[-1].date())
+
+
+def test_incremental_without_previous_or_changed_format_is_full(market, tmp_path):
+    assert not export_dataset(market, "returns", root=tmp_path, incremental=True).incremental
+    assert not export_dataset(market, "returns", root=tmp_path, fmt="arrow", incremental=True).incremental
+    assert export_dataset(market, "returns", root=tmp_path, fmt="arrow", incremental=True).incremental
+
+
+def test_matrix_export(market, tmp_path):
+    res = export_dataset(market, "adjclose_matrix", root=tmp_path, batch_rows=10)
+    df = read(res.path).set_index("date").sort_index()
+    assert list(df.columns) == ["AAA", "BBB", "CCC", "DDD"]
+    assert len(df) == len(DAYS) == res.rows
+    assert np.isnan(df["BBB"].iloc[5])
+    assert np.isnan(df["CCC"].iloc[:3]).all()
+    assert _read_state(res.path).tickers == ["AAA", "BBB", "CCC", "DDD"]
+
+
+def test_matrix_incremental_keeps_columns(market, tmp_path):
+    export_dataset(market, "adjclose_matrix", root=tmp_path)
+    add_days(market, "AAA", 2)
+    res = export_dataset(market, "adjclose_matrix", root=tmp_path, incremental=True)
+    assert res.incremental
+    assert res.rows == 2
+    df = read(res.path).set_index("date").sort_index()
+    assert list(df.columns) == ["AAA", "BBB", "CCC", "DDD"]
+    assert len(df) == len(DAYS) + 2
+    assert df["BBB"].iloc[-2:].isna().all()
+
+
+def test_matrix_new_ticker_falls_back_to_full(market, tmp_path):
+    export_dataset(market, "adjclose_matrix", root=tmp_path)
+    add_days(market, "EEE", 2)
+    res = export_dataset(market, "adjclose_matrix", root=tmp_path, incremental=True)
+    assert not res.incremental
+    df = read(res.path).set_index("date").sort_index()
+    assert list(df.columns) == ["AAA", "BBB", "CCC", "DDD", "EEE"]
+    assert len(df) == len(DAYS) + 2
+    assert df["EEE"].notna().sum() == 2
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"dataset": "prices"},
+    {"dataset": "ohlcv", "fmt": "csv"},
+    {"dataset": "ohlcv", "partition_by": "month"},
+    {"dataset": "returns_matrix", "partition_by": "ticker"},
+])
+def test_invalid_arguments(duck_repo, tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        export_dataset(duck_repo, root=tmp_path, **kwargs)
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from trilobite.analysis.factors import FactorSpec, PCAReturnFactors, _pick_solver
+
+
+def returns_matrix(T: int, N: int, *, rank: int = 3, noise: float = 1e-3, seed: int = 0) -> pd.DataFrame:
+    """
+    Returns driven by `rank` factors with distinct variances, plus noise
+    """
+    rng = np.random.default_rng(seed)
+    factors = rng.standard_normal((T, rank)) * np.linspace(0.03, 0.01, rank)
+    loadings = rng.standard_normal((rank, N))
+    R = factors @ loadings + noise * rng.standard_normal((T, N))
+    return pd.DataFrame(
+        R,
+        index=pd.bdate_range("2020-01-01", periods=T),
+        columns=[f"T{i:03d}" for i in range(N)],
+    )
+
+
+@pytest.mark.parametrize("T, N", [(300, 40), (40, 300)])
+@pytest.mark.parametrize("standardize", [False, True])
+def test_solvers_agree(T, N, standardize):
+    R = returns_matrix(T, N)
+    fits = {
+        solver: PCAReturnFactors(FactorSpec(n_factors=3, solver=solver, standardize=standardize)).fit(R)
+        for solver in ("full", "randomized", "gram")
+    }
+    ref = fits["full"]
+    for solver, fm in fits.items():
+        assert fm.solver == solver
+        np.testing.assert_allclose(fm.components, ref.components, atol=1e-6)
+        np.testing.assert_allclose(fm.explained_variance, ref.explained_variance, rtol=1e-6)
+        pd.testing.assert_frame_equal(fm.transform(R), ref.transform(R), atol=1e-5)
+
+
+def test_components_are_orthonormal_with_positive_largest_loading():
+    fm = PCAReturnFactors(FactorSpec(n_factors=3)).fit(returns_matrix(200, 30))
+    C = fm.components
+    np.testing.assert_allclose(C @ C.T, np.eye(3), atol=1e-10)
+    assert (C[np.arange(3), np.abs(C).argmax(axis=1)] > 0).all()
+
+
+def test_explained_variance_ratio():
+    fm = PCAReturnFactors(FactorSpec(n_factors=3)).fit(returns_matrix(200, 30))
+    ratio = fm.explained_variance_ratio
+    assert (np.diff(ratio) <= 0).all()
+    assert 0.99 < ratio.sum() <= 1.0
+
+
+def test_pick_solver():
+    spec = FactorSpec(n_factors=8, gram_max_dim=100)
+    assert _pick_solver(spec, (500, 10), 8) == "full"
+    assert _pick_solver(spec, (500, 80), 8) == "gram"
+    assert _pick_solver(spec, (500, 200), 8) == "randomized"
+    assert _pick_solver(FactorSpec(solver="full"), (500, 200), 8) == "full"
+
+
+def test_n_factors_capped_by_matrix():
+    fm = PCAReturnFactors(FactorSpec(n_factors=64)).fit(returns_matrix(20, 10))
+    assert fm.n_factors == 10
+    assert fm.transform(returns_matrix(20, 10)).shape == (20, 10)
+
+
+def test_float32_matches_float64():
+    R = returns_matrix(300, 40)
+    f64 = PCAReturnFactors(FactorSpec(n_factors=3)).fit(R)
+    f32 = PCAReturnFactors(FactorSpec(n_factors=3, dtype="float32")).fit(R)
+    assert f32.components.dtype == np.float64
+    np.testing.assert_allclose(f32.components, f64.components, atol=1e-3)
+
+
+@pytest.mark.parametrize("spec", [
+    FactorSpec(n_factors=0),
+    FactorSpec(solver="qr"),
+    FactorSpec(forgetting=0.0),
+])
+def test_invalid_spec(spec):
+    with pytest.raises(ValueError):
+        PCAReturnFactors(spec)
+
+
+def test_transform_checks_tickers():
+    R = returns_matrix(50, 10)
+    fm = PCAReturnFactors(FactorSpec(n_factors=2)).fit(R)
+    with pytest.raises(ValueError):
+        fm.transform(R.iloc[:, ::-1])
+
+
+def test_partial_fit_merges_statistics_exactly():
+    R = returns_matrix(300, 20, rank=3, noise=0.0)
+    spec = FactorSpec(n_factors=3, standardize=True)
+    full = PCAReturnFactors(spec).fit(R)
+    inc = PCAReturnFactors(spec).fit(R.iloc[:200]).partial_fit(R.iloc[200:250]).partial_fit(R.iloc[250:])
+    assert inc.last_date == R.index[-1]
+    np.testing.assert_allclose(inc._mean, full._mean, atol=1e-12)
+    np.testing.assert_allclose(inc._scale, full._scale, rtol=1e-10)
+    #The returns have rank 3, so nothing is lost outside the kept components
+    np.testing.assert_allclose(inc.components, full.components, atol=1e-8)
+    np.testing.assert_allclose(inc.explained_variance, full.explained_variance, rtol=1e-8)
+    drift = inc.drift()
+    assert drift.updates == 2
+    assert drift.overlap > 0.99
+    assert not drift.refit
+
+
+def test_partial_fit_skips_rows_already_seen():
+    R = returns_matrix(120, 10)
+    fm = PCAReturnFactors(FactorSpec(n_factors=2)).fit(R.iloc[:100])
+    C = fm.components.copy()
+    fm.partial_fit(R.iloc[:100])
+    np.testing.assert_array_equal(fm.components, C)
+    assert fm.drift().updates == 0
+    fm.partial_fit(R)
+    assert fm.drift().updates == 1
+    assert fm.last_date == R.index[-1]
+
+
+def test_partial_fit_before_fit_fits():
+    R = returns_matrix(100, 10)
+    fm = PCAReturnFactors(FactorSpec(n_factors=2)).partial_fit(R)
+    assert fm.drift().updates == 0
+    np.testing.assert_allclose(fm.components, PCAReturnFactors(FactorSpec(n_factors=2)).fit(R).components)
+
+
+def test_partial_fit_checks_tickers():
+    R = returns_matrix(100, 10)
+    fm = PCAReturnFactors(FactorSpec(n_factors=2)).fit(R.iloc[:50])
+    with pytest.raises(ValueError):
+        fm.partial_fit(R.iloc[50:, :-1])
+
+
+def test_drift_recommends_refit():
+    R = returns_matrix(100, 10)
+    fm = PCAReturnFactors(FactorSpec(n_factors=2, refit_max_updates=2)).fit(R.iloc[:60])
+    fm.partial_fit(R.iloc[:80])
+    assert not fm.drift().refit
+    fm.partial_fit(R)
+    assert fm.drift().refit
+    #A regime with other factors moves the subspace
+    other = returns_matrix(400, 10, seed=1)
+    other.index = pd.bdate_range(R.index[-1] + pd.Timedelta(days=1), periods=400)
+    other.columns = R.columns
+    fm = PCAReturnFactors(FactorSpec(n_factors=2, forgetting=0.97)).fit(R).partial_fit(other)
+    assert fm.drift().overlap < 0.9
+    assert fm.drift().refit
+
+
+def test_save_load_round_trip(tmp_path):
+    R = returns_matrix(150, 12)
+    spec = FactorSpec(n_factors=3, standardize=True, forgetting=0.99)
+    fm = PCAReturnFactors(spec).fit(R.iloc[:100]).partial_fit(R.iloc[:120])
+    path = tmp_path / "factors" / "pca.npz"
+    fm.save(path)
+    assert [p.name for p in path.parent.iterdir()] == ["pca.npz"]
+
+    loaded = PCAReturnFactors.load(path)
+    assert loaded.spec == spec
+    assert loaded.tickers == fm.tickers
+    assert loaded.last_date == fm.last_date
+    assert loaded.drift() == fm.drift()
+    pd.testing.assert_frame_equal(loaded.transform(R), fm.transform(R))
+    #Continuing in the loaded copy gives the same model
+    fm.partial_fit(R)
+    loaded.partial_fit(R)
+    np.testing.assert_array_equal(loaded.components, fm.components)
+
+
+def test_save_unfitted_raises(tmp_path):
+    with pytest.raises(RuntimeError):
+        PCAReturnFactors().save(tmp_path / "pca.npz")
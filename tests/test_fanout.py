@@ -0,0 +1,61 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("psycopg_pool")
+
+from trilobite.db.fanout import ParallelReader, date_shards, ticker_shards
+
+
+def test_ticker_shards_cover_tickers_in_order():
+    tickers = [f"T{i:03d}" for i in range(10)]
+    shards = ticker_shards(tickers, 3)
+    assert [len(s) for s in shards] == [3, 4, 3]
+    assert sum(shards, []) == tickers
+
+
+@pytest.mark.parametrize("n, width", [(1, 4), (5, 5), (7, 2), (100, 8), (3, 0)])
+def test_ticker_shards_sizes(n, width):
+    tickers = [f"T{i:03d}" for i in range(n)]
+    shards = ticker_shards(tickers, width)
+    assert len(shards) == max(1, min(width, n))
+    assert all(shards)
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+    assert sum(shards, []) == tickers
+
+
+def test_ticker_shards_empty():
+    assert ticker_shards([], 4) == []
+
+
+def test_date_shards_are_contiguous_and_inclusive():
+    start, end = date(2024, 1, 1), date(2024, 12, 31)
+    shards = date_shards(start, end, 4)
+    assert len(shards) == 4
+    assert shards[0][0] == start
+    assert shards[-1][1] == end
+    for (_, prev_end), (next_start, _) in zip(shards, shards[1:]):
+        assert next_start == prev_end + timedelta(days=1)
+    lengths = [(e - s).days + 1 for s, e in shards]
+    assert sum(lengths) == 366
+    assert max(lengths) - min(lengths) <= 1
+
+
+def test_date_shards_narrower_than_width():
+    day = date(2024, 1, 1)
+    assert date_shards(day, day, 4) == [(day, day)]
+    assert len(date_shards(day, day + timedelta(days=2), 8)) == 3
+
+
+def test_plan_by_ticker_and_date():
+    tickers = ["A", "B", "C", "D"]
+    start, end = date(2024, 1, 1), date(2024, 1, 10)
+    by_ticker = ParallelReader(pool=None, width=2).plan(tickers, start, end)
+    assert by_ticker == [(["A", "B"], start, end), (["C", "D"], start, end)]
+    by_date = ParallelReader(pool=None, width=2, shard_by="date").plan(tickers, start, end)
+    assert by_date == [(tickers, start, date(2024, 1, 5)), (tickers, date(2024, 1, 6), end)]
+
+
+def test_invalid_shard_by():
+    with pytest.raises(ValueError):
+        ParallelReader(pool=None, shard_by="month")
@@ -0,0 +1,138 @@
+from dataclasses import replace
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from trilobite.analysis.trainers.nn_direction import NNDirectionsTrainer
+from trilobite.config.config import CFGAnalysis, CFGMirror, CFGScreen
+from trilobite.handlers.uihandlers import Handler
+
+
+def returns(T: int = 100, N: int = 6, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        rng.normal(0, 0.01, (T, N)),
+        index=pd.bdate_range("2023-01-02", periods=T),
+        columns=[f"T{i}" for i in range(N)],
+    )
+
+
+def drain(gen):
+    """
+    Runs a handler generator, returns its status texts and its return value
+    """
+    texts = []
+    while True:
+        try:
+            texts.append(next(gen).text)
+        except StopIteration as stop:
+            return texts, stop.value
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.setattr(Handler, "_models_root", lambda self: tmp_path / "models")
+    analysis = CFGAnalysis(n_factors=3, lookback=10, epochs=1, dtype="float64", finetune_steps=3, finetune_max=2)
+    cfg = SimpleNamespace(analysis=analysis, mirror=CFGMirror(), screen=CFGScreen())
+    return Handler(state=SimpleNamespace(repo=None, mirror=None), cfg=cfg)
+
+
+def replace_analysis(handler, analysis):
+    return SimpleNamespace(**{**vars(handler._cfg), "analysis": analysis})
+
+
+@pytest.fixture
+def saved(handler):
+    torch.manual_seed(0)
+    R = returns()
+    trainer = NNDirectionsTrainer(handler._nn_config())
+    trainer.fit(R.iloc[:80])
+    trainer.save(handler._models_root())
+    return R
+
+
+def test_nn_config_takes_the_analysis_settings(handler):
+    a = replace(handler._cfg.analysis, finetune_recent=7, finetune_replay=0.5, finetune_lr=3e-5, hidden_max_steps=4)
+    handler._cfg = replace_analysis(handler, a)
+    cfg = handler._nn_config()
+    assert (cfg.finetune_steps, cfg.finetune_recent, cfg.finetune_replay, cfg.finetune_lr) == (3, 7, 0.5, 3e-5)
+    assert cfg.hidden_max_steps == 4
+    assert cfg.log_every == a.train_log_every
+
+
+def test_nn_config_takes_the_runtime_settings(handler):
+    a = replace(handler._cfg.analysis, train_threads=3, train_interop_threads=2, train_compile=True, train_compile_mode="max-autotune")
+    handler._cfg = replace_analysis(handler, a)
+    cfg = handler._nn_config()
+    assert (cfg.num_threads, cfg.num_interop_threads) == (3, 2)
+    assert cfg.compile and cfg.compile_mode == "max-autotune"
+
+
+def test_fine_tune_without_saved_model(handler):
+    texts, res = drain(handler._fine_tune(returns()))
+    assert res is None
+    assert texts == ["Full training (no saved model) .."]
+
+
+def test_fine_tune_continues_the_saved_model(handler, saved):
+    texts, res = drain(handler._fine_tune(saved))
+    trainer, n_new = res
+    assert n_new == 20
+    assert trainer.fine_tunes == 1
+    assert trainer.last_date == saved.index[-1]
+    assert trainer.cfg.finetune_steps == 3
+    assert texts[-1].startswith("Fine-tuned model")
+
+
+@pytest.mark.parametrize("change, reason", [
+    (lambda a, R: (replace(a, lookback=12), R), "model settings changed: lookback"),
+    (lambda a, R: (replace(a, n_factors=4), R), "model settings changed: n_factors"),
+    (lambda a, R: (a, R.iloc[:, :-1]), "universe changed"),
+    (lambda a, R: (a, R.iloc[:, ::-1]), "universe changed"),
+    (lambda a, R: (a, R.iloc[85:]), "saved model does not overlap the returns"),
+    (lambda a, R: (a, R.iloc[:60]), "saved model does not overlap the returns"),
+])
+def test_fine_tune_falls_back_to_full_training(handler, saved, change, reason):
+    a, R = change(handler._cfg.analysis, saved)
+    handler._cfg = replace_analysis(handler, a)
+    texts, res = drain(handler._fine_tune(R))
+    assert res is None
+    assert texts == [f"Full training ({reason}) .."]
+
+
+def test_fine_tune_schedules_a_full_training_after_finetune_max(handler, saved):
+    #Each fine-tune is saved, the next one loads it
+    for n in (1, 2):
+        trainer, _ = drain(handler._fine_tune(saved.iloc[:80 + n]))[1]
+        trainer.save(handler._models_root())
+        assert trainer.fine_tunes == n
+    texts, res = drain(handler._fine_tune(saved))
+    assert res is None
+    assert texts == ["Full training (scheduled after 2 fine-tunes) .."]
+
+
+def predict(handler, monkeypatch, rets):
+    monkeypatch.setattr("trilobite.handlers.uihandlers.MarketDataSource.load_returns_matrix", lambda self, **kwargs: rets)
+    return [e for e in handler._handle_predict()]
+
+
+def test_predict_ranks_with_the_saved_model(handler, saved, monkeypatch):
+    events = predict(handler, monkeypatch, saved.iloc[:, ::-1])
+    ranked = events[-1]
+    assert ranked.date == saved.index[-1]
+    assert sorted(ranked.ranked.index) == list(saved.columns)
+
+
+@pytest.mark.parametrize("columns, gone, new", [
+    (["T0", "T1", "T2", "T3", "T4"], 1, 0),
+    (["T0", "T1", "T2", "T3", "T4", "T5", "T6"], 0, 1),
+    (["T0", "T1", "T2", "T3", "T4", "T6"], 1, 1),
+])
+def test_predict_rejects_a_drifted_universe(handler, saved, monkeypatch, columns, gone, new):
+    rets = saved.assign(T6=saved["T0"]).loc[:, columns]
+    events = predict(handler, monkeypatch, rets)
+    assert events[-1].text.startswith(f"Model 0001 rejected, the universe has drifted since training: {gone} tickers gone, {new} new")
@@ -0,0 +1,238 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg")
+from psycopg import sql as pgsql
+
+from trilobite.db import queries as q
+from trilobite.db import schema
+from trilobite.db.repo import MarketRepo, _intraday_rows
+from trilobite.db.schema import (
+    _next_month,
+    ensure_intraday_partitions,
+    intraday_partition_month,
+    intraday_partition_name,
+)
+
+UTC = timezone.utc
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=()):
+        text = query.as_string(None) if isinstance(query, pgsql.Composable) else query
+        self._conn.executed.append((text, tuple(params)))
+        self.rowcount, self._rows = self._conn.reply(text, params)
+
+    def fetchall(self):
+        return self._rows
+
+    def copy(self, query):
+        return FakeCopy(self._conn, query)
+
+
+class FakeCopy:
+    def __init__(self, conn, query):
+        self._conn = conn
+        conn.copied = {"sql": query, "rows": []}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_types(self, types):
+        self._conn.copied["types"] = types
+
+    def write_row(self, row):
+        self._conn.copied["rows"].append(row)
+
+
+class FakeConn:
+    """
+    Records the statements a repo sends. reply(sql, params) gives the
+    rowcount and rows of each, by default -1 and none
+    """
+    def __init__(self, reply=None):
+        self.executed = []
+        self.copied = None
+        self.commits = self.rollbacks = 0
+        self.reply = reply or (lambda sql, params: (-1, []))
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def columns(text: str, after: str) -> list[str]:
+    """
+    The column list in parentheses after `after` in a statement
+    """
+    m = re.search(re.escape(after) + r"\s*\(([^)]*)\)", text)
+    assert m is not None
+    return [c.strip().split()[0] for c in m.group(1).split(",") if c.strip()]
+
+
+def test_partition_names_round_trip():
+    for month in (date(2024, 1, 1), date(2024, 12, 1), date(1999, 7, 1)):
+        for interval in schema.INTRADAY_INTERVALS:
+            name = intraday_partition_name(interval, month)
+            assert intraday_partition_month(name) == month
+    assert intraday_partition_name("5m", date(2024, 5, 1)) == "ohlcv_intraday_5m_2024_05"
+
+
+@pytest.mark.parametrize("name", ["ohlcv_intraday_5m", "ohlcv_intraday_5m_default", "ohlcv_intraday_5m_2024_x5"])
+def test_partition_month_of_other_names(name):
+    assert intraday_partition_month(name) is None
+
+
+def test_next_month():
+    assert _next_month(date(2024, 1, 1)) == date(2024, 2, 1)
+    assert _next_month(date(2024, 11, 1)) == date(2024, 12, 1)
+    assert _next_month(date(2024, 12, 1)) == date(2025, 1, 1)
+
+
+def test_ensure_partitions_cover_the_range_in_utc_months():
+    conn = FakeConn()
+    #20:00 in New York on Jan 31st is already February in UTC
+    ny = timezone(timedelta(hours=-5))
+    names = ensure_intraday_partitions(conn, "1h", datetime(2024, 1, 31, 20, tzinfo=ny), datetime(2025, 1, 1, 3, tzinfo=UTC))
+    assert names[0] == "ohlcv_intraday_1h_2024_02"
+    assert names[-1] == "ohlcv_intraday_1h_2025_01"
+    assert len(names) == 12
+    first = conn.executed[0][0]
+    assert first.startswith('CREATE TABLE IF NOT EXISTS "ohlcv_intraday_1h_2024_02" PARTITION OF "ohlcv_intraday_1h"')
+    assert "FROM ('2024-02-01 00:00+00') TO ('2024-03-01 00:00+00')" in first
+    assert "FROM ('2024-12-01 00:00+00') TO ('2025-01-01 00:00+00')" in conn.executed[-2][0]
+    assert conn.commits == 0
+
+
+def test_ensure_partitions_rejects_unknown_intervals():
+    with pytest.raises(ValueError):
+        ensure_intraday_partitions(FakeConn(), "15m", datetime(2024, 1, 1, tzinfo=UTC), datetime(2024, 1, 2, tzinfo=UTC))
+
+
+def test_intraday_stage_statements_agree():
+    stage = columns(schema.CREATE_INTRADAY_STAGE, "ohlcv_intraday_stage")
+    assert columns(schema.COPY_INTRADAY_STAGE, "ohlcv_intraday_stage") == stage
+    assert columns(schema.MERGE_INTRADAY_STAGE, "INSERT INTO ohlcv_intraday") == stage
+    table = schema.DDL.split("CREATE TABLE IF NOT EXISTS ohlcv_intraday (")[1].split(") PARTITION BY")[0]
+    assert sorted(re.findall(r"^    ([a-z_]+) ", table, re.M)) == sorted(stage)
+
+
+def bars(n: int, *, start: str = "2024-03-28 14:00", freq: str = "1h") -> pd.DataFrame:
+    ts = pd.date_range(start, periods=n, freq=freq, tz="UTC")
+    return pd.DataFrame({
+        "ts": ts,
+        "open": [1.0] * n,
+        "high": [2.0] * n,
+        "low": [0.5] * n,
+        "close": [1.5] * n,
+        "volume": [100] * n,
+    })
+
+
+def test_intraday_rows_match_the_copy_types():
+    df = bars(3)
+    df.loc[1, "open"] = float("nan")
+    df["volume"] = [100, None, 7]
+    rows = _intraday_rows(9, 60, df)
+    assert rows[0] == (datetime(2024, 3, 28, 14, tzinfo=UTC), 9, 100, 1.0, 2.0, 0.5, 1.5, 60)
+    assert rows[1][2] is None and rows[1][3] is None
+    assert len(rows[0]) == len(columns(schema.COPY_INTRADAY_STAGE, "ohlcv_intraday_stage"))
+    with pytest.raises(ValueError):
+        _intraday_rows(9, 60, df.drop(columns="close"))
+
+
+def test_upsert_intraday_copies_then_merges():
+    conn = FakeConn(lambda sql, params: (5, []))
+    repo = MarketRepo(conn)
+    #Bars over a month end need both partitions
+    n = repo.upsert_ohlcv_intraday("1h", {1: bars(100), 2: bars(0), 3: bars(2)})
+    assert n == 5
+    executed = [s for s, _ in conn.executed]
+    assert [s for s in executed if "PARTITION OF" in s][0].startswith('CREATE TABLE IF NOT EXISTS "ohlcv_intraday_1h_2024_03"')
+    assert sum("PARTITION OF" in s for s in executed) == 2
+    assert executed[-2:] == [schema.CREATE_INTRADAY_STAGE, schema.MERGE_INTRADAY_STAGE]
+    assert conn.copied["sql"] == schema.COPY_INTRADAY_STAGE
+    assert len(conn.copied["types"]) == len(conn.copied["rows"][0])
+    assert len(conn.copied["rows"]) == 102
+    assert {r[1] for r in conn.copied["rows"]} == {1, 3}
+    assert conn.commits == 1
+
+
+def test_upsert_intraday_rolls_back_on_failure():
+    def reply(sql, params):
+        if sql == schema.MERGE_INTRADAY_STAGE:
+            raise RuntimeError("merge failed")
+        return -1, []
+
+    conn = FakeConn(reply)
+    with pytest.raises(RuntimeError):
+        MarketRepo(conn).upsert_ohlcv_intraday("5m", {1: bars(2, freq="5min")})
+    assert conn.rollbacks == 1
+    assert conn.commits == 0
+    assert MarketRepo(FakeConn()).upsert_ohlcv_intraday("5m", {1: bars(0)}) == 0
+
+
+def test_retention_drops_whole_months_before_the_cutoff():
+    names = [intraday_partition_name("5m", date(2024, m, 1)) for m in range(1, 7)] + ["ohlcv_intraday_5m_default"]
+
+    def reply(sql, params):
+        if sql == q.LIST_INTRADAY_PARTITIONS:
+            return len(names), [(n,) for n in names]
+        if sql == q.DELETE_EXPIRED_INTRADAY:
+            return 42, []
+        return -1, []
+
+    conn = FakeConn(reply)
+    #The cutoff falls on April 10th, the April partition is only trimmed
+    now = datetime(2024, 6, 9, 12, tzinfo=UTC)
+    dropped, deleted = MarketRepo(conn).apply_intraday_retention("5m", keep_days=60, now=now)
+    assert (dropped, deleted) == (3, 42)
+    drops = [s for s, _ in conn.executed if s.startswith("DROP")]
+    assert drops == [f'DROP TABLE IF EXISTS "{intraday_partition_name("5m", date(2024, m, 1))}";' for m in (1, 2, 3)]
+    assert conn.executed[0][1] == ("ohlcv_intraday_5m",)
+    assert conn.executed[-1] == (q.DELETE_EXPIRED_INTRADAY, (5, now - timedelta(days=60)))
+
+
+def test_retention_months_are_utc_months():
+    names = [intraday_partition_name("1m", date(2024, m, 1)) for m in (2, 3)]
+    conn = FakeConn(lambda sql, params: (0, [(n,) for n in names]) if sql == q.LIST_INTRADAY_PARTITIONS else (0, []))
+    #March 1st 02:00 in UTC is still February in New York, the cutoff month is March
+    now = datetime(2024, 3, 31, 21, tzinfo=timezone(timedelta(hours=-5)))
+    dropped, _ = MarketRepo(conn).apply_intraday_retention("1m", keep_days=30, now=now)
+    assert dropped == 1
+
+
+def test_rollup_params_follow_placeholders():
+    conn = FakeConn(lambda sql, params: (3, []))
+    since = datetime(2024, 3, 1, tzinfo=UTC)
+    assert MarketRepo(conn).rollup_intraday_to_daily("5m", since=since, tz="America/New_York") == 3
+    (prune, p0), (rollup, p1) = conn.executed
+    assert prune == q.PRUNE_PROVISIONAL_DAILY and p0 == ()
+    assert rollup == q.ROLLUP_INTRADAY_DAILY
+    assert rollup.count("%s") == len(p1)
+    assert p1 == (5, "America/New_York", 5, since)
+    #The provisional rows never go to the tables the daily reads use
+    assert "ohlcv_daily " not in rollup and "ohlcv_daily\n" not in rollup
+    assert conn.commits == 1
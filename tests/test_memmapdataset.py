@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from trilobite.analysis.dataset import FactorDatasetSpec, FactorWindowDirectionDataset
+from trilobite.analysis.memmapdataset import MemmapDatasetWriter, MemmapFactorDataset
+
+
+def frames(T: int = 80, N: int = 13, K: int = 4, seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2023-01-02", periods=T)
+    factors = pd.DataFrame(rng.standard_normal((T, K)), index=index, columns=[f"F{i + 1:02d}" for i in range(K)])
+    rets = pd.DataFrame(rng.normal(0, 0.01, (T, N)), index=index, columns=[f"T{i:02d}" for i in range(N)])
+    return factors, rets
+
+
+def write(root, factors, rets, spec, *, chunk: int, label_format: str = "packbits") -> MemmapFactorDataset:
+    w = MemmapDatasetWriter(root, tickers=list(rets.columns), factor_names=list(factors.columns), spec=spec, label_format=label_format)
+    for a in range(0, len(rets), chunk):
+        w.append(factors.iloc[a:a + chunk], rets.iloc[a:a + chunk])
+    return w.close()
+
+
+#Chunks smaller than the horizon check the label offset across appends
+@pytest.mark.parametrize("label_format", ["packbits", "uint8"])
+@pytest.mark.parametrize("chunk, horizon", [(80, 1), (7, 1), (2, 3), (1, 5)])
+def test_same_samples_as_in_memory_dataset(tmp_path, label_format, chunk, horizon):
+    factors, rets = frames()
+    spec = FactorDatasetSpec(lookback=10, horizon=horizon)
+    ref = FactorWindowDirectionDataset(factors, rets, spec)
+    ds = write(tmp_path / "ds", factors, rets, spec, chunk=chunk, label_format=label_format)
+
+    assert len(ds) == len(ref)
+    assert ds.tickers == ref.tickers
+    assert ds.factor_names == ref.factor_names
+    assert ds.dates.equals(ref.dates)
+    assert ds.last_date == rets.index[-1]
+    for i in (0, 1, len(ref) // 2, len(ref) - 1):
+        x, y = ds[i]
+        rx, ry = ref[i]
+        torch.testing.assert_close(x, rx)
+        torch.testing.assert_close(y, ry)
+    idx = torch.tensor([0, 3, len(ref) - 1, 3])
+    for a, b in zip(ds.batch(idx), ref.batch(idx)):
+        torch.testing.assert_close(a, b)
+
+
+def test_latest_window_includes_unlabelled_rows(tmp_path):
+    factors, rets = frames()
+    ds = write(tmp_path / "ds", factors, rets, FactorDatasetSpec(lookback=10, horizon=2), chunk=30)
+    expected = torch.tensor(factors.iloc[-10:].to_numpy(dtype=np.float32))
+    torch.testing.assert_close(ds.latest_window(), expected)
+
+
+def test_reopen_and_rebuild(tmp_path):
+    factors, rets = frames()
+    spec = FactorDatasetSpec(lookback=5)
+    root = tmp_path / "ds"
+    write(root, factors, rets, spec, chunk=40)
+    assert len(MemmapFactorDataset(root)) == len(rets) - 1 - 4
+    #A rebuild replaces the dataset, an aborted one leaves it in place
+    write(root, factors.iloc[:30], rets.iloc[:30], spec, chunk=40)
+    w = MemmapDatasetWriter(root, tickers=list(rets.columns), factor_names=list(factors.columns), spec=spec)
+    w.append(factors, rets)
+    w.abort()
+    assert len(MemmapFactorDataset(root)) == 30 - 1 - 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ds"]
+
+
+def test_writer_checks_chunks(tmp_path):
+    factors, rets = frames()
+    w = MemmapDatasetWriter(tmp_path / "ds", tickers=list(rets.columns), factor_names=list(factors.columns), spec=FactorDatasetSpec(lookback=5))
+    with pytest.raises(ValueError):
+        w.append(factors.iloc[:10], rets.iloc[1:11])
+    with pytest.raises(ValueError):
+        w.append(factors.iloc[:10], rets.iloc[:10, ::-1])
+    with pytest.raises(ValueError):
+        w.append(factors.iloc[:10, :2], rets.iloc[:10])
+    w.abort()
+
+
+def test_too_few_rows(tmp_path):
+    factors, rets = frames(T=6)
+    with pytest.raises(ValueError):
+        write(tmp_path / "ds", factors, rets, FactorDatasetSpec(lookback=6), chunk=6)
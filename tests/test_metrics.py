@@ -0,0 +1,75 @@
+import logging
+from datetime import date
+
+from trilobite.db import queries as q
+from trilobite.db.metrics import BUCKETS_MS, QueryMetrics, StatementStats, redact
+
+
+def test_redact_hides_values():
+    assert redact(None) == "()"
+    assert redact([(1, "AAPL"), (2, "MSFT")]) == "2 rows"
+    assert redact(("AAPL", date(2024, 1, 2), ["A", "B", "C"])) == "(str, date, list[3])"
+    assert "AAPL" not in redact(("AAPL",))
+
+
+def test_record_by_statement_name():
+    m = QueryMetrics(slow_ms=None, summary_interval_s=None)
+    m.record(q.LIST_ACTIVE_TICKERS, None, 3.0, rows=5, result=[("A",)] * 5)
+    m.record(q.LIST_ACTIVE_TICKERS, None, 7.0, rows=5)
+    m.record("SELECT 1", (1,), 0.1, rows=1)
+    snap = m.snapshot()
+    assert set(snap) == {"LIST_ACTIVE_TICKERS", "adhoc"}
+    s = snap["LIST_ACTIVE_TICKERS"]
+    assert (s.calls, s.total_ms, s.max_ms, s.rows) == (2, 10.0, 7.0, 10)
+    assert s.est_bytes > 0
+
+
+def test_percentile_uses_bucket_bounds():
+    s = StatementStats()
+    for ms in (0.2, 0.3, 3.0, 4000.0):
+        s.add(ms, 0, 0)
+    assert s.percentile(0.5) == 0.5
+    assert s.percentile(0.75) == 5
+    assert s.percentile(1.0) == 5000
+    s.add(20000.0, 0, 0)
+    assert s.percentile(1.0) == 20000.0
+    assert len(s.buckets) == len(BUCKETS_MS) + 1
+
+
+def test_slow_query_is_logged_redacted(caplog):
+    m = QueryMetrics(slow_ms=100.0, summary_interval_s=None)
+    with caplog.at_level(logging.WARNING, logger="trilobite.db.slow"):
+        m.record("SELECT 1", ("AAPL",), 50.0, rows=1)
+        m.record("SELECT 1", ("AAPL",), 150.0, rows=1)
+    assert len(caplog.records) == 1
+    assert "adhoc took 150.0ms" in caplog.text
+    assert "AAPL" not in caplog.text
+
+
+def test_summary_orders_by_total_time():
+    m = QueryMetrics(slow_ms=None, summary_interval_s=None)
+    m.record(q.LIST_ACTIVE_TICKERS, None, 1.0, rows=1)
+    m.record("SELECT 1", None, 9.0, rows=1)
+    lines = m.summary().splitlines()
+    assert "est MB" in lines[0]
+    assert lines[1].startswith("adhoc")
+    assert len(m.summary(top=1).splitlines()) == 2
+
+
+def test_flush_logs_only_unreported_statements(caplog):
+    m = QueryMetrics(slow_ms=None, summary_interval_s=None)
+    with caplog.at_level(logging.INFO, logger="trilobite.db.metrics"):
+        m.flush()
+        assert "Query summary" not in caplog.text
+        m.record("SELECT 1", None, 1.0, rows=1)
+        m.flush()
+        assert caplog.text.count("Query summary") == 1
+        m.flush()
+        assert caplog.text.count("Query summary") == 1
+
+
+def test_reset_clears_stats():
+    m = QueryMetrics(slow_ms=None, summary_interval_s=None)
+    m.record("SELECT 1", None, 1.0, rows=1)
+    m.reset()
+    assert m.snapshot() == {}
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.conftest import DAYS, ohlcv_frame
+from trilobite.mirror.mirror import ColumnarMirror
+
+
+def db_matrix(repo, field: str) -> pd.DataFrame:
+    """
+    The field as a (dates x tickers) matrix read straight from the DB
+    """
+    df = repo.fetch_ohlcv_since({t: None for t in repo.last_ohlcv_date_for_all_tickers()})
+    wide = df.pivot(index="date", columns="ticker", values=field).astype("float64")
+    wide.index = pd.DatetimeIndex(wide.index, name="date")
+    return wide
+
+
+def assert_mirrors_db(mirror: ColumnarMirror, repo) -> None:
+    for field in ("close", "adjclose", "volume"):
+        got = mirror.frame(field)
+        want = db_matrix(repo, field)
+        assert list(got.index) == list(want.index)
+        np.testing.assert_array_equal(got.loc[:, want.columns].to_numpy(), want.to_numpy())
+
+
+def test_sync_round_trip(market, tmp_path):
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    assert not mirror.exists
+    written = mirror.sync(market)
+    assert written == 4 * len(DAYS) - 4
+    assert mirror.exists
+    assert mirror.tickers == ["AAA", "BBB", "CCC", "DDD"]
+    assert_mirrors_db(mirror, market)
+    #Days without a row are NaN
+    assert np.isnan(mirror.frame("close")["BBB"].iloc[5])
+    assert mirror.sync(market) == 0
+
+
+def test_sync_appends_new_days(market, tmp_path):
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    mirror.sync(market)
+    new_days = pd.bdate_range(DAYS[-1] + pd.Timedelta(days=1), periods=3)
+    market.upsert_ohlcv_daily(market.ensure_instrument("AAA"), ohlcv_frame(new_days, close=20.0))
+
+    assert mirror.sync(market) == 3
+    assert mirror.manifest.n_dates == len(DAYS) + 3
+    assert mirror.manifest.last_synced["AAA"] == new_days[-1].date().isoformat()
+    assert_mirrors_db(mirror, market)
+
+
+def test_sync_new_ticker_and_earlier_days(market, tmp_path):
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    mirror.sync(market)
+    capacity = mirror.manifest.capacity
+    #A listing with older history moves the existing rows down the date axis
+    older = pd.bdate_range(end=DAYS[0] - pd.Timedelta(days=1), periods=5)
+    market.upsert_ohlcv_daily(market.ensure_instrument("EEE"), ohlcv_frame(older.append(DAYS), close=7.0))
+
+    mirror.sync(market)
+    assert mirror.tickers[-1] == "EEE"
+    assert mirror.manifest.capacity == capacity
+    assert mirror.manifest.n_dates == len(DAYS) + 5
+    assert_mirrors_db(mirror, market)
+
+
+def test_forced_since_recopies_rewritten_history(market, tmp_path):
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    mirror.sync(market)
+    #A split rewrites the whole adjusted history, the last date does not move
+    market.upsert_ohlcv_daily(market.ensure_instrument("AAA"), ohlcv_frame(DAYS, close=5.0))
+    assert mirror.sync(market) == 0
+
+    assert mirror.sync(market, since={"AAA": DAYS[0].date()}) == len(DAYS)
+    assert_mirrors_db(mirror, market)
+
+
+def test_reopened_mirror_reads_the_same(market, tmp_path):
+    ColumnarMirror(tmp_path / "mirror").sync(market)
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    assert_mirrors_db(mirror, market)
+    series = mirror.fetch_adjclose_series("aaa", "10d")
+    assert list(series.columns) == ["date", "adjclose"]
+    assert series["date"].iloc[-1] == DAYS[-1]
+    assert len(series) == len(DAYS[DAYS >= DAYS[-1] - pd.Timedelta(days=10)])
+
+
+def test_datasource_reads_the_same_from_the_mirror(market, tmp_path):
+    from trilobite.analysis.datasource import MarketDataSource
+    from trilobite.db.screen import Screen
+
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    mirror.sync(market)
+    end = DAYS[-1].date()
+    for screen in (None, Screen().min_coverage(0.9)):
+        db = MarketDataSource(market).load_adjclose_matrix(period="90d", end_date=end, screen=screen)
+        mm = MarketDataSource(market, mirror).load_adjclose_matrix(period="90d", end_date=end, screen=screen)
+        pd.testing.assert_frame_equal(mm, db, check_names=False, check_freq=False, check_index_type=False)
+
+
+@pytest.mark.parametrize("period", ["90d", "1m"])
+@pytest.mark.parametrize("coverage", [None, 0.5])
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_returns_from_the_mirror_match_returns_daily(market, tmp_path, period, coverage, dtype):
+    from trilobite.analysis.datasource import MarketDataSource
+    from trilobite.db.screen import Screen
+
+    #A price of 0 leaves EEE without a valid return on that day and the next
+    eee = ohlcv_frame(DAYS, close=4.0)
+    eee.loc[12, "adjclose"] = 0.0
+    market.upsert_ohlcv_daily(market.ensure_instrument("EEE"), eee)
+    #FFF has gaps, one of them over the start of the 1m period
+    market.upsert_ohlcv_daily(market.ensure_instrument("FFF"), ohlcv_frame(DAYS[::3], close=6.0, drift=0.03))
+    mirror = ColumnarMirror(tmp_path / "mirror")
+    mirror.sync(market)
+
+    end = DAYS[-1].date()
+    screen = None if coverage is None else Screen().min_coverage(coverage)
+    db = MarketDataSource(market, dtype=dtype).load_returns_matrix(period=period, end_date=end, screen=screen)
+    mm = MarketDataSource(market, mirror, dtype=dtype).load_returns_matrix(period=period, end_date=end, screen=screen)
+    assert not db.empty
+    assert DAYS[12] not in db.index and DAYS[13] not in db.index
+    pd.testing.assert_frame_equal(mm, db, check_freq=False, check_index_type=False)
+
+    chunks = MarketDataSource(market, mirror, dtype=dtype).iter_returns_chunks(period=period, end_date=end, screen=screen, chunk_days=14)
+    pd.testing.assert_frame_equal(pd.concat(list(chunks)), db, check_freq=False, check_index_type=False)
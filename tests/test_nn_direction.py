@@ -0,0 +1,196 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from trilobite.analysis.trainers.nn_direction import NNDirectionsConfig, NNDirectionsTrainer
+
+
+def returns(T: int = 120, N: int = 8, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        rng.normal(0, 0.01, (T, N)),
+        index=pd.bdate_range("2023-01-02", periods=T),
+        columns=[f"T{i}" for i in range(N)],
+    )
+
+
+def small_config(**kwargs) -> NNDirectionsConfig:
+    return NNDirectionsConfig(**{"n_factors": 3, "lookback": 10, "epochs": 1, "hidden_size": 8, "batch_size": 16, **kwargs})
+
+
+@pytest.fixture
+def trained():
+    torch.manual_seed(0)
+    R = returns()
+    trainer = NNDirectionsTrainer(small_config(hidden_max_steps=3))
+    trainer.fit(R.iloc[:100])
+    return trainer, R
+
+
+def test_predict_incremental_on_a_fresh_state_equals_predict_latest(trained):
+    trainer, R = trained
+    inc = trainer.predict_incremental(R.iloc[:100])
+    latest = trainer.predict_latest(R.iloc[:100])
+    assert inc.date == latest.date
+    pd.testing.assert_series_equal(inc.probs_up, latest.probs_up, atol=1e-6, rtol=0)
+    assert trainer.hidden_steps == 0
+
+
+def test_score_dates_matches_predict_latest(trained):
+    trainer, R = trained
+    scored = trainer.score_dates(R, batch_size=7)
+    assert scored.index[0] == R.index[9]
+    assert len(scored) == len(R) - 9
+    for d in scored.index[1:]:
+        latest = trainer.predict_latest(R.loc[:d])
+        np.testing.assert_allclose(scored.loc[d].to_numpy(), latest.probs_up.to_numpy(), atol=1e-6)
+    some = trainer.score_dates(R, [R.index[50], R.index[20]])
+    np.testing.assert_allclose(some.to_numpy(), scored.loc[[R.index[50], R.index[20]]].to_numpy(), atol=1e-6)
+    with pytest.raises(ValueError):
+        trainer.score_dates(R, [R.index[3]])
+
+
+def test_carried_state_is_rebuilt_after_hidden_max_steps(trained):
+    trainer, R = trained
+    trainer.predict_incremental(R.iloc[:100])
+    trainer.predict_incremental(R.iloc[:101])
+    trainer.predict_incremental(R.iloc[:103])
+    assert trainer.hidden_steps == 3
+    #One more day would carry it 4 days, past hidden_max_steps
+    rebuilt = trainer.predict_incremental(R.iloc[:104])
+    assert trainer.hidden_steps == 0
+    pd.testing.assert_series_equal(rebuilt.probs_up, trainer.predict_latest(R.iloc[:104]).probs_up, atol=1e-6, rtol=0)
+
+
+def test_carried_state_steps_like_a_longer_window(trained):
+    trainer, R = trained
+    trainer.predict_incremental(R.iloc[:100])
+    carried = trainer.predict_incremental(R.iloc[:102])
+    #The state has seen lookback + 2 days from a zero start
+    with torch.no_grad():
+        logits, _ = trainer._model.step(trainer._factor_window(R.iloc[90:102]))
+    np.testing.assert_allclose(carried.probs_up.to_numpy(), torch.sigmoid(logits.squeeze(0)).numpy(), atol=1e-6)
+
+
+def test_revised_last_day_is_not_served_from_the_state(trained):
+    trainer, R = trained
+    first = trainer.predict_incremental(R.iloc[:100])
+    assert trainer.predict_incremental(R.iloc[:100]).probs_up.equals(first.probs_up)
+    revised = R.iloc[:100].copy()
+    revised.iloc[-1] += 0.05
+    again = trainer.predict_incremental(revised)
+    pd.testing.assert_series_equal(again.probs_up, trainer.predict_latest(revised).probs_up, atol=1e-6, rtol=0)
+    assert not again.probs_up.equals(first.probs_up)
+
+
+def test_training_drops_the_carried_state(trained):
+    trainer, R = trained
+    trainer.predict_incremental(R.iloc[:110])
+    trainer.fine_tune(R.iloc[:110], steps=2)
+    assert trainer.hidden_steps is None
+    after = trainer.predict_incremental(R.iloc[:110])
+    pd.testing.assert_series_equal(after.probs_up, trainer.predict_latest(R.iloc[:110]).probs_up, atol=1e-6, rtol=0)
+
+    trainer.fit(R)
+    assert trainer.hidden_steps is None
+
+
+def test_hidden_state_round_trip(trained, tmp_path):
+    trainer, R = trained
+    trainer.predict_incremental(R.iloc[:100])
+    trainer.save_hidden(tmp_path / "hidden.pt")
+    trainer._hidden = None
+    trainer.load_hidden(tmp_path / "hidden.pt")
+    assert trainer.hidden_steps == 0
+    carried = trainer.predict_incremental(R.iloc[:101])
+    assert trainer.hidden_steps == 1
+    assert carried.date == R.index[100]
+
+
+def test_save_load_predicts_the_same(trained, tmp_path):
+    trainer, R = trained
+    path = trainer.save(tmp_path)
+    loaded = NNDirectionsTrainer.load(path)
+    assert loaded.cfg == trainer.cfg
+    assert loaded.tickers == trainer.tickers
+    assert loaded.last_date == trainer.last_date == R.index[99]
+    assert loaded.fine_tunes == 0
+    a, b = trainer.predict_latest(R), loaded.predict_latest(R)
+    assert a.date == b.date == R.index[-1]
+    pd.testing.assert_series_equal(a.probs_up, b.probs_up)
+
+
+def test_load_rejects_other_models(trained, tmp_path):
+    trainer, _ = trained
+    path = trainer.save(tmp_path)
+    manifest = json.loads((path / "manifest.json").read_text())
+    manifest["model"] = "other"
+    (path / "manifest.json").write_text(json.dumps(manifest))
+    with pytest.raises(ValueError):
+        NNDirectionsTrainer.load(path)
+
+
+def test_optimizer_state_survives_the_artifact_round_trip(trained, tmp_path):
+    trainer, R = trained
+    loaded = NNDirectionsTrainer.load(trainer.save(tmp_path))
+    a, b = trainer._optimizer.state_dict(), loaded._optimizer.state_dict()
+    assert a["param_groups"] == b["param_groups"]
+    assert a["state"].keys() == b["state"].keys()
+    for k in a["state"]:
+        for name, value in a["state"][k].items():
+            torch.testing.assert_close(b["state"][k][name], value)
+    #Both continue the same way
+    torch.manual_seed(1)
+    trainer.fine_tune(R, steps=2)
+    torch.manual_seed(1)
+    loaded.fine_tune(R, steps=2)
+    for p, q in zip(trainer._model.parameters(), loaded._model.parameters()):
+        torch.testing.assert_close(p, q)
+
+
+def test_log_every_shows_the_window_loss(monkeypatch):
+    shown = []
+
+    class Bar:
+        def __init__(self, iterable, **kwargs):
+            self.iterable = iterable
+
+        def __iter__(self):
+            return iter(self.iterable)
+
+        def set_postfix(self, **kwargs):
+            shown.append(kwargs["loss"])
+
+    monkeypatch.setattr("trilobite.analysis.trainers.nn_direction.tqdm", Bar)
+    torch.manual_seed(0)
+    #90 days give 90 - 1 - 9 = 80 windows, 5 batches of 16 an epoch
+    trainer = NNDirectionsTrainer(small_config(log_every=2, epochs=2))
+    trainer.fit(returns(T=90))
+    assert len(shown) == 2 * 2
+    assert all(np.isfinite(shown))
+    shown.clear()
+    NNDirectionsTrainer(small_config(log_every=0)).fit(returns(T=90))
+    assert shown == []
+
+
+def test_threads_are_set_from_the_config(monkeypatch):
+    calls = []
+    monkeypatch.setattr(torch, "get_num_threads", lambda: 1)
+    monkeypatch.setattr(torch, "get_num_interop_threads", lambda: 1)
+    monkeypatch.setattr(torch, "set_num_threads", lambda n: calls.append(("intra", n)))
+
+    def set_interop(n):
+        calls.append(("interop", n))
+        raise RuntimeError("already set")
+
+    monkeypatch.setattr(torch, "set_num_interop_threads", set_interop)
+    #An inter-op count torch refuses is only logged
+    NNDirectionsTrainer(small_config(num_threads=3, num_interop_threads=2)).fit(returns(T=60))
+    assert calls == [("intra", 3), ("interop", 2)]
+    calls.clear()
+    NNDirectionsTrainer(small_config()).fit(returns(T=60))
+    assert calls == []
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.conftest import DAYS, ohlcv_frame
+
+pytestmark = pytest.mark.postgres
+
+
+def stats(repo) -> dict[str, tuple]:
+    rows = repo._fetchall(
+        "SELECT i.ticker, s.first_date, s.last_date, s.n_rows, s.last_volume "
+        "FROM instrument_stats AS s JOIN instrument AS i ON i.id = s.instrument_id ORDER BY i.ticker;"
+    )
+    return {t: tuple(rest) for (t, *rest) in rows}
+
+
+def hot_prices(repo) -> list[tuple]:
+    """
+    The NUMERIC prices of ohlcv_daily as text, so no float conversion hides a change
+    """
+    return repo._fetchall(
+        "SELECT instrument_id, date, open::text, high::text, low::text, close::text, adjclose::text, volume "
+        "FROM ohlcv_daily ORDER BY instrument_id, date;"
+    )
+
+
+def everything(repo) -> pd.DataFrame:
+    return repo.fetch_ohlcv_since({t: None for t in repo.last_ohlcv_date_for_all_tickers()})
+
+
+def test_cold_tier_round_trip(pg_market):
+    repo = pg_market
+    #Prices with all the digits a float8 carries
+    rng = np.random.default_rng(0)
+    eee = ohlcv_frame(DAYS)
+    for col in ("open", "high", "low", "close", "adjclose"):
+        eee[col] = rng.uniform(0.001, 5000.0, len(DAYS))
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("EEE"), eee)
+    before_hot, before_rows, before_stats = hot_prices(repo), everything(repo), stats(repo)
+
+    assert repo.compact_cold_year(2024) == 5
+    assert repo.first_hot_date() is None
+    pd.testing.assert_frame_equal(everything(repo), before_rows)
+    assert stats(repo) == before_stats
+
+    #An upsert into the cold year moves its segments back, the rest are unpacked by hand
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("AAA"), ohlcv_frame(DAYS).iloc[-1:])
+    assert repo._scalar("SELECT COUNT(*) FROM ohlcv_cold;") == 4
+    repo._execute(
+        "WITH gone AS (DELETE FROM ohlcv_cold RETURNING *) "
+        "INSERT INTO ohlcv_daily (instrument_id, date, open, high, low, close, adjclose, volume, dividends, stocksplits) "
+        "SELECT g.instrument_id, u.* FROM gone AS g CROSS JOIN LATERAL unnest("
+        "g.dates, g.open, g.high, g.low, g.close, g.adjclose, g.volume, g.dividends, g.stocksplits) AS u;"
+    )
+    assert hot_prices(repo) == before_hot
+
+
+def test_backfill_reads_both_tiers(pg_market):
+    from trilobite.db.schema import create_schema
+
+    repo = pg_market
+    before_stats = stats(repo)
+    before_returns = repo._fetchall("SELECT instrument_id, date, logret FROM returns_daily ORDER BY 1, 2;")
+    #Half the history cold, then stats and returns backfilled from scratch
+    repo.compact_cold_year(2024)
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("AAA"), ohlcv_frame(pd.bdate_range("2025-01-02", periods=3), close=30.0))
+    repo._execute("DELETE FROM instrument_stats;", commit=False)
+    repo._execute("DELETE FROM returns_daily;")
+    create_schema(repo.conn)
+
+    after = stats(repo)
+    assert {t: s for t, s in after.items() if t != "AAA"} == {t: s for t, s in before_stats.items() if t != "AAA"}
+    assert after["AAA"][0] == DAYS[0].date()
+    assert after["AAA"][2] == len(DAYS) + 3
+    returns = repo._fetchall("SELECT instrument_id, date, logret FROM returns_daily ORDER BY 1, 2;")
+    assert len(returns) == len(before_returns) + 3
+    assert set(before_returns) <= set(returns)
+
+
+def returns(repo) -> list[tuple]:
+    return repo._fetchall(
+        "SELECT i.ticker, r.date, r.logret FROM returns_daily AS r "
+        "JOIN instrument AS i ON i.id = r.instrument_id ORDER BY i.ticker, r.date;"
+    )
+
+
+def test_returns_match_duckdb(pg_market, market):
+    pg_rows = returns(pg_market)
+    duck_rows = market._fetchall(
+        "SELECT i.ticker, r.date, r.logret FROM returns_daily AS r "
+        "JOIN instrument AS i ON i.id = r.instrument_id ORDER BY i.ticker, r.date;"
+    )
+    assert [r[:2] for r in pg_rows] == [r[:2] for r in duck_rows]
+    np.testing.assert_allclose([r[2] for r in pg_rows], [r[2] for r in duck_rows], rtol=1e-12)
+
+
+def test_incremental_returns_match_rebuilds(pg_market):
+    repo = pg_market
+    more = pd.bdate_range(DAYS[-1] + pd.Timedelta(days=1), periods=5)
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("AAA"), ohlcv_frame(more, close=50.0))
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("BBB"), ohlcv_frame(DAYS[10:20], close=3.0))
+    #Zero prices leave NULL returns on their days and the day after
+    zero = ohlcv_frame(DAYS[30:32], close=0.0)
+    repo.upsert_ohlcv_daily(repo.ensure_instrument("CCC"), zero)
+    incremental_stats, incremental_returns = stats(repo), returns(repo)
+    ccc = {d: r for t, d, r in incremental_returns if t == "CCC"}
+    assert ccc[DAYS[30].date()] is None and ccc[DAYS[32].date()] is None
+
+    assert repo.rebuild_instrument_stats() == 4
+    repo.rebuild_returns_daily()
+    assert stats(repo) == incremental_stats
+    assert returns(repo) == incremental_returns
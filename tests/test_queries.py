@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+from trilobite.db import queries as q
+
+HOT = re.compile(r"\bohlcv_daily\b")
+
+
+def test_tiered_rewrites_whole_identifiers_only():
+    sql = (
+        "SELECT * FROM ohlcv_daily AS o "
+        "JOIN ohlcv_daily_provisional AS p ON p.date = o.date "
+        "JOIN ohlcv_daily_all AS a ON a.date = o.date "
+        "WHERE EXISTS (SELECT 1 FROM ohlcv_daily WHERE date = o.date);"
+    )
+    assert q._tiered(sql) == (
+        "SELECT * FROM ohlcv_daily_all AS o "
+        "JOIN ohlcv_daily_provisional AS p ON p.date = o.date "
+        "JOIN ohlcv_daily_all AS a ON a.date = o.date "
+        "WHERE EXISTS (SELECT 1 FROM ohlcv_daily_all WHERE date = o.date);"
+    )
+
+
+def test_tiered_needs_a_hot_read():
+    with pytest.raises(ValueError):
+        q._tiered("SELECT * FROM ohlcv_daily_provisional;")
+
+
+@pytest.mark.parametrize("name", [
+    "FETCH_ADJCLOSE_SERIES_BETWEEN",
+    "FETCH_ADJCLOSE_SERIES_LEQ",
+    "FETCH_OHLCV_SINCE",
+    "FETCH_OHLCV_ROWS_SINCE_BY_ID",
+    "EXPORT_OHLCV_BY_TICKER",
+    "EXPORT_OHLCV_BY_DATE",
+])
+def test_tiered_queries_read_both_tiers(name):
+    hot, tiered = getattr(q, name), getattr(q, f"{name}_TIERED")
+    assert HOT.search(hot)
+    assert not HOT.search(tiered)
+    assert tiered.count("%s") == hot.count("%s")
+    assert tiered.replace("ohlcv_daily_all", "ohlcv_daily") == hot
+
+
+def duckdb_dialect(sql: str) -> str:
+    """
+    The rewrites db/duck/queries.py applies to the Postgres returns statements
+    """
+    return sql.replace("%s", "?").replace("::float8", "::DOUBLE").replace("ohlcv_daily_all", "ohlcv_daily")
+
+
+def test_duckdb_returns_statements_follow_postgres():
+    from trilobite.db import schema
+    from trilobite.db.duck import queries as dq
+
+    for name in ("REFRESH_RETURNS_DAILY", "REBUILD_RETURNS_DAILY", "CLEAR_RETURNS_DAILY"):
+        duck = getattr(dq, name)
+        assert duck == duckdb_dialect(getattr(q, name)), name
+        #Nothing Postgres only is left for DuckDB to reject
+        assert "%s" not in duck and "::float8" not in duck and "ohlcv_daily_all" not in duck
+    assert q.REFRESH_RETURNS_DAILY.count("%s") == dq.REFRESH_RETURNS_DAILY.count("?") == 5
+    #The backfill computes the same returns as the rebuild
+    body = "WHERE r.prev_date IS NOT NULL"
+    assert schema.BACKFILL_RETURNS_DAILY.split(body)[0] == q.REBUILD_RETURNS_DAILY.split(body)[0]
@@ -0,0 +1,87 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from tests.conftest import DAYS
+from trilobite.db.screen import FULL_COVERAGE, Screen
+
+START, END = DAYS[0].date(), DAYS[-1].date()
+
+
+def test_filters_return_new_screens():
+    s = Screen()
+    t = s.active().min_coverage(0.9)
+    assert s == Screen()
+    assert (t.active_only, t.coverage) == (True, 0.9)
+
+
+@pytest.mark.parametrize("build", [
+    lambda: Screen().min_coverage(1.5),
+    lambda: Screen().max_gap(-1),
+    lambda: Screen().min_volume(1, days=0),
+    lambda: Screen().min_volume(1, days=5, how="median"),
+])
+def test_invalid_filters_raise(build):
+    with pytest.raises(ValueError):
+        build()
+
+
+def test_compile_params_follow_placeholders():
+    screen = Screen().active().min_coverage(0.9).max_gap(2).min_price(5).min_dollar_volume(1e6, days=20, how="min")
+    sql, params = screen.compile(date(2024, 1, 1), date(2024, 6, 30), source="ohlcv_daily_all")
+    assert sql.count("%s") == len(params)
+    assert params[:2] == (date(2024, 1, 1), date(2024, 6, 30))
+    #The volume aggregate's params come before the conditions'
+    assert params[2:] == (20, 20, 20, 0.9, 2, 5, 1e6)
+    assert "FROM ohlcv_daily_all" in sql
+    assert "i.is_active = TRUE" in sql
+
+
+def test_compile_without_filters_passes_everything():
+    sql, params = Screen().compile(date(2024, 1, 1), date(2024, 1, 31))
+    assert "WHERE TRUE" in sql
+    assert len(params) == 2
+
+
+def test_full_coverage_and_gaps():
+    assert FULL_COVERAGE.is_full_coverage_only
+    assert not FULL_COVERAGE.allows_gaps
+    assert not Screen().max_gap(0).allows_gaps
+    assert not Screen().min_coverage(1.0).min_price(5).is_full_coverage_only
+    assert Screen().min_coverage(0.9).allows_gaps
+    assert Screen().max_gap(3).allows_gaps
+    assert Screen().active().allows_gaps
+
+
+@pytest.mark.parametrize("screen, expected", [
+    (Screen(), ["AAA", "BBB", "CCC", "DDD"]),
+    (Screen().active(), ["AAA", "BBB", "CCC"]),
+    (Screen().min_coverage(1.0).min_price(0), ["AAA", "DDD"]),
+    (Screen().min_coverage(0.97), ["AAA", "BBB", "DDD"]),
+    (Screen().max_gap(1), ["AAA", "BBB", "DDD"]),
+    (Screen().max_gap(3), ["AAA", "BBB", "CCC", "DDD"]),
+    (Screen().min_price(5), ["AAA", "BBB", "DDD"]),
+    (Screen().min_volume(500, days=5), ["AAA", "BBB", "CCC"]),
+    (Screen().min_dollar_volume(1000, days=5, how="min"), ["AAA", "BBB", "CCC"]),
+])
+def test_screen_on_duckdb(market, screen, expected):
+    assert market.screen_tickers(screen, start_date=START, end_date=END) == expected
+
+
+def test_full_coverage_matches_dedicated_query(market):
+    assert market.screen_tickers(FULL_COVERAGE, start_date=START, end_date=END) == ["AAA", "DDD"]
+
+
+def test_datasource_fills_gaps_only_when_screen_allows(market):
+    from trilobite.analysis.datasource import MarketDataSource
+
+    ds = MarketDataSource(market)
+    full = ds.load_adjclose_matrix(period=f"{len(DAYS) + 30}d", end_date=END)
+    assert list(full.columns) == ["AAA", "DDD"]
+
+    gappy = ds.load_adjclose_matrix(period=f"{len(DAYS) + 30}d", end_date=END, screen=Screen().min_coverage(0.9))
+    #CCC has no price on the first day and is dropped, BBB's gap is filled
+    assert list(gappy.columns) == ["AAA", "BBB", "DDD"]
+    assert not np.isnan(gappy.to_numpy()).any()
+    assert gappy["BBB"].iloc[5] == gappy["BBB"].iloc[4]
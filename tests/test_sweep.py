@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("torch")
+
+from trilobite.analysis.sweep import grid_trials, parse_space, random_trials
+
+
+def test_parse_space_converts_to_field_types():
+    space = parse_space(" n_factors=16, 32 ; lr=3e-4,1e-3;standardize=true,0; ")
+    assert space == {"n_factors": [16, 32], "lr": [3e-4, 1e-3], "standardize": [True, False]}
+    assert all(isinstance(v, int) for v in space["n_factors"])
+
+
+def test_parse_space_ranges():
+    space = parse_space("lookback=20:60;lr=1e-4:1e-2")
+    assert space == {"lookback": (20, 60), "lr": (1e-4, 1e-2)}
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "n_factors",
+    "n_factors=",
+    "device=cpu,cuda",
+    "n_factors=sixteen",
+    "lookback=60:20",
+    "lr=0:1e-2",
+    "standardize=0:1",
+    "standardize=maybe",
+])
+def test_parse_space_rejects(text):
+    with pytest.raises(ValueError):
+        parse_space(text)
+
+
+def test_grid_trials():
+    trials = grid_trials(parse_space("n_factors=16,32;lookback=20,40,60"))
+    assert len(trials) == 6
+    assert trials[0] == {"n_factors": 16, "lookback": 20}
+    assert trials[-1] == {"n_factors": 32, "lookback": 60}
+    assert len({tuple(t.values()) for t in trials}) == 6
+
+
+def test_grid_trials_rejects_ranges():
+    with pytest.raises(ValueError):
+        grid_trials(parse_space("lr=1e-4:1e-2"))
+
+
+def test_random_trials_are_seeded_and_distinct():
+    space = parse_space("n_factors=16,32,64;lookback=20:60;lr=1e-4:1e-2")
+    trials = random_trials(space, 20, seed=3)
+    assert trials == random_trials(space, 20, seed=3)
+    assert trials != random_trials(space, 20, seed=4)
+    assert len({tuple(t.values()) for t in trials}) == 20
+    for t in trials:
+        assert t["n_factors"] in (16, 32, 64)
+        assert isinstance(t["lookback"], int) and 20 <= t["lookback"] <= 60
+        assert 1e-4 <= t["lr"] <= 1e-2
+
+
+def test_random_trials_stop_at_the_size_of_the_space():
+    trials = random_trials(parse_space("n_factors=16,32;standardize=0,1"), 10)
+    assert len(trials) == 4
+    assert sorted(map(lambda t: tuple(t.values()), trials)) == sorted(
+        tuple(t.values()) for t in grid_trials(parse_space("n_factors=16,32;standardize=0,1"))
+    )